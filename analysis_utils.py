@@ -5,12 +5,71 @@ import matplotlib
 matplotlib.use('Agg')  # 使用非交互式后端，避免与tkinter冲突
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import stats
-from collections import Counter
 from typing import List, Dict
 from config import PlayerInfo
 
 
+# 中文字体候选，按优先级排列
+CJK_FONTS = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS']
+
+
+def configure_fonts():
+    """设置中文字体支持"""
+    plt.rcParams['font.sans-serif'] = CJK_FONTS
+    plt.rcParams['axes.unicode_minus'] = False
+
+
+def warm_up():
+    """预热字体缓存和绘图管线
+
+    首次绘图的大部分耗时在于查找中文字体和初始化文本渲染。
+    图形界面在窗口显示后于后台线程调用本函数，之后的第一次模拟出图不再需要等待。
+    """
+    from matplotlib import font_manager
+    configure_fonts()
+    for family in CJK_FONTS + ['sans-serif']:
+        font_manager.findfont(font_manager.FontProperties(family=[family]), fallback_to_default=True)
+    fig, ax = plt.subplots(figsize=(2, 2))
+    ax.plot([0, 1], [0, 100], label='预热')
+    ax.set_title('累积概率 (%)')
+    ax.legend()
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def as_histogram(results):
+    """将结果字典列表、archive_utils.ResultHistogram 或 archive_utils.ResultArchive 统一转换为结果直方图"""
+    from archive_utils import ResultHistogram
+    if isinstance(results, ResultHistogram):
+        return results
+    if hasattr(results, 'histogram'):
+        return results.histogram()
+    return ResultHistogram.from_results(results)
+
+
+def _cdf_points(values: np.ndarray, counts: np.ndarray):
+    """由 (升序取值, 次数) 生成累积分布折线的顶点 (x, 累积概率%)
+
+    每个取值对应两个顶点（该取值的第一个和最后一个样本），与逐样本排序后作图的形状相同。
+    """
+    cumulative = np.cumsum(counts)
+    x = np.repeat(values, 2)
+    y = np.empty(len(x))
+    y[0::2] = (cumulative - counts + 1) / cumulative[-1] * 100
+    y[1::2] = cumulative / cumulative[-1] * 100
+    return x, y
+
+
+def _success_gradient_cdf(values: np.ndarray, counts: np.ndarray, success_counts: np.ndarray):
+    """累积分布折线的线段和颜色：颜色按截至该取值的累计成功率从红（0%）渐变到绿（100%）"""
+    x, y = _cdf_points(values, counts)
+    points = np.array([x, y]).T.reshape(-1, 1, 2)
+    segments = np.concatenate([points[:-1], points[1:]], axis=1)
+    rates = np.repeat(np.cumsum(success_counts) / np.cumsum(counts), 2)[:-1]
+    colors = np.column_stack([1 - rates, rates, np.zeros(len(rates))])
+    return segments, colors
+
+
 def plot_success_failure_pie(success_count: int, failure_count: int, 
                               save_path: str = 'success_failure_pie.png',
                               results: List[Dict] = None):
@@ -20,11 +79,10 @@ def plot_success_failure_pie(success_count: int, failure_count: int,
         success_count: 成功次数
         failure_count: 失败次数
         save_path: 保存路径
-        results: 完整的模拟结果列表
+        results: 完整的模拟结果列表，也可以是 ResultHistogram 或 ResultArchive
     """
     # 设置中文字体支持
-    plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS']
-    plt.rcParams['axes.unicode_minus'] = False
+    configure_fonts()
     
     # 创建子图布局：1行3列
     fig = plt.figure(figsize=(20, 6))
@@ -64,8 +122,13 @@ def plot_success_failure_pie(success_count: int, failure_count: int,
     ax1.legend(legend_labels, loc='upper left', bbox_to_anchor=(0.7, 1),
                fontsize=10, framealpha=0.9)
     
-    # 添加总数文本
-    ax1.text(0, -1.3, f'总模拟次数: {total}', 
+    # 添加总数文本，给出完整结果时附上成功率的自助法置信区间
+    total_text = f'总模拟次数: {total}'
+    if results:
+        from bootstrap_utils import success_rate_interval
+        interval = success_rate_interval(as_histogram(results))
+        total_text += f'\n成功率{interval.confidence:.0%}置信区间: {interval.low:.2%} - {interval.high:.2%}'
+    ax1.text(0, -1.3, total_text, 
              ha='center', fontsize=11, weight='bold',
              bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
     
@@ -73,10 +136,10 @@ def plot_success_failure_pie(success_count: int, failure_count: int,
     
     # ========== 中间：剩余武器配额 CDF ==========
     if results:
+        histogram = as_histogram(results)
         ax2 = fig.add_subplot(gs[0, 1])
-        remaining_quota = [r.get('剩余配额', 0) for r in results]
-        remaining_quota_sorted = np.sort(remaining_quota)
-        cdf = np.arange(1, len(remaining_quota_sorted) + 1) / len(remaining_quota_sorted) * 100
+        values, counts, _ = histogram.distribution('remaining_quota')
+        remaining_quota_sorted, cdf = _cdf_points(values, counts)
         
         ax2.plot(remaining_quota_sorted, cdf, linewidth=2, color='#2196F3')
         ax2.grid(True, alpha=0.3, linestyle='--')
@@ -85,8 +148,8 @@ def plot_success_failure_pie(success_count: int, failure_count: int,
         ax2.set_title('剩余武器配额累积分布', fontsize=16, fontweight='bold', pad=15)
         
         # 添加统计信息
-        mean_val = np.mean(remaining_quota)
-        median_val = np.median(remaining_quota)
+        mean_val = histogram.mean('remaining_quota')
+        median_val = histogram.median('remaining_quota')
         stats_text = f'平均: {mean_val:.1f}\n中位数: {median_val:.1f}'
         ax2.text(0.95, 0.05, stats_text, transform=ax2.transAxes,
                 fontsize=10, verticalalignment='bottom', horizontalalignment='right',
@@ -94,9 +157,8 @@ def plot_success_failure_pie(success_count: int, failure_count: int,
         
         # ========== 右侧：额外购买配额 CDF ==========
         ax3 = fig.add_subplot(gs[0, 2])
-        extra_quota = [r.get('额外购买配额', 0) for r in results]
-        extra_quota_sorted = np.sort(extra_quota)
-        cdf2 = np.arange(1, len(extra_quota_sorted) + 1) / len(extra_quota_sorted) * 100
+        values, counts, _ = histogram.distribution('extra_quota_purchased')
+        extra_quota_sorted, cdf2 = _cdf_points(values, counts)
         
         ax3.plot(extra_quota_sorted, cdf2, linewidth=2, color='#FF9800')
         ax3.grid(True, alpha=0.3, linestyle='--')
@@ -105,8 +167,8 @@ def plot_success_failure_pie(success_count: int, failure_count: int,
         ax3.set_title('额外购买配额累积分布', fontsize=16, fontweight='bold', pad=15)
         
         # 添加统计信息
-        mean_val2 = np.mean(extra_quota)
-        median_val2 = np.median(extra_quota)
+        mean_val2 = histogram.mean('extra_quota_purchased')
+        median_val2 = histogram.median('extra_quota_purchased')
         stats_text2 = f'平均: {mean_val2:.1f}\n中位数: {median_val2:.1f}'
         ax3.text(0.95, 0.05, stats_text2, transform=ax3.transAxes,
                 fontsize=10, verticalalignment='bottom', horizontalalignment='right',
@@ -119,22 +181,53 @@ def plot_success_failure_pie(success_count: int, failure_count: int,
     print(f"成功率饼图已保存至: {save_path}")
 
 
-def plot_combined_distributions(results, success_rate, save_prefix='combined'):
+def _success_bar_heights(counts: np.ndarray, success_counts: np.ndarray, bar_height_max: float):
+    """每个取值处成功/失败部分的柱高：两部分之和固定为 bar_height_max 的一半"""
+    success_rates = success_counts / counts
+    return bar_height_max * 1/2 * success_rates, bar_height_max * 1/2 * (1 - success_rates)
+
+
+def _sample_bars(values: np.ndarray, success_heights: np.ndarray, failure_heights: np.ndarray,
+                 max_bars: int = 50):
+    """取值过多时均匀抽取至多 max_bars 个柱子，避免柱状图过于密集"""
+    n_bars = min(max_bars, len(values))
+    if len(values) > n_bars:
+        bar_indices = np.linspace(0, len(values) - 1, n_bars, dtype=int)
+        return values[bar_indices], success_heights[bar_indices], failure_heights[bar_indices], n_bars
+    return values, success_heights, failure_heights, n_bars
+
+
+def _draw_cdf_band(ax, histogram, field: str, replicates: int):
+    """在累积分布图上绘制自助法置信带，返回图例项；replicates 为0时不绘制"""
+    from matplotlib.patches import Rectangle
+    from bootstrap_utils import cdf_band
+    band = cdf_band(histogram, field, replicates)
+    ax.fill_between(band.values, band.low, band.high, step='post', color='gray', alpha=0.35, linewidth=0)
+    return Rectangle((0, 0), 1, 1, fc='gray', alpha=0.35, label=f'{band.confidence:.0%}置信带（自助法）')
+
+
+def plot_combined_distributions(results, success_rate, save_prefix='combined', bootstrap_replicates=None):
     """绘制综合分布图
     
     参数:
-        results: 模拟结果列表
+        results: 模拟结果列表，也可以是 ResultHistogram 或 ResultArchive（按块统计，不整体载入内存）
         success_rate: 总体成功率（0-100）
         save_prefix: 保存文件名前缀
+        bootstrap_replicates: 累积分布置信带的自助法重复样本数，None表示默认值，0表示不绘制置信带
     """
+    from bootstrap_utils import DEFAULT_REPLICATES
+    if bootstrap_replicates is None:
+        bootstrap_replicates = DEFAULT_REPLICATES
     # 设置中文字体支持
-    plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS']
-    plt.rcParams['axes.unicode_minus'] = False
+    configure_fonts()
+    
+    from matplotlib.collections import LineCollection
+    from matplotlib.patches import Rectangle
     
-    # 提取数据
-    character_total_no_urgent = [r['角色总抽数（不含紧急）'] for r in results]
-    weapon_ten_pulls = [r['武器十连次数'] for r in results]
-    success_flags = [r['成功'] for r in results]
+    # 提取数据：按取值统计的次数和其中成功的次数
+    histogram = as_histogram(results)
+    char_values, char_counts, char_success_counts = histogram.distribution('character_pulls')
+    weapon_values, weapon_counts, weapon_success_counts = histogram.distribution('weapon_ten_pulls')
     
     # ========== 创建2x2子图布局 ==========
     fig, axes = plt.subplots(2, 2, figsize=(20, 14))
@@ -142,45 +235,19 @@ def plot_combined_distributions(results, success_rate, save_prefix='combined'):
     # ========== 左上：角色池累积分布 ==========
     ax1 = axes[0, 0]
     
-    # 构建数据：将角色抽数和成功标志配对
-    char_data = list(zip(character_total_no_urgent, success_flags))
-    char_data.sort(key=lambda x: x[0])  # 按抽数排序
-    
-    sorted_character = np.array([x[0] for x in char_data])
-    cumulative_character = np.arange(1, len(sorted_character) + 1) / len(sorted_character) * 100
-    
-    # 计算每个点处的实际成功率（在该抽数以下的所有结果中，成功的比例）
-    point_success_rates = []
-    for i in range(len(sorted_character)):
-        success_count_up_to_here = sum(1 for j in range(i+1) if char_data[j][1])
-        point_success_rate = success_count_up_to_here / (i + 1) * 100
-        point_success_rates.append(point_success_rate)
-    
-    # 使用matplotlib的LineCollection绘制渐变颜色的线
-    from matplotlib.collections import LineCollection
-    from matplotlib.patches import Rectangle
+    # 置信带画在折线下方
+    band_legend = []
+    if bootstrap_replicates:
+        band_legend = [_draw_cdf_band(ax1, histogram, 'character_pulls', bootstrap_replicates)]
     
-    # 创建线段
-    points = np.array([sorted_character, cumulative_character]).T.reshape(-1, 1, 2)
-    segments = np.concatenate([points[:-1], points[1:]], axis=1)
-    
-    # 为每个线段计算颜色（使用线段起始点的成功率）
-    colors = []
-    for i in range(len(point_success_rates) - 1):
-        rate = point_success_rates[i] / 100  # 归一化到0-1
-        # 绿色(0,1,0)到红色(1,0,0)的插值
-        r = 1 - rate
-        g = rate
-        b = 0
-        colors.append((r, g, b))
-    
-    # 创建 LineCollection
+    # 颜色为截至该抽数的所有结果中成功的比例
+    segments, colors = _success_gradient_cdf(char_values, char_counts, char_success_counts)
     lc = LineCollection(segments, colors=colors, linewidths=2.5)
     ax1.add_collection(lc)
     
     # 自适应x轴范围，留出边距
-    x_min = sorted_character.min()
-    x_max = sorted_character.max()
+    x_min = char_values.min()
+    x_max = char_values.max()
     x_range = x_max - x_min
     x_margin = max(x_range * 0.05, 5)  # 至少留5个单位的边距
     ax1.set_xlim(-1, max(10, x_max + x_margin))  # 左边界-1留出空白，右边自适应
@@ -197,7 +264,7 @@ def plot_combined_distributions(results, success_rate, save_prefix='combined'):
         Rectangle((0, 0), 1, 1, fc='red', alpha=0.8, label='成功率0%'),
         Rectangle((0, 0), 1, 1, fc='yellow', alpha=0.8, label='成功率中间值')
     ]
-    ax1.legend(handles=legend_elements, fontsize=10, loc='upper left')
+    ax1.legend(handles=legend_elements + band_legend, fontsize=10, loc='upper left')
     
     # 设置y轴刻度以10%为单位
     ax1.set_yticks(np.arange(0, 101, 10))
@@ -215,40 +282,16 @@ def plot_combined_distributions(results, success_rate, save_prefix='combined'):
     # ========== 右上：武器池累积分布 ==========
     ax2 = axes[0, 1]
     
-    # 构建数据：将武器十连次数和成功标志配对
-    weapon_data = list(zip(weapon_ten_pulls, success_flags))
-    weapon_data.sort(key=lambda x: x[0])  # 按十连次数排序
-    
-    sorted_weapon = np.array([x[0] for x in weapon_data])
-    cumulative_weapon = np.arange(1, len(sorted_weapon) + 1) / len(sorted_weapon) * 100
-    
-    # 计算每个点处的实际成功率
-    point_success_rates_weapon = []
-    for i in range(len(sorted_weapon)):
-        success_count_up_to_here = sum(1 for j in range(i+1) if weapon_data[j][1])
-        point_success_rate = success_count_up_to_here / (i + 1) * 100
-        point_success_rates_weapon.append(point_success_rate)
-    
-    # 创建线段
-    points = np.array([sorted_weapon, cumulative_weapon]).T.reshape(-1, 1, 2)
-    segments = np.concatenate([points[:-1], points[1:]], axis=1)
-    
-    # 为每个线段计算颜色
-    colors = []
-    for i in range(len(point_success_rates_weapon) - 1):
-        rate = point_success_rates_weapon[i] / 100
-        r = 1 - rate
-        g = rate
-        b = 0
-        colors.append((r, g, b))
-    
-    # 创建 LineCollection
+    band_legend = []
+    if bootstrap_replicates:
+        band_legend = [_draw_cdf_band(ax2, histogram, 'weapon_ten_pulls', bootstrap_replicates)]
+    segments, colors = _success_gradient_cdf(weapon_values, weapon_counts, weapon_success_counts)
     lc = LineCollection(segments, colors=colors, linewidths=2.5)
     ax2.add_collection(lc)
     
     # 自适应x轴范围
-    x_min_weapon = sorted_weapon.min()
-    x_max_weapon = sorted_weapon.max()
+    x_min_weapon = weapon_values.min()
+    x_max_weapon = weapon_values.max()
     x_range_weapon = x_max_weapon - x_min_weapon
     x_margin_weapon = max(x_range_weapon * 0.05, 1)  # 至少留1个单位的边距
     ax2.set_xlim(-1, max(10, x_max_weapon + x_margin_weapon))  # 左边界-1留出空白，右边自适应
@@ -260,7 +303,7 @@ def plot_combined_distributions(results, success_rate, save_prefix='combined'):
     ax2.grid(True, alpha=0.3)
     
     # 添加图例
-    ax2.legend(handles=legend_elements, fontsize=10, loc='upper left')
+    ax2.legend(handles=legend_elements + band_legend, fontsize=10, loc='upper left')
     ax2.set_yticks(np.arange(0, 101, 10))
     
     # 设置x轴刻度，自适应间隔以避免过密
@@ -276,48 +319,12 @@ def plot_combined_distributions(results, success_rate, save_prefix='combined'):
     # ========== 左下：角色池成功/失败堆叠柱状图 ==========
     ax3 = axes[1, 0]
     
-    # 统计每个抽数对应的成功和失败数量
-    from collections import Counter
-    char_counter = Counter(character_total_no_urgent)
-    unique_char_pulls = sorted(char_counter.keys())
-    
-    # 为每个抽数统计成功和失败的数量
-    char_success_counts = []
-    char_failure_counts = []
-    
-    for pull_count in unique_char_pulls:
-        success_count = sum(1 for char_pull, success in zip(character_total_no_urgent, success_flags) 
-                          if char_pull == pull_count and success)
-        failure_count = sum(1 for char_pull, success in zip(character_total_no_urgent, success_flags) 
-                          if char_pull == pull_count and not success)
-        char_success_counts.append(success_count)
-        char_failure_counts.append(failure_count)
-    
-    # 计算每个位置的成功率，并用固定高度的柱子表示
+    # 计算每个抽数处的成功率，并用固定高度的柱子表示
     bar_height_max = 200  # 固定的柱子最大高度（对应200%）
-    char_success_heights = []
-    char_failure_heights = []
-    
-    for success_count, failure_count in zip(char_success_counts, char_failure_counts):
-        total = success_count + failure_count
-        if total > 0:
-            success_rate = success_count / total
-        else:
-            success_rate = 0
-        char_success_heights.append(bar_height_max * 1/2 * success_rate)
-        char_failure_heights.append(bar_height_max * 1/2 * (1 - success_rate))
-    
-    # 采样以避免柱状图过于密集
-    n_bars = min(50, len(unique_char_pulls))  # 最多50个柱子
-    if len(unique_char_pulls) > n_bars:
-        bar_indices = np.linspace(0, len(unique_char_pulls) - 1, n_bars, dtype=int)
-        sampled_pulls = [unique_char_pulls[i] for i in bar_indices]
-        sampled_success = [char_success_heights[i] for i in bar_indices]
-        sampled_failure = [char_failure_heights[i] for i in bar_indices]
-    else:
-        sampled_pulls = unique_char_pulls
-        sampled_success = char_success_heights
-        sampled_failure = char_failure_heights
+    char_success_heights, char_failure_heights = _success_bar_heights(char_counts, char_success_counts,
+                                                                      bar_height_max)
+    sampled_pulls, sampled_success, sampled_failure, n_bars = _sample_bars(
+        char_values, char_success_heights, char_failure_heights)
     
     # 绘制堆叠柱状图
     bar_width = max(x_range / n_bars * 0.8, 0.5)
@@ -342,45 +349,10 @@ def plot_combined_distributions(results, success_rate, save_prefix='combined'):
     # ========== 右下：武器池成功/失败堆叠柱状图 ==========
     ax4 = axes[1, 1]
     
-    # 统计每个十连次数对应的成功和失败数量
-    weapon_counter = Counter(weapon_ten_pulls)
-    unique_weapon_pulls = sorted(weapon_counter.keys())
-    
-    weapon_success_counts = []
-    weapon_failure_counts = []
-    
-    for pull_count in unique_weapon_pulls:
-        success_count = sum(1 for weapon_pull, success in zip(weapon_ten_pulls, success_flags) 
-                          if weapon_pull == pull_count and success)
-        failure_count = sum(1 for weapon_pull, success in zip(weapon_ten_pulls, success_flags) 
-                          if weapon_pull == pull_count and not success)
-        weapon_success_counts.append(success_count)
-        weapon_failure_counts.append(failure_count)
-    
-    # 计算每个位置的成功率，并用固定高度的柱子表示
-    weapon_success_heights = []
-    weapon_failure_heights = []
-    
-    for success_count, failure_count in zip(weapon_success_counts, weapon_failure_counts):
-        total = success_count + failure_count
-        if total > 0:
-            success_rate = success_count / total
-        else:
-            success_rate = 0
-        weapon_success_heights.append(bar_height_max * 1/2 * success_rate)
-        weapon_failure_heights.append(bar_height_max * 1/2 * (1 - success_rate))
-    
-    # 采样以避免柱状图过于密集
-    n_bars_weapon = min(50, len(unique_weapon_pulls))  # 最多50个柱子
-    if len(unique_weapon_pulls) > n_bars_weapon:
-        bar_indices_weapon = np.linspace(0, len(unique_weapon_pulls) - 1, n_bars_weapon, dtype=int)
-        sampled_weapon_pulls = [unique_weapon_pulls[i] for i in bar_indices_weapon]
-        sampled_weapon_success = [weapon_success_heights[i] for i in bar_indices_weapon]
-        sampled_weapon_failure = [weapon_failure_heights[i] for i in bar_indices_weapon]
-    else:
-        sampled_weapon_pulls = unique_weapon_pulls
-        sampled_weapon_success = weapon_success_heights
-        sampled_weapon_failure = weapon_failure_heights
+    weapon_success_heights, weapon_failure_heights = _success_bar_heights(weapon_counts, weapon_success_counts,
+                                                                          bar_height_max)
+    sampled_weapon_pulls, sampled_weapon_success, sampled_weapon_failure, n_bars_weapon = _sample_bars(
+        weapon_values, weapon_success_heights, weapon_failure_heights)
     
     # 绘制堆叠柱状图
     bar_width_weapon = max(x_range_weapon / n_bars_weapon * 0.8, 0.5)
@@ -404,4 +376,4 @@ def plot_combined_distributions(results, success_rate, save_prefix='combined'):
     
     plt.tight_layout()
     plt.savefig(f'{save_prefix}_cdf.png', dpi=300, bbox_inches='tight')
-    plt.close()  # 显式关闭图形，释放资源
\ No newline at end of file
+    plt.close()  # 显式关闭图形，释放资源
@@ -0,0 +1,52 @@
+"""
+结果归档查看工具 - 汇总、出图或导出 character_weapon_main.py --archive 生成的归档文件
+"""
+import argparse
+from archive_utils import ResultArchive
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='结果归档查看与导出')
+    parser.add_argument('path', help='归档文件路径')
+    parser.add_argument('--csv', default=None, metavar='PATH', help='导出为CSV')
+    parser.add_argument('--parquet', default=None, metavar='PATH', help='导出为Parquet（需要 pyarrow）')
+    parser.add_argument('--plot', default=None, metavar='PREFIX', help='按块统计后绘制分布图，PREFIX 为文件名前缀')
+    parser.add_argument('--show', default=None, metavar='START:STOP', help='打印一段记录，如 "0:10"')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+    archive = ResultArchive(args.path)
+    histogram = archive.histogram()
+    print(f"归档文件 {args.path}: {len(archive)} 次模拟，场景哈希 {archive.scenario[:16]}")
+    if histogram.runs:
+        print(f"成功率: {histogram.successes / histogram.runs * 100:.2f}%")
+        print(f"角色池抽数（不含紧急）: 平均 {histogram.mean('character_pulls'):.1f}，"
+              f"中位数 {histogram.median('character_pulls'):.1f}")
+        print(f"武器十连次数: 平均 {histogram.mean('weapon_ten_pulls'):.2f}，"
+              f"中位数 {histogram.median('weapon_ten_pulls'):.1f}")
+        for reason, count in histogram.failure_reasons().items():
+            print(f"  {reason}: {count}")
+
+    if args.show:
+        start, stop = (int(part) if part else None for part in args.show.split(':', 1))
+        for result in archive.results(start or 0, stop):
+            print(result)
+    if args.csv:
+        archive.to_csv(args.csv)
+        print(f"已导出CSV: {args.csv}")
+    if args.parquet:
+        archive.to_parquet(args.parquet)
+        print(f"已导出Parquet: {args.parquet}")
+    if args.plot and histogram.runs:
+        from analysis_utils import plot_success_failure_pie, plot_combined_distributions
+        plot_success_failure_pie(histogram.successes, histogram.runs - histogram.successes,
+                                 save_path=f'{args.plot}_success_failure_pie.png', results=histogram)
+        plot_combined_distributions(histogram, histogram.successes / histogram.runs * 100, save_prefix=args.plot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+结果归档模块 - 以定长二进制记录保存每次模拟的结果，供超出内存规模的离线分析使用
+
+文件格式: 固定长度的文件头（魔数、版本、记录数、JSON元数据）后接 ARCHIVE_DTYPE 定长记录。
+写入按块追加：缓冲区写满后扩展文件、通过内存映射写入新块，再更新文件头中的记录数，
+因此写入中断时已落盘的块仍然可读。读取时记录以内存映射方式按需加载，统计按块累加。
+"""
+import csv
+import hashlib
+import json
+import struct
+from dataclasses import asdict
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo, config_from_dict
+from compiled_rules import RESULT_DTYPE, FAILURE_REASONS, records_from_results, results_from_records, result_row
+
+
+ARCHIVE_MAGIC = b'GRES'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER_SIZE = 4096
+_HEADER_PREFIX = struct.Struct('<4sIQI')  # 魔数, 版本, 记录数, 元数据长度
+
+# 结果记录字段之后追加随机种子，(seed, run) 可单独重放任意一次模拟
+ARCHIVE_DTYPE = np.dtype(RESULT_DTYPE.descr + [('seed', np.uint64)])
+
+# 导出时的列名，与结果字典的键一致
+_EXPORT_COLUMNS = [
+    ('模拟编号', 'run'),
+    ('随机种子', 'seed'),
+    ('角色总抽数（不含紧急）', 'character_pulls'),
+    ('角色紧急招募', 'character_urgent_pulls'),
+    ('武器十连次数', 'weapon_ten_pulls'),
+    ('武器配额消耗', 'weapon_quota_used'),
+    ('剩余配额', 'remaining_quota'),
+    ('补充武库箱', 'supply_boxes'),
+    ('额外购买配额', 'extra_quota_purchased'),
+    ('成功', 'success'),
+    ('失败原因', 'failure_reason'),
+]
+
+# ResultHistogram 统计的字段
+HISTOGRAM_FIELDS = ('character_pulls', 'weapon_ten_pulls', 'remaining_quota', 'extra_quota_purchased')
+
+
+def scenario_dict(character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                  player_info: PlayerInfo) -> Dict:
+    """模拟场景（卡池配置+玩家信息）的字典形式，可序列化为JSON并用 scenario_from_dict 还原"""
+    return {
+        'character_pool': asdict(character_pool_config),
+        'weapon_pool': asdict(weapon_pool_config),
+        'player': asdict(player_info),
+    }
+
+
+def scenario_from_dict(scenario: Dict) -> Tuple[CharacterPoolConfig, WeaponPoolConfig, PlayerInfo]:
+    """从 scenario_dict 的结果（或其JSON）还原 (角色池配置, 武器池配置, 玩家信息)，缺少的部分使用默认值"""
+    return (config_from_dict(CharacterPoolConfig, scenario.get('character_pool', {})),
+            config_from_dict(WeaponPoolConfig, scenario.get('weapon_pool', {})),
+            config_from_dict(PlayerInfo, scenario.get('player', {})))
+
+
+def scenario_hash(character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                  player_info: PlayerInfo) -> str:
+    """计算模拟场景（卡池配置+玩家信息）的哈希，用于确认归档、检查点等文件属于同一场景"""
+    scenario = scenario_dict(character_pool_config, weapon_pool_config, player_info)
+    text = json.dumps(scenario, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ResultArchiveWriter:
+    """结果归档写入器
+
+    用法:
+        with ResultArchiveWriter('results.gra', scenario_hash(...)) as writer:
+            for i in range(runs):
+                writer.append(simulator.simulate(seed=seed, run_index=i), seed)
+    """
+
+    def __init__(self, path: str, scenario: str, chunk_size: int = 1 << 16, metadata: Optional[Dict] = None,
+                 resume_count: Optional[int] = None):
+        """
+        参数:
+            path: 归档文件路径，已存在时覆盖
+            scenario: 场景哈希，见 scenario_hash
+            chunk_size: 每块的记录数
+            metadata: 额外写入文件头的元数据（需可序列化为JSON）
+            resume_count: 续写已有的归档：保留前 resume_count 条记录（如检查点记录的条数），截断其后的记录
+        """
+        self.path = path
+        self.scenario = scenario
+        self.metadata = dict(metadata or {})
+        self._count = 0
+        self._buffer = np.zeros(chunk_size, dtype=ARCHIVE_DTYPE)
+        self._buffered = 0
+        if resume_count is not None:
+            existing = ResultArchive(path)
+            if existing.scenario != scenario:
+                raise ValueError(f"{path} 属于另一个模拟场景，无法续写")
+            if len(existing) < resume_count:
+                raise ValueError(f"{path} 只有 {len(existing)} 条记录，少于要保留的 {resume_count} 条")
+            del existing
+            self._count = resume_count
+            with open(path, 'r+b') as f:
+                f.truncate(ARCHIVE_HEADER_SIZE + resume_count * ARCHIVE_DTYPE.itemsize)
+        else:
+            with open(path, 'wb') as f:
+                f.write(b'\0' * ARCHIVE_HEADER_SIZE)
+        self._write_header()
+
+    def __len__(self) -> int:
+        return self._count + self._buffered
+
+    def append(self, result: Dict, seed: int):
+        """追加一次模拟的结果字典（需带'模拟编号'，否则按已追加的记录数编号）"""
+        self._buffer[self._buffered] = result_row(result, len(self)) + (seed,)
+        self._buffered += 1
+        if self._buffered == len(self._buffer):
+            self.flush()
+
+    def append_records(self, records: np.ndarray, seed: int):
+        """追加 RESULT_DTYPE 结果记录数组（如编译型引擎的输出）"""
+        start = 0
+        while start < len(records):
+            step = min(len(records) - start, len(self._buffer) - self._buffered)
+            target = self._buffer[self._buffered:self._buffered + step]
+            for name in RESULT_DTYPE.names:
+                target[name] = records[name][start:start + step]
+            target['seed'] = seed
+            self._buffered += step
+            start += step
+            if self._buffered == len(self._buffer):
+                self.flush()
+
+    def flush(self):
+        """将缓冲区作为一块写入文件并更新文件头"""
+        if not self._buffered:
+            return
+        offset = ARCHIVE_HEADER_SIZE + self._count * ARCHIVE_DTYPE.itemsize
+        with open(self.path, 'r+b') as f:
+            f.truncate(offset + self._buffered * ARCHIVE_DTYPE.itemsize)
+        chunk = np.memmap(self.path, dtype=ARCHIVE_DTYPE, mode='r+', offset=offset, shape=(self._buffered,))
+        chunk[:] = self._buffer[:self._buffered]
+        chunk.flush()
+        del chunk
+        self._count += self._buffered
+        self._buffered = 0
+        self._write_header()
+
+    def _write_header(self):
+        """写入文件头（记录数只包含已落盘的块）"""
+        metadata = json.dumps({
+            'dtype': ARCHIVE_DTYPE.descr,
+            'scenario_hash': self.scenario,
+            'failure_reasons': FAILURE_REASONS,
+            **self.metadata,
+        }, ensure_ascii=False).encode('utf-8')
+        if _HEADER_PREFIX.size + len(metadata) > ARCHIVE_HEADER_SIZE:
+            raise ValueError("归档元数据超出文件头长度")
+        with open(self.path, 'r+b') as f:
+            f.write(_HEADER_PREFIX.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, self._count, len(metadata)))
+            f.write(metadata)
+
+    def close(self):
+        """写入剩余的缓冲区"""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ResultArchive:
+    """结果归档读取器，记录以内存映射方式按需加载"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            magic, version, count, metadata_length = _HEADER_PREFIX.unpack(f.read(_HEADER_PREFIX.size))
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError(f"{path} 不是结果归档文件")
+            if version != ARCHIVE_VERSION:
+                raise ValueError(f"不支持的归档文件版本: {version}")
+            self.metadata = json.loads(f.read(metadata_length).decode('utf-8'))
+        self.path = path
+        self.scenario = self.metadata['scenario_hash']
+        if count:
+            self.records = np.memmap(path, dtype=ARCHIVE_DTYPE, mode='r', offset=ARCHIVE_HEADER_SIZE,
+                                     shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=ARCHIVE_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def chunks(self, chunk_size: int = 1 << 20) -> Iterator[np.ndarray]:
+        """按块遍历记录，每块是内存映射上的视图"""
+        for start in range(0, len(self.records), chunk_size):
+            yield self.records[start:start + chunk_size]
+
+    def results(self, start: int = 0, stop: Optional[int] = None) -> List[Dict]:
+        """将一段记录转换为结果字典列表（只适合小范围查看）"""
+        return results_from_records(self.records[start:stop][list(RESULT_DTYPE.names)])
+
+    def histogram(self, chunk_size: int = 1 << 20) -> 'ResultHistogram':
+        """按块累加整个归档的结果直方图"""
+        histogram = ResultHistogram()
+        for chunk in self.chunks(chunk_size):
+            histogram.add_records(chunk)
+        return histogram
+
+    def to_csv(self, path: str, chunk_size: int = 1 << 20):
+        """按块导出为CSV，列名与结果字典的键一致"""
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow([column for column, _ in _EXPORT_COLUMNS])
+            for chunk in self.chunks(chunk_size):
+                columns = [chunk[field].tolist() for _, field in _EXPORT_COLUMNS]
+                reasons = columns[-1]
+                columns[-1] = [FAILURE_REASONS[code] for code in reasons]
+                writer.writerows(zip(*columns))
+
+    def to_parquet(self, path: str, chunk_size: int = 1 << 20):
+        """按块导出为Parquet（需要安装 pyarrow）"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("导出Parquet需要安装 pyarrow: pip install pyarrow") from None
+        writer = None
+        try:
+            for chunk in self.chunks(chunk_size):
+                arrays = {column: np.ascontiguousarray(chunk[field]) for column, field in _EXPORT_COLUMNS}
+                arrays['失败原因'] = pa.DictionaryArray.from_arrays(
+                    arrays['失败原因'].astype(np.int32), pa.array(FAILURE_REASONS))
+                table = pa.table(arrays)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+class ResultHistogram:
+    """结果直方图：按字段统计每个取值的次数及其中成功的次数
+
+    可以从结果字典列表、结果记录数组或归档按块构建，多个直方图可以合并（如分批/分片模拟的结果）。
+    绘图函数基于直方图计算累积分布，结果规模只影响构建时间。
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.successes = 0
+        self.failure_counts = np.zeros(len(FAILURE_REASONS), dtype=np.int64)
+        empty = np.zeros(0, dtype=np.int64)
+        self._values = {field: empty for field in HISTOGRAM_FIELDS}
+        self._counts = {field: empty for field in HISTOGRAM_FIELDS}
+        self._success_counts = {field: empty for field in HISTOGRAM_FIELDS}
+
+    @classmethod
+    def from_results(cls, results: List[Dict]) -> 'ResultHistogram':
+        """从结果字典列表构建"""
+        histogram = cls()
+        histogram.add_records(records_from_results(results))
+        return histogram
+
+    def add_records(self, records: np.ndarray):
+        """累加一块结果记录（RESULT_DTYPE 或 ARCHIVE_DTYPE）"""
+        success = records['success']
+        self.runs += len(records)
+        self.successes += int(np.count_nonzero(success))
+        self.failure_counts += np.bincount(records['failure_reason'], minlength=len(FAILURE_REASONS))
+        for field in HISTOGRAM_FIELDS:
+            values, inverse = np.unique(records[field], return_inverse=True)
+            counts = np.bincount(inverse, minlength=len(values))
+            success_counts = np.bincount(inverse, weights=success, minlength=len(values)).astype(np.int64)
+            self._merge_field(field, values, counts, success_counts)
+
+    def _merge_field(self, field: str, values: np.ndarray, counts: np.ndarray, success_counts: np.ndarray):
+        """把一组 (取值, 次数, 成功次数) 合并进字段的直方图"""
+        merged, inverse = np.unique(np.concatenate([self._values[field], values]), return_inverse=True)
+        weights = np.concatenate([self._counts[field], counts])
+        success_weights = np.concatenate([self._success_counts[field], success_counts])
+        self._values[field] = merged
+        self._counts[field] = np.bincount(inverse, weights=weights, minlength=len(merged)).astype(np.int64)
+        self._success_counts[field] = np.bincount(inverse, weights=success_weights,
+                                                  minlength=len(merged)).astype(np.int64)
+
+    def merge(self, other: 'ResultHistogram'):
+        """合并另一个直方图"""
+        self.runs += other.runs
+        self.successes += other.successes
+        self.failure_counts += other.failure_counts
+        for field in HISTOGRAM_FIELDS:
+            self._merge_field(field, other._values[field], other._counts[field], other._success_counts[field])
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """导出为数组字典（可用 np.savez 保存），见 from_arrays"""
+        arrays = {
+            'runs': np.array(self.runs, dtype=np.int64),
+            'successes': np.array(self.successes, dtype=np.int64),
+            'failure_counts': self.failure_counts,
+        }
+        for field in HISTOGRAM_FIELDS:
+            arrays[f'{field}.values'] = self._values[field]
+            arrays[f'{field}.counts'] = self._counts[field]
+            arrays[f'{field}.success_counts'] = self._success_counts[field]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays) -> 'ResultHistogram':
+        """从 to_arrays 导出的数组字典（或 np.load 打开的 npz 文件）恢复"""
+        histogram = cls()
+        histogram.runs = int(arrays['runs'])
+        histogram.successes = int(arrays['successes'])
+        # 旧文件的失败原因可能少于当前的 FAILURE_REASONS，缺少的原因计为0
+        failure_counts = np.array(arrays['failure_counts'], dtype=np.int64)
+        histogram.failure_counts[:len(failure_counts)] = failure_counts
+        for field in HISTOGRAM_FIELDS:
+            histogram._values[field] = np.array(arrays[f'{field}.values'], dtype=np.int64)
+            histogram._counts[field] = np.array(arrays[f'{field}.counts'], dtype=np.int64)
+            histogram._success_counts[field] = np.array(arrays[f'{field}.success_counts'], dtype=np.int64)
+        return histogram
+
+    def distribution(self, field: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """返回字段的 (升序取值, 次数, 成功次数)"""
+        return self._values[field], self._counts[field], self._success_counts[field]
+
+    def mean(self, field: str) -> float:
+        """字段均值"""
+        values, counts, _ = self.distribution(field)
+        return float(np.dot(values, counts) / counts.sum()) if len(counts) else 0.0
+
+    def quantile(self, field: str, q: float) -> float:
+        """字段分位数，与 np.quantile 默认的线性插值一致"""
+        values, counts, _ = self.distribution(field)
+        if not len(counts):
+            return 0.0
+        position = q * (counts.sum() - 1)
+        lower = self.value_at(field, int(np.floor(position)))
+        upper = self.value_at(field, int(np.ceil(position)))
+        return float(lower + (upper - lower) * (position - np.floor(position)))
+
+    def value_at(self, field: str, index: int) -> int:
+        """所有结果按字段升序排列后第 index 个（从0开始）的取值，即 sorted(...)[index]"""
+        values, counts, _ = self.distribution(field)
+        return int(values[np.searchsorted(np.cumsum(counts), index, side='right')])
+
+    def median(self, field: str) -> float:
+        """字段中位数，与 np.median 一致"""
+        return self.quantile(field, 0.5)
+
+    def failure_reasons(self) -> Dict[str, int]:
+        """失败原因计数"""
+        return {FAILURE_REASONS[code]: int(count) for code, count in enumerate(self.failure_counts)
+                if code and count}
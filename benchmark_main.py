@@ -0,0 +1,447 @@
+"""
+性能基准测试 - 测量抽卡引擎、统计分析和绘图的吞吐量以及程序启动耗时，并与保存的基线比较
+
+用法:
+    python benchmark_main.py                         # 运行默认规模并与基线比较
+    python benchmark_main.py --scale full            # 包含100万次模拟的完整规模（参考实现和跳跃式引擎最多10万次）
+    python benchmark_main.py --save-baseline         # 将本次结果保存为新基线
+    python benchmark_main.py --filter micro.         # 只运行名称以 micro. 开头的基准
+    python benchmark_main.py --filter startup.       # 只测量启动耗时（每项在新的子进程中运行）
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from config import (CharacterPoolConfig, WeaponPoolConfig, PlayerInfo, CharacterRuntimeInfo,
+                    WeaponRuntimeInfo)
+from character_gacha_utils import (perform_single_character_pull, perform_ten_character_pulls,
+                                   get_six_star_character_by_probability)
+from weapon_gacha_utils import (perform_ten_weapon_pulls, get_six_star_weapon_by_probability,
+                                combined_character_weapon_simulation)
+from scalar_gacha_utils import ScalarSimulator
+from rng_utils import run_streams
+
+
+DEFAULT_BASELINE_PATH = 'benchmark_baseline.json'
+DEFAULT_THRESHOLD = 0.20  # 比基线慢20%以上视为性能回退
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 各规模下宏观基准的模拟次数
+SCALES = {
+    'quick': [1000],
+    'default': [1000, 100000],
+    'full': [1000, 100000, 1000000],
+}
+# 参考实现和跳跃式引擎每次模拟较慢，宏观基准的模拟次数不超过此值，更大规模只测标量引擎和jit引擎
+SLOW_ENGINE_MAX_RUNS = 100000
+# 绘图基准的结果数量（结果先汇总为按取值计数的直方图，耗时随规模近似线性增长）
+PLOT_SIZES = {
+    'quick': [1000],
+    'default': [1000, 5000],
+    'full': [1000, 5000, 20000, 50000],
+}
+
+
+@dataclass
+class Benchmark:
+    """单个基准测试"""
+
+    name: str  # 基准名称，形如 group.case[.size]
+    setup: Callable[[], Callable[[], Optional[float]]]  # 准备函数，返回被计时的无参函数；
+                                                       # 被计时函数返回秒数时以返回值为准（子进程内部计时）
+    operations: int = 1  # 被计时函数每次调用包含的操作数（抽卡次数/模拟次数）
+    repeat: int = 5  # 重复次数，取最快的一次
+
+
+@dataclass
+class BenchmarkResult:
+    """基准测试结果"""
+
+    name: str
+    seconds_per_operation: float
+    operations_per_second: float
+    total_seconds: float
+
+
+def representative_profiles() -> Dict[str, PlayerInfo]:
+    """代表性的玩家配置"""
+    return {
+        '单限定': PlayerInfo(character_goals={"限定": 1}, weapon_goals={"限定武器": 1}),
+        '双限定': PlayerInfo(character_goals={"限定": 2}, weapon_goals={"限定武器": 1}),
+        '直接购买配额': PlayerInfo(character_goals={"限定": 1}, weapon_goals={"限定武器": 2},
+                               is_character_pull_enabled_on_low_quota=False),
+        '凭证加上限': PlayerInfo(got_six_star_character_in_next_pulls=30, character_total_pulls_used=20,
+                             character_ten_pulls_available=2, character_urgent_ten_pulls_available=1,
+                             initial_weapon_quota=3000, character_goals={"限定": 2},
+                             weapon_goals={"限定武器": 1}, character_pull_limit=160, weapon_pull_limit=8),
+    }
+
+
+def _micro_benchmarks() -> List[Benchmark]:
+    """微观基准：单个抽卡函数"""
+    character_pool_config = CharacterPoolConfig()
+    weapon_pool_config = WeaponPoolConfig()
+    player_info = PlayerInfo()
+    player_info.compute_internal_state(character_pool_config)
+    loops = 20000
+
+    def single_character_pull():
+        runtime_info = CharacterRuntimeInfo.from_player_info(player_info, character_pool_config)
+        obtained_six_stars = []
+
+        def run():
+            for _ in range(loops):
+                perform_single_character_pull(character_pool_config, runtime_info, obtained_six_stars)
+            obtained_six_stars.clear()
+        return run
+
+    def ten_character_pulls():
+        runtime_info = CharacterRuntimeInfo.from_player_info(player_info, character_pool_config)
+
+        def run():
+            for _ in range(loops // 10):
+                perform_ten_character_pulls(character_pool_config, runtime_info)
+        return run
+
+    def ten_weapon_pulls():
+        runtime_info = WeaponRuntimeInfo.from_player_info(player_info)
+
+        def run():
+            runtime_info.weapon_quota = weapon_pool_config.weapon_quota_cost_per_ten_pull * (loops // 10)
+            for _ in range(loops // 10):
+                perform_ten_weapon_pulls(weapon_pool_config, runtime_info)
+        return run
+
+    def six_star_character():
+        def run():
+            for _ in range(loops):
+                get_six_star_character_by_probability(character_pool_config)
+        return run
+
+    def six_star_weapon():
+        def run():
+            for _ in range(loops):
+                get_six_star_weapon_by_probability(weapon_pool_config)
+        return run
+
+    def run_streams_setup():
+        def run():
+            for run_index in range(loops // 100):
+                character_rng, weapon_rng = run_streams(0, run_index)
+                for _ in range(100):
+                    character_rng.random()
+        return run
+
+    return [
+        Benchmark('micro.perform_single_character_pull', single_character_pull, loops),
+        Benchmark('micro.perform_ten_character_pulls', ten_character_pulls, loops // 10),
+        Benchmark('micro.perform_ten_weapon_pulls', ten_weapon_pulls, loops // 10),
+        Benchmark('micro.get_six_star_character_by_probability', six_star_character, loops),
+        Benchmark('micro.get_six_star_weapon_by_probability', six_star_weapon, loops),
+        Benchmark('micro.run_streams', run_streams_setup, loops // 100),
+    ]
+
+
+def _macro_benchmarks(scale: str) -> List[Benchmark]:
+    """宏观基准：不同玩家配置下的完整综合模拟"""
+    character_pool_config = CharacterPoolConfig()
+    weapon_pool_config = WeaponPoolConfig()
+    benchmarks = []
+
+    for profile_name, player_info in representative_profiles().items():
+        player_info.compute_internal_state(character_pool_config)
+        for runs in SCALES[scale]:
+            def python_engine(player_info=player_info, runs=runs):
+                def run():
+                    for _ in range(runs):
+                        combined_character_weapon_simulation(character_pool_config, weapon_pool_config, player_info)
+                return run
+
+            def scalar_engine(player_info=player_info, runs=runs):
+                simulator = ScalarSimulator(character_pool_config, weapon_pool_config, player_info)
+
+                def run():
+                    for _ in range(runs):
+                        simulator.run()
+                return run
+
+            def event_engine(player_info=player_info, runs=runs):
+                from event_gacha_utils import EventSimulator
+                simulator = EventSimulator(character_pool_config, weapon_pool_config, player_info)
+
+                def run():
+                    for _ in range(runs):
+                        simulator.run()
+                return run
+
+            def jit_engine(player_info=player_info, runs=runs):
+                from jit_gacha_utils import combined_character_weapon_simulation_batch
+                # 预热，排除编译时间
+                combined_character_weapon_simulation_batch(character_pool_config, weapon_pool_config,
+                                                           player_info, 10, seed=0)
+
+                def run():
+                    combined_character_weapon_simulation_batch(character_pool_config, weapon_pool_config,
+                                                               player_info, runs, seed=0)
+                return run
+
+            repeat = 3 if runs <= 1000 else 1
+            if runs <= SLOW_ENGINE_MAX_RUNS:
+                benchmarks.append(Benchmark(f'macro.python.{profile_name}.{runs}', python_engine, runs, repeat))
+            benchmarks.append(Benchmark(f'macro.scalar.{profile_name}.{runs}', scalar_engine, runs, repeat))
+            if runs <= SLOW_ENGINE_MAX_RUNS:
+                benchmarks.append(Benchmark(f'macro.event.{profile_name}.{runs}', event_engine, runs, repeat))
+            benchmarks.append(Benchmark(f'macro.jit.{profile_name}.{runs}', jit_engine, runs, repeat))
+    return benchmarks
+
+
+def _plot_benchmarks(scale: str, output_dir: str) -> List[Benchmark]:
+    """绘图基准：两个绘图函数"""
+    character_pool_config = CharacterPoolConfig()
+    weapon_pool_config = WeaponPoolConfig()
+    player_info = representative_profiles()['双限定']
+    player_info.compute_internal_state(character_pool_config)
+    benchmarks = []
+    results_cache = {}  # 两个绘图基准共用同一规模的模拟结果，大规模时生成结果比出图更慢
+
+    for size in PLOT_SIZES[scale]:
+        def make_results(size=size):
+            if size not in results_cache:
+                random.seed(0)
+                results_cache.clear()
+                results_cache[size] = [combined_character_weapon_simulation(character_pool_config,
+                                                                            weapon_pool_config, player_info)
+                                       for _ in range(size)]
+            return results_cache[size]
+
+        def pie(size=size):
+            from analysis_utils import plot_success_failure_pie
+            results = make_results(size)
+            success_count = sum(1 for r in results if r['成功'])
+
+            def run():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    plot_success_failure_pie(success_count, len(results) - success_count,
+                                             save_path=os.path.join(output_dir, 'pie.png'), results=results)
+            return run
+
+        def distributions(size=size):
+            from analysis_utils import plot_combined_distributions
+            results = make_results(size)
+            success_rate = sum(1 for r in results if r['成功']) / len(results) * 100
+
+            def run():
+                plot_combined_distributions(results, success_rate, save_prefix=os.path.join(output_dir, 'combined'))
+            return run
+
+        benchmarks.append(Benchmark(f'plot.plot_success_failure_pie.{size}', pie, size, 1))
+        benchmarks.append(Benchmark(f'plot.plot_combined_distributions.{size}', distributions, size, 1))
+    return benchmarks
+
+
+def _run_python(code: str) -> str:
+    """在新的解释器进程中执行代码，返回标准输出"""
+    completed = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_DIR, capture_output=True,
+                               text=True, encoding='utf-8', check=True)
+    return completed.stdout
+
+
+def _startup_benchmarks(output_dir: str) -> List[Benchmark]:
+    """启动基准：冷启动导入各入口模块的耗时，以及首次出图耗时（有无预热）"""
+    def run_code(code: str):
+        def setup():
+            def run():
+                _run_python(code)
+            return run
+        return setup
+
+    def first_plot(warm: bool):
+        save_path = os.path.join(output_dir, 'startup_pie.png')
+        code = (
+            'import time, analysis_utils\n'
+            + ('analysis_utils.warm_up()\n' if warm else '')
+            + 'start = time.perf_counter()\n'
+            f'analysis_utils.plot_success_failure_pie(60, 40, save_path={save_path!r})\n'
+            'print(time.perf_counter() - start)\n'
+        )
+
+        def setup():
+            return lambda: float(_run_python(code).split()[-1])
+        return setup
+
+    benchmarks = [Benchmark('startup.python', run_code('pass'), 1, 3)]
+    for module in ('ui_main', 'character_weapon_main', 'weapon_gacha_utils', 'analysis_utils', 'jit_gacha_utils'):
+        benchmarks.append(Benchmark(f'startup.import.{module}', run_code(f'import {module}'), 1, 3))
+    benchmarks.append(Benchmark('startup.first_plot.cold', first_plot(False), 1, 3))
+    benchmarks.append(Benchmark('startup.first_plot.warm', first_plot(True), 1, 3))
+    return benchmarks
+
+
+def collect_benchmarks(scale: str, output_dir: str) -> List[Benchmark]:
+    """收集指定规模下的所有基准"""
+    return (_startup_benchmarks(output_dir) + _micro_benchmarks() + _macro_benchmarks(scale)
+            + _plot_benchmarks(scale, output_dir))
+
+
+def run_benchmark(benchmark: Benchmark) -> BenchmarkResult:
+    """运行单个基准，重复多次取最快的一次"""
+    random.seed(0)
+    function = benchmark.setup()
+    timings = []
+    for _ in range(benchmark.repeat):
+        start = time.perf_counter()
+        reported = function()
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed if reported is None else reported)
+    best = min(timings)
+    return BenchmarkResult(
+        name=benchmark.name,
+        seconds_per_operation=best / benchmark.operations,
+        operations_per_second=benchmark.operations / best if best > 0 else float('inf'),
+        total_seconds=sum(timings),
+    )
+
+
+def environment_info() -> Dict[str, str]:
+    """记录运行环境，便于判断基线是否可比"""
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = ''
+    import numpy
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': str(os.cpu_count()),
+        'numpy': numpy.__version__,
+        'numba': numba_version,
+    }
+
+
+def load_baseline(path: str) -> Optional[Dict]:
+    """读取基线文件，不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: List[BenchmarkResult]):
+    """保存基线文件，已存在的其他基准条目会被保留"""
+    baseline = load_baseline(path) or {'benchmarks': {}}
+    baseline['environment'] = environment_info()
+    baseline['created'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    for result in results:
+        baseline['benchmarks'][result.name] = {
+            'seconds_per_operation': result.seconds_per_operation,
+        }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+
+
+def compare_with_baseline(results: List[BenchmarkResult], baseline: Dict,
+                          threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """与基线比较，返回性能回退的基准名称列表
+
+    参数:
+        results: 本次运行结果
+        baseline: 基线数据
+        threshold: 允许的相对变慢比例
+
+    返回:
+        变慢超过阈值的基准名称
+    """
+    regressions = []
+    for result in results:
+        entry = baseline['benchmarks'].get(result.name)
+        if entry is None:
+            continue
+        ratio = result.seconds_per_operation / entry['seconds_per_operation']
+        if ratio > 1.0 + threshold:
+            regressions.append(result.name)
+    return regressions
+
+
+def format_results(results: List[BenchmarkResult], baseline: Optional[Dict] = None) -> str:
+    """格式化结果表格"""
+    lines = [f"{'基准':<56}{'单次耗时':>14}{'吞吐量(/s)':>16}{'相对基线':>12}"]
+    for result in results:
+        relative = ''
+        if baseline is not None and result.name in baseline['benchmarks']:
+            ratio = result.seconds_per_operation / baseline['benchmarks'][result.name]['seconds_per_operation']
+            relative = f'{ratio:.2f}x'
+        lines.append(f'{result.name:<56}{_format_seconds(result.seconds_per_operation):>14}'
+                     f'{result.operations_per_second:>16.1f}{relative:>12}')
+    return '\n'.join(lines)
+
+
+def _format_seconds(seconds: float) -> str:
+    """将秒数格式化为合适的单位"""
+    if seconds >= 1:
+        return f'{seconds:.3f} s'
+    if seconds >= 1e-3:
+        return f'{seconds * 1e3:.3f} ms'
+    return f'{seconds * 1e6:.3f} us'
+
+
+def main(argv: List[str] = None) -> int:
+    """主函数，存在性能回退时返回1"""
+    parser = argparse.ArgumentParser(description='抽卡模拟器性能基准测试')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='default', help='宏观基准规模')
+    parser.add_argument('--filter', default='', help='只运行名称以此开头的基准')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='基线文件路径')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基线')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='判定回退的相对变慢比例')
+    parser.add_argument('--output', default='', help='将本次结果另存为JSON')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for benchmark in collect_benchmarks(args.scale, output_dir):
+            if not benchmark.name.startswith(args.filter):
+                continue
+            result = run_benchmark(benchmark)
+            results.append(result)
+            print(f'{result.name}: {_format_seconds(result.seconds_per_operation)}', file=sys.stderr)
+
+    baseline = load_baseline(args.baseline)
+    print(format_results(results, baseline))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment_info(),
+                       'benchmarks': {r.name: {'seconds_per_operation': r.seconds_per_operation}
+                                      for r in results}}, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f'基线已保存至: {args.baseline}')
+        return 0
+
+    if baseline is None:
+        print(f'未找到基线文件 {args.baseline}，使用 --save-baseline 创建')
+        return 0
+
+    regressions = compare_with_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f'\n性能回退（慢于基线 {args.threshold:.0%} 以上）:')
+        for name in regressions:
+            print(f'  - {name}')
+        return 1
+    print('\n未发现性能回退')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+自助法置信区间模块 - 在结果直方图上做多项分布重抽样，给出累积分布的置信带和成功率、均值的置信区间
+
+对 n 次模拟的结果有放回地重抽 n 次，等价于按各取值的经验频率做一次 n 次的多项分布抽样。
+因此重抽样直接在直方图的整数计数上进行：每个重复样本是一个计数向量，所有重复样本一次生成，
+累积分布和分位数沿 (重复样本, 取值) 两个轴向量化计算，不需要逐个处理结果字典。
+计算量只取决于重复样本数和不同取值的个数，与模拟次数无关。
+"""
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+
+
+DEFAULT_REPLICATES = 1000  # 默认重复样本数
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SEED = 0  # 默认使用固定种子，同一结果的置信带可复现
+
+
+@dataclass
+class CdfBand:
+    """累积分布的逐点置信带"""
+
+    values: np.ndarray  # 升序取值
+    low: np.ndarray  # 各取值处累积概率（%）的置信下限
+    high: np.ndarray  # 各取值处累积概率（%）的置信上限
+    confidence: float
+    replicates: int
+
+
+@dataclass
+class Interval:
+    """统计量（成功率、均值）的置信区间"""
+
+    estimate: float  # 样本上的统计量
+    low: float
+    high: float
+    confidence: float
+    replicates: int
+
+    def format(self, spec: str = '.2%') -> str:
+        """格式化为"估计 ± 半宽（置信区间）"的文本，spec 为数值格式，默认百分数"""
+        half_width = max(self.estimate - self.low, self.high - self.estimate)
+        return (f"{self.estimate:{spec}} ± {half_width:{spec}}"
+                f"（{self.confidence:.0%} 置信区间 {self.low:{spec}} - {self.high:{spec}}）")
+
+
+def resample_counts(counts: np.ndarray, replicates: int, rng: np.random.Generator) -> np.ndarray:
+    """按计数的经验频率做多项分布重抽样
+
+    参数:
+        counts: 各取值的次数
+        replicates: 重复样本数
+        rng: 随机数生成器
+
+    返回:
+        (重复样本数, 取值个数) 的计数矩阵，每行之和等于 counts 之和
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros((replicates, len(counts)), dtype=np.int64)
+    return rng.multinomial(total, counts / total, size=replicates)
+
+
+def _quantiles(samples: np.ndarray, confidence: float):
+    """沿重复样本轴取百分位区间的上下限"""
+    alpha = 1 - confidence
+    return np.quantile(samples, [alpha / 2, 1 - alpha / 2], axis=0)
+
+
+def cdf_band(histogram, field: str, replicates: int = DEFAULT_REPLICATES,
+             confidence: float = DEFAULT_CONFIDENCE, seed: Optional[int] = DEFAULT_SEED) -> CdfBand:
+    """结果直方图中一个字段的累积分布置信带（百分位自助法，逐点）
+
+    参数:
+        histogram: archive_utils.ResultHistogram
+        field: 字段名，如 'character_pulls'
+        replicates: 重复样本数
+        confidence: 置信水平
+        seed: 重抽样的随机种子，None表示随机
+    """
+    values, counts, _ = histogram.distribution(field)
+    samples = resample_counts(counts, replicates, np.random.default_rng(seed))
+    cdf = np.cumsum(samples, axis=1) / max(int(counts.sum()), 1) * 100
+    low, high = _quantiles(cdf, confidence)
+    return CdfBand(values, low, high, confidence, replicates)
+
+
+def success_rate_interval(histogram, replicates: int = DEFAULT_REPLICATES,
+                          confidence: float = DEFAULT_CONFIDENCE,
+                          seed: Optional[int] = DEFAULT_SEED) -> Interval:
+    """结果直方图的成功率置信区间（成功/失败两格的多项分布重抽样）
+
+    参数:
+        histogram: archive_utils.ResultHistogram
+        replicates: 重复样本数
+        confidence: 置信水平
+        seed: 重抽样的随机种子，None表示随机
+    """
+    runs = histogram.runs
+    if runs == 0:
+        return Interval(0.0, 0.0, 1.0, confidence, replicates)
+    samples = resample_counts(np.array([histogram.successes, runs - histogram.successes]), replicates,
+                              np.random.default_rng(seed))[:, 0] / runs
+    low, high = _quantiles(samples, confidence)
+    return Interval(histogram.successes / runs, float(low), float(high), confidence, replicates)
+
+
+def mean_interval(histogram, field: str, replicates: int = DEFAULT_REPLICATES,
+                  confidence: float = DEFAULT_CONFIDENCE, seed: Optional[int] = DEFAULT_SEED) -> Interval:
+    """结果直方图中一个字段均值的置信区间
+
+    参数:
+        histogram: archive_utils.ResultHistogram
+        field: 字段名，如 'character_pulls'
+        replicates: 重复样本数
+        confidence: 置信水平
+        seed: 重抽样的随机种子，None表示随机
+    """
+    values, counts, _ = histogram.distribution(field)
+    total = int(counts.sum())
+    if total == 0:
+        return Interval(0.0, 0.0, 0.0, confidence, replicates)
+    samples = resample_counts(counts, replicates, np.random.default_rng(seed)) @ values.astype(np.float64) / total
+    low, high = _quantiles(samples, confidence)
+    return Interval(float(np.dot(values, counts) / total), float(low), float(high), confidence, replicates)
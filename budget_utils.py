@@ -0,0 +1,239 @@
+"""
+预算分配优化模块 - 固定预算下，在"付费抽角色池（顺带获得武器配额）"和"直接购买武器配额"之间寻找成功率最高的分配
+
+策略空间:
+- 抽角色换配额：角色池付费抽数上限为 N（在十连凭证之外），剩余预算全部预先购买配额，
+  配额不足时继续抽角色池（is_character_pull_enabled_on_low_quota 开启）；N 在网格上取值
+- 直接购买：角色池只为角色目标而抽，配额不足时直接购买（is_character_pull_enabled_on_low_quota 关闭）
+
+两类策略都要求付费抽数和购买配额的总花费不超过预算才算成功（强制十连时最后一次十连可能越过抽数上限）。
+
+所有策略使用相同的种子和模拟编号（公共随机数），策略之间的差异不被抽样噪声淹没。
+搜索采用逐次减半：所有策略先各模拟一小批，每轮淘汰成功率较低的一半，幸存者的模拟次数翻倍，
+只有最后的少数策略会模拟到最大次数。每个策略已模拟的结果会被缓存，后续轮次和之后的优化只补算新增的编号。
+"""
+import copy
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+from rng_utils import new_seed
+from stats_utils import wilson_interval
+
+
+_TRAJECTORY_CACHE_SIZE = 64  # 最多缓存多少个策略的模拟结果
+
+
+@dataclass
+class Budget:
+    """预算与价格，三者使用同一种货币单位（如合成玉）"""
+
+    total: float  # 总预算
+    quota_cost: float  # 每单位武器配额的价格
+    pull_cost: float = 1.0  # 每次角色池付费单抽的价格
+
+    def __post_init__(self):
+        if self.total < 0:
+            raise ValueError(f"预算不能为负数: {self.total}")
+        if self.quota_cost <= 0 or self.pull_cost <= 0:
+            raise ValueError("配额价格和单抽价格必须为正数")
+
+    @property
+    def max_paid_pulls(self) -> int:
+        """全部预算都用于抽角色池时的付费抽数"""
+        return int(self.total // self.pull_cost)
+
+    def quota_for(self, paid_pulls: int) -> int:
+        """付费抽数为 paid_pulls 时，剩余预算可以购买的配额"""
+        return int((self.total - paid_pulls * self.pull_cost) // self.quota_cost)
+
+
+@dataclass(frozen=True)
+class BudgetStrategy:
+    """一种预算分配策略"""
+
+    paid_pull_cap: int  # 角色池付费抽数上限
+    purchased_quota: int  # 预先购买的武器配额（直接购买策略为0，按需购买）
+    low_quota_character_pull: bool  # 配额不足时是否抽角色池，False 即直接购买策略
+
+    def describe(self) -> str:
+        """一行中文说明"""
+        if self.low_quota_character_pull:
+            return f"角色池付费抽数上限 {self.paid_pull_cap}，预先购买配额 {self.purchased_quota}，配额不足时抽角色池"
+        return f"角色池付费抽数上限 {self.paid_pull_cap}，配额不足时直接购买"
+
+    def player_info(self, player_info: PlayerInfo) -> PlayerInfo:
+        """按该策略修改后的玩家信息（抽数上限包含十连凭证的抽数）"""
+        player = copy.deepcopy(player_info)
+        player.character_pull_limit = self.paid_pull_cap + 10 * player_info.character_ten_pulls_available
+        player.initial_weapon_quota = player_info.initial_weapon_quota + self.purchased_quota
+        player.is_character_pull_enabled_on_low_quota = self.low_quota_character_pull
+        return player
+
+    def successes(self, records: np.ndarray, budget: Budget, player_info: PlayerInfo) -> np.ndarray:
+        """结果记录中哪些模拟在预算内达成了目标"""
+        # 抽数上限按十连检查，强制十连时最后一次十连可能超出付费抽数上限，因此所有策略都按实际花费判断
+        # 十连凭证总是先于付费单抽使用，超出凭证抽数的部分才是付费抽数
+        paid_pulls = np.maximum(records['character_pulls'] - 10 * player_info.character_ten_pulls_available, 0)
+        quota = self.purchased_quota + records['extra_quota_purchased']
+        spent = paid_pulls * budget.pull_cost + quota * budget.quota_cost
+        return records['success'] & (spent <= budget.total)
+
+
+@dataclass
+class StrategyEstimate:
+    """一种策略的成功率估计"""
+
+    strategy: BudgetStrategy
+    successes: int
+    runs: int
+
+    @property
+    def success_rate(self) -> float:
+        """成功率"""
+        return self.successes / self.runs if self.runs else 0.0
+
+    def interval(self, confidence: float = 0.95) -> Tuple[float, float]:
+        """成功率的置信区间"""
+        return wilson_interval(self.successes, self.runs, confidence)
+
+
+@dataclass
+class BudgetOptimization:
+    """预算分配优化结果"""
+
+    best: StrategyEstimate  # 成功率最高的策略
+    estimates: List[StrategyEstimate]  # 所有候选策略在被淘汰时（或最终）的估计，按成功率降序
+    seed: int  # 随机种子，相同种子和场景的优化结果可复现
+    simulated_runs: int = 0  # 本次实际新模拟的次数（不含缓存命中）
+    confidence: float = 0.95
+
+    def format(self) -> str:
+        """格式化为多行中文说明"""
+        lower, upper = self.best.interval(self.confidence)
+        lines = [
+            f"最优策略: {self.best.strategy.describe()}",
+            f"成功率: {self.best.success_rate:.2%}（{self.confidence:.0%} 置信区间 {lower:.2%} - {upper:.2%}，"
+            f"{self.best.runs} 次模拟）",
+        ]
+        for estimate in self.estimates[1:6]:
+            lines.append(f"  {estimate.success_rate:.2%}（{estimate.runs} 次）: {estimate.strategy.describe()}")
+        return '\n'.join(lines)
+
+
+def candidate_strategies(budget: Budget, player_info: PlayerInfo, candidates: int = 17) -> List[BudgetStrategy]:
+    """生成候选策略：付费抽数上限在 [0, 全部预算] 上均匀取 candidates 个点，外加直接购买策略
+
+    没有十连凭证时抽数上限为0会被当作"无上限"，因此抽角色换配额的策略至少付费1抽。
+    """
+    max_pulls = budget.max_paid_pulls
+    min_pulls = 0 if player_info.character_ten_pulls_available > 0 else min(1, max_pulls)
+    caps = np.unique(np.linspace(min_pulls, max_pulls, max(candidates, 1)).round().astype(np.int64))
+    strategies = [BudgetStrategy(int(cap), budget.quota_for(int(cap)), True) for cap in caps
+                  if cap > 0 or player_info.character_ten_pulls_available > 0]
+    if max_pulls > 0:
+        strategies.append(BudgetStrategy(max_pulls, 0, False))
+    return strategies
+
+
+_trajectory_cache: Dict[Tuple[str, int], np.ndarray] = {}
+
+
+def _cached_records(key: Tuple[str, int]) -> np.ndarray:
+    """某策略已缓存的结果记录（编号从0开始连续），没有时返回空数组"""
+    from compiled_rules import RESULT_DTYPE
+    records = _trajectory_cache.get(key)
+    return records if records is not None else np.empty(0, dtype=RESULT_DTYPE)
+
+
+def _store_records(key: Tuple[str, int], records: np.ndarray):
+    """缓存某策略的结果记录，超出容量时丢弃最早加入的策略"""
+    _trajectory_cache.pop(key, None)
+    if len(_trajectory_cache) >= _TRAJECTORY_CACHE_SIZE:
+        _trajectory_cache.pop(next(iter(_trajectory_cache)))
+    _trajectory_cache[key] = records
+
+
+def optimize_budget(character_pool_config: CharacterPoolConfig,
+                    weapon_pool_config: WeaponPoolConfig,
+                    player_info: PlayerInfo,
+                    budget: Budget,
+                    candidates: int = 17,
+                    initial_runs: int = 1000,
+                    max_runs: int = 32000,
+                    seed: Optional[int] = None,
+                    confidence: float = 0.95,
+                    parallel: bool = True) -> BudgetOptimization:
+    """用逐次减半和公共随机数搜索成功率最高的预算分配
+
+    参数:
+        character_pool_config: 角色池配置
+        weapon_pool_config: 武器池配置
+        player_info: 玩家信息（内部状态字段需已计算），其中的角色池抽数上限、初始配额和配额不足策略由预算分配决定
+        budget: 预算与价格
+        candidates: 抽角色换配额策略的网格点数
+        initial_runs: 第一轮每个策略的模拟次数
+        max_runs: 每个策略最多模拟的次数，最优策略最终会模拟到这个次数
+        seed: 随机种子，None表示随机生成
+        confidence: 置信区间的置信度
+        parallel: 是否多线程并行
+
+    返回:
+        最优策略及其成功率和置信区间
+    """
+    from archive_utils import scenario_hash
+    from jit_gacha_utils import combined_character_weapon_simulation_scenarios
+    if initial_runs <= 0 or max_runs < initial_runs:
+        raise ValueError(f"模拟次数设置无效: initial_runs={initial_runs}, max_runs={max_runs}")
+    if seed is None:
+        seed = new_seed()
+    strategies = candidate_strategies(budget, player_info, candidates)
+    if not strategies:
+        raise ValueError("预算不足一次付费抽卡，没有可比较的分配策略")
+
+    players = {strategy: strategy.player_info(player_info) for strategy in strategies}
+    keys = {strategy: (scenario_hash(character_pool_config, weapon_pool_config, players[strategy]), seed)
+            for strategy in strategies}
+    records = {strategy: _cached_records(keys[strategy]) for strategy in strategies}
+    simulated_runs = 0
+
+    def evaluate(alive: List[BudgetStrategy], runs: int) -> List[StrategyEstimate]:
+        """把幸存策略补算到 runs 次，缓存中已有的编号直接复用；起点相同的策略在一次多场景批量中模拟"""
+        nonlocal simulated_runs
+        by_start: Dict[int, List[BudgetStrategy]] = {}
+        for strategy in alive:
+            start = len(records[strategy])
+            if start < runs:
+                by_start.setdefault(start, []).append(strategy)
+        for start, group in by_start.items():
+            scenarios = [(character_pool_config, weapon_pool_config, players[strategy]) for strategy in group]
+            batches = combined_character_weapon_simulation_scenarios(
+                scenarios, runs - start, seed=seed, parallel=parallel, first_run=start)
+            for strategy, batch in zip(group, batches):
+                records[strategy] = np.concatenate([records[strategy], batch])
+                _store_records(keys[strategy], records[strategy])
+            simulated_runs += (runs - start) * len(group)
+        return [StrategyEstimate(strategy, int(strategy.successes(records[strategy][:runs], budget, players[strategy])
+                                                .sum()), runs)
+                for strategy in alive]
+
+    # 逐次减半：每轮保留成功率较高的一半，幸存者的模拟次数翻倍
+    alive = strategies
+    runs = initial_runs
+    eliminated: List[StrategyEstimate] = []
+    while True:
+        estimates = sorted(evaluate(alive, runs), key=lambda estimate: estimate.successes, reverse=True)
+        if len(estimates) == 1 or runs >= max_runs:
+            break
+        keep = (len(estimates) + 1) // 2
+        eliminated += estimates[keep:]
+        alive = [estimate.strategy for estimate in estimates[:keep]]
+        runs = min(runs * 2, max_runs)
+
+    best = estimates[0]
+    if best.runs < max_runs:
+        best = evaluate([best.strategy], max_runs)[0]
+        estimates[0] = best
+    ranked = sorted(estimates[1:] + eliminated, key=lambda estimate: estimate.success_rate, reverse=True)
+    return BudgetOptimization(best=best, estimates=[best] + ranked, seed=seed,
+                              simulated_runs=simulated_runs, confidence=confidence)
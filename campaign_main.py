@@ -0,0 +1,32 @@
+"""
+多期连续模拟工具 - 读取规划周期JSON（初始状态、各期卡池、目标、收入和抽取策略），模拟整个周期并输出各期统计
+"""
+import argparse
+import json
+from campaign_utils import campaign_from_dict, run_campaign, DEFAULT_CAMPAIGN_CHUNK
+from rng_utils import new_seed
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='多期卡池连续抽卡模拟')
+    parser.add_argument('path', help='规划周期JSON，格式见 campaign_utils.campaign_from_dict')
+    parser.add_argument('--runs', type=int, default=100000, help='模拟次数')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子，默认随机生成并打印')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CAMPAIGN_CHUNK, metavar='N',
+                        help=f'每块的模拟次数，决定内存占用，默认{DEFAULT_CAMPAIGN_CHUNK}')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+    with open(args.path, encoding='utf-8') as f:
+        campaign = campaign_from_dict(json.load(f))
+    seed = new_seed() if args.seed is None else args.seed
+    print(f"{len(campaign.banners)} 期卡池，模拟 {args.runs} 次，随机种子: {seed}")
+    print(run_campaign(campaign, args.runs, seed=seed, chunk_size=args.chunk_size).format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+多期连续模拟模块 - 按卡池序列和收入计划模拟玩家跨越多期卡池的整个规划周期
+
+单期模拟（combined_character_weapon_simulation）只覆盖一对角色池/武器池。真实的规划跨越多期：
+玩家为两期限定攒抽，小保底累计抽数跨期继承，十连凭证和武器配额随时间到账，每期决定是否抽取。
+
+结转规则:
+- 每期开始时先到账该期的收入（付费抽数、十连凭证、武器配额）
+- 小保底累计抽数、五星保底倒数、武器配额、十连凭证和付费抽数存量结转到下一期
+- 角色池总抽数（大保底、循环保底）、紧急招募和武器池进度每期重新开始；第一期取玩家信息中的初始状态
+- 本期的抽数上限为可用的付费抽数（存量，受 max_paid_pulls 约束）加十连凭证抽数，用掉的付费抽数从存量中扣除
+- 不抽取（pull=False）或可用抽数不足 min_available_pulls 的一期直接跳过，状态原样结转
+
+每次模拟的随机流只由 (种子, 模拟编号, 期号) 决定，第一期与单期模拟逐位一致。
+编译型内核在一次并行批量中完成所有模拟的所有期；未安装 Numba 时使用结果相同的标量引擎。
+"""
+import copy
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo, config_from_dict
+from compiled_rules import (
+    CompiledCampaign, compile_scenarios, FAILURE_REASONS, CAMPAIGN_DTYPE,
+    I_PULLS, I_VOUCHERS, I_QUOTA, N_INCOME, B_PULL, B_MIN_AVAILABLE, B_MAX_PAID, N_BANNER_POLICY,
+)
+from rng_utils import new_seed, run_streams
+
+
+DEFAULT_CAMPAIGN_CHUNK = 1 << 16  # run_campaign 每块的模拟次数，决定内存占用
+
+
+@dataclass
+class Income:
+    """一期开始时到账的收入"""
+
+    pulls: int = 0  # 付费抽数（合成玉等折算为抽数）
+    ten_pull_vouchers: int = 0  # 十连寻访凭证
+    weapon_quota: int = 0  # 武器配额
+
+
+@dataclass
+class Banner:
+    """一期卡池及该期的目标和抽取策略"""
+
+    name: str = ''
+    character_pool_config: CharacterPoolConfig = field(default_factory=CharacterPoolConfig)
+    weapon_pool_config: WeaponPoolConfig = field(default_factory=WeaponPoolConfig)
+    character_goals: Dict[str, int] = field(default_factory=lambda: {"限定": 1})
+    weapon_goals: Dict[str, int] = field(default_factory=dict)
+    income: Income = field(default_factory=Income)  # 本期开始时到账的收入
+    pull: bool = True  # 是否抽取本期，False 表示只攒抽
+    min_available_pulls: int = 0  # 本期开始时可用抽数（付费存量 + 十连凭证×10）不足该值时跳过本期
+    max_paid_pulls: int = 0  # 本期最多使用的付费抽数，0表示不限（仍受存量约束），用于为后续卡池留存
+    character_always_pull_ten: bool = False  # 角色池是否总是十连
+    character_pull_minimum: int = 0  # 角色池抽数下限（如为了60抽的奖励）
+    weapon_pull_limit: int = 0  # 武器池十连次数上限，0表示不限
+    is_character_pull_enabled_on_low_quota: bool = True  # 配额不足时是否抽角色池，False 表示直接购买配额
+
+
+@dataclass
+class Campaign:
+    """一个规划周期：初始状态、初始存量和按顺序排列的各期卡池"""
+
+    banners: List[Banner]
+    player_info: PlayerInfo = field(default_factory=PlayerInfo)  # 第一期开始时的状态（目标和抽数上限字段不使用）
+    initial_savings: int = 0  # 第一期收入到账前的付费抽数存量
+
+    def banner_players(self) -> List[PlayerInfo]:
+        """各期开始时不结转部分的玩家信息：第一期取初始状态，之后各期从新卡池的初始状态开始"""
+        players = []
+        for index, banner in enumerate(self.banners):
+            player = copy.deepcopy(self.player_info) if index == 0 else PlayerInfo()
+            player.character_goals = dict(banner.character_goals)
+            player.weapon_goals = dict(banner.weapon_goals)
+            player.character_always_pull_ten = banner.character_always_pull_ten
+            player.character_pull_minimum = banner.character_pull_minimum
+            player.weapon_pull_limit = banner.weapon_pull_limit
+            player.is_character_pull_enabled_on_low_quota = banner.is_character_pull_enabled_on_low_quota
+            player.compute_internal_state(banner.character_pool_config)
+            players.append(player)
+        return players
+
+
+def campaign_from_dict(data: Dict[str, Any]) -> Campaign:
+    """从JSON对象构建规划周期
+
+    格式: {"player": {...}, "initial_savings": 0, "banners": [{"name": ..., "character_pool": {...},
+    "weapon_pool": {...}, "income": {...}, "character_goals": {...}, ...}]}，
+    卡池配置和玩家信息的字段名与 config.py 中的数据类一致，缺少的字段使用默认值。
+    """
+    banners = []
+    for item in data.get('banners', []):
+        values = dict(item)
+        character_pool_config = config_from_dict(CharacterPoolConfig, values.pop('character_pool', {}))
+        weapon_pool_config = config_from_dict(WeaponPoolConfig, values.pop('weapon_pool', {}))
+        income = config_from_dict(Income, values.pop('income', {}))
+        banners.append(config_from_dict(Banner, dict(values, character_pool_config=character_pool_config,
+                                                     weapon_pool_config=weapon_pool_config, income=income)))
+    if not banners:
+        raise ValueError("规划周期至少需要一期卡池")
+    return Campaign(banners=banners, player_info=config_from_dict(PlayerInfo, data.get('player', {})),
+                    initial_savings=data.get('initial_savings', 0))
+
+
+def compile_campaign(campaign: Campaign) -> CompiledCampaign:
+    """将规划周期编译为内核使用的数组表"""
+    banners = compile_scenarios([(banner.character_pool_config, banner.weapon_pool_config, player)
+                                 for banner, player in zip(campaign.banners, campaign.banner_players())])
+    income = np.zeros((len(campaign.banners), N_INCOME), dtype=np.int64)
+    policy = np.zeros((len(campaign.banners), N_BANNER_POLICY), dtype=np.int64)
+    for index, banner in enumerate(campaign.banners):
+        income[index, I_PULLS] = banner.income.pulls
+        income[index, I_VOUCHERS] = banner.income.ten_pull_vouchers
+        income[index, I_QUOTA] = banner.income.weapon_quota
+        policy[index, B_PULL] = banner.pull
+        policy[index, B_MIN_AVAILABLE] = banner.min_available_pulls
+        policy[index, B_MAX_PAID] = banner.max_paid_pulls
+    return CompiledCampaign(banners=banners, income=income, policy=policy, initial_savings=campaign.initial_savings)
+
+
+class CampaignSimulator:
+    """多期连续模拟的标量实现，结果与编译型内核逐位一致，未安装 Numba 时使用"""
+
+    def __init__(self, campaign: Campaign):
+        from scalar_gacha_utils import ScalarSimulator
+        self.campaign = campaign
+        self.simulators = [ScalarSimulator(banner.character_pool_config, banner.weapon_pool_config, player)
+                           for banner, player in zip(campaign.banners, campaign.banner_players())]
+        # 每期不结转部分的初始状态，模拟时在其上写入结转的状态
+        self.initial_states = [simulator.player.initial_state for simulator in self.simulators]
+
+    def simulate(self, seed: int, run_index: int) -> np.ndarray:
+        """执行编号为 run_index 的一次多期模拟，返回按期排列的 CAMPAIGN_DTYPE 记录"""
+        records = np.zeros(len(self.simulators), dtype=CAMPAIGN_DTYPE)
+        first = self.initial_states[0]
+        soft, quota, vouchers, five = first[0], first[3], first[4], first[7]
+        savings = self.campaign.initial_savings
+        for index, (banner, simulator) in enumerate(zip(self.campaign.banners, self.simulators)):
+            savings += banner.income.pulls
+            vouchers += banner.income.ten_pull_vouchers
+            quota += banner.income.weapon_quota
+            record = records[index]
+
+            paid_cap = savings
+            if 0 < banner.max_paid_pulls < paid_cap:
+                paid_cap = banner.max_paid_pulls
+            if banner.character_always_pull_ten:
+                paid_cap -= paid_cap % 10
+            limit = paid_cap + 10 * vouchers
+            if not banner.pull or savings + 10 * vouchers < banner.min_available_pulls or limit == 0:
+                record['savings'], record['weapon_quota'] = savings, quota
+                record['vouchers'], record['soft_pity'] = vouchers, soft
+                continue
+
+            # 结转的状态写入该期的初始状态（顺序见 ScalarState.reset）
+            player = simulator.player
+            initial_state = list(self.initial_states[index])
+            initial_state[0], initial_state[3], initial_state[4], initial_state[7] = soft, quota, vouchers, five
+            player.initial_state = tuple(initial_state)
+            player.character_pull_limit = limit
+            result = simulator.run(*run_streams(seed, run_index, index))
+
+            state = simulator.state
+            paid_pulls = result['角色总抽数（不含紧急）'] - 10 * (vouchers - state.ten_pull_count)
+            savings -= paid_pulls
+            soft, five, quota, vouchers = (state.soft_pity_accumulate, state.five_star_countdown,
+                                           state.weapon_quota, state.ten_pull_count)
+            record['pulled'] = True
+            record['success'] = result['成功']
+            record['failure_reason'] = FAILURE_REASONS.index(result.get('失败原因', ''))
+            record['character_pulls'] = result['角色总抽数（不含紧急）']
+            record['paid_pulls'] = paid_pulls
+            record['weapon_ten_pulls'] = result['武器十连次数']
+            record['extra_quota_purchased'] = result['额外购买配额']
+            record['savings'], record['weapon_quota'] = savings, quota
+            record['vouchers'], record['soft_pity'] = vouchers, soft
+        return records
+
+
+def _campaign_runner(campaign: Campaign, seed: int, parallel: bool):
+    """生成 simulate(start, stop)：执行编号为 [start, stop) 的模拟，规则表只编译一次"""
+    from jit_gacha_utils import NUMBA_AVAILABLE, simulate_compiled_campaign
+    from compiled_rules import records_from_matrix
+    if not NUMBA_AVAILABLE:
+        simulator = CampaignSimulator(campaign)
+
+        def simulate(start, stop):
+            records = np.zeros((stop - start, len(campaign.banners)), dtype=CAMPAIGN_DTYPE)
+            for run in range(start, stop):
+                records[run - start] = simulator.simulate(seed, run)
+            return records
+        return simulate
+
+    compiled = compile_campaign(campaign)
+
+    def simulate(start, stop):
+        out = simulate_compiled_campaign(compiled, stop - start, seed, parallel=parallel, first_run=start)
+        return records_from_matrix(out, CAMPAIGN_DTYPE)
+    return simulate
+
+
+def simulate_campaign(campaign: Campaign, simulation_runs: int, seed: Optional[int] = None,
+                      parallel: bool = True, first_run: int = 0) -> np.ndarray:
+    """批量执行多期连续模拟
+
+    参数:
+        campaign: 规划周期
+        simulation_runs: 模拟次数
+        seed: 随机种子，None表示随机生成
+        parallel: 是否多线程并行（仅Numba可用时生效）
+        first_run: 第一次模拟的编号，分块执行时依次传入各块的起始编号
+
+    返回:
+        形状为 (模拟次数, 期数) 的 CAMPAIGN_DTYPE 记录数组，第 b 列为各次模拟第 b 期的结果
+    """
+    if seed is None:
+        seed = new_seed()
+    return _campaign_runner(campaign, seed, parallel)(first_run, first_run + simulation_runs)
+
+
+@dataclass
+class CampaignSummary:
+    """多期连续模拟的汇总，可按块累加"""
+
+    banner_names: List[str]
+    seed: int = 0  # 随机种子，配合模拟编号可重放任意一次模拟
+    runs: int = 0
+    pulled: np.ndarray = None  # 各期被抽取的模拟次数
+    successes: np.ndarray = None  # 各期达成目标的模拟次数
+    paid_pulls: np.ndarray = None  # 各期付费抽数之和
+    extra_quota: np.ndarray = None  # 各期额外购买配额之和
+    success_banners: np.ndarray = None  # 下标为达成目标的期数，值为模拟次数
+    final_savings: int = 0  # 最后一期结束时付费抽数存量之和
+
+    def __post_init__(self):
+        banners = len(self.banner_names)
+        for name in ('pulled', 'successes', 'paid_pulls', 'extra_quota'):
+            if getattr(self, name) is None:
+                setattr(self, name, np.zeros(banners, dtype=np.int64))
+        if self.success_banners is None:
+            self.success_banners = np.zeros(banners + 1, dtype=np.int64)
+
+    def add_records(self, records: np.ndarray):
+        """累加一块 (模拟次数, 期数) 的 CAMPAIGN_DTYPE 记录"""
+        self.runs += len(records)
+        self.pulled += records['pulled'].sum(axis=0)
+        self.successes += records['success'].sum(axis=0)
+        self.paid_pulls += records['paid_pulls'].sum(axis=0, dtype=np.int64)
+        self.extra_quota += records['extra_quota_purchased'].sum(axis=0, dtype=np.int64)
+        self.success_banners += np.bincount(records['success'].sum(axis=1), minlength=len(self.success_banners))
+        self.final_savings += int(records['savings'][:, -1].sum(dtype=np.int64))
+
+    def format(self) -> str:
+        """格式化为中文表格"""
+        runs = max(self.runs, 1)
+        lines = [f"{self.runs} 次模拟，平均达成 {np.dot(np.arange(len(self.success_banners)), self.success_banners) / runs:.3f} 期目标，"
+                 f"期末平均剩余付费抽数 {self.final_savings / runs:.1f}"]
+        lines.append(f"{'卡池':<12}{'抽取比例':>10}{'成功率':>10}{'抽取时成功率':>14}{'平均付费抽数':>14}{'平均购买配额':>14}")
+        for index, name in enumerate(self.banner_names):
+            pulled = self.pulled[index]
+            conditional = self.successes[index] / pulled if pulled else 0.0
+            lines.append(f"{name:<12}{pulled / runs:>10.2%}{self.successes[index] / runs:>10.2%}{conditional:>14.2%}"
+                         f"{self.paid_pulls[index] / runs:>14.1f}{self.extra_quota[index] / runs:>14.1f}")
+        lines.append("达成目标的期数分布: " + '，'.join(
+            f"{count}期 {runs_with / runs:.2%}" for count, runs_with in enumerate(self.success_banners) if runs_with))
+        return '\n'.join(lines)
+
+
+def run_campaign(campaign: Campaign, simulation_runs: int, seed: Optional[int] = None, parallel: bool = True,
+                 chunk_size: int = DEFAULT_CAMPAIGN_CHUNK) -> CampaignSummary:
+    """按块执行多期连续模拟并汇总，内存占用只取决于块大小
+
+    参数:
+        campaign: 规划周期
+        simulation_runs: 模拟次数
+        seed: 随机种子，None表示随机生成
+        parallel: 是否多线程并行
+        chunk_size: 每块的模拟次数
+
+    返回:
+        各期的抽取比例、成功率、付费抽数和达成期数分布
+    """
+    if seed is None:
+        seed = new_seed()
+    names = [banner.name or f'第{index + 1}期' for index, banner in enumerate(campaign.banners)]
+    summary = CampaignSummary(names, seed=seed)
+    simulate = _campaign_runner(campaign, seed, parallel)
+    for start in range(0, simulation_runs, chunk_size):
+        summary.add_records(simulate(start, min(start + chunk_size, simulation_runs)))
+    return summary
@@ -4,6 +4,8 @@
 import random
 from typing import List, Dict, Tuple
 from config import CharacterPoolConfig, PlayerInfo, CharacterRuntimeInfo
+from trace_events import (POOL_CHARACTER, KIND_SINGLE, KIND_TEN, KIND_URGENT, GUARANTEE_NONE, GUARANTEE_LOOP,
+                          GUARANTEE_HARD, GUARANTEE_SOFT, GUARANTEE_FIVE)
 
 
 def character_goals_achieved(goals_achieved_dict: Dict[str, int], goals: Dict[str, int]) -> bool:
@@ -22,16 +24,17 @@ def character_goals_achieved(goals_achieved_dict: Dict[str, int], goals: Dict[st
     return True
 
 
-def get_six_star_character_by_probability(pool_config: CharacterPoolConfig) -> str:
+def get_six_star_character_by_probability(pool_config: CharacterPoolConfig, rng=random) -> str:
     """根据概率获取一个六星角色
     
     参数:
         pool_config: 角色池配置
+        rng: 随机数源，提供 random() 方法，默认为 random 模块
     
     返回:
         六星角色名称
     """
-    rand_value = random.random()
+    rand_value = rng.random()
     cumulative_probability = 0.0
     for character, probability in pool_config.six_star_pool.items():
         cumulative_probability += probability
@@ -59,23 +62,25 @@ def get_current_six_star_character_probability(pool_config: CharacterPoolConfig,
     return pool_config.base_six_probability
 
 
-def get_character_by_probability(pool_config: CharacterPoolConfig, current_probability: float = None) -> Tuple[str, int]:
+def get_character_by_probability(pool_config: CharacterPoolConfig, current_probability: float = None,
+                                 rng=random) -> Tuple[str, int]:
     """根据概率获取一个角色
     
     参数:
         pool_config: 角色池配置
         current_probability: 当前六星概率，如果为None则使用基础概率
+        rng: 随机数源
     
     返回:
         (角色名称, 稀有度) - 角色名称为""表示未抽中六星，稀有度为4/5/6
     """
     if current_probability is None:
         current_probability = pool_config.base_six_probability
-    rand_value = random.random()
+    rand_value = rng.random()
     
     # 检查是否抽中六星
     if rand_value <= current_probability:
-        return get_six_star_character_by_probability(pool_config), 6
+        return get_six_star_character_by_probability(pool_config, rng), 6
     
     # 未抽中六星，判断是4星还是5星
     # 剩余概率 = 1 - 六星概率
@@ -86,7 +91,7 @@ def get_character_by_probability(pool_config: CharacterPoolConfig, current_proba
     )
     
     # 在非六星中随机判断
-    rand_value_2 = random.random()
+    rand_value_2 = rng.random()
     if rand_value_2 <= four_star_in_remaining:
         return "", 4  # 4星角色
     else:
@@ -94,13 +99,15 @@ def get_character_by_probability(pool_config: CharacterPoolConfig, current_proba
 
 
 def perform_single_character_pull(pool_config: CharacterPoolConfig, runtime_info: CharacterRuntimeInfo, 
-                                   obtained_six_stars: List[str]):
+                                   obtained_six_stars: List[str], rng=random, tracer=None):
     """执行单次角色池抽卡
     
     参数:
         pool_config: 角色池配置
         runtime_info: 角色池运行时信息
         obtained_six_stars: 用于记录获得的六星角色列表
+        rng: 随机数源
+        tracer: 轨迹记录器（trace_utils.PullTraceWriter），None表示不记录
     
     返回:
     """
@@ -114,6 +121,9 @@ def perform_single_character_pull(pool_config: CharacterPoolConfig, runtime_info
         obtained_six_stars.append("限定")
         # 这里直接给信物，应该不给武器配额
         # runtime_info.weapon_quota += pool_config.weapon_quota_per_rarity[6]
+        if tracer is not None:
+            tracer.record(POOL_CHARACTER, tracer.kind, 6, "限定", runtime_info.soft_pity_accumulate,
+                          runtime_info.weapon_quota, runtime_info.weapon_quota, GUARANTEE_LOOP)
         runtime_info.soft_pity_accumulate = 0
     
     # 检查大保底
@@ -122,28 +132,42 @@ def perform_single_character_pull(pool_config: CharacterPoolConfig, runtime_info
         obtained_six_stars.append("限定")
         runtime_info.weapon_quota += pool_config.weapon_quota_per_rarity[6]
         runtime_info.limited_obtained = True
+        if tracer is not None:
+            tracer.record(POOL_CHARACTER, tracer.kind, 6, "限定", runtime_info.soft_pity_accumulate,
+                          runtime_info.weapon_quota - pool_config.weapon_quota_per_rarity[6],
+                          runtime_info.weapon_quota, GUARANTEE_HARD)
         runtime_info.soft_pity_accumulate = 0  # 出金后重置小保底
         runtime_info.got_five_or_six_star_character_in_next_pulls = 10  # 重置N次必得
     
     # 检查小保底
     elif runtime_info.soft_pity_accumulate == pool_config.soft_pity:
         # 抽一个六星
-        six_star = get_six_star_character_by_probability(pool_config)
+        six_star = get_six_star_character_by_probability(pool_config, rng)
         obtained_six_stars.append(six_star)
         runtime_info.weapon_quota += pool_config.weapon_quota_per_rarity[6]
         if six_star == "限定":
             runtime_info.limited_obtained = True
+        if tracer is not None:
+            tracer.record(POOL_CHARACTER, tracer.kind, 6, six_star, runtime_info.soft_pity_accumulate,
+                          runtime_info.weapon_quota - pool_config.weapon_quota_per_rarity[6],
+                          runtime_info.weapon_quota, GUARANTEE_SOFT)
         runtime_info.soft_pity_accumulate = 0  # 出金后重置小保底
         runtime_info.got_five_or_six_star_character_in_next_pulls = 10  # 重置N次必得
     else:
         # 正常抽卡，使用区间概率提升机制
         current_probability = get_current_six_star_character_probability(pool_config, runtime_info.soft_pity_accumulate)
-        character, rarity = get_character_by_probability(pool_config, current_probability)
+        character, rarity = get_character_by_probability(pool_config, current_probability, rng)
         # 已经10发未出5星或6星，强制出一个5星
         if runtime_info.got_five_or_six_star_character_in_next_pulls <= 0 and rarity < 5:
             character = ""
             rarity = 5
         runtime_info.weapon_quota += pool_config.weapon_quota_per_rarity[rarity]
+        if tracer is not None:
+            tracer.record(POOL_CHARACTER, tracer.kind, rarity, character, runtime_info.soft_pity_accumulate,
+                          runtime_info.weapon_quota - pool_config.weapon_quota_per_rarity[rarity],
+                          runtime_info.weapon_quota,
+                          GUARANTEE_FIVE if runtime_info.got_five_or_six_star_character_in_next_pulls <= 0
+                          else GUARANTEE_NONE)
         if rarity >= 5:
             # 抽到5星或6星，重置N次必得
             runtime_info.got_five_or_six_star_character_in_next_pulls = 10
@@ -154,12 +178,15 @@ def perform_single_character_pull(pool_config: CharacterPoolConfig, runtime_info
             runtime_info.soft_pity_accumulate = 0  # 出金后重置小保底
 
 
-def perform_ten_character_pulls(pool_config: CharacterPoolConfig, runtime_info: CharacterRuntimeInfo) -> List[str]:
+def perform_ten_character_pulls(pool_config: CharacterPoolConfig, runtime_info: CharacterRuntimeInfo,
+                                rng=random, tracer=None) -> List[str]:
     """执行一次角色池十连抽
     
     参数:
         pool_config: 角色池配置
         runtime_info: 角色池运行时信息
+        rng: 随机数源
+        tracer: 轨迹记录器，None表示不记录
     
     返回:
     """
@@ -167,20 +194,28 @@ def perform_ten_character_pulls(pool_config: CharacterPoolConfig, runtime_info:
     
     # 有紧急招募且未使用，则优先使用，不需要更新小保底累计
     use_urgent_pulls = runtime_info.ten_pull_count_urgent != 0
+    if tracer is not None:
+        tracer.kind = KIND_URGENT if use_urgent_pulls else KIND_TEN
     
     for i in range(10):
         # 非紧急招募十连，检查大保底和循环保底
         if not use_urgent_pulls:
-            perform_single_character_pull(pool_config, runtime_info, obtained_six_stars)
+            perform_single_character_pull(pool_config, runtime_info, obtained_six_stars, rng, tracer)
         else:
             # 紧急招募使用基础概率（不累计大小保底和五星保底）
             current_probability = pool_config.base_six_probability
-            character, rarity = get_character_by_probability(pool_config, current_probability)
+            character, rarity = get_character_by_probability(pool_config, current_probability, rng)
             
             runtime_info.weapon_quota += pool_config.weapon_quota_per_rarity[rarity]
+            if tracer is not None:
+                tracer.record(POOL_CHARACTER, KIND_URGENT, rarity, character, runtime_info.soft_pity_accumulate,
+                              runtime_info.weapon_quota - pool_config.weapon_quota_per_rarity[rarity],
+                              runtime_info.weapon_quota)
             if character != "":
                 obtained_six_stars.append(character)
     
+    if tracer is not None:
+        tracer.kind = KIND_SINGLE
     if use_urgent_pulls:
         runtime_info.ten_pull_count_urgent -= 1
     elif runtime_info.ten_pull_count > 0:
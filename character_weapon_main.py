@@ -1,33 +1,111 @@
 """
 明日方舟·终末地 角色池+武器池综合抽卡概率模拟器
 """
-import numpy as np
-from collections import Counter
+import argparse
 from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo, SimulationConfig
 from weapon_gacha_utils import combined_character_weapon_simulation
-from analysis_utils import plot_success_failure_pie, plot_combined_distributions
+from profiling_utils import SimulationProfile
+from rng_utils import new_seed
+
+# numpy/Numba/matplotlib 较重，只在用到时导入：
+# jit_gacha_utils 用于 jit 引擎，trace_utils 用于 --trace，archive_utils/checkpoint_utils 用于分块汇总、
+# 归档和检查点，analysis_utils 用于出图
 
 
 def print_combined_statistics(results: list, simulation_runs: int):
     """打印综合统计信息（已禁用）
     
     参数:
-        results: 模拟结果列表
+        results: 模拟结果（结果列表或 ResultHistogram）
         simulation_runs: 模拟次数
     """
     pass
 
 
-def main():
-    """主函数"""
-    # 创建角色池配置
-    character_pool_config = CharacterPoolConfig()
+def report_results(results, simulation_runs: int):
+    """打印统计信息并绘制成功率饼图和分布图（分片合并等入口共用）
     
-    # 创建武器池配置
-    weapon_pool_config = WeaponPoolConfig()
+    参数:
+        results: 模拟结果（结果列表或 ResultHistogram）
+        simulation_runs: 模拟次数
+    """
+    from analysis_utils import plot_success_failure_pie, plot_combined_distributions
     
-    # 创建玩家信息
-    player_info = PlayerInfo(
+    # 计算成功率
+    success_count = results.successes
+    failure_count = simulation_runs - success_count
+    success_rate = success_count / simulation_runs * 100
+    
+    # 绘制成功率饼图
+    plot_success_failure_pie(success_count, failure_count, 
+                            save_path='combined_success_failure_pie.png')
+    
+    # 打印所有结果的统计信息
+    print_combined_statistics(results, simulation_runs)
+    
+    # 绘制所有结果的分布图
+    plot_combined_distributions(results, success_rate, save_prefix='combined_all')
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='角色池+武器池综合抽卡概率模拟')
+    parser.add_argument('--runs', type=int, default=10000, help='模拟次数')
+    parser.add_argument('--engine', choices=['scalar', 'python', 'jit', 'event'], default='scalar',
+                        help='模拟引擎：scalar 标量引擎（默认），python 参考实现，jit Numba编译型批量引擎，'
+                             'event 跳跃式引擎（同分布但不逐位一致）')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子，默认随机生成并打印，用于重放')
+    parser.add_argument('--profile', nargs='?', const='simulation_profile.json', default=None,
+                        metavar='PATH', help='收集性能剖析数据并导出为JSON（改用参考实现运行，jit引擎不支持）')
+    parser.add_argument('--trace', default=None, metavar='PATH',
+                        help='逐抽记录模拟过程到轨迹文件（改用参考实现运行，jit引擎不支持）')
+    parser.add_argument('--trace-runs', default='', metavar='SPEC',
+                        help='只记录指定编号的模拟，如 "0-99,734211"，默认全部记录')
+    parser.add_argument('--archive', default=None, metavar='PATH',
+                        help='将每次模拟的结果写入归档文件，不在内存中保留结果列表（可用 archive_main.py 查看和导出）')
+    parser.add_argument('--replay-run', type=int, default=None, metavar='RUN',
+                        help='只重放指定编号的一次模拟并打印结果（需配合 --seed）')
+    parser.add_argument('--checkpoint', default=None, metavar='PATH',
+                        help='定期将模拟进度写入检查点文件，中断后可用 --resume 继续')
+    parser.add_argument('--checkpoint-every-runs', type=int, default=0, metavar='N',
+                        help='每完成N次模拟写一次检查点（0表示不按次数）')
+    parser.add_argument('--checkpoint-every-seconds', type=float, default=60.0, metavar='S',
+                        help='每隔S秒写一次检查点（0表示不按时间），默认60')
+    parser.add_argument('--chunk-size', type=int, default=None, metavar='N',
+                        help='每块的模拟次数，检查点以块为单位记录进度，默认65536')
+    parser.add_argument('--resume', default=None, metavar='PATH',
+                        help='从检查点继续中断的模拟（模拟次数、引擎、种子和归档路径以检查点为准），结果与不中断时逐位一致')
+    parser.add_argument('--target-probability', type=float, default=None, metavar='P',
+                        help='反查达到目标成功率P（如0.9）所需的角色池抽数、武器十连次数和额外购买配额')
+    parser.add_argument('--budget', type=float, default=None, metavar='B',
+                        help='只搜索预算B下成功率最高的"抽角色换配额/直接购买配额"分配（需配合 --quota-cost）')
+    parser.add_argument('--quota-cost', type=float, default=None, metavar='C',
+                        help='每单位武器配额的价格，与 --budget 使用同一种货币单位')
+    parser.add_argument('--pull-cost', type=float, default=1.0, metavar='C',
+                        help='每次角色池付费单抽的价格，默认1（即预算以抽数计）')
+    parser.add_argument('--sensitivity', action='store_true',
+                        help='只做灵敏度分析：一次模拟估计成功率和平均抽数对各项概率参数的导数（似然比估计）')
+    args = parser.parse_args(argv)
+    if args.budget is not None and args.quota_cost is None:
+        parser.error('--budget 需要同时指定 --quota-cost')
+    if args.target_probability is not None and not 0 < args.target_probability < 1:
+        parser.error('--target-probability 必须在0和1之间')
+    if args.profile and args.engine == 'jit' and not args.resume:
+        parser.error('jit引擎不支持 --profile，剖析时请使用 --engine python/scalar/event（均改用参考实现运行）')
+    if args.trace and args.engine == 'jit' and args.replay_run is None:
+        parser.error('jit引擎不支持 --trace，记录轨迹时请使用 --engine python/scalar/event（均改用参考实现运行）')
+    if args.replay_run is not None and args.seed is None:
+        parser.error('--replay-run 需要同时指定 --seed')
+    if args.resume and args.replay_run is not None:
+        parser.error('--resume 不能与 --replay-run 同时使用')
+    if args.trace and (args.checkpoint or args.resume) and args.replay_run is None:
+        parser.error('抽卡轨迹不支持断点续跑，--trace 不能与 --checkpoint/--resume 同时使用')
+    return args
+
+
+def default_player_info() -> PlayerInfo:
+    """命令行模拟使用的玩家信息（分片模拟等入口共用同一场景）"""
+    return PlayerInfo(
         # 角色池初始状态
         character_soft_pity_accumulate=0,
         character_total_pulls_used=0,
@@ -36,8 +114,6 @@ def main():
         # 暴露给玩家的接口，玩家填这些信息
         got_six_star_character_in_next_pulls=10, # N次内寻访必得6星干员
         got_five_or_six_star_character_in_next_pulls=10, # N次内寻访必得5星或以上干员
-        got_up_character_once_in_next_pulls=10, # 仅限一次，N次内寻访必得UP角色
-        got_gifty_in_next_pulls=10, # 信物赠礼 N次寻访后可获得
         character_ten_pulls_available=0, # N张十连寻访凭证
         character_urgent_ten_pulls_available=0, # N张紧急招募十连
         initial_weapon_quota=0,  # 初始武器配额
@@ -59,43 +135,166 @@ def main():
         weapon_pull_minimum=0,  # 武器池抽数下限（十连次数）
         is_character_pull_enabled_on_low_quota=True  # 配额不足时抽角色池
     )
+
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+    
+    # 创建角色池配置
+    character_pool_config = CharacterPoolConfig()
+    
+    # 创建武器池配置
+    weapon_pool_config = WeaponPoolConfig()
+    
+    # 创建玩家信息
+    player_info = default_player_info()
     
     # 创建模拟配置
-    sim_config = SimulationConfig(simulation_runs=10000)
+    sim_config = SimulationConfig(simulation_runs=args.runs, engine=args.engine,
+                                  seed=new_seed() if args.seed is None else args.seed)
+    
+    # 单独重放一次模拟
+    if args.replay_run is not None:
+        tracer = None
+        if sim_config.engine == "event":
+            # 跳跃式引擎的随机数消耗方式与其他引擎不同，只能用它自己重放，且不支持轨迹
+            from event_gacha_utils import EventSimulator
+            result = EventSimulator(character_pool_config, weapon_pool_config, player_info).simulate(
+                seed=sim_config.seed, run_index=args.replay_run)
+        else:
+            if args.trace:
+                from trace_utils import PullTraceWriter
+                tracer = PullTraceWriter(args.trace)
+            result = combined_character_weapon_simulation(character_pool_config, weapon_pool_config, player_info,
+                                                          tracer=tracer, seed=sim_config.seed,
+                                                          run_index=args.replay_run)
+        for key, value in result.items():
+            print(f"{key}: {value}")
+        if tracer is not None:
+            tracer.close()
+            print(f"抽卡轨迹已保存至: {args.trace}")
+        return
+    
+    # 搜索预算分配（逐次减半，最优策略模拟到 --runs 次）
+    if args.budget is not None:
+        from budget_utils import Budget, optimize_budget
+        print(f"随机种子: {sim_config.seed}")
+        optimization = optimize_budget(character_pool_config, weapon_pool_config, player_info,
+                                       Budget(args.budget, args.quota_cost, args.pull_cost),
+                                       initial_runs=min(1000, sim_config.simulation_runs),
+                                       max_runs=sim_config.simulation_runs, seed=sim_config.seed)
+        print(optimization.format())
+        return
+    
+    # 灵敏度分析（标量引擎，同一批轨迹给出所有概率参数的导数）
+    if args.sensitivity:
+        from sensitivity_utils import analyze_sensitivity
+        print(f"随机种子: {sim_config.seed}")
+        report = analyze_sensitivity(character_pool_config, weapon_pool_config, player_info,
+                                     sim_config.simulation_runs, seed=sim_config.seed)
+        print(report.format())
+        return
+    
+    from archive_utils import scenario_hash
+    from checkpoint_utils import SimulationCheckpoint, CheckpointPolicy, DEFAULT_CHUNK_SIZE, run_chunks, chunk_simulator
+    from compiled_rules import records_from_results
+    scenario = scenario_hash(character_pool_config, weapon_pool_config, player_info)
+    
+    # 模拟按块执行，已完成块的结果汇总为直方图；续跑时模拟次数、引擎、种子和归档路径以检查点为准
+    checkpoint_path = args.checkpoint or args.resume
+    if args.resume:
+        checkpoint = SimulationCheckpoint.load(args.resume)
+        checkpoint.check_scenario(scenario)
+        sim_config = SimulationConfig(simulation_runs=checkpoint.simulation_runs, engine=checkpoint.engine,
+                                      seed=checkpoint.seed)
+        archive_path = checkpoint.metadata.get('archive')
+        print(f"从检查点继续: 已完成 {checkpoint.completed_runs}/{checkpoint.simulation_runs} 次模拟")
+    else:
+        archive_path = args.archive
+        checkpoint = SimulationCheckpoint(scenario, sim_config.seed, sim_config.engine, sim_config.simulation_runs,
+                                          chunk_size=args.chunk_size or DEFAULT_CHUNK_SIZE,
+                                          metadata={'archive': archive_path} if archive_path else None)
+    print(f"随机种子: {sim_config.seed}")
     
     # 运行模拟
-    results = []
-    success_count = 0
-    failure_reasons = Counter()
-    
-    for i in range(sim_config.simulation_runs):
-        result = combined_character_weapon_simulation(
-            character_pool_config,
-            weapon_pool_config,
-            player_info
-        )
-        results.append(result)
-        
-        if result['成功']:
-            success_count += 1
+    profile = SimulationProfile() if args.profile and sim_config.engine != "jit" else None
+    if args.profile and profile is None:
+        print("检查点使用的 jit 引擎不支持性能剖析，忽略 --profile")
+    tracer = None
+    if args.trace:
+        from trace_utils import PullTraceWriter, parse_run_filter
+        tracer = PullTraceWriter(args.trace, runs=parse_run_filter(args.trace_runs))
+    
+    archive = None
+    if archive_path:
+        from archive_utils import ResultArchiveWriter
+        archive = ResultArchiveWriter(archive_path, scenario, metadata={'engine': sim_config.engine},
+                                      resume_count=checkpoint.archive_records if args.resume else None)
+    
+    # 标量引擎和跳跃式引擎不支持剖析和轨迹，需要时改用参考实现
+    if (profile is not None or tracer is not None) and sim_config.engine != "python":
+        features = '、'.join(name for name, enabled in (('性能剖析', profile is not None), ('抽卡轨迹', tracer is not None))
+                             if enabled)
+        print(f"{features}需要参考实现，本次以 python 引擎运行（而不是 {sim_config.engine}）")
+    if profile is None and tracer is None:
+        simulate_chunk = chunk_simulator(sim_config.engine, character_pool_config, weapon_pool_config, player_info,
+                                         sim_config.seed)
+    else:
+        def simulate_chunk(start, stop):
+            """用参考实现执行编号为 [start, stop) 的模拟，返回结果记录"""
+            results = [
+                combined_character_weapon_simulation(
+                    character_pool_config,
+                    weapon_pool_config,
+                    player_info,
+                    profile=profile,
+                    tracer=tracer,
+                    seed=sim_config.seed,
+                    run_index=i
+                )
+                for i in range(start, stop)
+            ]
+            return records_from_results(results, first_run=start)
+    
+    policy = CheckpointPolicy(every_runs=args.checkpoint_every_runs, every_seconds=args.checkpoint_every_seconds)
+    try:
+        run_chunks(checkpoint, simulate_chunk, path=checkpoint_path, policy=policy, archive=archive)
+    except KeyboardInterrupt:
+        if checkpoint_path:
+            print(f"\n模拟已中断，已完成 {checkpoint.completed_runs} 次，可用 --resume {checkpoint_path} 继续")
         else:
-            # 统计失败原因
-            failure_reason = result.get('失败原因', '未知原因')
-            failure_reasons[failure_reason] += 1
+            print("\n模拟已中断")
+        return
+    finally:
+        if tracer is not None:
+            tracer.close()
     
-    # 计算成功率
-    failure_count = sim_config.simulation_runs - success_count
-    success_rate = success_count / sim_config.simulation_runs * 100
+    if tracer is not None:
+        print(f"抽卡轨迹已保存至: {args.trace}")
+    if checkpoint_path:
+        print(f"检查点已保存至: {checkpoint_path}")
+    if archive is not None:
+        archive.close()
+        print(f"模拟结果已归档至: {archive_path}")
     
-    # 绘制成功率饼图
-    plot_success_failure_pie(success_count, failure_count, 
-                            save_path='combined_success_failure_pie.png')
+    # 之后的统计和出图都基于已完成块汇总的直方图
+    report_results(checkpoint.histogram, sim_config.simulation_runs)
     
-    # 打印所有结果的统计信息
-    print_combined_statistics(results, sim_config.simulation_runs)
+    # 反查所需资源（不设抽数上限重新模拟一批首达量样本）
+    if args.target_probability is not None:
+        from requirement_utils import first_hit_sample
+        sample = first_hit_sample(character_pool_config, weapon_pool_config, player_info,
+                                  sim_config.simulation_runs, sim_config.seed)
+        print(f"达到 {args.target_probability:.1%} 成功率所需资源（95% 置信区间）:")
+        for requirement in sample.requirements(args.target_probability).values():
+            print(f"  {requirement.format()}")
     
-    # 绘制所有结果的分布图
-    plot_combined_distributions(results, success_rate, save_prefix='combined_all')
+    # 输出性能剖析
+    if profile is not None:
+        print(profile.format_report())
+        profile.save_json(args.profile)
+        print(f"性能剖析已保存至: {args.profile}")
 
 
 if __name__ == "__main__":
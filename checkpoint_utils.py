@@ -0,0 +1,228 @@
+"""
+检查点模块 - 长时间批量模拟的断点续跑
+
+批量模拟按固定大小的块（连续的模拟编号）执行。每次模拟的随机流只由 (种子, 模拟编号) 决定（见 rng_utils），
+一块的随机数位置就是它的起始编号，因此检查点只需保存种子、已完成块的位图和已完成块的汇总直方图；
+续跑时重新执行未完成的块，最终结果与不中断执行逐位一致。
+检查点先写入临时文件再原子替换，写入过程中中断不会损坏上一次的检查点。
+"""
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, Optional, Tuple
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+from archive_utils import ResultHistogram, ResultArchiveWriter
+
+
+CHECKPOINT_VERSION = 1
+DEFAULT_CHUNK_SIZE = 1 << 16  # 每块的模拟次数，也是中断时最多需要重算的次数
+
+
+@dataclass
+class CheckpointPolicy:
+    """写检查点的间隔，两个条件满足其一即写入；都为0时只在结束或中断时写入"""
+
+    every_runs: int = 0  # 每完成多少次模拟写一次
+    every_seconds: float = 60.0  # 每隔多少秒写一次
+
+    def due(self, runs: int, seconds: float) -> bool:
+        """距上次写入已完成 runs 次模拟、经过 seconds 秒时是否需要写入"""
+        return ((self.every_runs > 0 and runs >= self.every_runs)
+                or (self.every_seconds > 0 and seconds >= self.every_seconds))
+
+
+class SimulationCheckpoint:
+    """一次批量模拟的进度：已完成块的位图及其结果的汇总直方图"""
+
+    def __init__(self, scenario: str, seed: int, engine: str, simulation_runs: int,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, metadata: Optional[Dict] = None):
+        """
+        参数:
+            scenario: 场景哈希，见 archive_utils.scenario_hash
+            seed: 随机种子
+            engine: 模拟引擎
+            simulation_runs: 总模拟次数
+            chunk_size: 每块的模拟次数
+            metadata: 额外保存的元数据（需可序列化为JSON），如归档文件路径
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"块大小必须为正数: {chunk_size}")
+        self.scenario = scenario
+        self.seed = seed
+        self.engine = engine
+        self.simulation_runs = simulation_runs
+        self.chunk_size = chunk_size
+        self.metadata = dict(metadata or {})
+        self.completed = np.zeros(-(-simulation_runs // chunk_size), dtype=bool)
+        self.histogram = ResultHistogram()
+        self.archive_records = 0  # 归档中属于已完成块的记录数
+
+    @property
+    def completed_runs(self) -> int:
+        """已完成的模拟次数"""
+        return self.histogram.runs
+
+    @property
+    def done(self) -> bool:
+        """是否所有块都已完成"""
+        return bool(self.completed.all())
+
+    def chunk_range(self, chunk: int) -> Tuple[int, int]:
+        """第 chunk 块的模拟编号范围 [start, stop)"""
+        start = chunk * self.chunk_size
+        return start, min(start + self.chunk_size, self.simulation_runs)
+
+    def pending_chunks(self) -> Iterator[int]:
+        """按编号顺序遍历未完成的块"""
+        return (int(chunk) for chunk in np.flatnonzero(~self.completed))
+
+    def mark_completed(self, chunk: int, records: np.ndarray, archived: bool = False):
+        """登记一块的结果记录（RESULT_DTYPE），archived 表示这些记录已追加到归档"""
+        if self.completed[chunk]:
+            raise ValueError(f"第 {chunk} 块已经完成")
+        self.histogram.add_records(records)
+        self.completed[chunk] = True
+        if archived:
+            self.archive_records += len(records)
+
+    def check_scenario(self, scenario: str):
+        """确认当前场景与检查点一致，否则续跑的结果没有意义"""
+        if scenario != self.scenario:
+            raise ValueError("检查点属于另一个模拟场景（卡池配置或玩家信息已改变），无法续跑")
+
+    def save(self, path: str):
+        """原子写入检查点文件"""
+        header = {
+            'version': CHECKPOINT_VERSION,
+            'scenario_hash': self.scenario,
+            'seed': self.seed,
+            'engine': self.engine,
+            'simulation_runs': self.simulation_runs,
+            'chunk_size': self.chunk_size,
+            'archive_records': self.archive_records,
+            **self.metadata,
+        }
+        arrays = {f'histogram.{name}': array for name, array in self.histogram.to_arrays().items()}
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez(f, header=np.frombuffer(json.dumps(header, ensure_ascii=False).encode('utf-8'), dtype=np.uint8),
+                     completed=np.packbits(self.completed), **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'SimulationCheckpoint':
+        """读取检查点文件"""
+        with np.load(path) as data:
+            header = json.loads(data['header'].tobytes().decode('utf-8'))
+            if header.pop('version') != CHECKPOINT_VERSION:
+                raise ValueError(f"不支持的检查点版本: {path}")
+            checkpoint = cls(header.pop('scenario_hash'), header.pop('seed'), header.pop('engine'),
+                             header.pop('simulation_runs'), header.pop('chunk_size'))
+            checkpoint.archive_records = header.pop('archive_records')
+            checkpoint.metadata = header
+            checkpoint.completed = np.unpackbits(data['completed'], count=len(checkpoint.completed)).astype(bool)
+            prefix = 'histogram.'
+            checkpoint.histogram = ResultHistogram.from_arrays(
+                {name[len(prefix):]: data[name] for name in data.files if name.startswith(prefix)})
+        return checkpoint
+
+
+def chunk_simulator(engine: str, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                    player_info: PlayerInfo, seed: int) -> Callable[[int, int], np.ndarray]:
+    """按引擎生成 run_chunks 使用的 simulate_chunk(start, stop)
+
+    参数:
+        engine: 'jit'、'scalar'、'event' 或 'python'（参考实现，不带剖析和轨迹）
+        character_pool_config: 角色池配置
+        weapon_pool_config: 武器池配置
+        player_info: 玩家信息
+        seed: 随机种子
+    """
+    from compiled_rules import records_from_results
+    if engine == 'jit':
+        from jit_gacha_utils import combined_character_weapon_simulation_batch
+
+        def simulate_chunk(start, stop):
+            # 编译型批量引擎一次完成一整块
+            return combined_character_weapon_simulation_batch(character_pool_config, weapon_pool_config,
+                                                              player_info, stop - start, seed=seed, first_run=start)
+        return simulate_chunk
+
+    if engine == 'scalar':
+        from scalar_gacha_utils import ScalarSimulator
+        simulate = ScalarSimulator(character_pool_config, weapon_pool_config, player_info).simulate
+    elif engine == 'event':
+        from event_gacha_utils import EventSimulator
+        simulate = EventSimulator(character_pool_config, weapon_pool_config, player_info).simulate
+    elif engine == 'python':
+        from weapon_gacha_utils import combined_character_weapon_simulation
+
+        def simulate(seed, run_index):
+            return combined_character_weapon_simulation(character_pool_config, weapon_pool_config, player_info,
+                                                        seed=seed, run_index=run_index)
+    else:
+        raise ValueError(f"未知的模拟引擎: {engine}")
+
+    def simulate_chunk(start, stop):
+        return records_from_results([simulate(seed=seed, run_index=i) for i in range(start, stop)], first_run=start)
+    return simulate_chunk
+
+
+def run_chunks(checkpoint: SimulationCheckpoint,
+               simulate_chunk: Callable[[int, int], np.ndarray],
+               path: Optional[str] = None,
+               policy: Optional[CheckpointPolicy] = None,
+               archive: Optional[ResultArchiveWriter] = None,
+               should_stop: Optional[Callable[[], bool]] = None) -> bool:
+    """按编号顺序执行检查点中未完成的块，按策略定期写入检查点
+
+    模拟过程中中断（异常、Ctrl-C）时先写入已完成块的检查点再抛出，正在执行的块在续跑时重算。
+
+    参数:
+        checkpoint: 检查点，新建的或 SimulationCheckpoint.load 读取的
+        simulate_chunk: simulate_chunk(start, stop) 返回编号为 [start, stop) 的模拟的 RESULT_DTYPE 结果记录
+        path: 检查点文件路径，None表示不写检查点
+        policy: 写检查点的间隔，默认 CheckpointPolicy()
+        archive: 结果归档写入器，每块完成后追加该块的记录
+        should_stop: 每块完成后调用，返回True时写入检查点并提前返回
+
+    返回:
+        所有块是否都已完成
+    """
+    if policy is None:
+        policy = CheckpointPolicy()
+
+    def save():
+        if archive is not None:
+            archive.flush()
+        if path is not None:
+            checkpoint.save(path)
+
+    runs_since_save = 0
+    last_save = time.monotonic()
+    for chunk in checkpoint.pending_chunks():
+        start, stop = checkpoint.chunk_range(chunk)
+        try:
+            records = simulate_chunk(start, stop)
+        except BaseException:
+            # 中断几乎总是发生在模拟过程中，此时检查点与归档处于一致状态；
+            # 若中断发生在下面的登记过程中则不写入，续跑时从上一次的检查点开始
+            save()
+            raise
+        if archive is not None:
+            archive.append_records(records, checkpoint.seed)
+        checkpoint.mark_completed(chunk, records, archived=archive is not None)
+        runs_since_save += len(records)
+        if should_stop is not None and should_stop():
+            save()
+            return False
+        if path is not None and policy.due(runs_since_save, time.monotonic() - last_save):
+            save()
+            runs_since_save = 0
+            last_save = time.monotonic()
+    save()
+    return True
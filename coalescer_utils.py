@@ -0,0 +1,219 @@
+"""
+查询合批模块 - 把同时到达的小查询合并为一次多场景批量模拟
+
+许多小查询（卡池配置相同、玩家状态不同）逐个调用模拟函数时，每次调用都有固定开销（编译规则表、启动并行区）。
+QueryCoalescer 在一个很短的时间窗口内收集待处理的查询，把卡池配置、模拟次数和种子相同的
+查询按玩家排成一个批次轴，用一次 combined_character_weapon_simulation_scenarios 调用完成，再把结果分发给各调用者。
+每个查询的等待时间不超过时间窗口加一次批量模拟的耗时。
+
+合批不一定更快：多场景内核每次模拟比单场景批量内核慢，单核上省下的每次调用约0.2毫秒的固定开销抵消不了
+（500个查询、每个5次模拟时约0.14秒对0.12秒，每个2000次时约44秒对28秒）。只有每个查询的模拟次数很少、
+单个查询不足以让多个核并行时，跨查询并行才可能带来收益；其余情况下合批的作用只是让并发的调用者共享一个后台线程。
+
+随机流:
+- 指定了种子的查询与单独调用 combined_character_weapon_simulation_batch(seed=seed) 逐位一致
+- 未指定种子的查询共用批次生成的种子，第 p 个查询的模拟编号从 p*模拟次数 开始，互不重叠；
+  结果中的种子和 'run' 列足以单独重放任意一次模拟
+"""
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+from rng_utils import new_seed
+
+
+DEFAULT_WINDOW_SECONDS = 0.005  # 收集查询的时间窗口
+DEFAULT_MAX_BATCH = 256  # 一次批量模拟最多合并的查询数
+
+
+@dataclass
+class CoalescedResult:
+    """一个查询的结果"""
+
+    records: np.ndarray  # RESULT_DTYPE 结果记录
+    seed: int  # 随机种子，配合 records['run'] 可重放任意一次模拟
+    batch_size: int  # 与该查询合并执行的查询数（含自身）
+
+
+@dataclass
+class _PendingQuery:
+    """等待合批的查询"""
+
+    character_pool_config: CharacterPoolConfig
+    weapon_pool_config: WeaponPoolConfig
+    player_info: PlayerInfo
+    simulation_runs: int
+    seed: Optional[int]
+    future: Future
+
+
+def _pool_key(character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig) -> str:
+    """卡池配置的比较键，内容相同的配置对象视为同一卡池"""
+    return json.dumps([asdict(character_pool_config), asdict(weapon_pool_config)],
+                      ensure_ascii=False, sort_keys=True, default=str)
+
+
+class QueryCoalescer:
+    """查询合批器，可被多个线程或协程同时调用
+
+    用法:
+        with QueryCoalescer() as coalescer:
+            result = coalescer.simulate(character_pool_config, weapon_pool_config, player_info, 10000)
+            # 或在 asyncio 中: result = await coalescer.simulate_async(...)
+    """
+
+    def __init__(self, window: float = DEFAULT_WINDOW_SECONDS, max_batch: int = DEFAULT_MAX_BATCH,
+                 parallel: bool = True):
+        """
+        参数:
+            window: 第一个查询到达后继续收集的时间（秒），越长合批越多、延迟越高
+            max_batch: 一次批量模拟最多合并的查询数，收集满时不等窗口结束立即执行
+            parallel: 批量模拟是否多线程并行
+        """
+        if max_batch <= 0:
+            raise ValueError(f"max_batch 必须为正数: {max_batch}")
+        self.window = window
+        self.max_batch = max_batch
+        self.parallel = parallel
+        self.batches = 0  # 已执行的批量模拟次数
+        self.queries = 0  # 已完成的查询数
+        self._pending: List[_PendingQuery] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._dispatch, name='QueryCoalescer', daemon=True)
+        self._thread.start()
+
+    def submit(self, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+               player_info: PlayerInfo, simulation_runs: int, seed: Optional[int] = None) -> Future:
+        """提交一个查询，返回结果为 CoalescedResult 的 Future
+
+        参数:
+            character_pool_config: 角色池配置
+            weapon_pool_config: 武器池配置
+            player_info: 玩家信息（内部状态字段需已计算），提交后不应再修改
+            simulation_runs: 模拟次数
+            seed: 随机种子，None表示使用批次的种子
+        """
+        if simulation_runs <= 0:
+            raise ValueError(f"模拟次数必须为正数: {simulation_runs}")
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("QueryCoalescer 已关闭")
+            self._pending.append(_PendingQuery(character_pool_config, weapon_pool_config, player_info,
+                                               simulation_runs, seed, future))
+            self._condition.notify()
+        return future
+
+    def simulate(self, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                 player_info: PlayerInfo, simulation_runs: int, seed: Optional[int] = None) -> CoalescedResult:
+        """提交一个查询并等待结果"""
+        return self.submit(character_pool_config, weapon_pool_config, player_info, simulation_runs, seed).result()
+
+    async def simulate_async(self, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                             player_info: PlayerInfo, simulation_runs: int,
+                             seed: Optional[int] = None) -> CoalescedResult:
+        """在 asyncio 中提交一个查询并等待结果，不阻塞事件循环"""
+        return await asyncio.wrap_future(
+            self.submit(character_pool_config, weapon_pool_config, player_info, simulation_runs, seed))
+
+    def close(self):
+        """执行完已提交的查询后停止"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _dispatch(self):
+        """后台线程：收集一个时间窗口内的查询，分组执行"""
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return  # 已关闭且没有待处理的查询
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                queries = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            for group in self._group(self._compile_each(queries)).values():
+                self._run_group(group)
+
+    @staticmethod
+    def _compile_each(queries: List[_PendingQuery]) -> List[_PendingQuery]:
+        """逐个编译查询的卡池配置和玩家信息，返回可以合批的查询
+
+        编译出错的查询（如玩家信息或配置无效）只让自己的 Future 以该异常结束，不影响同一窗口内的其他查询；
+        已取消的查询直接跳过。规则表按 (配置对象, 目标名称) 缓存，同一窗口内只编译一次。
+        """
+        from compiled_rules import compile_rules, compile_player
+        rules_cache = {}
+        compiled = []
+        for query in queries:
+            if not query.future.set_running_or_notify_cancel():
+                continue
+            try:
+                player_info = query.player_info
+                source = (id(query.character_pool_config), id(query.weapon_pool_config),
+                          tuple(player_info.character_goals), tuple(player_info.weapon_goals))
+                if source not in rules_cache:
+                    rules_cache[source] = compile_rules(query.character_pool_config, query.weapon_pool_config,
+                                                        player_info.character_goals, player_info.weapon_goals)
+                compile_player(player_info, query.character_pool_config, rules_cache[source])
+            except Exception as e:
+                query.future.set_exception(e)
+                continue
+            compiled.append(query)
+        return compiled
+
+    @staticmethod
+    def _group(queries: List[_PendingQuery]) -> Dict[Tuple, List[_PendingQuery]]:
+        """按 (卡池配置, 模拟次数, 种子) 分组，同组查询可以在一次批量模拟中完成"""
+        groups: Dict[Tuple, List[_PendingQuery]] = {}
+        pool_keys = {}
+        for query in queries:
+            configs = (id(query.character_pool_config), id(query.weapon_pool_config))
+            if configs not in pool_keys:
+                pool_keys[configs] = _pool_key(query.character_pool_config, query.weapon_pool_config)
+            key = (pool_keys[configs], query.simulation_runs, query.seed)
+            groups.setdefault(key, []).append(query)
+        return groups
+
+    def _run_group(self, group: List[_PendingQuery]):
+        """一次批量模拟完成一组查询，把各玩家的结果分发给对应的 Future"""
+        from jit_gacha_utils import combined_character_weapon_simulation_scenarios
+        first = group[0]
+        runs = first.simulation_runs
+        seed = new_seed() if first.seed is None else first.seed
+        # 指定种子时各查询使用相同的随机流，与单独模拟逐位一致；否则各查询使用互不重叠的编号区间
+        stride = runs if first.seed is None else 0
+        # 同组查询的卡池配置内容相同，统一使用第一个查询的配置对象，规则表只编译一次
+        character_pool_config, weapon_pool_config = first.character_pool_config, first.weapon_pool_config
+        try:
+            batches = combined_character_weapon_simulation_scenarios(
+                [(character_pool_config, weapon_pool_config, query.player_info) for query in group],
+                runs, seed=seed, parallel=self.parallel, scenario_stride=stride)
+        except Exception as e:
+            # 各查询已单独编译通过，这里的异常来自批量模拟本身，无法归咎于某一个查询
+            for query in group:
+                query.future.set_exception(e)
+            return
+        self.batches += 1
+        self.queries += len(group)
+        for query, records in zip(group, batches):
+            query.future.set_result(CoalescedResult(records, seed, len(group)))
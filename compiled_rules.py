@@ -0,0 +1,442 @@
+"""
+规则编译模块 - 将卡池配置和玩家信息编译为整数编码的数组表，供批量/编译型引擎使用
+"""
+import copy
+import itertools
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo, CharacterRuntimeInfo
+from character_gacha_utils import get_current_six_star_character_probability
+
+
+# 硬编码在抽卡逻辑中的物品名称（大保底/循环保底/武器特殊奖励直接给出这些物品）
+LIMITED_CHARACTER = "限定"
+LIMITED_WEAPON = "限定武器"
+
+# 失败原因编码，下标即编码，0表示成功
+FAILURE_REASONS = [
+    "",
+    "角色池达到上限但未满足目标",
+    "武器池达到上限但未满足目标",
+    "角色池达到上限无法继续获取武器配额",
+    "武器配额不足无法继续",
+    "策略结束时未满足目标",
+]
+FAILURE_CHARACTER_LIMIT = 1
+FAILURE_WEAPON_LIMIT = 2
+FAILURE_QUOTA_CHARACTER_LIMIT = 3
+FAILURE_QUOTA_INSUFFICIENT = 4
+FAILURE_STRATEGY_STOP = 5  # 抽卡策略（strategy_utils）停止或超出步数时未满足目标
+
+# 整数规则参数下标
+R_SOFT_PITY = 0
+R_HARD_PITY = 1
+R_LOOP_PITY = 2
+R_URGENT_PITY = 3
+R_QUOTA_FOUR = 4  # 4/5/6星武器配额依次存放，按 R_QUOTA_FOUR + 稀有度 - 4 取值
+R_QUOTA_FIVE = 5
+R_QUOTA_SIX = 6
+R_CHARACTER_LIMITED = 7
+R_WEAPON_COST = 8
+R_WEAPON_LIMITED = 9
+N_INT_RULES = 10
+
+# 浮点规则参数下标
+F_BASE_SIX = 0
+F_FOUR_SHARE = 1
+F_WEAPON_BASE_SIX = 2
+N_FLOAT_RULES = 3
+
+# 玩家参数向量下标（前半部分同时也是单次模拟的运行时状态）
+P_SOFT = 0
+P_TOTAL = 1
+P_LIMITED = 2
+P_QUOTA = 3
+P_TEN = 4
+P_URGENT = 5
+P_URGENT_GOT = 6
+P_FIVE = 7
+P_WEAPON_TOTAL = 8
+P_WEAPON_LIMITED = 9
+P_WEAPON_SIX = 10
+P_WEAPON_BOXES = 11
+N_STATE = 12
+P_LOW_QUOTA = 12
+P_ALWAYS_TEN = 13
+P_CHARACTER_LIMIT = 14
+P_CHARACTER_MINIMUM = 15
+P_WEAPON_LIMIT = 16
+P_WEAPON_MINIMUM = 17
+N_PLAYER = 18
+
+# 批量结果记录
+RESULT_DTYPE = np.dtype([
+    ('character_pulls', np.int64),        # 角色总抽数（不含紧急）
+    ('character_urgent_pulls', np.int64), # 角色紧急招募
+    ('weapon_ten_pulls', np.int64),       # 武器十连次数
+    ('weapon_quota_used', np.int64),      # 武器配额消耗
+    ('remaining_quota', np.int64),        # 剩余配额
+    ('supply_boxes', np.int64),           # 补充武库箱
+    ('extra_quota_purchased', np.int64),  # 额外购买配额
+    ('success', np.bool_),                # 成功
+    ('failure_reason', np.int8),          # 失败原因编码，见 FAILURE_REASONS
+    ('run', np.int64),                    # 模拟编号，配合种子可单独重放该次模拟
+])
+# 编译型引擎输出的整数矩阵列顺序与 RESULT_DTYPE 字段顺序一致
+N_RESULT_COLUMNS = len(RESULT_DTYPE.names)
+RESULT_RUN_COLUMN = RESULT_DTYPE.names.index('run')
+
+# 多期连续模拟（campaign_utils）每期的收入向量下标，收入在该期开始时到账
+I_PULLS = 0  # 付费抽数（合成玉等折算为抽数）
+I_VOUCHERS = 1  # 十连寻访凭证
+I_QUOTA = 2  # 武器配额
+N_INCOME = 3
+
+# 多期连续模拟每期的抽取策略向量下标
+B_PULL = 0  # 是否抽取本期
+B_MIN_AVAILABLE = 1  # 本期开始时可用抽数（付费存量 + 十连凭证×10）不足该值时跳过本期
+B_MAX_PAID = 2  # 本期最多使用的付费抽数，0表示不限（仍受存量约束）
+N_BANNER_POLICY = 3
+
+# 多期连续模拟每期的结果记录，状态字段为该期结束（或跳过）后结转到下一期的值
+CAMPAIGN_DTYPE = np.dtype([
+    ('pulled', np.bool_),                 # 是否抽取了本期
+    ('success', np.bool_),                # 是否达成本期目标
+    ('failure_reason', np.int8),          # 失败原因编码，见 FAILURE_REASONS
+    ('character_pulls', np.int32),        # 角色池抽数（不含紧急）
+    ('paid_pulls', np.int32),             # 其中的付费抽数
+    ('weapon_ten_pulls', np.int32),       # 武器十连次数
+    ('extra_quota_purchased', np.int32),  # 额外购买配额
+    ('savings', np.int32),                # 付费抽数存量
+    ('weapon_quota', np.int32),           # 武器配额
+    ('vouchers', np.int16),               # 十连寻访凭证
+    ('soft_pity', np.int16),              # 小保底累计抽数
+])
+N_CAMPAIGN_COLUMNS = len(CAMPAIGN_DTYPE.names)
+
+
+@dataclass
+class CompiledRules:
+    """编译后的卡池规则表"""
+
+    int_rules: np.ndarray  # 整数规则参数，下标见 R_*
+    float_rules: np.ndarray  # 浮点规则参数，下标见 F_*
+    six_star_rate: np.ndarray  # 按小保底累计抽数索引的六星概率，超出表长时使用基础概率
+    character_cdf: np.ndarray  # 六星角色池累积概率
+    weapon_cdf: np.ndarray  # 六星武器池累积概率
+    character_names: List[str]  # 角色名称表，下标即物品编码（可能包含池外的目标名称）
+    weapon_names: List[str]  # 武器名称表
+
+
+@dataclass
+class CompiledPlayer:
+    """编译后的玩家信息"""
+
+    params: np.ndarray  # 玩家参数向量，下标见 P_*
+    character_goal_counts: np.ndarray  # 按角色编码索引的目标数量
+    weapon_goal_counts: np.ndarray  # 按武器编码索引的目标数量
+
+
+@dataclass
+class CompiledScenarios:
+    """多个场景编译后的规则表和玩家信息
+
+    规则表按内容去重，配置相同的场景共用一份；变长的表按最长者补零，实际长度另存。
+    第一维为规则表编号的数组以 rule_index 按场景索引，其余数组的第一维即场景。
+    """
+
+    rule_index: np.ndarray  # 每个场景使用的规则表编号
+    int_rules: np.ndarray  # (规则表数, N_INT_RULES)
+    float_rules: np.ndarray  # (规则表数, N_FLOAT_RULES)
+    six_star_rate: np.ndarray  # (规则表数, 最长表长)
+    six_star_rate_lengths: np.ndarray
+    character_cdf: np.ndarray
+    character_cdf_lengths: np.ndarray
+    weapon_cdf: np.ndarray
+    weapon_cdf_lengths: np.ndarray
+    player_params: np.ndarray  # (场景数, N_PLAYER)
+    character_goal_counts: np.ndarray  # (场景数, 最长名称表)，补零的目标数量总是已满足
+    weapon_goal_counts: np.ndarray
+
+    @property
+    def scenario_count(self) -> int:
+        """场景数"""
+        return len(self.rule_index)
+
+
+@dataclass
+class CompiledCampaign:
+    """多期连续模拟编译后的各期规则表、玩家模板、收入和抽取策略（见 campaign_utils.compile_campaign）"""
+
+    banners: CompiledScenarios  # 第 b 个场景即第 b 期，其玩家参数为该期开始时不结转的状态和策略
+    income: np.ndarray  # (期数, N_INCOME)
+    policy: np.ndarray  # (期数, N_BANNER_POLICY)
+    initial_savings: int  # 第一期收入到账前的付费抽数存量
+
+    @property
+    def banner_count(self) -> int:
+        """期数"""
+        return self.banners.scenario_count
+
+
+def _intern_names(pool: Dict[str, float], required: str) -> List[str]:
+    """生成名称表：卡池中的物品在前，保证硬编码的限定物品总有编码"""
+    names = list(pool.keys())
+    if required not in names:
+        names.append(required)
+    return names
+
+
+def compile_rules(character_pool_config: CharacterPoolConfig,
+                  weapon_pool_config: WeaponPoolConfig,
+                  character_goals: Dict[str, int] = None,
+                  weapon_goals: Dict[str, int] = None) -> CompiledRules:
+    """将角色池和武器池配置编译为数组表
+
+    参数:
+        character_pool_config: 角色池配置
+        weapon_pool_config: 武器池配置
+        character_goals: 角色池目标，池外的目标名称会被追加到名称表（永远抽不到）
+        weapon_goals: 武器池目标
+
+    返回:
+        编译后的规则表
+    """
+    character_names = _intern_names(character_pool_config.six_star_pool, LIMITED_CHARACTER)
+    weapon_names = _intern_names(weapon_pool_config.six_star_weapon_pool, LIMITED_WEAPON)
+    for goal in (character_goals or {}):
+        if goal not in character_names:
+            character_names.append(goal)
+    for goal in (weapon_goals or {}):
+        if goal not in weapon_names:
+            weapon_names.append(goal)
+
+    int_rules = np.zeros(N_INT_RULES, dtype=np.int64)
+    int_rules[R_SOFT_PITY] = character_pool_config.soft_pity
+    int_rules[R_HARD_PITY] = character_pool_config.hard_pity
+    int_rules[R_LOOP_PITY] = character_pool_config.loop_pity
+    int_rules[R_URGENT_PITY] = character_pool_config.urgent_recruitment_pity
+    int_rules[R_QUOTA_FOUR] = character_pool_config.weapon_quota_per_rarity[4]
+    int_rules[R_QUOTA_FIVE] = character_pool_config.weapon_quota_per_rarity[5]
+    int_rules[R_QUOTA_SIX] = character_pool_config.weapon_quota_per_rarity[6]
+    int_rules[R_CHARACTER_LIMITED] = character_names.index(LIMITED_CHARACTER)
+    int_rules[R_WEAPON_COST] = weapon_pool_config.weapon_quota_cost_per_ten_pull
+    int_rules[R_WEAPON_LIMITED] = weapon_names.index(LIMITED_WEAPON)
+
+    float_rules = np.zeros(N_FLOAT_RULES, dtype=np.float64)
+    float_rules[F_BASE_SIX] = character_pool_config.base_six_probability
+    float_rules[F_FOUR_SHARE] = character_pool_config.four_star_probability / (
+        character_pool_config.four_star_probability + character_pool_config.five_star_probability
+    )
+    float_rules[F_WEAPON_BASE_SIX] = weapon_pool_config.base_six_probability
+
+    # 六星概率表覆盖到小保底和所有提升区间的末尾
+    table_length = character_pool_config.soft_pity + 1
+    for start, end, boost in character_pool_config.probability_boost_ranges:
+        table_length = max(table_length, end + 1)
+    six_star_rate = np.array([
+        get_current_six_star_character_probability(character_pool_config, soft_pity_count)
+        for soft_pity_count in range(table_length)
+    ], dtype=np.float64)
+
+    return CompiledRules(
+        int_rules=int_rules,
+        float_rules=float_rules,
+        six_star_rate=six_star_rate,
+        character_cdf=np.cumsum(list(character_pool_config.six_star_pool.values()), dtype=np.float64),
+        weapon_cdf=np.cumsum(list(weapon_pool_config.six_star_weapon_pool.values()), dtype=np.float64),
+        character_names=character_names,
+        weapon_names=weapon_names,
+    )
+
+
+def _goal_counts(goals: Dict[str, int], names: List[str]) -> np.ndarray:
+    """将目标字典编码为按物品编码索引的数量数组"""
+    counts = np.zeros(len(names), dtype=np.int64)
+    for goal, count in goals.items():
+        counts[names.index(goal)] = count
+    return counts
+
+
+def compile_player(player_info: PlayerInfo, character_pool_config: CharacterPoolConfig,
+                   rules: CompiledRules) -> CompiledPlayer:
+    """将玩家信息编译为参数向量
+
+    运行时初始状态与 CharacterRuntimeInfo/WeaponRuntimeInfo.from_player_info 完全一致。
+
+    参数:
+        player_info: 玩家信息（内部状态字段需已计算）
+        character_pool_config: 角色池配置
+        rules: 由 compile_rules 生成的规则表，需包含玩家的所有目标名称
+
+    返回:
+        编译后的玩家信息
+    """
+    character_runtime_info = CharacterRuntimeInfo.from_player_info(player_info, character_pool_config)
+
+    params = np.zeros(N_PLAYER, dtype=np.int64)
+    params[P_SOFT] = character_runtime_info.soft_pity_accumulate
+    params[P_TOTAL] = character_runtime_info.total_pulls
+    params[P_LIMITED] = character_runtime_info.limited_obtained
+    params[P_QUOTA] = character_runtime_info.weapon_quota
+    params[P_TEN] = character_runtime_info.ten_pull_count
+    params[P_URGENT] = character_runtime_info.ten_pull_count_urgent
+    params[P_URGENT_GOT] = character_runtime_info.urgent_recruitment_got
+    params[P_FIVE] = character_runtime_info.got_five_or_six_star_character_in_next_pulls
+    params[P_WEAPON_TOTAL] = player_info.weapon_total_pulls_used
+    params[P_WEAPON_LIMITED] = player_info.weapon_limited_obtained
+    params[P_WEAPON_SIX] = player_info.weapon_six_star_obtained
+    params[P_WEAPON_BOXES] = 0
+    params[P_LOW_QUOTA] = player_info.is_character_pull_enabled_on_low_quota
+    params[P_ALWAYS_TEN] = player_info.character_always_pull_ten
+    params[P_CHARACTER_LIMIT] = player_info.character_pull_limit
+    params[P_CHARACTER_MINIMUM] = player_info.character_pull_minimum
+    params[P_WEAPON_LIMIT] = player_info.weapon_pull_limit
+    params[P_WEAPON_MINIMUM] = player_info.weapon_pull_minimum
+
+    return CompiledPlayer(
+        params=params,
+        character_goal_counts=_goal_counts(player_info.character_goals, rules.character_names),
+        weapon_goal_counts=_goal_counts(player_info.weapon_goals, rules.weapon_names),
+    )
+
+
+def _stack_padded(arrays: List[np.ndarray], dtype) -> Tuple[np.ndarray, np.ndarray]:
+    """将一组一维数组按最长者补零堆叠为二维数组，返回 (二维数组, 各自长度)"""
+    lengths = np.array([len(array) for array in arrays], dtype=np.int64)
+    stacked = np.zeros((len(arrays), max(lengths, default=0)), dtype=dtype)
+    for row, array in enumerate(arrays):
+        stacked[row, :len(array)] = array
+    return stacked, lengths
+
+
+def compile_scenarios(scenarios: Sequence[Tuple[CharacterPoolConfig, WeaponPoolConfig, PlayerInfo]]
+                      ) -> CompiledScenarios:
+    """将多个 (角色池配置, 武器池配置, 玩家信息) 场景编译为带场景维度的数组表
+
+    参数:
+        scenarios: 场景列表，玩家信息的内部状态字段需已按对应的角色池配置计算（见 scenario_grid）
+
+    返回:
+        编译后的多场景规则表和玩家信息
+    """
+    tables = []
+    table_keys = {}
+    # 同一对配置对象、同一组目标名称编译出的规则表相同，只编译一次（场景多时编译是主要开销）
+    compiled = {}
+    rule_index = np.zeros(len(scenarios), dtype=np.int64)
+    players = []
+    for scenario, (character_pool_config, weapon_pool_config, player_info) in enumerate(scenarios):
+        source = (id(character_pool_config), id(weapon_pool_config),
+                  tuple(player_info.character_goals), tuple(player_info.weapon_goals))
+        if source not in compiled:
+            rules = compile_rules(character_pool_config, weapon_pool_config,
+                                  player_info.character_goals, player_info.weapon_goals)
+            key = tuple(array.tobytes() for array in (rules.int_rules, rules.float_rules, rules.six_star_rate,
+                                                      rules.character_cdf, rules.weapon_cdf))
+            if key not in table_keys:
+                table_keys[key] = len(tables)
+                tables.append(rules)
+            compiled[source] = (rules, table_keys[key])
+        rules, rule_index[scenario] = compiled[source]
+        players.append(compile_player(player_info, character_pool_config, rules))
+
+    six_star_rate, six_star_rate_lengths = _stack_padded([rules.six_star_rate for rules in tables], np.float64)
+    character_cdf, character_cdf_lengths = _stack_padded([rules.character_cdf for rules in tables], np.float64)
+    weapon_cdf, weapon_cdf_lengths = _stack_padded([rules.weapon_cdf for rules in tables], np.float64)
+    return CompiledScenarios(
+        rule_index=rule_index,
+        int_rules=np.array([rules.int_rules for rules in tables], dtype=np.int64).reshape(-1, N_INT_RULES),
+        float_rules=np.array([rules.float_rules for rules in tables], dtype=np.float64).reshape(-1, N_FLOAT_RULES),
+        six_star_rate=six_star_rate,
+        six_star_rate_lengths=six_star_rate_lengths,
+        character_cdf=character_cdf,
+        character_cdf_lengths=character_cdf_lengths,
+        weapon_cdf=weapon_cdf,
+        weapon_cdf_lengths=weapon_cdf_lengths,
+        player_params=np.array([player.params for player in players], dtype=np.int64).reshape(-1, N_PLAYER),
+        character_goal_counts=_stack_padded([player.character_goal_counts for player in players], np.int64)[0],
+        weapon_goal_counts=_stack_padded([player.weapon_goal_counts for player in players], np.int64)[0],
+    )
+
+
+def scenario_grid(character_pool_configs: Sequence[CharacterPoolConfig],
+                  weapon_pool_configs: Sequence[WeaponPoolConfig],
+                  player_infos: Sequence[PlayerInfo]) -> List[Tuple[CharacterPoolConfig, WeaponPoolConfig, PlayerInfo]]:
+    """生成配置网格：按 itertools.product 的顺序组合所有角色池配置、武器池配置和玩家信息
+
+    每个场景使用玩家信息的副本，并按该场景的角色池配置计算内部状态。
+    """
+    scenarios = []
+    for character_pool_config, weapon_pool_config, player_info in itertools.product(
+            character_pool_configs, weapon_pool_configs, player_infos):
+        player_info = copy.deepcopy(player_info)
+        player_info.compute_internal_state(character_pool_config)
+        scenarios.append((character_pool_config, weapon_pool_config, player_info))
+    return scenarios
+
+
+def result_row(result: Dict, run_index: int) -> tuple:
+    """将一个结果字典转换为 RESULT_DTYPE 的一行，结果中没有'模拟编号'时使用 run_index"""
+    return (
+        result['角色总抽数（不含紧急）'],
+        result['角色紧急招募'],
+        result['武器十连次数'],
+        result['武器配额消耗'],
+        result['剩余配额'],
+        result['补充武库箱'],
+        result['额外购买配额'],
+        result['成功'],
+        FAILURE_REASONS.index(result.get('失败原因', '')),
+        result.get('模拟编号', run_index),
+    )
+
+
+def records_from_matrix(out: np.ndarray, dtype: np.dtype = RESULT_DTYPE) -> np.ndarray:
+    """将编译型引擎输出的整数矩阵（最后一维的列顺序与 dtype 字段一致）转换为结果记录数组"""
+    records = np.zeros(out.shape[:-1], dtype=dtype)
+    for column, name in enumerate(dtype.names):
+        records[name] = out[..., column]
+    return records
+
+
+def records_from_results(results: List[Dict], first_run: int = 0) -> np.ndarray:
+    """将 combined_character_weapon_simulation 的结果字典列表转换为结果记录数组
+
+    结果中没有'模拟编号'时以 first_run + 列表下标作为模拟编号。
+    """
+    records = np.zeros(len(results), dtype=RESULT_DTYPE)
+    for i, result in enumerate(results):
+        records[i] = result_row(result, first_run + i)
+    return records
+
+
+def results_from_records(records: np.ndarray) -> List[Dict]:
+    """将结果记录数组转换为与 combined_character_weapon_simulation 相同格式的结果字典列表"""
+    results = []
+    for record in records.tolist():
+        (character_pulls, urgent_pulls, weapon_ten_pulls, quota_used, remaining_quota,
+         supply_boxes, extra_quota, success, failure_reason, run) = record
+        # 与原逻辑保持一致：因角色池上限无法补充配额而失败时，角色总抽数不含紧急招募
+        if failure_reason == FAILURE_QUOTA_CHARACTER_LIMIT:
+            character_total = character_pulls
+        else:
+            character_total = character_pulls + urgent_pulls
+        result = {
+            '角色总抽数（不含紧急）': character_pulls,
+            '角色紧急招募': urgent_pulls,
+            '角色总抽数': character_total,
+            '武器十连次数': weapon_ten_pulls,
+            '武器总抽数': weapon_ten_pulls * 10,
+            '武器配额消耗': quota_used,
+            '剩余配额': remaining_quota,
+            '补充武库箱': supply_boxes,
+            '额外购买配额': extra_quota,
+            '成功': success,
+        }
+        if failure_reason:
+            result['失败原因'] = FAILURE_REASONS[failure_reason]
+        result['模拟编号'] = run
+        results.append(result)
+    return results
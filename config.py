@@ -1,8 +1,8 @@
 """
 配置模块 - 定义卡池规则、玩家信息和运行时信息的数据结构
 """
-from dataclasses import dataclass, field
-from typing import Dict
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, Optional
 
 
 @dataclass
@@ -198,3 +198,26 @@ class SimulationConfig:
     """模拟配置"""
     
     simulation_runs: int = 10000  # 模拟次数
+    engine: str = "python"  # 模拟引擎："python" 纯Python参考实现，"scalar" 标量引擎，"jit" Numba编译型批量引擎，"event" 跳跃式引擎
+    seed: Optional[int] = None  # 随机种子，None表示不固定
+
+
+def config_from_dict(cls, data: Dict[str, Any]):
+    """用字典（如 asdict 的结果或 JSON 对象）覆盖配置数据类的默认值，未知字段报错
+
+    参数:
+        cls: CharacterPoolConfig、WeaponPoolConfig 或 PlayerInfo 等配置数据类
+        data: 字段名 -> 值，缺少的字段使用默认值
+    """
+    names = {f.name for f in fields(cls)}
+    unknown = sorted(set(data) - names)
+    if unknown:
+        raise ValueError(f"{cls.__name__} 没有字段: {', '.join(unknown)}")
+    values = dict(data)
+    # JSON 的对象键总是字符串、没有元组，还原为配置中使用的类型
+    if 'weapon_quota_per_rarity' in values:
+        values['weapon_quota_per_rarity'] = {int(rarity): quota
+                                             for rarity, quota in values['weapon_quota_per_rarity'].items()}
+    if 'probability_boost_ranges' in values:
+        values['probability_boost_ranges'] = [tuple(item) for item in values['probability_boost_ranges']]
+    return cls(**values)
@@ -0,0 +1,335 @@
+"""
+跳跃式抽卡引擎模块 - 跳过角色池中不出六星的连续抽卡，单次模拟的耗时与六星数量而非抽数成正比
+
+在 ScalarSimulator 的基础上改写角色池的连续单抽：
+- 到下一个六星的间隔抽数按六星概率表（分段常数的风险函数，小保底处为1）直接逆变换抽样
+- 间隔内的4星/5星数量（即获得的武器配额）按预先计算的分布一次抽样，分布考虑了10抽必出5星的保底
+- 遇到大保底、循环保底、抽数上限/下限和紧急招募门槛时停下，保底抽本身按逐抽逻辑执行
+- 阶段2配额不足时的补充单抽按配额首达分布一次抽样：先抽六星间隔，再抽配额首次补足缺口的抽数，
+  二者取先发生者；首达晚于六星时，间隔内的4星/5星以"未补足缺口"为条件抽样
+结果与参考实现同分布，但随机数的消耗方式不同，相同种子下单次模拟的结果与其他引擎不一致。
+"""
+import math
+from bisect import bisect_right
+from typing import Dict, List, Tuple
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+from scalar_gacha_utils import ScalarRules, ScalarSimulator, _sample_index
+
+
+COUNTDOWN_RESET = 10  # 出5星或6星后的"N次必得"计数
+_NEVER = 1 << 62  # 六星概率为0时的间隔抽数
+_MAX_FIRST_PASSAGE_PULLS = 512  # 配额首达分布覆盖的最大抽数，超过时补充配额改为分段跳跃
+
+
+class JumpTables:
+    """角色池跳跃抽样表
+
+    gap_cdf[s]: 小保底累计为 s 时，"下一个六星在第 j 抽出现"的累积概率（j = 1..），
+        表覆盖到小保底或六星概率表末尾，之后为基础概率下的几何分布尾部
+    填充抽分布: 从"N次必得"计数 c 开始连续 n 抽均未出六星时，(5星数量, 结束时的计数) 的联合分布，
+        按 n 不超过 chunk 预先递推，更长的区间分段抽样
+    配额首达分布: 从计数 c 开始，配额增量第一次达到缺口 d 时的 (抽数, 5星数量, 结束计数)，按 (c, d) 首次使用时生成
+    """
+
+    def __init__(self, rules: ScalarRules, max_countdown: int):
+        """
+        参数:
+            rules: 编译后的卡池规则
+            max_countdown: "N次必得"计数可能的最大值（玩家初始值可能超过 COUNTDOWN_RESET）
+        """
+        self.base_six = rules.base_six
+        self._tail_log = math.log1p(-rules.base_six) if 0.0 < rules.base_six < 1.0 else 0.0
+        table_length = len(rules.six_star_rate)
+        self.gap_cdf = []
+        for start in range(table_length):
+            survival = 1.0
+            cdf = []
+            for soft_pity_count in range(start + 1, table_length):
+                hazard = 1.0 if soft_pity_count == rules.soft_pity else rules.six_star_rate[soft_pity_count]
+                survival *= 1.0 - hazard
+                cdf.append(1.0 - survival)
+                if survival <= 0.0:
+                    break
+            self.gap_cdf.append(cdf)
+
+        self.five_share = 1.0 - rules.four_share
+        self.four_quota = rules.quota_by_rarity[4]
+        self.five_quota = rules.quota_by_rarity[5]
+        # 首达抽样要求每抽配额为正且5星多于4星，此时配额单调递增，首达时刻不超过 ceil(配额缺口 / 4星配额)
+        self.first_passage = 0 < self.four_quota < self.five_quota \
+            and -(-rules.weapon_cost // self.four_quota) <= _MAX_FIRST_PASSAGE_PULLS
+        self.max_countdown = max(max_countdown, COUNTDOWN_RESET)
+        self.chunk = max(rules.soft_pity, COUNTDOWN_RESET)
+        if self.first_passage:
+            self.chunk = max(self.chunk, -(-rules.weapon_cost // self.four_quota))
+        self._filler_layers = _filler_distributions(self.five_share, self.max_countdown, self.chunk)
+        self._filler_samplers = {}
+        self._flat_layers = {}
+        self._crossing_samplers = {}
+
+    def sample_gap(self, soft_pity_accumulate: int, rng) -> int:
+        """抽样到下一个六星所需的抽数（含出六星的那一抽）"""
+        rand_value = rng.random()
+        cdf = self.gap_cdf[soft_pity_accumulate] if soft_pity_accumulate < len(self.gap_cdf) else ()
+        index = bisect_right(cdf, rand_value)
+        if index < len(cdf):
+            return index + 1
+        # 几何分布尾部：在剩余的生存概率内重新缩放随机数
+        if self._tail_log == 0.0:
+            return _NEVER if self.base_six <= 0.0 else len(cdf) + 1
+        covered = cdf[-1] if cdf else 0.0
+        residual = (rand_value - covered) / (1.0 - covered)
+        return len(cdf) + int(math.log1p(-residual) / self._tail_log) + 1
+
+    def _filler_sampler(self, countdown: int, pulls: int) -> Tuple[List[float], List[Tuple[int, int]], List[int]]:
+        """(累积概率, [(5星数量, 结束计数)], 5星数量) 抽样表，按5星数量升序，首次使用时从递推结果生成"""
+        key = countdown * (self.chunk + 1) + pulls
+        sampler = self._filler_samplers.get(key)
+        if sampler is None:
+            distribution = self._filler_layers[pulls][countdown]
+            five_counts, end_countdowns = np.nonzero(distribution)
+            sampler = (np.cumsum(distribution[five_counts, end_countdowns]).tolist(),
+                       list(zip(five_counts.tolist(), end_countdowns.tolist())), five_counts.tolist())
+            self._filler_samplers[key] = sampler
+        return sampler
+
+    def sample_fillers(self, countdown: int, pulls: int, rng, deficit: int = 0) -> Tuple[int, int]:
+        """抽样连续 pulls 次未出六星的单抽中5星的数量
+
+        参数:
+            countdown: 开始时的"N次必得"计数，不大于0时按1处理（下一抽必出5星）
+            pulls: 抽数
+            rng: 随机数源
+            deficit: 大于0时，以"这些抽获得的配额小于 deficit"为条件抽样（需 first_passage 可用且 pulls 不超过 chunk）
+
+        返回:
+            (5星数量, 结束时的"N次必得"计数)
+        """
+        five_count = 0
+        countdown = max(countdown, 1)
+        if deficit > 0:
+            cdf, outcomes, five_counts = self._filler_sampler(countdown, pulls)
+            # 配额随5星数量递增，满足条件的结果是按5星数量排序后的前缀
+            five_limit = -(-(deficit - pulls * self.four_quota) // (self.five_quota - self.four_quota))
+            end = bisect_right(five_counts, five_limit - 1)
+            index = min(bisect_right(cdf, rng.random() * cdf[end - 1], 0, end), end - 1)
+            return outcomes[index]
+        while pulls > 0:
+            step = min(pulls, self.chunk)
+            cdf, outcomes, _ = self._filler_sampler(countdown, step)
+            index = min(bisect_right(cdf, rng.random()), len(cdf) - 1)
+            fives, countdown = outcomes[index]
+            five_count += fives
+            pulls -= step
+        return five_count, countdown
+
+    def _flat_layer(self, countdown: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """从计数 countdown 开始、0..chunk-1 抽后的所有非零状态 (抽数, 5星数量, 结束计数, 概率)"""
+        flat = self._flat_layers.get(countdown)
+        if flat is None:
+            parts = []
+            for pulls in range(self.chunk):
+                distribution = self._filler_layers[pulls][countdown]
+                five_counts, end_countdowns = np.nonzero(distribution)
+                parts.append((np.full(len(five_counts), pulls), five_counts, end_countdowns,
+                              distribution[five_counts, end_countdowns]))
+            flat = self._flat_layers[countdown] = tuple(np.concatenate(column) for column in zip(*parts))
+        return flat
+
+    def _crossing_sampler(self, countdown: int, deficit: int) -> Tuple[List[float], List[Tuple[int, int, int]]]:
+        """配额首达分布：未出六星的连续单抽中，配额增量第一次达到 deficit 时的 (抽数, 5星数量, 结束计数)
+
+        配额单调递增，"第 t 抽首次达到"等价于"前 t-1 抽的配额小于 deficit 且第 t 抽后不小于 deficit"，
+        因此只需在无条件分布上按第 t 抽之前的状态筛选，不必为每个缺口重新递推。
+        """
+        key = (countdown, deficit)
+        sampler = self._crossing_samplers.get(key)
+        if sampler is None:
+            pulls, five_counts, end_countdowns, probabilities = self._flat_layer(countdown)
+            quota = pulls * self.four_quota + five_counts * (self.five_quota - self.four_quota)
+            alive = quota < deficit
+            forced = end_countdowns <= 1
+            # 下一抽出5星
+            five = alive & (quota + self.five_quota >= deficit)
+            five_probability = np.where(forced, 1.0, self.five_share)[five] * probabilities[five]
+            # 下一抽出4星（计数未到时）
+            four = alive & ~forced & (quota + self.four_quota >= deficit)
+            four_probability = (1.0 - self.five_share) * probabilities[four]
+            outcome_pulls = np.concatenate([pulls[five], pulls[four]]) + 1
+            outcome_fives = np.concatenate([five_counts[five] + 1, five_counts[four]])
+            outcome_countdowns = np.concatenate([np.full(np.count_nonzero(five), COUNTDOWN_RESET),
+                                                 end_countdowns[four] - 1])
+            sampler = (np.cumsum(np.concatenate([five_probability, four_probability])).tolist(),
+                       list(zip(outcome_pulls.tolist(), outcome_fives.tolist(), outcome_countdowns.tolist())))
+            self._crossing_samplers[key] = sampler
+        return sampler
+
+    def sample_crossing(self, countdown: int, deficit: int, rng) -> Tuple[int, int, int]:
+        """抽样未出六星时配额首次达到 deficit 所需的 (抽数, 5星数量, 结束计数)，需 first_passage 可用"""
+        cdf, outcomes = self._crossing_sampler(max(countdown, 1), deficit)
+        return outcomes[min(bisect_right(cdf, rng.random()), len(cdf) - 1)]
+
+
+def _filler_distributions(five_share: float, max_countdown: int, chunk: int) -> List[np.ndarray]:
+    """递推未出六星的连续单抽中5星数量的分布
+
+    layers[n][c, k, e] 为从计数 c 开始 n 抽后共出 k 个5星、结束计数为 e 的概率。
+    每一抽计数先减1，减到0时必出5星，否则以 five_share 的概率出5星；出5星后计数重置为 COUNTDOWN_RESET。
+    """
+    size = max_countdown + 1
+    layer = np.zeros((size, 1, size))
+    for countdown in range(1, size):
+        layer[countdown, 0, countdown] = 1.0
+    layers = [layer]
+    for pulls in range(1, chunk + 1):
+        previous = layer
+        layer = np.zeros((size, pulls + 1, size))
+        after_five = previous[COUNTDOWN_RESET]
+        layer[1, 1:] = after_five
+        layer[2:, 1:] = five_share * after_five
+        layer[2:, :pulls] += (1.0 - five_share) * previous[1:-1]
+        layers.append(layer)
+    return layers
+
+
+_tables_cache: Dict[tuple, JumpTables] = {}
+
+
+def jump_tables(rules: ScalarRules, max_countdown: int) -> JumpTables:
+    """按规则缓存的跳跃抽样表，同一卡池配置的多个模拟器共用"""
+    key = (tuple(rules.six_star_rate), rules.soft_pity, rules.base_six, rules.four_share,
+           rules.quota_by_rarity[4], rules.quota_by_rarity[5], rules.weapon_cost, max_countdown)
+    tables = _tables_cache.get(key)
+    if tables is None:
+        tables = _tables_cache[key] = JumpTables(rules, max_countdown)
+    return tables
+
+
+class EventSimulator(ScalarSimulator):
+    """跳跃式综合模拟器，接口与 ScalarSimulator 相同
+
+    用法:
+        simulator = EventSimulator(character_pool_config, weapon_pool_config, player_info)
+        results = [simulator.simulate(seed=42, run_index=i) for i in range(10000)]
+    """
+
+    __slots__ = ('tables', 'filler_quota', 'max_filler_quota')
+
+    def __init__(self, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                 player_info: PlayerInfo):
+        """
+        参数:
+            character_pool_config: 角色池配置
+            weapon_pool_config: 武器池配置
+            player_info: 玩家信息（内部状态字段需已计算）
+        """
+        super().__init__(character_pool_config, weapon_pool_config, player_info)
+        countdown = self.player.initial_state[7]
+        self.tables = jump_tables(self.rules, countdown)
+        quota_by_rarity = self.rules.quota_by_rarity
+        self.filler_quota = (quota_by_rarity[4], quota_by_rarity[5] - quota_by_rarity[4])  # (4星配额, 5星多出的配额)
+        self.max_filler_quota = max(quota_by_rarity[4], quota_by_rarity[5])
+
+    def _advance_fillers(self, pulls: int, five_count: int, countdown: int):
+        """跨过 pulls 次未出六星的单抽，其中 five_count 次为5星"""
+        state = self.state
+        four_quota, five_extra = self.filler_quota
+        state.weapon_quota += pulls * four_quota + five_count * five_extra
+        state.five_star_countdown = countdown
+        state.soft_pity_accumulate += pulls
+        state.total_pulls += pulls
+
+    def _skip_fillers(self, pulls: int, rng, deficit: int = 0):
+        """抽样并跨过 pulls 次未出六星的单抽；deficit 大于0时以这些抽未补足该配额缺口为条件"""
+        if pulls <= 0:
+            return
+        five_count, countdown = self.tables.sample_fillers(self.state.five_star_countdown, pulls, rng, deficit)
+        self._advance_fillers(pulls, five_count, countdown)
+
+    def _six_star_pull(self, rng):
+        """按概率（或小保底）出六星的一抽"""
+        rules = self.rules
+        state = self.state
+        state.total_pulls += 1
+        character = _sample_index(rules.character_cdf, rng)
+        self._obtain_character(character)
+        state.weapon_quota += rules.quota_by_rarity[6]
+        if character == rules.limited_character:
+            state.limited_obtained = True
+        state.soft_pity_accumulate = 0
+        state.five_star_countdown = COUNTDOWN_RESET
+
+    def _character_pulls(self, rng, max_pulls: int, deficit: int = 0) -> int:
+        """连续单抽至多 max_pulls 次，出六星或触发大保底/循环保底后立即返回，返回实际抽数
+
+        参数:
+            rng: 角色池随机数源
+            max_pulls: 最多抽数
+            deficit: 大于0时为补充配额的缺口，配额补足后也立即返回（需 first_passage 可用）
+        """
+        rules = self.rules
+        state = self.state
+        if max_pulls == 1:
+            self._single_character_pull(rng)
+            return 1
+        done = 0
+        while done < max_pulls:
+            total_pulls = state.total_pulls
+            # 下一次大保底/循环保底所在的抽是第几抽
+            boundary = rules.loop_pity - total_pulls % rules.loop_pity
+            if not state.limited_obtained and total_pulls < rules.hard_pity:
+                boundary = min(boundary, rules.hard_pity - total_pulls)
+            stretch = min(max_pulls - done, boundary - 1)
+            if stretch > 0:
+                gap = self.tables.sample_gap(state.soft_pity_accumulate, rng)
+                if deficit:
+                    # 六星间隔与4星/5星序列相互独立：先抽样配额首达，早于六星和区间末尾则直接停在首达处
+                    pulls, five_count, countdown = self.tables.sample_crossing(state.five_star_countdown,
+                                                                               deficit, rng)
+                    if pulls < gap and pulls <= stretch:
+                        self._advance_fillers(pulls, five_count, countdown)
+                        return done + pulls
+                if gap <= stretch:
+                    self._skip_fillers(gap - 1, rng, deficit)
+                    self._six_star_pull(rng)
+                    return done + gap
+                self._skip_fillers(stretch, rng, deficit)
+                done += stretch
+                if done == max_pulls:
+                    break
+            self._single_character_pull(rng)
+            return done + 1
+        return done
+
+    def _paid_character_pulls(self, rng, character_pulls: int, quota_target: int) -> int:
+        """连续付费单抽，直到出六星或下一抽前主循环的判断可能改变"""
+        player = self.player
+        state = self.state
+        max_pulls = _NEVER
+        if player.character_pull_limit > 0:
+            max_pulls = player.character_pull_limit - character_pulls
+        if not state.urgent_recruitment_got and state.total_pulls < self.rules.urgent_pity:
+            max_pulls = min(max_pulls, self.rules.urgent_pity - state.total_pulls)
+        if quota_target:
+            deficit = quota_target - state.weapon_quota
+            if self.tables.first_passage and deficit <= self.tables.chunk * self.tables.four_quota:
+                return self._character_pulls(rng, max(max_pulls, 1), deficit)
+            # 未出六星时每抽配额至多增加 max_filler_quota，在此之前不可能达到目标
+            if self.max_filler_quota > 0:
+                max_pulls = min(max_pulls, -(-deficit // self.max_filler_quota))
+        elif state.character_remaining == 0:
+            max_pulls = min(max_pulls, player.character_pull_minimum - character_pulls)
+        return self._character_pulls(rng, max(max_pulls, 1))
+
+    def _ten_character_pulls(self, rng):
+        """角色池十连抽；非紧急招募的十连按跳跃方式完成十抽"""
+        state = self.state
+        if state.ten_pull_count_urgent != 0:
+            super()._ten_character_pulls(rng)
+            return
+        done = 0
+        while done < 10:
+            done += self._character_pulls(rng, 10 - done)
+        if state.ten_pull_count > 0:
+            state.ten_pull_count -= 1
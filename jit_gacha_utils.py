@@ -0,0 +1,880 @@
+"""
+编译型抽卡引擎模块 - 用 Numba 在 nopython 模式下批量执行角色池+武器池综合模拟
+
+内核是 combined_character_weapon_simulation 的逐行移植，运行在整数状态向量和整数编码的目标上。
+随机数使用与 rng_utils 相同的 Philox4x64-10 计数器随机流，相同种子下与纯 Python 引擎结果逐位一致。
+未安装 Numba 时自动回退到纯 Python 标量引擎。
+"""
+from typing import List, Sequence, Tuple
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+from rng_utils import new_seed, STREAM_CHARACTER, STREAM_WEAPON, STREAMS_PER_BANNER
+from compiled_rules import (
+    CompiledScenarios, CompiledCampaign, compile_rules, compile_player, compile_scenarios, records_from_matrix,
+    records_from_results, RESULT_DTYPE, N_RESULT_COLUMNS, RESULT_RUN_COLUMN,
+    I_PULLS, I_VOUCHERS, I_QUOTA, B_PULL, B_MIN_AVAILABLE, B_MAX_PAID, N_CAMPAIGN_COLUMNS,
+    R_SOFT_PITY, R_HARD_PITY, R_LOOP_PITY, R_URGENT_PITY, R_QUOTA_FOUR, R_QUOTA_SIX,
+    R_CHARACTER_LIMITED, R_WEAPON_COST, R_WEAPON_LIMITED, F_BASE_SIX, F_FOUR_SHARE, F_WEAPON_BASE_SIX,
+    P_SOFT, P_TOTAL, P_LIMITED, P_QUOTA, P_TEN, P_URGENT, P_URGENT_GOT, P_FIVE,
+    P_WEAPON_TOTAL, P_WEAPON_LIMITED, P_WEAPON_SIX, P_WEAPON_BOXES, N_STATE,
+    P_LOW_QUOTA, P_ALWAYS_TEN, P_CHARACTER_LIMIT, P_CHARACTER_MINIMUM, P_WEAPON_LIMIT, P_WEAPON_MINIMUM,
+    FAILURE_CHARACTER_LIMIT, FAILURE_WEAPON_LIMIT, FAILURE_QUOTA_CHARACTER_LIMIT, FAILURE_QUOTA_INSUFFICIENT,
+    FAILURE_STRATEGY_STOP,
+)
+from strategy_rules import (
+    V_SOFT_PITY, V_BANNER_PULLS, V_CHARACTER_PULLS, V_PAID_PULLS, V_URGENT_PULLS, V_WEAPON_TEN_PULLS, V_QUOTA,
+    V_EXTRA_QUOTA, V_VOUCHERS, V_URGENT_VOUCHERS, V_LIMITED_OBTAINED, V_WEAPON_LIMITED_OBTAINED,
+    V_CHARACTER_GOALS_MET, V_WEAPON_GOALS_MET, V_CHARACTER_DONE, V_WEAPON_DONE, V_WEAPON_COST,
+    V_CHARACTER_PULL_LIMIT, V_CHARACTER_PULL_MINIMUM, V_WEAPON_PULL_LIMIT, V_WEAPON_PULL_MINIMUM,
+    V_ALWAYS_PULL_TEN, V_LOW_QUOTA_CHARACTER_PULL, N_VARIABLES,
+    A_STOP, A_CHARACTER_PULL, A_CHARACTER_TEN_PULL, A_WEAPON_TEN_PULL, A_BUY_QUOTA,
+    O_LT, O_LE, O_GT, O_GE, O_EQ,
+    RULE_ACTION, RULE_REASON, RULE_FIRST_CONDITION, RULE_STOP_CONDITION,
+    CONDITION_VARIABLE, CONDITION_OP, CONDITION_RIGHT_IS_VARIABLE, CONDITION_RIGHT, MAX_STRATEGY_STEPS,
+)
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:  # Numba 为可选依赖
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """未安装 Numba 时的占位装饰器，原样返回函数"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+    prange = range
+
+
+# Philox4x64-10 常量（与 numpy.random.Philox 相同）
+_PHILOX_M0 = np.uint64(0xD2E7470EE14C6C93)
+_PHILOX_M1 = np.uint64(0xCA5A826395121157)
+_PHILOX_W0 = np.uint64(0x9E3779B97F4A7C15)
+_PHILOX_W1 = np.uint64(0xBB67AE8584CAA73B)
+_MASK32 = np.uint64(0xFFFFFFFF)
+_SHIFT32 = np.uint64(32)
+_DOUBLE_SHIFT = np.uint64(11)
+_DOUBLE_SCALE = 1.0 / 9007199254740992.0
+
+# 多期连续模拟读取的单期结果列
+_RESULT_CHARACTER_PULLS = RESULT_DTYPE.names.index('character_pulls')
+_RESULT_WEAPON_TEN_PULLS = RESULT_DTYPE.names.index('weapon_ten_pulls')
+_RESULT_EXTRA_QUOTA = RESULT_DTYPE.names.index('extra_quota_purchased')
+_RESULT_SUCCESS = RESULT_DTYPE.names.index('success')
+_RESULT_FAILURE = RESULT_DTYPE.names.index('failure_reason')
+
+# 随机流状态向量下标：密钥(2) + 计数器(4) + 输出缓冲(4) + 缓冲位置(1)
+S_KEY = 0
+S_COUNTER = 2
+S_BUFFER = 6
+S_POSITION = 10
+N_STREAM_STATE = 11
+
+
+@njit(cache=True)
+def _mulhilo64(a, b):
+    """64位无符号乘法，返回 (高64位, 低64位)"""
+    a_lo = a & _MASK32
+    a_hi = a >> _SHIFT32
+    b_lo = b & _MASK32
+    b_hi = b >> _SHIFT32
+    lo_lo = a_lo * b_lo
+    hi_lo = a_hi * b_lo
+    lo_hi = a_lo * b_hi
+    cross = (lo_lo >> _SHIFT32) + (hi_lo & _MASK32) + lo_hi
+    hi = a_hi * b_hi + (hi_lo >> _SHIFT32) + (cross >> _SHIFT32)
+    return hi, a * b
+
+
+@njit(cache=True)
+def _stream_init(stream_state, seed, run_index, stream):
+    """初始化一条随机流，与 rng_utils.PhiloxStream(seed, run_index, stream) 相同"""
+    stream_state[S_KEY] = seed
+    stream_state[S_KEY + 1] = run_index
+    stream_state[S_COUNTER] = 0
+    stream_state[S_COUNTER + 1] = 0
+    stream_state[S_COUNTER + 2] = 0
+    stream_state[S_COUNTER + 3] = stream
+    stream_state[S_POSITION] = 4
+
+
+@njit(cache=True)
+def _stream_refill(stream_state):
+    """计数器加1后生成下一组4个64位输出"""
+    for i in range(4):
+        stream_state[S_COUNTER + i] += np.uint64(1)
+        if stream_state[S_COUNTER + i] != 0:
+            break
+    c0 = stream_state[S_COUNTER]
+    c1 = stream_state[S_COUNTER + 1]
+    c2 = stream_state[S_COUNTER + 2]
+    c3 = stream_state[S_COUNTER + 3]
+    k0 = stream_state[S_KEY]
+    k1 = stream_state[S_KEY + 1]
+    for round_index in range(10):
+        if round_index > 0:
+            k0 += _PHILOX_W0
+            k1 += _PHILOX_W1
+        hi0, lo0 = _mulhilo64(_PHILOX_M0, c0)
+        hi1, lo1 = _mulhilo64(_PHILOX_M1, c2)
+        c0 = hi1 ^ c1 ^ k0
+        c1 = lo1
+        c2 = hi0 ^ c3 ^ k1
+        c3 = lo0
+    stream_state[S_BUFFER] = c0
+    stream_state[S_BUFFER + 1] = c1
+    stream_state[S_BUFFER + 2] = c2
+    stream_state[S_BUFFER + 3] = c3
+    stream_state[S_POSITION] = 0
+
+
+@njit(cache=True)
+def _stream_random(stream_state):
+    """取下一个 [0, 1) 均匀随机数"""
+    if stream_state[S_POSITION] >= 4:
+        _stream_refill(stream_state)
+    position = stream_state[S_POSITION]
+    stream_state[S_POSITION] = position + np.uint64(1)
+    return np.float64(stream_state[S_BUFFER + position] >> _DOUBLE_SHIFT) * _DOUBLE_SCALE
+
+
+@njit(cache=True)
+def _sample_index(cdf, rng):
+    """按累积概率表抽取一个物品编码，与 get_six_star_*_by_probability 的判定方式一致"""
+    rand_value = _stream_random(rng)
+    for i in range(cdf.shape[0]):
+        if rand_value <= cdf[i]:
+            return i
+    return cdf.shape[0] - 1
+
+
+@njit(cache=True)
+def _draw_character(float_rules, character_cdf, six_probability, rng):
+    """按概率抽取一个角色，返回 (角色编码, 稀有度)，未抽中六星时编码为-1"""
+    if _stream_random(rng) <= six_probability:
+        return _sample_index(character_cdf, rng), 6
+    if _stream_random(rng) <= float_rules[F_FOUR_SHARE]:
+        return -1, 4
+    return -1, 5
+
+
+@njit(cache=True)
+def _single_character_pull(int_rules, float_rules, six_star_rate, character_cdf, state, character_got, rng):
+    """单次角色池抽卡，对应 perform_single_character_pull"""
+    limited = int_rules[R_CHARACTER_LIMITED]
+    state[P_SOFT] += 1
+    state[P_TOTAL] += 1
+    state[P_FIVE] -= 1
+
+    # 循环保底赠送，不给武器配额
+    total_pulls = state[P_TOTAL]
+    loop_pity = int_rules[R_LOOP_PITY]
+    if total_pulls >= loop_pity and total_pulls % loop_pity == 0:
+        character_got[limited] += 1
+        state[P_SOFT] = 0
+
+    if state[P_LIMITED] == 0 and total_pulls == int_rules[R_HARD_PITY]:
+        # 大保底
+        character_got[limited] += 1
+        state[P_QUOTA] += int_rules[R_QUOTA_SIX]
+        state[P_LIMITED] = 1
+        state[P_SOFT] = 0
+        state[P_FIVE] = 10
+    elif state[P_SOFT] == int_rules[R_SOFT_PITY]:
+        # 小保底
+        character = _sample_index(character_cdf, rng)
+        character_got[character] += 1
+        state[P_QUOTA] += int_rules[R_QUOTA_SIX]
+        if character == limited:
+            state[P_LIMITED] = 1
+        state[P_SOFT] = 0
+        state[P_FIVE] = 10
+    else:
+        soft_pity_count = state[P_SOFT]
+        if soft_pity_count < six_star_rate.shape[0]:
+            six_probability = six_star_rate[soft_pity_count]
+        else:
+            six_probability = float_rules[F_BASE_SIX]
+        character, rarity = _draw_character(float_rules, character_cdf, six_probability, rng)
+        # 已经10发未出5星或6星，强制出一个5星
+        if state[P_FIVE] <= 0 and rarity < 5:
+            character = -1
+            rarity = 5
+        state[P_QUOTA] += int_rules[R_QUOTA_FOUR + rarity - 4]
+        if rarity >= 5:
+            state[P_FIVE] = 10
+        if character == limited:
+            state[P_LIMITED] = 1
+        if character >= 0:
+            character_got[character] += 1
+            state[P_SOFT] = 0
+
+
+@njit(cache=True)
+def _ten_character_pulls(int_rules, float_rules, six_star_rate, character_cdf, state, character_got, rng):
+    """角色池十连抽，对应 perform_ten_character_pulls"""
+    use_urgent_pulls = state[P_URGENT] != 0
+    for _ in range(10):
+        if not use_urgent_pulls:
+            _single_character_pull(int_rules, float_rules, six_star_rate, character_cdf, state, character_got, rng)
+        else:
+            # 紧急招募使用基础概率（不累计大小保底和五星保底）
+            character, rarity = _draw_character(float_rules, character_cdf, float_rules[F_BASE_SIX], rng)
+            state[P_QUOTA] += int_rules[R_QUOTA_FOUR + rarity - 4]
+            if character >= 0:
+                character_got[character] += 1
+
+    if use_urgent_pulls:
+        state[P_URGENT] -= 1
+    elif state[P_TEN] > 0:
+        state[P_TEN] -= 1
+
+
+@njit(cache=True)
+def _ten_weapon_pulls(int_rules, float_rules, weapon_cdf, state, weapon_got, rng):
+    """武器池十连抽，对应 perform_ten_weapon_pulls"""
+    cost = int_rules[R_WEAPON_COST]
+    limited = int_rules[R_WEAPON_LIMITED]
+    if state[P_QUOTA] < cost:
+        return
+    state[P_QUOTA] -= cost
+    state[P_WEAPON_TOTAL] += 1
+    total_pulls = state[P_WEAPON_TOTAL]
+
+    # 特殊奖励
+    if total_pulls == 10:
+        state[P_WEAPON_BOXES] += 1
+    elif total_pulls == 18:
+        weapon_got[limited] += 1
+        state[P_WEAPON_LIMITED] = 1
+    elif total_pulls > 18:
+        cycles_after_18 = total_pulls - 18
+        if cycles_after_18 % 8 == 0:
+            if (cycles_after_18 // 8) % 2 == 1:
+                state[P_WEAPON_BOXES] += 1
+            else:
+                weapon_got[limited] += 1
+                state[P_WEAPON_LIMITED] = 1
+
+    # 正常概率抽取
+    for _ in range(10):
+        if _stream_random(rng) <= float_rules[F_WEAPON_BASE_SIX]:
+            weapon = _sample_index(weapon_cdf, rng)
+            weapon_got[weapon] += 1
+            state[P_WEAPON_SIX] = 1
+            if weapon == limited:
+                state[P_WEAPON_LIMITED] = 1
+
+    # 保底，限定保底优先级高于六星保底
+    if total_pulls == 8 and state[P_WEAPON_LIMITED] == 0:
+        weapon_got[limited] += 1
+        state[P_WEAPON_LIMITED] = 1
+        state[P_WEAPON_SIX] = 1
+    elif total_pulls == 4 and state[P_WEAPON_SIX] == 0:
+        weapon = _sample_index(weapon_cdf, rng)
+        weapon_got[weapon] += 1
+        state[P_WEAPON_SIX] = 1
+        if weapon == limited:
+            state[P_WEAPON_LIMITED] = 1
+
+
+@njit(cache=True)
+def _goals_achieved(got, goal_counts):
+    """检查是否达成所有目标，对应 character_goals_achieved/weapon_goals_achieved"""
+    for i in range(goal_counts.shape[0]):
+        if got[i] < goal_counts[i]:
+            return False
+    return True
+
+
+@njit(cache=True)
+def _grant_urgent_recruitment(int_rules, state):
+    """紧急招募更新"""
+    if state[P_URGENT_GOT] == 0 and state[P_TOTAL] >= int_rules[R_URGENT_PITY]:
+        state[P_URGENT] += 1
+        state[P_URGENT_GOT] = 1
+
+
+@njit(cache=True)
+def _write_result(out, character_pulls, urgent_pulls, weapon_ten_pulls, quota_used, remaining_quota,
+                  supply_boxes, extra_quota, success, failure_reason):
+    """按 RESULT_DTYPE 字段顺序写出一次模拟的结果"""
+    out[0] = character_pulls
+    out[1] = urgent_pulls
+    out[2] = weapon_ten_pulls
+    out[3] = quota_used
+    out[4] = remaining_quota
+    out[5] = supply_boxes
+    out[6] = extra_quota
+    out[7] = success
+    out[8] = failure_reason
+
+
+@njit(cache=True)
+def _simulate_run(int_rules, float_rules, six_star_rate, character_cdf, weapon_cdf,
+                  player_params, character_goal_counts, weapon_goal_counts, character_rng, weapon_rng, out):
+    """单次综合模拟，对应 combined_character_weapon_simulation"""
+    _simulate_run_state(int_rules, float_rules, six_star_rate, character_cdf, weapon_cdf,
+                        player_params, player_params[:N_STATE].copy(), character_goal_counts, weapon_goal_counts,
+                        character_rng, weapon_rng, out)
+
+
+@njit(cache=True)
+def _simulate_run_state(int_rules, float_rules, six_star_rate, character_cdf, weapon_cdf,
+                        player_params, state, character_goal_counts, weapon_goal_counts, character_rng, weapon_rng,
+                        out):
+    """从给定的运行时状态 state 开始单次综合模拟，结束时 state 即模拟后的状态（多期连续模拟据此结转）"""
+    character_got = np.zeros(character_goal_counts.shape[0], dtype=np.int64)
+    weapon_got = np.zeros(weapon_goal_counts.shape[0], dtype=np.int64)
+    cost = int_rules[R_WEAPON_COST]
+
+    character_paid_pulls = 0
+    character_free_pulls = 0
+    character_urgent_pulls = 0
+    weapon_ten_pulls = 0
+    extra_quota_purchased = 0
+
+    character_pull_limit = player_params[P_CHARACTER_LIMIT]
+    weapon_pull_limit = player_params[P_WEAPON_LIMIT]
+
+    # ========== 阶段1: 抽角色池直到满足目标和约束 ==========
+    while True:
+        if _goals_achieved(character_got, character_goal_counts):
+            if character_paid_pulls + character_free_pulls >= player_params[P_CHARACTER_MINIMUM]:
+                break
+        if character_pull_limit > 0 and character_paid_pulls + character_free_pulls >= character_pull_limit:
+            _write_result(out, character_paid_pulls + character_free_pulls, character_urgent_pulls,
+                          weapon_ten_pulls, 0, state[P_QUOTA], 0, extra_quota_purchased,
+                          0, FAILURE_CHARACTER_LIMIT)
+            return
+
+        _grant_urgent_recruitment(int_rules, state)
+
+        if state[P_TEN] > 0 or state[P_URGENT] > 0:
+            using_urgent = state[P_URGENT] > 0
+            _ten_character_pulls(int_rules, float_rules, six_star_rate, character_cdf, state, character_got,
+                                 character_rng)
+            if using_urgent:
+                character_urgent_pulls += 10
+            else:
+                character_free_pulls += 10
+        elif player_params[P_ALWAYS_TEN] != 0:
+            _ten_character_pulls(int_rules, float_rules, six_star_rate, character_cdf, state, character_got,
+                                 character_rng)
+            character_paid_pulls += 10
+        else:
+            _single_character_pull(int_rules, float_rules, six_star_rate, character_cdf, state, character_got,
+                                   character_rng)
+            character_paid_pulls += 1
+
+    # ========== 阶段2: 抽武器池直到满足目标和约束 ==========
+    while True:
+        if _goals_achieved(weapon_got, weapon_goal_counts):
+            if weapon_ten_pulls >= player_params[P_WEAPON_MINIMUM]:
+                break
+        if weapon_pull_limit > 0 and weapon_ten_pulls >= weapon_pull_limit:
+            _write_result(out, character_paid_pulls + character_free_pulls, character_urgent_pulls,
+                          weapon_ten_pulls, weapon_ten_pulls * cost, state[P_QUOTA], state[P_WEAPON_BOXES],
+                          extra_quota_purchased, 0, FAILURE_WEAPON_LIMIT)
+            return
+
+        while state[P_QUOTA] < cost:
+            if player_params[P_LOW_QUOTA] == 0:
+                quota_needed = cost - state[P_QUOTA]
+                state[P_QUOTA] += quota_needed
+                extra_quota_purchased += quota_needed
+                break
+            if character_pull_limit > 0 and character_paid_pulls + character_free_pulls >= character_pull_limit:
+                _write_result(out, character_paid_pulls + character_free_pulls, character_urgent_pulls,
+                              weapon_ten_pulls, weapon_ten_pulls * cost, state[P_QUOTA], state[P_WEAPON_BOXES],
+                              extra_quota_purchased, 0, FAILURE_QUOTA_CHARACTER_LIMIT)
+                return
+
+            _grant_urgent_recruitment(int_rules, state)
+
+            if state[P_TEN] > 0 or state[P_URGENT] > 0:
+                using_urgent = state[P_URGENT] > 0
+                _ten_character_pulls(int_rules, float_rules, six_star_rate, character_cdf, state, character_got,
+                                     character_rng)
+                if using_urgent:
+                    character_urgent_pulls += 10
+                else:
+                    character_free_pulls += 10
+            else:
+                _single_character_pull(int_rules, float_rules, six_star_rate, character_cdf, state, character_got,
+                                       character_rng)
+                character_paid_pulls += 1
+
+            if state[P_QUOTA] >= cost:
+                break
+
+        if state[P_QUOTA] < cost:
+            _write_result(out, character_paid_pulls + character_free_pulls, character_urgent_pulls,
+                          weapon_ten_pulls, weapon_ten_pulls * cost, state[P_QUOTA], state[P_WEAPON_BOXES],
+                          extra_quota_purchased, 0, FAILURE_QUOTA_INSUFFICIENT)
+            return
+
+        _ten_weapon_pulls(int_rules, float_rules, weapon_cdf, state, weapon_got, weapon_rng)
+        weapon_ten_pulls += 1
+
+    success = _goals_achieved(weapon_got, weapon_goal_counts)
+    _write_result(out, character_paid_pulls + character_free_pulls, character_urgent_pulls,
+                  weapon_ten_pulls, weapon_ten_pulls * cost, state[P_QUOTA], state[P_WEAPON_BOXES],
+                  extra_quota_purchased, success, 0)
+
+
+@njit(cache=True)
+def _condition_holds(condition, variables):
+    """判断策略的一个条件 (左侧变量, 运算, 右侧是否为变量, 右侧) 是否成立"""
+    left = variables[condition[CONDITION_VARIABLE]]
+    right = condition[CONDITION_RIGHT]
+    if condition[CONDITION_RIGHT_IS_VARIABLE] != 0:
+        right = variables[right]
+    op = condition[CONDITION_OP]
+    if op == O_LT:
+        return left < right
+    if op == O_LE:
+        return left <= right
+    if op == O_GT:
+        return left > right
+    if op == O_GE:
+        return left >= right
+    if op == O_EQ:
+        return left == right
+    return left != right
+
+
+@njit(cache=True)
+def _simulate_strategy_run(int_rules, float_rules, six_star_rate, character_cdf, weapon_cdf,
+                           player_params, character_goal_counts, weapon_goal_counts, rule_table, condition_table,
+                           character_rng, weapon_rng, out):
+    """按编译后的抽卡策略执行单次综合模拟，对应 strategy_utils.StrategySimulator.run
+
+    每一步按顺序检查策略的规则，执行第一条条件全部成立的规则的动作；没有规则成立时停止。
+    """
+    state = player_params[:N_STATE].copy()
+    character_got = np.zeros(character_goal_counts.shape[0], dtype=np.int64)
+    weapon_got = np.zeros(weapon_goal_counts.shape[0], dtype=np.int64)
+    cost = int_rules[R_WEAPON_COST]
+    variables = np.zeros(N_VARIABLES, dtype=np.int64)
+    variables[V_WEAPON_COST] = cost
+    variables[V_CHARACTER_PULL_LIMIT] = player_params[P_CHARACTER_LIMIT]
+    variables[V_CHARACTER_PULL_MINIMUM] = player_params[P_CHARACTER_MINIMUM]
+    variables[V_WEAPON_PULL_LIMIT] = player_params[P_WEAPON_LIMIT]
+    variables[V_WEAPON_PULL_MINIMUM] = player_params[P_WEAPON_MINIMUM]
+    variables[V_ALWAYS_PULL_TEN] = player_params[P_ALWAYS_TEN]
+    variables[V_LOW_QUOTA_CHARACTER_PULL] = player_params[P_LOW_QUOTA]
+
+    paid_pulls = 0
+    free_pulls = 0
+    urgent_pulls = 0
+    weapon_ten_pulls = 0
+    extra_quota_purchased = 0
+    reason = FAILURE_STRATEGY_STOP  # 超出步数时的失败原因
+    for _ in range(MAX_STRATEGY_STEPS):
+        character_goals_met = _goals_achieved(character_got, character_goal_counts)
+        weapon_goals_met = _goals_achieved(weapon_got, weapon_goal_counts)
+        variables[V_SOFT_PITY] = state[P_SOFT]
+        variables[V_BANNER_PULLS] = state[P_TOTAL]
+        variables[V_CHARACTER_PULLS] = paid_pulls + free_pulls
+        variables[V_PAID_PULLS] = paid_pulls
+        variables[V_URGENT_PULLS] = urgent_pulls
+        variables[V_WEAPON_TEN_PULLS] = weapon_ten_pulls
+        variables[V_QUOTA] = state[P_QUOTA]
+        variables[V_EXTRA_QUOTA] = extra_quota_purchased
+        variables[V_VOUCHERS] = state[P_TEN]
+        variables[V_URGENT_VOUCHERS] = state[P_URGENT]
+        variables[V_LIMITED_OBTAINED] = state[P_LIMITED]
+        variables[V_WEAPON_LIMITED_OBTAINED] = state[P_WEAPON_LIMITED]
+        variables[V_CHARACTER_GOALS_MET] = character_goals_met
+        variables[V_WEAPON_GOALS_MET] = weapon_goals_met
+        variables[V_CHARACTER_DONE] = character_goals_met and paid_pulls + free_pulls >= player_params[
+            P_CHARACTER_MINIMUM]
+        variables[V_WEAPON_DONE] = weapon_goals_met and weapon_ten_pulls >= player_params[P_WEAPON_MINIMUM]
+
+        action = A_STOP
+        rule_reason = 0
+        for rule in range(rule_table.shape[0]):
+            matched = True
+            for condition in range(rule_table[rule, RULE_FIRST_CONDITION], rule_table[rule, RULE_STOP_CONDITION]):
+                if not _condition_holds(condition_table[condition], variables):
+                    matched = False
+                    break
+            if matched:
+                action = rule_table[rule, RULE_ACTION]
+                rule_reason = rule_table[rule, RULE_REASON]
+                break
+
+        if action == A_STOP:
+            reason = rule_reason
+            break
+        if action == A_CHARACTER_PULL or action == A_CHARACTER_TEN_PULL:
+            _grant_urgent_recruitment(int_rules, state)
+            if state[P_TEN] > 0 or state[P_URGENT] > 0:
+                using_urgent = state[P_URGENT] > 0
+                _ten_character_pulls(int_rules, float_rules, six_star_rate, character_cdf, state, character_got,
+                                     character_rng)
+                if using_urgent:
+                    urgent_pulls += 10
+                else:
+                    free_pulls += 10
+            elif action == A_CHARACTER_TEN_PULL:
+                _ten_character_pulls(int_rules, float_rules, six_star_rate, character_cdf, state, character_got,
+                                     character_rng)
+                paid_pulls += 10
+            else:
+                _single_character_pull(int_rules, float_rules, six_star_rate, character_cdf, state, character_got,
+                                       character_rng)
+                paid_pulls += 1
+        elif action == A_WEAPON_TEN_PULL:
+            if state[P_QUOTA] < cost:
+                reason = FAILURE_QUOTA_INSUFFICIENT
+                break
+            _ten_weapon_pulls(int_rules, float_rules, weapon_cdf, state, weapon_got, weapon_rng)
+            weapon_ten_pulls += 1
+        elif action == A_BUY_QUOTA:
+            if state[P_QUOTA] < cost:
+                extra_quota_purchased += cost - state[P_QUOTA]
+                state[P_QUOTA] = cost
+
+    # 不带失败原因的停止：两个池的目标都满足即成功
+    success = False
+    if reason == 0:
+        success = _goals_achieved(character_got, character_goal_counts) and _goals_achieved(weapon_got,
+                                                                                              weapon_goal_counts)
+        if not success:
+            reason = FAILURE_STRATEGY_STOP
+    _write_result(out, paid_pulls + free_pulls, urgent_pulls, weapon_ten_pulls, weapon_ten_pulls * cost,
+                  state[P_QUOTA], state[P_WEAPON_BOXES], extra_quota_purchased, success, reason)
+
+
+def _simulate_strategy_batch_impl(int_rules, float_rules, six_star_rate, character_cdf, weapon_cdf,
+                                  player_params, character_goal_counts, weapon_goal_counts, rule_table,
+                                  condition_table, seed, first_run, out):
+    """按抽卡策略批量模拟，第 i 行 out 对应编号为 first_run+i 的模拟，随机流与 _simulate_batch_impl 相同"""
+    for run in prange(out.shape[0]):
+        run_index = first_run + run
+        character_rng = np.empty(N_STREAM_STATE, dtype=np.uint64)
+        weapon_rng = np.empty(N_STREAM_STATE, dtype=np.uint64)
+        _stream_init(character_rng, seed, np.uint64(run_index), np.uint64(STREAM_CHARACTER))
+        _stream_init(weapon_rng, seed, np.uint64(run_index), np.uint64(STREAM_WEAPON))
+        _simulate_strategy_run(int_rules, float_rules, six_star_rate, character_cdf, weapon_cdf,
+                               player_params, character_goal_counts, weapon_goal_counts, rule_table,
+                               condition_table, character_rng, weapon_rng, out[run])
+        out[run, RESULT_RUN_COLUMN] = run_index
+
+
+_simulate_strategy_batch_parallel = njit(parallel=True, cache=True)(_simulate_strategy_batch_impl)
+_simulate_strategy_batch_serial = njit(cache=True)(_simulate_strategy_batch_impl)
+
+
+def simulate_strategy_batch(character_pool_config: CharacterPoolConfig,
+                            weapon_pool_config: WeaponPoolConfig,
+                            player_info: PlayerInfo,
+                            rule_table: np.ndarray,
+                            condition_table: np.ndarray,
+                            simulation_runs: int,
+                            seed: int,
+                            parallel: bool = True,
+                            first_run: int = 0) -> np.ndarray:
+    """按编译后的抽卡策略（strategy_utils.Strategy 的规则表和条件表）批量执行综合模拟
+
+    未安装 Numba 时内核以纯 Python 执行，结果相同但非常慢（strategy_utils 会改用标量实现）。
+
+    返回:
+        RESULT_DTYPE 结果记录数组
+    """
+    rules = compile_rules(character_pool_config, weapon_pool_config,
+                          player_info.character_goals, player_info.weapon_goals)
+    player = compile_player(player_info, character_pool_config, rules)
+    out = np.zeros((simulation_runs, N_RESULT_COLUMNS), dtype=np.int64)
+    simulate_batch = _simulate_strategy_batch_parallel if parallel else _simulate_strategy_batch_serial
+    simulate_batch(rules.int_rules, rules.float_rules, rules.six_star_rate, rules.character_cdf, rules.weapon_cdf,
+                   player.params, player.character_goal_counts, player.weapon_goal_counts,
+                   rule_table, condition_table, np.uint64(seed), first_run, out)
+    return records_from_matrix(out)
+
+
+def _simulate_batch_impl(int_rules, float_rules, six_star_rate, character_cdf, weapon_cdf,
+                         player_params, character_goal_counts, weapon_goal_counts, seed, first_run, out):
+    """批量模拟，第 i 行 out 对应编号为 first_run+i 的模拟，其随机流只由 (seed, 编号, 卡池) 决定"""
+    for run in prange(out.shape[0]):
+        run_index = first_run + run
+        character_rng = np.empty(N_STREAM_STATE, dtype=np.uint64)
+        weapon_rng = np.empty(N_STREAM_STATE, dtype=np.uint64)
+        _stream_init(character_rng, seed, np.uint64(run_index), np.uint64(STREAM_CHARACTER))
+        _stream_init(weapon_rng, seed, np.uint64(run_index), np.uint64(STREAM_WEAPON))
+        _simulate_run(int_rules, float_rules, six_star_rate, character_cdf, weapon_cdf,
+                      player_params, character_goal_counts, weapon_goal_counts, character_rng, weapon_rng, out[run])
+        out[run, RESULT_RUN_COLUMN] = run_index
+
+
+_simulate_batch_parallel = njit(parallel=True, cache=True)(_simulate_batch_impl)
+_simulate_batch_serial = njit(cache=True)(_simulate_batch_impl)
+
+
+def combined_character_weapon_simulation_batch(
+    character_pool_config: CharacterPoolConfig,
+    weapon_pool_config: WeaponPoolConfig,
+    player_info: PlayerInfo,
+    simulation_runs: int,
+    seed: int = None,
+    parallel: bool = True,
+    first_run: int = 0
+) -> np.ndarray:
+    """批量执行角色池+武器池的综合模拟
+
+    参数:
+        character_pool_config: 角色池配置
+        weapon_pool_config: 武器池配置
+        player_info: 玩家信息（内部状态字段需已计算）
+        simulation_runs: 模拟次数
+        seed: 随机种子，None表示随机生成；结果与线程数、分块方式无关，
+              且与 combined_character_weapon_simulation(seed=seed, run_index=编号) 逐位一致
+        parallel: 是否多线程并行（仅Numba可用时生效）
+        first_run: 第一次模拟的编号，分块执行时依次传入各块的起始编号
+
+    返回:
+        RESULT_DTYPE 结果记录数组，可用 compiled_rules.results_from_records 转换为结果字典列表
+    """
+    if seed is None:
+        seed = new_seed()
+    if not NUMBA_AVAILABLE:
+        # 回退到结果相同的纯 Python 标量引擎
+        from scalar_gacha_utils import ScalarSimulator
+        simulator = ScalarSimulator(character_pool_config, weapon_pool_config, player_info)
+        return records_from_results([
+            simulator.simulate(seed=seed, run_index=run_index)
+            for run_index in range(first_run, first_run + simulation_runs)
+        ])
+
+    rules = compile_rules(character_pool_config, weapon_pool_config,
+                          player_info.character_goals, player_info.weapon_goals)
+    player = compile_player(player_info, character_pool_config, rules)
+    out = np.zeros((simulation_runs, N_RESULT_COLUMNS), dtype=np.int64)
+    simulate_batch = _simulate_batch_parallel if parallel else _simulate_batch_serial
+    simulate_batch(rules.int_rules, rules.float_rules, rules.six_star_rate, rules.character_cdf, rules.weapon_cdf,
+                   player.params, player.character_goal_counts, player.weapon_goal_counts,
+                   np.uint64(seed), first_run, out)
+
+    return records_from_matrix(out)
+
+
+def _simulate_scenarios_impl(rule_index, int_rules, float_rules, six_star_rate, six_star_rate_lengths,
+                             character_cdf, character_cdf_lengths, weapon_cdf, weapon_cdf_lengths,
+                             player_params, character_goal_counts, weapon_goal_counts, seed, first_run,
+                             scenario_stride, out):
+    """多场景批量模拟，out[s, i] 对应场景 s 中编号为 first_run + s*scenario_stride + i 的模拟
+
+    scenario_stride 为0时同一编号的模拟在所有场景中使用同一组随机流（公共随机数），场景之间的差异不受抽样噪声干扰；
+    为每场景模拟次数时各场景使用互不重叠的随机流（如玩家群体中的每个玩家）。
+    """
+    runs = out.shape[1]
+    for task in prange(out.shape[0] * runs):
+        scenario = task // runs
+        run = task % runs
+        run_index = first_run + scenario * scenario_stride + run
+        table = rule_index[scenario]
+        character_rng = np.empty(N_STREAM_STATE, dtype=np.uint64)
+        weapon_rng = np.empty(N_STREAM_STATE, dtype=np.uint64)
+        _stream_init(character_rng, seed, np.uint64(run_index), np.uint64(STREAM_CHARACTER))
+        _stream_init(weapon_rng, seed, np.uint64(run_index), np.uint64(STREAM_WEAPON))
+        _simulate_run(int_rules[table], float_rules[table],
+                      six_star_rate[table, :six_star_rate_lengths[table]],
+                      character_cdf[table, :character_cdf_lengths[table]],
+                      weapon_cdf[table, :weapon_cdf_lengths[table]],
+                      player_params[scenario], character_goal_counts[scenario], weapon_goal_counts[scenario],
+                      character_rng, weapon_rng, out[scenario, run])
+        out[scenario, run, RESULT_RUN_COLUMN] = run_index
+
+
+_simulate_scenarios_parallel = njit(parallel=True, cache=True)(_simulate_scenarios_impl)
+_simulate_scenarios_serial = njit(cache=True)(_simulate_scenarios_impl)
+
+
+def combined_character_weapon_simulation_scenarios(
+    scenarios: Sequence[Tuple[CharacterPoolConfig, WeaponPoolConfig, PlayerInfo]],
+    simulation_runs: int,
+    seed: int = None,
+    parallel: bool = True,
+    first_run: int = 0,
+    scenario_stride: int = 0
+) -> List[np.ndarray]:
+    """一次批量执行多个场景（配置网格）的综合模拟：场景数 × 模拟次数
+
+    配置相同的场景共用编译后的规则表；默认同一编号的模拟在各场景中使用相同的随机流，
+    每个场景的结果与单独调用 combined_character_weapon_simulation_batch(seed=seed) 逐位一致。
+    第 s 个场景的模拟编号从 first_run + s*scenario_stride 开始。
+
+    参数:
+        scenarios: (角色池配置, 武器池配置, 玩家信息) 列表，玩家信息的内部状态字段需已计算，
+                   可用 compiled_rules.scenario_grid 生成
+        simulation_runs: 每个场景的模拟次数
+        seed: 随机种子，None表示随机生成
+        parallel: 是否多线程并行（仅Numba可用时生效）
+        first_run: 第一次模拟的编号
+        scenario_stride: 相邻场景之间模拟编号的间隔，0表示所有场景使用相同的随机流（公共随机数），
+                         为 simulation_runs 时各场景使用互不重叠的随机流
+
+    返回:
+        按场景顺序排列的 RESULT_DTYPE 结果记录数组列表
+    """
+    if seed is None:
+        seed = new_seed()
+    if not NUMBA_AVAILABLE:
+        return [combined_character_weapon_simulation_batch(character_pool_config, weapon_pool_config, player_info,
+                                                           simulation_runs, seed=seed,
+                                                           first_run=first_run + scenario * scenario_stride)
+                for scenario, (character_pool_config, weapon_pool_config, player_info) in enumerate(scenarios)]
+
+    compiled = compile_scenarios(scenarios)
+    out = simulate_compiled_scenarios(compiled, simulation_runs, seed, parallel=parallel, first_run=first_run,
+                                      scenario_stride=scenario_stride)
+    return [records_from_matrix(scenario_out) for scenario_out in out]
+
+
+def simulate_compiled_scenarios(compiled: CompiledScenarios, simulation_runs: int, seed: int,
+                                parallel: bool = True, first_run: int = 0, scenario_stride: int = 0) -> np.ndarray:
+    """执行已编译的多场景批量模拟
+
+    未安装 Numba 时内核以纯 Python 执行，结果相同但非常慢。
+
+    参数:
+        compiled: compiled_rules.compile_scenarios 等生成的多场景规则表和玩家信息
+        simulation_runs: 每个场景的模拟次数
+        seed: 随机种子
+        parallel: 是否多线程并行
+        first_run: 第一次模拟的编号
+        scenario_stride: 相邻场景之间模拟编号的间隔，0表示所有场景使用相同的随机流
+
+    返回:
+        形状为 (场景数, 模拟次数, N_RESULT_COLUMNS) 的整数矩阵，列顺序与 RESULT_DTYPE 字段一致
+    """
+    out = np.zeros((compiled.scenario_count, simulation_runs, N_RESULT_COLUMNS), dtype=np.int64)
+    simulate_scenarios = _simulate_scenarios_parallel if parallel else _simulate_scenarios_serial
+    simulate_scenarios(compiled.rule_index, compiled.int_rules, compiled.float_rules,
+                       compiled.six_star_rate, compiled.six_star_rate_lengths,
+                       compiled.character_cdf, compiled.character_cdf_lengths,
+                       compiled.weapon_cdf, compiled.weapon_cdf_lengths,
+                       compiled.player_params, compiled.character_goal_counts, compiled.weapon_goal_counts,
+                       np.uint64(seed), first_run, scenario_stride, out)
+    return out
+
+
+@njit(cache=True)
+def _write_campaign_row(row, pulled, result, paid_pulls, savings, quota, vouchers, soft):
+    """按 CAMPAIGN_DTYPE 字段顺序写出一期的结果和结转状态"""
+    row[0] = pulled
+    row[1] = result[_RESULT_SUCCESS]
+    row[2] = result[_RESULT_FAILURE]
+    row[3] = result[_RESULT_CHARACTER_PULLS]
+    row[4] = paid_pulls
+    row[5] = result[_RESULT_WEAPON_TEN_PULLS]
+    row[6] = result[_RESULT_EXTRA_QUOTA]
+    row[7] = savings
+    row[8] = quota
+    row[9] = vouchers
+    row[10] = soft
+
+
+def _simulate_campaign_impl(rule_index, int_rules, float_rules, six_star_rate, six_star_rate_lengths,
+                            character_cdf, character_cdf_lengths, weapon_cdf, weapon_cdf_lengths,
+                            player_params, character_goal_counts, weapon_goal_counts, income, policy,
+                            initial_savings, seed, first_run, out):
+    """多期连续模拟，out[i, b] 为编号 first_run+i 的模拟第 b 期的结果（列顺序与 CAMPAIGN_DTYPE 一致）
+
+    第一期的初始状态取 player_params[0]；之后各期的小保底累计抽数、五星保底倒数、武器配额、十连凭证和付费抽数存量
+    从上一期结转，其余状态（总抽数、大保底、紧急招募、武器池进度）按该期的 player_params 重新开始。
+    第 b 期使用编号为 STREAM_* + b*STREAMS_PER_BANNER 的随机流，第一期与单期模拟逐位一致。
+    """
+    banners = out.shape[1]
+    for run in prange(out.shape[0]):
+        run_index = first_run + run
+        character_rng = np.empty(N_STREAM_STATE, dtype=np.uint64)
+        weapon_rng = np.empty(N_STREAM_STATE, dtype=np.uint64)
+        result = np.zeros(N_RESULT_COLUMNS, dtype=np.int64)
+        soft = player_params[0, P_SOFT]
+        five = player_params[0, P_FIVE]
+        quota = player_params[0, P_QUOTA]
+        vouchers = player_params[0, P_TEN]
+        savings = initial_savings
+        for banner in range(banners):
+            savings += income[banner, I_PULLS]
+            vouchers += income[banner, I_VOUCHERS]
+            quota += income[banner, I_QUOTA]
+            params = player_params[banner].copy()
+
+            # 抽数上限 = 本期可用的付费抽数 + 十连凭证抽数；总是十连时付费抽数取整到10，不会超出存量
+            paid_cap = savings
+            if 0 < policy[banner, B_MAX_PAID] < paid_cap:
+                paid_cap = policy[banner, B_MAX_PAID]
+            if params[P_ALWAYS_TEN] != 0:
+                paid_cap -= paid_cap % 10
+            limit = paid_cap + 10 * vouchers
+            result[:] = 0
+            if (policy[banner, B_PULL] == 0 or savings + 10 * vouchers < policy[banner, B_MIN_AVAILABLE]
+                    or limit == 0):
+                # 跳过本期（上限为0在单期模拟中表示无上限，也按跳过处理）
+                _write_campaign_row(out[run, banner], 0, result, 0, savings, quota, vouchers, soft)
+                continue
+
+            params[P_SOFT] = soft
+            params[P_FIVE] = five
+            params[P_QUOTA] = quota
+            params[P_TEN] = vouchers
+            params[P_CHARACTER_LIMIT] = limit
+            state = params[:N_STATE].copy()
+            offset = banner * STREAMS_PER_BANNER
+            _stream_init(character_rng, seed, np.uint64(run_index), np.uint64(STREAM_CHARACTER + offset))
+            _stream_init(weapon_rng, seed, np.uint64(run_index), np.uint64(STREAM_WEAPON + offset))
+            table = rule_index[banner]
+            _simulate_run_state(int_rules[table], float_rules[table],
+                                six_star_rate[table, :six_star_rate_lengths[table]],
+                                character_cdf[table, :character_cdf_lengths[table]],
+                                weapon_cdf[table, :weapon_cdf_lengths[table]],
+                                params, state, character_goal_counts[banner], weapon_goal_counts[banner],
+                                character_rng, weapon_rng, result)
+
+            # 十连凭证总是先于付费单抽使用，其余的角色池抽数都是付费抽数
+            paid_pulls = result[_RESULT_CHARACTER_PULLS] - 10 * (vouchers - state[P_TEN])
+            savings -= paid_pulls
+            soft = state[P_SOFT]
+            five = state[P_FIVE]
+            quota = state[P_QUOTA]
+            vouchers = state[P_TEN]
+            _write_campaign_row(out[run, banner], 1, result, paid_pulls, savings, quota, vouchers, soft)
+
+
+_simulate_campaign_parallel = njit(parallel=True, cache=True)(_simulate_campaign_impl)
+_simulate_campaign_serial = njit(cache=True)(_simulate_campaign_impl)
+
+
+def simulate_compiled_campaign(compiled: CompiledCampaign, simulation_runs: int, seed: int,
+                               parallel: bool = True, first_run: int = 0) -> np.ndarray:
+    """执行已编译的多期连续模拟
+
+    未安装 Numba 时内核以纯 Python 执行，结果相同但非常慢（campaign_utils 会改用标量引擎）。
+
+    参数:
+        compiled: campaign_utils.compile_campaign 生成的各期规则表、收入和策略
+        simulation_runs: 模拟次数
+        seed: 随机种子
+        parallel: 是否多线程并行
+        first_run: 第一次模拟的编号
+
+    返回:
+        形状为 (模拟次数, 期数, N_CAMPAIGN_COLUMNS) 的整数矩阵，列顺序与 CAMPAIGN_DTYPE 字段一致
+    """
+    banners = compiled.banners
+    out = np.zeros((simulation_runs, banners.scenario_count, N_CAMPAIGN_COLUMNS), dtype=np.int64)
+    simulate_campaign = _simulate_campaign_parallel if parallel else _simulate_campaign_serial
+    simulate_campaign(banners.rule_index, banners.int_rules, banners.float_rules,
+                      banners.six_star_rate, banners.six_star_rate_lengths,
+                      banners.character_cdf, banners.character_cdf_lengths,
+                      banners.weapon_cdf, banners.weapon_cdf_lengths,
+                      banners.player_params, banners.character_goal_counts, banners.weapon_goal_counts,
+                      compiled.income, compiled.policy, compiled.initial_savings,
+                      np.uint64(seed), first_run, out)
+    return out
@@ -0,0 +1,324 @@
+"""
+模拟任务队列模块 - 多组参数在共享的工作进程池中并发模拟，每个任务有独立的进度、优先级和输出目录
+
+任务按块（JOB_CHUNK_RUNS 次模拟）提交给进程池，进程池中同时最多有 2×工作进程数 个块，
+因此优先级调整和取消在一块之内生效。块完成后合并进任务的结果直方图；全部块完成后在工作进程中出图并生成报告，
+写入任务自己的输出目录（output_root/本次会话的目录/job_NNN，不同会话的任务编号相同也不会互相覆盖）。同一任务的所有块使用同一个种子和连续的模拟编号，结果与一次性模拟逐位一致。
+
+JobQueue 不启动线程，所有状态只在调用 poll() 的线程中修改：图形界面用 after() 定时调用 poll()，
+poll() 只检查已完成的块并提交新的块，不会阻塞事件循环。
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+
+
+JOB_OUTPUT_ROOT = 'simulation_jobs'  # 每个队列在其下新建一个会话目录，各任务的输出目录位于会话目录中
+JOB_CHUNK_RUNS = 4096
+REQUIREMENT_SAMPLE_RUNS = 20000  # 反查所需资源时的最大样本量
+
+JOB_PENDING = '排队中'
+JOB_RUNNING = '运行中'
+JOB_PLOTTING = '出图中'
+JOB_DONE = '完成'
+JOB_CANCELLED = '已取消'
+JOB_FAILED = '失败'
+FINISHED_STATES = (JOB_DONE, JOB_CANCELLED, JOB_FAILED)
+
+
+def format_result_report(character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                         player_info: PlayerInfo, histogram, seed: int,
+                         target_probability: Optional[float] = None) -> str:
+    """模拟结果的文本报告：成功率、各项统计（带自助法置信区间）、失败原因，以及可选的达到目标成功率所需资源
+
+    结果直方图只记录每次模拟的最终状态，反查所需资源要另做最多 REQUIREMENT_SAMPLE_RUNS 次记录首次达成时刻的模拟，
+    耗时数秒，因此只在指定目标成功率时进行。
+
+    参数:
+        character_pool_config: 角色池配置
+        weapon_pool_config: 武器池配置
+        player_info: 玩家信息（内部状态字段需已计算）
+        histogram: archive_utils.ResultHistogram
+        seed: 模拟使用的随机种子，反查所需资源时复用
+        target_probability: 反查的目标成功率（0-1），None表示不反查
+    """
+    from bootstrap_utils import success_rate_interval, mean_interval
+    runs = histogram.runs
+    failure_count = runs - histogram.successes
+    report = f"模拟次数: {runs}\n"
+    report += f"成功次数: {histogram.successes}\n"
+    report += f"失败次数: {failure_count}\n"
+    report += f"成功率: {success_rate_interval(histogram).format()}\n\n"
+
+    for title, name in (("角色池抽数统计（不含紧急）", 'character_pulls'),
+                        ("武器池十连次数统计", 'weapon_ten_pulls'),
+                        ("剩余武库配额统计", 'remaining_quota'),
+                        ("额外购买武库配额统计", 'extra_quota_purchased')):
+        report += f"{title}:\n"
+        report += f"  平均: {mean_interval(histogram, name).format('.2f')}\n"
+        report += f"  最小: {histogram.value_at(name, 0)}\n"
+        report += f"  最大: {histogram.value_at(name, runs - 1)}\n"
+        report += f"  中位数: {histogram.value_at(name, runs // 2)}\n\n"
+
+    failure_reasons = sorted(histogram.failure_reasons().items(), key=lambda item: -item[1])
+    if failure_reasons:
+        report += "失败原因统计:\n"
+        for reason, count in failure_reasons:
+            report += f"  {reason}: {count} 次 ({count/failure_count*100:.1f}%)\n"
+
+    if target_probability is None:
+        return report
+    from requirement_utils import first_hit_sample
+    sample = first_hit_sample(character_pool_config, weapon_pool_config, player_info,
+                              min(runs, REQUIREMENT_SAMPLE_RUNS), seed)
+    report += f"\n达到 {target_probability:.1%} 成功率所需资源（{sample.runs} 次样本，95% 置信区间）:\n"
+    for requirement in sample.requirements(target_probability).values():
+        report += f"  {requirement.format()}\n"
+    return report
+
+
+# ========== 工作进程 ==========
+
+def _simulate_chunk(character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                    player_info: PlayerInfo, seed: int, start: int, stop: int):
+    """在工作进程中执行编号为 [start, stop) 的模拟，返回结果直方图"""
+    from archive_utils import ResultHistogram
+    from worker_utils import run_chunk, worker_simulator
+    histogram = ResultHistogram()
+    histogram.add_records(run_chunk(worker_simulator(character_pool_config, weapon_pool_config, player_info),
+                                     seed, start, stop))
+    return histogram
+
+
+def _finish(character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+            player_info: PlayerInfo, histogram, seed: int, target_probability: Optional[float],
+            output_dir: str) -> str:
+    """在工作进程中出图，并把场景、报告写入输出目录，返回报告"""
+    from analysis_utils import plot_success_failure_pie, plot_combined_distributions
+    from archive_utils import scenario_dict
+    os.makedirs(output_dir, exist_ok=True)
+    plot_success_failure_pie(histogram.successes, histogram.runs - histogram.successes,
+                             save_path=os.path.join(output_dir, 'combined_success_failure_pie.png'),
+                             results=histogram)
+    plot_combined_distributions(histogram, histogram.successes / histogram.runs * 100,
+                                save_prefix=os.path.join(output_dir, 'combined_all'))
+    report = format_result_report(character_pool_config, weapon_pool_config, player_info, histogram, seed,
+                                  target_probability)
+    report += f"\n随机种子: {seed}\n"
+    with open(os.path.join(output_dir, 'scenario.json'), 'w', encoding='utf-8') as f:
+        json.dump(scenario_dict(character_pool_config, weapon_pool_config, player_info), f,
+                  ensure_ascii=False, indent=2)
+    with open(os.path.join(output_dir, 'report.txt'), 'w', encoding='utf-8') as f:
+        f.write(report)
+    return report
+
+
+# ========== 任务队列 ==========
+
+@dataclass
+class SimulationJob:
+    """一个模拟任务"""
+
+    job_id: int
+    name: str
+    character_pool_config: CharacterPoolConfig
+    weapon_pool_config: WeaponPoolConfig
+    player_info: PlayerInfo  # 内部状态字段已计算
+    runs: int
+    seed: int
+    target_probability: Optional[float]  # 反查所需资源的目标成功率（0-1），None表示不反查
+    output_dir: str
+    priority: int = 0  # 越大越先执行，相同时先加入的先执行
+    state: str = JOB_PENDING
+    completed_runs: int = 0
+    histogram: Any = None  # archive_utils.ResultHistogram，第一块完成后创建
+    report: str = ''
+    error: str = ''
+    next_start: int = 0  # 下一块的起始模拟编号
+    futures: set = field(default_factory=set)
+
+    @property
+    def progress(self) -> float:
+        """已完成模拟的比例"""
+        return self.completed_runs / self.runs
+
+    @property
+    def finished(self) -> bool:
+        """是否已结束（完成、取消或失败）"""
+        return self.state in FINISHED_STATES
+
+    def output_paths(self) -> List[str]:
+        """任务输出的文件"""
+        return [os.path.join(self.output_dir, name) for name in
+                ('combined_success_failure_pie.png', 'combined_all_cdf.png', 'scenario.json', 'report.txt')]
+
+
+class JobQueue:
+    """模拟任务队列
+
+    用法:
+        queue = JobQueue(workers=4)
+        job = queue.add('双限定', character_pool_config, weapon_pool_config, player_info, runs=100000,
+                        target_probability=0.9)
+        while queue.active:
+            queue.poll()
+            time.sleep(0.1)
+        print(job.report)
+        queue.shutdown()
+    """
+
+    def __init__(self, workers: Optional[int] = None, output_root: str = JOB_OUTPUT_ROOT,
+                 chunk_runs: int = JOB_CHUNK_RUNS):
+        """
+        参数:
+            workers: 工作进程数，默认为CPU核数
+            output_root: 会话目录的上级目录，加入第一个任务时在其下新建本队列的会话目录
+            chunk_runs: 每块的模拟次数，决定进度更新、优先级调整和取消的粒度
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.output_root = output_root
+        self.session_dir = None  # 本队列各任务输出目录的上级目录，加入第一个任务时创建
+        self.chunk_runs = chunk_runs
+        self.jobs: Dict[int, SimulationJob] = {}
+        self.executor = None
+        self._in_flight = {}  # future -> (任务, 块的模拟次数)，出图任务的模拟次数为0
+        self._next_id = 1
+
+    def add(self, name: str, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+            player_info: PlayerInfo, runs: int, target_probability: Optional[float] = None, priority: int = 0,
+            seed: Optional[int] = None) -> SimulationJob:
+        """加入一个任务，返回任务对象
+
+        参数:
+            name: 任务名称
+            character_pool_config: 角色池配置
+            weapon_pool_config: 武器池配置
+            player_info: 玩家信息（内部状态字段需已计算）
+            runs: 模拟次数
+            target_probability: 反查所需资源的目标成功率（0-1），None表示不反查
+            priority: 优先级，越大越先执行
+            seed: 随机种子，None表示随机生成
+        """
+        from rng_utils import new_seed
+        if self.session_dir is None:
+            os.makedirs(self.output_root, exist_ok=True)
+            self.session_dir = tempfile.mkdtemp(prefix=time.strftime('%Y%m%d_%H%M%S_'), dir=self.output_root)
+        job_id = self._next_id
+        self._next_id += 1
+        job = SimulationJob(job_id, name, character_pool_config, weapon_pool_config, player_info, runs,
+                            new_seed() if seed is None else seed, target_probability,
+                            os.path.join(self.session_dir, f'job_{job_id:03d}'), priority)
+        self.jobs[job_id] = job
+        self._schedule()
+        return job
+
+    def set_priority(self, job_id: int, priority: int):
+        """调整任务优先级，已提交的块不受影响"""
+        self.jobs[job_id].priority = priority
+        self._schedule()
+
+    def cancel(self, job_id: int):
+        """取消任务：尚未开始的块直接撤销，正在执行的块完成后丢弃结果
+
+        已开始的出图无法中断，会照常写入输出目录；poll() 收到其结果时删除该目录，不留下已取消任务的输出。
+        """
+        job = self.jobs[job_id]
+        if job.finished:
+            return
+        job.state = JOB_CANCELLED
+        for future in job.futures:
+            future.cancel()
+        self._schedule()
+
+    @property
+    def active(self) -> bool:
+        """是否还有未结束的任务或未返回的块"""
+        return bool(self._in_flight) or any(not job.finished for job in self.jobs.values())
+
+    def poll(self) -> bool:
+        """处理已完成的块并提交新的块，不等待
+
+        返回:
+            是否有任务的状态或进度发生变化
+        """
+        changed = False
+        for future in [future for future in self._in_flight if future.done()]:
+            job, runs = self._in_flight.pop(future)
+            job.futures.discard(future)
+            changed = True
+            # 已取消或已失败的任务丢弃剩余块的结果
+            expected_state = JOB_PLOTTING if runs == 0 else JOB_RUNNING
+            if future.cancelled() or job.state != expected_state:
+                if runs == 0 and not future.cancelled():
+                    shutil.rmtree(job.output_dir, ignore_errors=True)
+                continue
+            error = future.exception()
+            if error is not None:
+                job.state = JOB_FAILED
+                job.error = f"{type(error).__name__}: {error}"
+                for other in job.futures:
+                    other.cancel()
+                continue
+            if runs == 0:
+                job.report = future.result()
+                job.state = JOB_DONE
+                continue
+            if job.histogram is None:
+                job.histogram = future.result()
+            else:
+                job.histogram.merge(future.result())
+            job.completed_runs += runs
+        changed |= self._schedule()
+        return changed
+
+    def _schedule(self) -> bool:
+        """按优先级提交块和出图任务，直到进程池中的块数达到上限，返回是否提交了新的块"""
+        submitted = False
+        limit = 2 * self.workers
+        while len(self._in_flight) < limit:
+            job = self._next_job()
+            if job is None:
+                break
+            if self.executor is None:
+                # spawn 在各平台行为一致，且不会把 Tk 的状态复制到子进程
+                from worker_utils import init_worker
+                self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                                    initializer=init_worker)
+            configs = (job.character_pool_config, job.weapon_pool_config, job.player_info)
+            if job.next_start < job.runs:
+                stop = min(job.next_start + self.chunk_runs, job.runs)
+                future = self.executor.submit(_simulate_chunk, *configs, job.seed, job.next_start, stop)
+                self._in_flight[future] = (job, stop - job.next_start)
+                job.next_start = stop
+                job.state = JOB_RUNNING
+            else:
+                future = self.executor.submit(_finish, *configs, job.histogram, job.seed, job.target_probability,
+                                              job.output_dir)
+                self._in_flight[future] = (job, 0)
+                job.state = JOB_PLOTTING
+            job.futures.add(future)
+            submitted = True
+        return submitted
+
+    def _next_job(self) -> Optional[SimulationJob]:
+        """优先级最高、可以提交下一块或出图的任务"""
+        ready = [job for job in self.jobs.values()
+                 if job.state in (JOB_PENDING, JOB_RUNNING)
+                 and (job.next_start < job.runs or (job.completed_runs == job.runs and not job.futures))]
+        if not ready:
+            return None
+        return max(ready, key=lambda job: (job.priority, -job.job_id))
+
+    def shutdown(self):
+        """撤销未开始的块并关闭进程池，不等待正在执行的块"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        self._in_flight.clear()
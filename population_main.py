@@ -0,0 +1,72 @@
+"""
+玩家群体模拟工具 - 读取玩家属性CSV（每行一个玩家），模拟每个玩家并输出整体和分组统计
+"""
+import argparse
+import csv
+from population_utils import read_population_csv, simulate_population, population_size, SEGMENT_COLUMN
+from rng_utils import new_seed
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='玩家群体抽卡模拟')
+    parser.add_argument('path', help='玩家属性CSV，列名见 population_utils 的说明')
+    parser.add_argument('--runs-per-player', type=int, default=1, help='每个玩家的模拟次数')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子，默认随机生成并打印')
+    parser.add_argument('--segment-by', default=SEGMENT_COLUMN, metavar='COLUMN',
+                        help=f'按该列分组统计，默认 {SEGMENT_COLUMN}（CSV中没有该列时不分组）')
+    parser.add_argument('--summary-csv', default=None, metavar='PATH', help='将整体和分组统计导出为CSV')
+    parser.add_argument('--plot', default=None, metavar='PREFIX', help='绘制整体分布图，PREFIX 为文件名前缀')
+    return parser.parse_args(argv)
+
+
+def summary_row(label, histogram) -> list:
+    """一组结果的统计行：分组, 模拟次数, 成功率, 角色池平均抽数, 角色池抽数中位数, 武器十连平均次数, 平均额外购买配额"""
+    return [
+        label,
+        histogram.runs,
+        histogram.successes / histogram.runs,
+        histogram.mean('character_pulls'),
+        histogram.median('character_pulls'),
+        histogram.mean('weapon_ten_pulls'),
+        histogram.mean('extra_quota_purchased'),
+    ]
+
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+    columns = read_population_csv(args.path)
+    seed = new_seed() if args.seed is None else args.seed
+    print(f"玩家数: {population_size(columns)}，每人模拟 {args.runs_per_player} 次，随机种子: {seed}")
+
+    result = simulate_population(columns, runs_per_player=args.runs_per_player, seed=seed)
+    aggregate = result.aggregate()
+    rows = [summary_row('全部', aggregate)]
+    if args.segment_by in columns:
+        rows += [summary_row(label, histogram) for label, histogram in result.by_segment(args.segment_by).items()]
+
+    print(f"{'分组':<12}{'模拟次数':>10}{'成功率':>10}{'角色平均抽数':>14}{'角色抽数中位数':>14}"
+          f"{'武器平均十连':>12}{'平均额外配额':>12}")
+    for label, runs, success_rate, mean_pulls, median_pulls, mean_weapon, mean_extra in rows:
+        print(f"{str(label):<12}{runs:>10}{success_rate:>10.2%}{mean_pulls:>14.1f}{median_pulls:>14.1f}"
+              f"{mean_weapon:>12.2f}{mean_extra:>12.1f}")
+    for reason, count in aggregate.failure_reasons().items():
+        print(f"  {reason}: {count}")
+
+    if args.summary_csv:
+        with open(args.summary_csv, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['分组', '模拟次数', '成功率', '角色池平均抽数', '角色池抽数中位数',
+                             '武器平均十连次数', '平均额外购买配额'])
+            writer.writerows(rows)
+        print(f"统计已导出: {args.summary_csv}")
+    if args.plot and aggregate.runs:
+        from analysis_utils import plot_success_failure_pie, plot_combined_distributions
+        plot_success_failure_pie(aggregate.successes, aggregate.runs - aggregate.successes,
+                                 save_path=f'{args.plot}_success_failure_pie.png', results=aggregate)
+        plot_combined_distributions(aggregate, aggregate.successes / aggregate.runs * 100, save_prefix=args.plot)
+
+
+if __name__ == "__main__":
+    main()
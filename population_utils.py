@@ -0,0 +1,239 @@
+"""
+玩家群体模拟模块 - 按列给出一批玩家的属性（CSV 或 NumPy 数组），在一次并行批量模拟中模拟每个玩家
+
+玩家属性直接编译为参数矩阵，不为每个玩家构造 PlayerInfo。列名与 PlayerInfo 的字段名一致，缺少的列取
+PlayerInfo 的默认值；目标数量用 'character_goals.<名称>' / 'weapon_goals.<名称>' 列给出。其余列（如 'segment'）
+不参与模拟，可用于分组统计。
+"""
+import csv
+from dataclasses import fields
+from typing import Dict, List, Optional
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+from compiled_rules import (
+    CompiledScenarios, compile_rules, records_from_matrix, N_PLAYER, N_INT_RULES, N_FLOAT_RULES,
+    P_SOFT, P_TOTAL, P_LIMITED, P_QUOTA, P_TEN, P_URGENT, P_URGENT_GOT, P_FIVE,
+    P_WEAPON_TOTAL, P_WEAPON_LIMITED, P_WEAPON_SIX, P_LOW_QUOTA, P_ALWAYS_TEN,
+    P_CHARACTER_LIMIT, P_CHARACTER_MINIMUM, P_WEAPON_LIMIT, P_WEAPON_MINIMUM,
+)
+from archive_utils import ResultHistogram
+from rng_utils import new_seed
+
+
+SEGMENT_COLUMN = 'segment'
+CHARACTER_GOAL_PREFIX = 'character_goals.'
+WEAPON_GOAL_PREFIX = 'weapon_goals.'
+
+# 可按列给出的玩家属性（内部状态由"N次内必得6星"推算，目标用带前缀的列给出）
+PLAYER_COLUMNS = [f.name for f in fields(PlayerInfo)
+                  if f.name not in ('character_soft_pity_accumulate', 'character_goals', 'weapon_goals')]
+
+# 直接复制到玩家参数向量的列，与 compile_player 一致
+_PARAM_COLUMNS = [
+    (P_TOTAL, 'character_total_pulls_used'),
+    (P_LIMITED, 'character_limited_obtained'),
+    (P_QUOTA, 'initial_weapon_quota'),
+    (P_TEN, 'character_ten_pulls_available'),
+    (P_URGENT, 'character_urgent_ten_pulls_available'),
+    (P_FIVE, 'got_five_or_six_star_character_in_next_pulls'),
+    (P_WEAPON_TOTAL, 'weapon_total_pulls_used'),
+    (P_WEAPON_LIMITED, 'weapon_limited_obtained'),
+    (P_WEAPON_SIX, 'weapon_six_star_obtained'),
+    (P_LOW_QUOTA, 'is_character_pull_enabled_on_low_quota'),
+    (P_ALWAYS_TEN, 'character_always_pull_ten'),
+    (P_CHARACTER_LIMIT, 'character_pull_limit'),
+    (P_CHARACTER_MINIMUM, 'character_pull_minimum'),
+    (P_WEAPON_LIMIT, 'weapon_pull_limit'),
+    (P_WEAPON_MINIMUM, 'weapon_pull_minimum'),
+]
+
+_TRUE_STRINGS = ('true', 'yes', '是')
+_BOOLEAN_STRINGS = _TRUE_STRINGS + ('false', 'no', '否')
+
+
+def _parse_column(values: List[str]) -> np.ndarray:
+    """将CSV中的一列文本转换为整数数组；布尔文本转换为0/1，其他文本保持为字符串数组"""
+    try:
+        return np.array(values, dtype=np.int64)
+    except ValueError:
+        pass
+    lowered = np.char.lower(np.char.strip(np.array(values, dtype=str)))
+    if np.isin(lowered, _BOOLEAN_STRINGS).all():
+        return np.isin(lowered, _TRUE_STRINGS).astype(np.int64)
+    return np.array(values, dtype=str)
+
+
+def read_population_csv(path: str) -> Dict[str, np.ndarray]:
+    """读取玩家群体CSV，返回 列名 -> 数组
+
+    参数:
+        path: CSV文件路径，第一行为列名（见模块说明），每行一个玩家
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        values = [[] for _ in header]
+        for row in reader:
+            if not row:
+                continue
+            for column, value in zip(values, row):
+                column.append(value)
+    return {name: _parse_column(column) for name, column in zip(header, values)}
+
+
+def population_size(columns: Dict[str, np.ndarray]) -> int:
+    """玩家数，所有列的长度必须相同"""
+    sizes = {len(np.asarray(column)) for column in columns.values()}
+    if len(sizes) != 1:
+        raise ValueError(f"玩家属性列的长度不一致: {sorted(sizes)}")
+    return sizes.pop()
+
+
+def _player_column(columns: Dict[str, np.ndarray], name: str, size: int) -> np.ndarray:
+    """取一列玩家属性，缺少时以 PlayerInfo 的默认值填充"""
+    if name in columns:
+        return np.asarray(columns[name]).astype(np.int64)
+    return np.full(size, int(getattr(PlayerInfo(), name)), dtype=np.int64)
+
+
+def _goal_columns(columns: Dict[str, np.ndarray], prefix: str, default_goals: Dict[str, int],
+                  size: int) -> Dict[str, np.ndarray]:
+    """取所有带前缀的目标列，一列都没有时所有玩家使用 PlayerInfo 的默认目标"""
+    goals = {name[len(prefix):]: np.asarray(column).astype(np.int64)
+             for name, column in columns.items() if name.startswith(prefix)}
+    if not goals:
+        goals = {name: np.full(size, count, dtype=np.int64) for name, count in default_goals.items()}
+    return goals
+
+
+def compile_population(columns: Dict[str, np.ndarray],
+                       character_pool_config: CharacterPoolConfig,
+                       weapon_pool_config: WeaponPoolConfig) -> CompiledScenarios:
+    """将玩家属性列编译为多场景规则表（每个玩家一个场景，共用一份规则表）
+
+    运行时初始状态与逐个构造 PlayerInfo、调用 compute_internal_state 后 compile_player 的结果一致。
+
+    参数:
+        columns: 列名 -> 数组，见模块说明
+        character_pool_config: 角色池配置
+        weapon_pool_config: 武器池配置
+
+    返回:
+        可直接交给 jit_gacha_utils.simulate_compiled_scenarios 的规则表和玩家参数矩阵
+    """
+    size = population_size(columns)
+    default_player = PlayerInfo()
+    character_goals = _goal_columns(columns, CHARACTER_GOAL_PREFIX, default_player.character_goals, size)
+    weapon_goals = _goal_columns(columns, WEAPON_GOAL_PREFIX, default_player.weapon_goals, size)
+    rules = compile_rules(character_pool_config, weapon_pool_config, character_goals, weapon_goals)
+
+    params = np.zeros((size, N_PLAYER), dtype=np.int64)
+    # 与 PlayerInfo.compute_internal_state 相同的推算和检查
+    soft_pity = character_pool_config.soft_pity - _player_column(
+        columns, 'got_six_star_character_in_next_pulls', size)
+    invalid = np.flatnonzero(soft_pity < 0)
+    if len(invalid):
+        raise ValueError(f"第 {invalid[:10].tolist()} 个玩家的“N次内必得6星”超出小保底抽数，请检查填写是否正确")
+    params[:, P_SOFT] = soft_pity
+    for index, name in _PARAM_COLUMNS:
+        params[:, index] = _player_column(columns, name, size)
+    # 与 CharacterRuntimeInfo.from_player_info 相同的紧急招募判断
+    params[:, P_URGENT_GOT] = ((params[:, P_TOTAL] >= character_pool_config.urgent_recruitment_pity)
+                               | (params[:, P_URGENT] > 0))
+
+    def goal_matrix(goals, names):
+        counts = np.zeros((size, len(names)), dtype=np.int64)
+        for name, column in goals.items():
+            counts[:, names.index(name)] = column
+        return counts
+
+    return CompiledScenarios(
+        rule_index=np.zeros(size, dtype=np.int64),
+        int_rules=rules.int_rules.reshape(1, N_INT_RULES),
+        float_rules=rules.float_rules.reshape(1, N_FLOAT_RULES),
+        six_star_rate=rules.six_star_rate.reshape(1, -1),
+        six_star_rate_lengths=np.array([len(rules.six_star_rate)], dtype=np.int64),
+        character_cdf=rules.character_cdf.reshape(1, -1),
+        character_cdf_lengths=np.array([len(rules.character_cdf)], dtype=np.int64),
+        weapon_cdf=rules.weapon_cdf.reshape(1, -1),
+        weapon_cdf_lengths=np.array([len(rules.weapon_cdf)], dtype=np.int64),
+        player_params=params,
+        character_goal_counts=goal_matrix(character_goals, rules.character_names),
+        weapon_goal_counts=goal_matrix(weapon_goals, rules.weapon_names),
+    )
+
+
+class PopulationResult:
+    """玩家群体模拟结果：每个玩家 runs_per_player 次模拟的结果记录，可整体或按分组列汇总"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], records: np.ndarray, runs_per_player: int):
+        """
+        参数:
+            columns: 玩家属性列
+            records: RESULT_DTYPE 结果记录，第 p 个玩家的结果位于 [p*runs_per_player, (p+1)*runs_per_player)
+            runs_per_player: 每个玩家的模拟次数
+        """
+        self.columns = columns
+        self.records = records
+        self.runs_per_player = runs_per_player
+        self.players = len(records) // runs_per_player if runs_per_player else 0
+
+    def aggregate(self) -> ResultHistogram:
+        """所有玩家的结果直方图"""
+        histogram = ResultHistogram()
+        histogram.add_records(self.records)
+        return histogram
+
+    def by_segment(self, column: str = SEGMENT_COLUMN) -> Dict[object, ResultHistogram]:
+        """按某一列玩家属性的取值分组，返回 取值 -> 该组的结果直方图（按取值升序）"""
+        if column not in self.columns:
+            raise KeyError(f"没有分组列: {column}")
+        labels, inverse = np.unique(np.asarray(self.columns[column]), return_inverse=True)
+        record_segments = np.repeat(inverse, self.runs_per_player)
+        order = np.argsort(record_segments, kind='stable')
+        bounds = np.searchsorted(record_segments[order], np.arange(len(labels) + 1))
+        segments = {}
+        for segment, label in enumerate(labels):
+            histogram = ResultHistogram()
+            histogram.add_records(self.records[order[bounds[segment]:bounds[segment + 1]]])
+            segments[label.item()] = histogram
+        return segments
+
+    def player_success_rate(self) -> np.ndarray:
+        """每个玩家的成功率"""
+        return self.records['success'].reshape(self.players, self.runs_per_player).mean(axis=1)
+
+
+def simulate_population(columns: Dict[str, np.ndarray],
+                        character_pool_config: Optional[CharacterPoolConfig] = None,
+                        weapon_pool_config: Optional[WeaponPoolConfig] = None,
+                        runs_per_player: int = 1,
+                        seed: Optional[int] = None,
+                        parallel: bool = True) -> PopulationResult:
+    """在一次并行批量模拟中模拟群体中的每个玩家
+
+    第 p 个玩家的第 i 次模拟编号为 p*runs_per_player + i，每次模拟的随机流只由 (种子, 编号) 决定，
+    与用该玩家的 PlayerInfo 调用 combined_character_weapon_simulation(seed=seed, run_index=编号) 逐位一致。
+
+    参数:
+        columns: 玩家属性列（见模块说明），如 read_population_csv 的返回值
+        character_pool_config: 角色池配置，默认 CharacterPoolConfig()
+        weapon_pool_config: 武器池配置，默认 WeaponPoolConfig()
+        runs_per_player: 每个玩家的模拟次数
+        seed: 随机种子，None表示随机生成
+        parallel: 是否多线程并行
+
+    返回:
+        玩家群体模拟结果
+    """
+    from jit_gacha_utils import simulate_compiled_scenarios
+    if character_pool_config is None:
+        character_pool_config = CharacterPoolConfig()
+    if weapon_pool_config is None:
+        weapon_pool_config = WeaponPoolConfig()
+    if seed is None:
+        seed = new_seed()
+    compiled = compile_population(columns, character_pool_config, weapon_pool_config)
+    out = simulate_compiled_scenarios(compiled, runs_per_player, seed, parallel=parallel,
+                                      scenario_stride=runs_per_player)
+    return PopulationResult(columns, records_from_matrix(out.reshape(-1, out.shape[-1])), runs_per_player)
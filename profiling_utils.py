@@ -0,0 +1,148 @@
+"""
+性能剖析模块 - 收集综合模拟各阶段耗时、抽卡次数、配额补充循环次数和随机数消耗
+"""
+import json
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict
+
+
+# 综合模拟的阶段
+PHASE_CHARACTER = '阶段1-角色池'
+PHASE_WEAPON_CHECK = '阶段2-目标与上限检查'
+PHASE_REFILL = '阶段2-配额补充循环'
+PHASE_WEAPON_PULL = '阶段2-武器十连'
+PHASES = [PHASE_CHARACTER, PHASE_WEAPON_CHECK, PHASE_REFILL, PHASE_WEAPON_PULL]
+
+
+class CountingRandom:
+    """统计调用次数的随机数源，接口与 random 模块的 random() 一致"""
+
+    __slots__ = ('draws', '_random')
+
+    def __init__(self, source=random):
+        self.draws = 0
+        self._random = source.random
+
+    def random(self) -> float:
+        self.draws += 1
+        return self._random()
+
+
+@dataclass
+class SimulationProfile:
+    """综合模拟剖析数据，跨多次模拟累计
+
+    传给 combined_character_weapon_simulation 的 profile 参数即可启用；不传时没有任何额外开销。
+    """
+
+    runs: int = 0  # 已剖析的模拟次数
+    phase_seconds: Dict[str, float] = field(default_factory=lambda: {phase: 0.0 for phase in PHASES})
+    single_pulls: int = 0  # 角色池单抽次数
+    ten_pulls: int = 0  # 角色池十连次数（免费十连凭证和总是十连）
+    urgent_ten_pulls: int = 0  # 紧急招募十连次数
+    weapon_ten_pulls: int = 0  # 武器池十连次数
+    refill_iterations: int = 0  # 配额补充循环的总迭代次数
+    refill_iterations_per_run: Counter = field(default_factory=Counter)  # 每次模拟的补充迭代次数分布
+    rng_draws: int = 0  # 随机数消耗总数
+
+    # 单次模拟内部的临时状态
+    _phase: str = field(default=PHASE_CHARACTER, repr=False)
+    _phase_start: float = field(default=0.0, repr=False)
+    _run_refill_iterations: int = field(default=0, repr=False)
+    _run_rngs: tuple = field(default=(), repr=False)
+
+    def start_run(self, *sources) -> tuple:
+        """开始一次模拟
+
+        参数:
+            sources: 本次模拟使用的随机数源
+
+        返回:
+            与 sources 一一对应的计数随机数源，模拟中应使用它们代替原随机数源
+        """
+        self._run_rngs = tuple(CountingRandom(source) for source in sources)
+        self._run_refill_iterations = 0
+        self._phase = PHASE_CHARACTER
+        self._phase_start = time.perf_counter()
+        return self._run_rngs
+
+    def enter_phase(self, phase: str):
+        """切换到新的阶段，将上一阶段的耗时计入统计"""
+        now = time.perf_counter()
+        self.phase_seconds[self._phase] += now - self._phase_start
+        self._phase = phase
+        self._phase_start = now
+
+    def count_refill_iteration(self):
+        """记录一次配额补充循环迭代"""
+        self.refill_iterations += 1
+        self._run_refill_iterations += 1
+
+    def end_run(self):
+        """结束一次模拟"""
+        self.enter_phase(PHASE_CHARACTER)
+        self.runs += 1
+        self.rng_draws += sum(rng.draws for rng in self._run_rngs)
+        self._run_rngs = ()
+        self.refill_iterations_per_run[self._run_refill_iterations] += 1
+
+    def merge(self, other: 'SimulationProfile'):
+        """合并另一份剖析数据"""
+        self.runs += other.runs
+        for phase, seconds in other.phase_seconds.items():
+            self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
+        self.single_pulls += other.single_pulls
+        self.ten_pulls += other.ten_pulls
+        self.urgent_ten_pulls += other.urgent_ten_pulls
+        self.weapon_ten_pulls += other.weapon_ten_pulls
+        self.refill_iterations += other.refill_iterations
+        self.refill_iterations_per_run.update(other.refill_iterations_per_run)
+        self.rng_draws += other.rng_draws
+
+    def to_dict(self) -> Dict:
+        """转换为可序列化的字典"""
+        runs = max(self.runs, 1)
+        return {
+            '模拟次数': self.runs,
+            '阶段耗时(秒)': dict(self.phase_seconds),
+            '角色池单抽次数': self.single_pulls,
+            '角色池十连次数': self.ten_pulls,
+            '紧急招募十连次数': self.urgent_ten_pulls,
+            '武器池十连次数': self.weapon_ten_pulls,
+            '配额补充循环迭代次数': self.refill_iterations,
+            '每次模拟配额补充迭代次数分布': {str(k): v for k, v in sorted(self.refill_iterations_per_run.items())},
+            '随机数消耗': self.rng_draws,
+            '每次模拟平均': {
+                '角色池单抽': self.single_pulls / runs,
+                '角色池十连': self.ten_pulls / runs,
+                '紧急招募十连': self.urgent_ten_pulls / runs,
+                '武器池十连': self.weapon_ten_pulls / runs,
+                '配额补充迭代': self.refill_iterations / runs,
+                '随机数消耗': self.rng_draws / runs,
+            },
+        }
+
+    def save_json(self, path: str):
+        """导出为JSON文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def format_report(self) -> str:
+        """格式化为可读的文本报告"""
+        runs = max(self.runs, 1)
+        total_seconds = sum(self.phase_seconds.values())
+        lines = [f"性能剖析（{self.runs} 次模拟，计时 {total_seconds:.3f} 秒）:"]
+        for phase in PHASES:
+            seconds = self.phase_seconds.get(phase, 0.0)
+            share = seconds / total_seconds * 100 if total_seconds > 0 else 0.0
+            lines.append(f"  {phase}: {seconds:.3f} 秒 ({share:.1f}%)")
+        lines.append(f"  每次模拟平均: 单抽 {self.single_pulls / runs:.2f} 次, "
+                     f"十连 {self.ten_pulls / runs:.2f} 次, 紧急十连 {self.urgent_ten_pulls / runs:.2f} 次, "
+                     f"武器十连 {self.weapon_ten_pulls / runs:.2f} 次")
+        lines.append(f"  配额补充循环: 平均 {self.refill_iterations / runs:.2f} 次/模拟, "
+                     f"最多 {max(self.refill_iterations_per_run, default=0)} 次")
+        lines.append(f"  随机数消耗: 平均 {self.rng_draws / runs:.1f} 个/模拟")
+        return '\n'.join(lines)
@@ -0,0 +1,83 @@
+"""
+抽卡记录拟合工具 - 流式读取真实抽卡记录（CSV/JSON Lines，可 gzip 压缩），估计各小保底位置的六星概率，
+检验当前配置并写出拟合后的配置
+
+示例:
+    python pull_log_main.py pulls-2024*.csv.gz --write-config fitted.json
+    python strategy_main.py my_strategy.txt --scenario fitted.json   # 其他工具以 --scenario 使用拟合后的配置
+"""
+import argparse
+import csv
+import json
+import time
+from dataclasses import asdict
+from config import CharacterPoolConfig, WeaponPoolConfig
+from pull_log_utils import PullLogFit, iter_pull_log
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='由真实抽卡记录拟合并检验卡池概率')
+    parser.add_argument('paths', nargs='+', help='抽卡记录文件，格式见 pull_log_utils 的说明，按顺序读取')
+    parser.add_argument('--scenario', default=None, metavar='PATH',
+                        help='当前配置所在的场景JSON（character_pool/weapon_pool），默认使用 config.py 的配置')
+    parser.add_argument('--assume-fresh', action='store_true',
+                        help='账号在记录开始时的小保底累计为0（默认第一次六星之前的抽卡只用于对齐）')
+    parser.add_argument('--confidence', type=float, default=0.95, help='置信区间的置信水平，默认0.95')
+    parser.add_argument('--estimates-csv', default=None, metavar='PATH', help='将各位置的估计导出为CSV')
+    parser.add_argument('--write-config', default=None, metavar='PATH',
+                        help='写出拟合后的场景JSON（可用于其他工具的 --scenario）')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+    scenario = {}
+    if args.scenario is not None:
+        from archive_utils import scenario_from_dict
+        with open(args.scenario, encoding='utf-8') as f:
+            scenario = json.load(f)
+        character_pool_config, weapon_pool_config, _ = scenario_from_dict(scenario)
+    else:
+        character_pool_config, weapon_pool_config = CharacterPoolConfig(), WeaponPoolConfig()
+
+    fit = PullLogFit(character_pool_config, assume_fresh=args.assume_fresh)
+    start = time.perf_counter()
+    for path in args.paths:
+        fit.add_rows(iter_pull_log(path))
+    print(f"读取 {len(args.paths)} 个文件，用时 {time.perf_counter() - start:.1f} 秒")
+    print(fit.format(args.confidence))
+
+    test = fit.goodness_of_fit(character_pool_config, weapon_pool_config)
+    print(f"\n当前配置的拟合优度检验: 卡方 = {test.statistic:.2f}，自由度 {test.degrees_of_freedom}，"
+          f"p = {test.p_value:.4g}" + ('（数据与当前配置显著不符）' if test.p_value < 1 - args.confidence else ''))
+    for label, trials, sixes, expected in test.worst_bins():
+        print(f"  {label}: {trials} 抽，六星 {sixes}，期望 {expected:.1f}")
+
+    fitted_character, fitted_weapon = fit.fitted_configs(character_pool_config, weapon_pool_config)
+    print(f"\n拟合结果: 角色池基础六星概率 {character_pool_config.base_six_probability:.4f} -> "
+          f"{fitted_character.base_six_probability:.4f}，武器池基础六星概率 "
+          f"{weapon_pool_config.base_six_probability:.4f} -> {fitted_weapon.base_six_probability:.4f}")
+    for (start, end, boost), (_, _, fitted_boost) in zip(character_pool_config.probability_boost_ranges,
+                                                         fitted_character.probability_boost_ranges):
+        span = f'{start}' if start == end else f'{start}-{end}'
+        print(f"  第{span}抽六星概率提升 {boost:.4f} -> {fitted_boost:.4f}")
+
+    if args.estimates_csv:
+        with open(args.estimates_csv, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['位置', '抽数', '六星数', '估计', '置信区间下限', '置信区间上限', '当前配置'])
+            for estimate in fit.position_estimates(args.confidence):
+                writer.writerow([estimate.label, estimate.trials, estimate.sixes, estimate.estimate,
+                                 estimate.low, estimate.high, estimate.configured])
+        print(f"估计已导出: {args.estimates_csv}")
+    if args.write_config:
+        scenario = dict(scenario, character_pool=asdict(fitted_character), weapon_pool=asdict(fitted_weapon))
+        with open(args.write_config, 'w', encoding='utf-8') as f:
+            json.dump(scenario, f, ensure_ascii=False, indent=2)
+        print(f"拟合后的配置已写入: {args.write_config}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+抽卡记录拟合模块 - 流式读取真实抽卡记录，重建每个账号的小保底位置，估计各位置的六星概率并检验当前配置
+
+记录格式: CSV（第一行为列名）或 JSON Lines（.jsonl/.ndjson），可以是 gzip 压缩（.gz），每行一个抽出的物品:
+- account: 账号
+- pool: 卡池，character/角色池 或 weapon/武器池；武器池十连记为10行
+- rarity: 稀有度（4/5/6）
+- kind: 可选，抽卡类型，urgent/紧急招募 表示紧急招募（使用基础概率，不计入小保底），其余视为普通抽卡
+- banner: 可选，卡池期号；变化时该账号的角色池总抽数（大保底、循环保底）重新计数
+其余列忽略。保底赠送的物品（循环保底、武器池里程碑等）不是抽卡结果，不应出现在记录中。
+
+重建规则与模拟器（character_gacha_utils.perform_single_character_pull）相同:
+- 每个账号的记录须按时间顺序排列，不同账号的记录可以交错；每期卡池的记录须从该期第一抽开始
+- 账号第一次抽出六星之前的小保底位置未知，这些抽卡只用于对齐，不参与估计（--assume-fresh 时视为从0开始）
+- 小保底累计达到 soft_pity 的一抽必出六星，大保底所在的一抽可能被保底替换，两者都不参与估计；
+  前者单独计数，用于检查数据与保底规则是否一致；该抽不是六星时（记录缺失、顺序错误或 soft_pity 不同），
+  账号回到未对齐状态，到下一次六星重新对齐
+内存占用只取决于账号数和小保底长度，与记录数无关。
+
+估计:
+- 每个小保底位置的六星概率的最大似然估计为 六星数/抽数，置信区间为 Wilson 区间
+- 写回配置时，基础六星概率为所有不在提升区间内的位置（含紧急招募）合并的估计，
+  每个提升区间的提升值为该区间合并的估计减去基础概率；这正是配置结构下的联合最大似然估计
+- 拟合优度检验: 按位置分组（期望六星数和非六星数都不少于5的相邻位置合并），
+  Pearson 统计量 Σ(六星数-期望)²/方差 在当前配置成立时近似服从自由度为组数的卡方分布
+"""
+import csv
+import gzip
+import io
+import json
+import math
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, Iterator, List, Tuple
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig
+from character_gacha_utils import get_current_six_star_character_probability
+from stats_utils import wilson_interval, chi2_survival
+
+
+POOL_VALUES = {'character': 0, '角色池': 0, '角色': 0, 'weapon': 1, '武器池': 1, '武器': 1}
+URGENT_VALUES = ('urgent', '紧急招募')
+REQUIRED_COLUMNS = ('account', 'pool', 'rarity')
+MIN_EXPECTED = 5.0  # 拟合优度检验中每组的最小期望六星数和非六星数
+
+
+def _open_text(path: str):
+    """以文本方式打开记录文件，.gz 结尾时解压"""
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+def iter_pull_log(path: str) -> Iterator[Dict[str, str]]:
+    """逐行读取抽卡记录，返回 列名 -> 值 的字典，格式按扩展名判断（见模块说明）"""
+    name = path[:-3] if path.endswith('.gz') else path
+    with _open_text(path) as f:
+        if name.endswith(('.jsonl', '.ndjson')):
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"{path} 第{line_number}行不是合法的JSON: {e}") from None
+        else:
+            yield from csv.DictReader(f)
+
+
+@dataclass
+class PositionEstimate:
+    """一个小保底位置（或紧急招募、武器池）的六星概率估计"""
+
+    label: str  # 位置说明
+    trials: int  # 抽数
+    sixes: int  # 其中的六星数
+    estimate: float  # 最大似然估计
+    low: float  # 置信区间下限
+    high: float  # 置信区间上限
+    configured: float  # 当前配置的概率
+
+
+@dataclass
+class GoodnessOfFit:
+    """当前配置对数据的拟合优度检验"""
+
+    statistic: float  # Pearson 卡方统计量
+    degrees_of_freedom: int  # 组数
+    p_value: float
+    bins: List[Tuple[str, int, int, float]]  # 每组的 (说明, 抽数, 六星数, 期望六星数)
+
+    def worst_bins(self, count: int = 5) -> List[Tuple[str, int, int, float]]:
+        """偏离最大（对统计量贡献最大）的若干组"""
+        def contribution(item):
+            label, trials, sixes, expected = item
+            variance = expected * (1 - expected / trials)
+            return (sixes - expected) ** 2 / variance if variance > 0 else 0.0
+        return sorted(self.bins, key=contribution, reverse=True)[:count]
+
+
+@dataclass
+class PullLogFit:
+    """按小保底位置累计的抽数和六星数
+
+    用法:
+        fit = PullLogFit(CharacterPoolConfig())
+        fit.add_rows(iter_pull_log('pulls.csv.gz'))
+        estimates = fit.position_estimates()
+        character_pool_config, weapon_pool_config = fit.fitted_configs(character_pool_config, weapon_pool_config)
+    """
+
+    character_pool_config: CharacterPoolConfig  # 提供重建位置所需的保底规则
+    assume_fresh: bool = False  # 账号在记录开始时的小保底累计是否为0
+    trials: np.ndarray = None  # trials[位置] 为该小保底位置的普通抽数（不含必出六星的位置）
+    sixes: np.ndarray = None  # 其中的六星数
+    urgent_trials: int = 0
+    urgent_sixes: int = 0
+    weapon_trials: int = 0
+    weapon_sixes: int = 0
+    guaranteed_trials: int = 0  # 小保底累计达到 soft_pity 的抽数，应当全部为六星
+    guaranteed_sixes: int = 0
+    records: int = 0  # 读取的记录数
+    skipped: int = 0  # 无法识别（卡池、稀有度）的记录数
+    unaligned: int = 0  # 小保底位置未知（账号第一次六星之前）的角色池记录数
+    excluded: int = 0  # 大保底所在的、不参与估计的记录数
+    # 账号 -> [小保底累计（未对齐时为-1）, 卡池期号, 本期总抽数]
+    _accounts: Dict[str, list] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        length = self.character_pool_config.soft_pity
+        if self.trials is None:
+            self.trials = np.zeros(length, dtype=np.int64)
+        if self.sixes is None:
+            self.sixes = np.zeros(length, dtype=np.int64)
+
+    @property
+    def accounts(self) -> int:
+        """记录中的账号数"""
+        return len(self._accounts)
+
+    def add_rows(self, rows: Iterable[Dict[str, str]]):
+        """按顺序累计一批记录（如 iter_pull_log 的结果）
+
+        异常:
+            ValueError: 记录缺少必需的列
+
+        示例（违反保底规则的记录计入必出位置，之后重新对齐，不中断拟合）:
+            >>> fit = PullLogFit(CharacterPoolConfig(), assume_fresh=True)
+            >>> fit.add_rows({'account': 'a', 'pool': 'character', 'rarity': '4'} for _ in range(85))
+            >>> fit.guaranteed_trials, fit.guaranteed_sixes, fit.unaligned
+            (1, 0, 5)
+        """
+        config = self.character_pool_config
+        soft_pity, hard_pity, loop_pity = config.soft_pity, config.hard_pity, config.loop_pity
+        accounts = self._accounts
+        trials, sixes = self.trials, self.sixes
+        initial_pity = 0 if self.assume_fresh else -1
+        checked = False
+        for row in rows:
+            if not checked:
+                missing = [column for column in REQUIRED_COLUMNS if column not in row]
+                if missing:
+                    raise ValueError(f"抽卡记录缺少列: {', '.join(missing)}")
+                checked = True
+            self.records += 1
+            pool = POOL_VALUES.get(str(row['pool']).strip().lower())
+            try:
+                six = int(row['rarity']) == 6
+            except (TypeError, ValueError):
+                pool = None
+            if pool is None:
+                self.skipped += 1
+                continue
+            if pool == 1:
+                self.weapon_trials += 1
+                self.weapon_sixes += six
+                continue
+            if str(row.get('kind') or '').strip().lower() in URGENT_VALUES:
+                self.urgent_trials += 1
+                self.urgent_sixes += six
+                continue
+
+            account = str(row['account'])
+            banner = row.get('banner')
+            state = accounts.get(account)
+            if state is None:
+                state = accounts[account] = [initial_pity, banner, 0]
+            elif state[1] != banner:
+                state[1] = banner
+                state[2] = 0
+            state[2] += 1
+            total = state[2]
+            pity = state[0]
+            if pity >= 0:
+                pity += 1
+            if total % loop_pity == 0:
+                pity = 0  # 循环保底赠送的六星重置小保底，未对齐的账号也由此对齐
+            if pity >= 0:
+                if total == hard_pity:
+                    self.excluded += 1
+                elif pity >= soft_pity:
+                    self.guaranteed_trials += 1
+                    self.guaranteed_sixes += six
+                    if not six:
+                        state[0] = -1  # 与保底规则不符，等下一次六星重新对齐
+                        continue
+                else:
+                    trials[pity] += 1
+                    sixes[pity] += six
+            else:
+                self.unaligned += 1
+            state[0] = 0 if six else pity
+
+    def _configured_rates(self, character_pool_config: CharacterPoolConfig) -> np.ndarray:
+        """给定配置下各小保底位置的六星概率"""
+        return np.array([get_current_six_star_character_probability(character_pool_config, position)
+                         for position in range(len(self.trials))])
+
+    def position_estimates(self, confidence: float = 0.95, min_trials: int = 1) -> List[PositionEstimate]:
+        """各小保底位置、紧急招募和武器池的六星概率估计
+
+        参数:
+            confidence: 置信区间的置信水平
+            min_trials: 抽数少于该值的位置不列出
+        """
+        rates = self._configured_rates(self.character_pool_config)
+        groups = [(f'小保底第{position}抽', int(self.trials[position]), int(self.sixes[position]), rates[position])
+                  for position in range(len(self.trials))]
+        groups.append(('紧急招募', self.urgent_trials, self.urgent_sixes,
+                       self.character_pool_config.base_six_probability))
+        groups.append(('武器池', self.weapon_trials, self.weapon_sixes, None))
+        estimates = []
+        for label, trials, sixes, configured in groups:
+            if trials < min_trials:
+                continue
+            low, high = wilson_interval(sixes, trials, confidence)
+            estimates.append(PositionEstimate(label, trials, sixes, sixes / trials if trials else float('nan'),
+                                              low, high, configured))
+        return estimates
+
+    def fitted_configs(self, character_pool_config: CharacterPoolConfig,
+                       weapon_pool_config: WeaponPoolConfig) -> Tuple[CharacterPoolConfig, WeaponPoolConfig]:
+        """以最大似然估计替换配置中的六星概率，返回新的 (角色池配置, 武器池配置)
+
+        没有数据的参数保持原值，概率提升区间的划分不变。
+        """
+        boosted = np.zeros(len(self.trials), dtype=bool)
+        for start, end, boost in character_pool_config.probability_boost_ranges:
+            boosted[max(start, 0):end + 1] = True
+        base_trials = int(self.trials[~boosted].sum()) + self.urgent_trials
+        base_sixes = int(self.sixes[~boosted].sum()) + self.urgent_sixes
+        base = base_sixes / base_trials if base_trials else character_pool_config.base_six_probability
+
+        boost_ranges = []
+        for start, end, boost in character_pool_config.probability_boost_ranges:
+            trials = int(self.trials[max(start, 0):end + 1].sum())
+            if trials:
+                rate = self.sixes[max(start, 0):end + 1].sum() / trials
+                boost = min(max(rate, base), 1.0) - base
+            boost_ranges.append((start, end, float(boost)))
+        fitted_character = replace(character_pool_config, base_six_probability=float(base),
+                                   probability_boost_ranges=boost_ranges)
+
+        fitted_weapon = weapon_pool_config
+        if self.weapon_trials:
+            weapon_base = self.weapon_sixes / self.weapon_trials
+            fitted_weapon = replace(weapon_pool_config, base_six_probability=weapon_base,
+                                    five_star_probability=1 - weapon_base)
+        return fitted_character, fitted_weapon
+
+    def goodness_of_fit(self, character_pool_config: CharacterPoolConfig,
+                        weapon_pool_config: WeaponPoolConfig) -> GoodnessOfFit:
+        """检验给定配置（通常为当前配置）与数据是否一致，见模块说明"""
+        rates = self._configured_rates(character_pool_config)
+        groups = [(f'第{position}抽', int(self.trials[position]), int(self.sixes[position]), rates[position])
+                  for position in range(len(self.trials))]
+        groups.append(('紧急招募', self.urgent_trials, self.urgent_sixes, character_pool_config.base_six_probability))
+        groups.append(('武器池', self.weapon_trials, self.weapon_sixes, weapon_pool_config.base_six_probability))
+
+        bins = []
+        pending = None  # 正在合并的相邻位置: [起始说明, 结束说明, 抽数, 六星数, 期望, 方差]
+        for index, (label, trials, sixes, rate) in enumerate(groups):
+            if trials:
+                if pending is None:
+                    pending = [label, label, 0, 0, 0.0, 0.0]
+                pending[1] = label
+                pending[2] += trials
+                pending[3] += sixes
+                pending[4] += trials * rate
+                pending[5] += trials * rate * (1 - rate)
+            # 小保底位置之间可以合并，紧急招募和武器池各自单独成组
+            last = index >= len(self.trials) - 1
+            if pending is not None and (last or (pending[4] >= MIN_EXPECTED
+                                                 and pending[2] - pending[4] >= MIN_EXPECTED)):
+                bins.append(pending)
+                pending = None
+
+        statistic = 0.0
+        for start, end, trials, sixes, expected, variance in bins:
+            if variance > 0:
+                statistic += (sixes - expected) ** 2 / variance
+            elif sixes != expected:
+                statistic = math.inf  # 配置认为不可能的结果
+        labels = [(start if start == end else f'{start}-{end}', trials, sixes, float(expected))
+                  for start, end, trials, sixes, expected, variance in bins]
+        return GoodnessOfFit(statistic, len(bins), chi2_survival(statistic, len(bins)), labels)
+
+    def format(self, confidence: float = 0.95) -> str:
+        """格式化数据概况和各位置的估计"""
+        lines = [f"记录 {self.records} 条，账号 {self.accounts} 个；无法识别 {self.skipped} 条，"
+                 f"小保底位置未知 {self.unaligned} 条，大保底位置 {self.excluded} 条"]
+        if self.guaranteed_trials:
+            lines.append(f"小保底必出位置 {self.guaranteed_trials} 抽，其中六星 {self.guaranteed_sixes} 抽"
+                         + ('' if self.guaranteed_sixes == self.guaranteed_trials
+                            else '（与保底规则不符，请检查记录顺序或 soft_pity）'))
+        lines.append(f"{'位置':<12}{'抽数':>10}{'六星':>8}{'估计':>9}{f'{confidence:.0%}置信区间':>20}{'当前配置':>9}")
+        for estimate in self.position_estimates(confidence):
+            configured = '-' if estimate.configured is None else f'{estimate.configured:.4f}'
+            lines.append(f"{estimate.label:<12}{estimate.trials:>10}{estimate.sixes:>8}{estimate.estimate:>9.4f}"
+                         f"{f'[{estimate.low:.4f}, {estimate.high:.4f}]':>20}{configured:>9}")
+        return '\n'.join(lines)
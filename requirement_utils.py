@@ -0,0 +1,203 @@
+"""
+所需资源反查模块 - 给定目标成功率，求所需的角色池抽数、武器池十连次数或额外购买配额
+
+抽数上限只会截断模拟：在相同的随机流下，加上限的模拟与不加上限的模拟在触发上限之前完全相同。
+因此只需在不设上限的情况下模拟一批，记录每次模拟的"首达量"——最后一次角色池抽卡前的抽数+1、
+武器十连次数和额外购买配额——任意上限下的成功率都可以由这批样本直接得出，
+反查所需资源即在样本的经验分布上求满足目标成功率的最小阈值（对经验分布二分，等价于取次序统计量）。
+置信区间为分位数的无分布次序统计量区间（正态近似）。
+"""
+import copy
+import math
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Dict, Optional
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+from scalar_gacha_utils import ScalarSimulator
+from rng_utils import run_streams, new_seed
+
+
+REQUIRED_CHARACTER_PULLS = 'character_pulls'
+REQUIRED_WEAPON_TEN_PULLS = 'weapon_ten_pulls'
+REQUIRED_EXTRA_QUOTA = 'extra_quota'
+
+REQUIREMENT_LABELS = {
+    REQUIRED_CHARACTER_PULLS: '角色池抽数（不含紧急）',
+    REQUIRED_WEAPON_TEN_PULLS: '武器池十连次数',
+    REQUIRED_EXTRA_QUOTA: '额外购买配额',
+}
+
+_UNREACHABLE = np.iinfo(np.int64).max  # 样本中"无论上限多大都不会成功"的首达量
+_SAMPLE_CACHE_SIZE = 8
+
+
+@dataclass
+class Requirement:
+    """反查结果"""
+
+    quantity: str  # 资源种类，见 REQUIRED_*
+    target: float  # 目标成功率
+    value: Optional[int]  # 满足目标成功率的最小资源量，None表示该资源不设上限时也达不到目标
+    lower: Optional[int]  # 置信区间下界
+    upper: Optional[int]  # 置信区间上界，None表示样本不足以确定上界
+    achievable: float  # 该资源不设上限时的成功率
+    runs: int  # 样本量
+
+    def format(self) -> str:
+        """格式化为一行中文说明"""
+        label = REQUIREMENT_LABELS[self.quantity]
+        if self.value is None:
+            return f"{label}: 无法达到 {self.target:.1%}（不设上限时成功率 {self.achievable:.2%}）"
+        upper = '∞' if self.upper is None else self.upper
+        return f"{label}: {self.value}（置信区间 {self.lower} - {upper}）"
+
+
+class _FirstHitSimulator(ScalarSimulator):
+    """记录最后一次角色池抽卡前已用抽数的标量模拟器
+
+    每次角色池抽卡（含紧急招募）之前都会先检查抽数上限、再调用 _grant_urgent_recruitment，
+    在这里记下的 total_pulls 减去初始已用抽数，就是最后一次上限检查时的角色池抽数（不含紧急）。
+    """
+
+    __slots__ = ('last_step_pulls',)
+
+    def _grant_urgent_recruitment(self):
+        self.last_step_pulls = self.state.total_pulls
+        super()._grant_urgent_recruitment()
+
+
+class FirstHitSample:
+    """不设抽数上限时的一批首达量样本，可反查任意目标成功率所需的资源"""
+
+    def __init__(self, character_pulls: np.ndarray, weapon_ten_pulls: np.ndarray, extra_quota: np.ndarray,
+                 character_pull_limit: int = 0, weapon_pull_limit: int = 0):
+        """
+        参数:
+            character_pulls: 每次模拟成功所需的最小角色池抽数上限，不可能成功时为 _UNREACHABLE
+            weapon_ten_pulls: 每次模拟成功所需的最小武器十连次数上限
+            extra_quota: 每次模拟成功所需的额外购买配额
+            character_pull_limit: 玩家原本的角色池抽数上限，反查其他资源时仍然生效
+            weapon_pull_limit: 玩家原本的武器池十连次数上限
+        """
+        self.values = {
+            REQUIRED_CHARACTER_PULLS: character_pulls,
+            REQUIRED_WEAPON_TEN_PULLS: weapon_ten_pulls,
+            REQUIRED_EXTRA_QUOTA: extra_quota,
+        }
+        self.limits = {
+            REQUIRED_CHARACTER_PULLS: character_pull_limit,
+            REQUIRED_WEAPON_TEN_PULLS: weapon_pull_limit,
+        }
+
+    @classmethod
+    def simulate(cls, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                 player_info: PlayerInfo, runs: int, seed: Optional[int] = None) -> 'FirstHitSample':
+        """去掉玩家的抽数上限模拟一批，记录首达量
+
+        参数:
+            character_pool_config: 角色池配置
+            weapon_pool_config: 武器池配置
+            player_info: 玩家信息（内部状态字段需已计算），其中的抽数上限在反查时作为其他资源的约束
+            runs: 样本量
+            seed: 随机种子，None表示随机生成
+        """
+        if seed is None:
+            seed = new_seed()
+        unlimited = copy.deepcopy(player_info)
+        unlimited.character_pull_limit = 0
+        unlimited.weapon_pull_limit = 0
+        simulator = _FirstHitSimulator(character_pool_config, weapon_pool_config, unlimited)
+        initial_pulls = player_info.character_total_pulls_used
+
+        character_pulls = np.full(runs, _UNREACHABLE, dtype=np.int64)
+        weapon_ten_pulls = np.full(runs, _UNREACHABLE, dtype=np.int64)
+        extra_quota = np.full(runs, _UNREACHABLE, dtype=np.int64)
+        for run_index in range(runs):
+            simulator.last_step_pulls = None
+            result = simulator.run(*run_streams(seed, run_index))
+            if not result['成功']:
+                continue  # 不设上限仍失败（如配额不足）的模拟在任何上限下都不会成功
+            if simulator.last_step_pulls is not None:
+                character_pulls[run_index] = simulator.last_step_pulls - initial_pulls + 1
+            else:
+                character_pulls[run_index] = 0
+            weapon_ten_pulls[run_index] = result['武器十连次数']
+            extra_quota[run_index] = result['额外购买配额']
+        return cls(character_pulls, weapon_ten_pulls, extra_quota,
+                   player_info.character_pull_limit, player_info.weapon_pull_limit)
+
+    @property
+    def runs(self) -> int:
+        """样本量"""
+        return len(self.values[REQUIRED_CHARACTER_PULLS])
+
+    def _feasible(self, quantity: str) -> np.ndarray:
+        """在玩家原有的其他上限下仍能成功的模拟"""
+        feasible = self.values[REQUIRED_CHARACTER_PULLS] != _UNREACHABLE
+        for other, limit in self.limits.items():
+            if other != quantity and limit > 0:
+                feasible &= self.values[other] <= limit
+        return feasible
+
+    def success_rate(self, quantity: str, threshold: int) -> float:
+        """该资源的上限为 threshold（其他上限保持玩家原值）时的成功率"""
+        return float(np.mean(self._feasible(quantity) & (self.values[quantity] <= threshold)))
+
+    def required(self, quantity: str, target: float, confidence: float = 0.95) -> Requirement:
+        """反查达到目标成功率所需的最小资源量
+
+        参数:
+            quantity: 资源种类，见 REQUIRED_*
+            target: 目标成功率，如0.9
+            confidence: 置信区间的置信度
+        """
+        if not 0 < target < 1:
+            raise ValueError(f"目标成功率必须在0和1之间: {target}")
+        runs = self.runs
+        values = np.sort(np.where(self._feasible(quantity), self.values[quantity], _UNREACHABLE))
+        achievable = float(np.mean(values != _UNREACHABLE))
+        rank = math.ceil(target * runs)  # 第 rank 小的值即满足经验成功率 >= target 的最小阈值
+
+        def value_at(rank):
+            if rank > runs:
+                return None
+            value = values[max(rank, 1) - 1]
+            return None if value == _UNREACHABLE else int(value)
+
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        spread = z * math.sqrt(runs * target * (1 - target))
+        return Requirement(
+            quantity=quantity,
+            target=target,
+            value=value_at(rank),
+            lower=value_at(math.floor(runs * target - spread)) if achievable >= target else None,
+            upper=value_at(math.ceil(runs * target + spread) + 1) if achievable >= target else None,
+            achievable=achievable,
+            runs=runs,
+        )
+
+    def requirements(self, target: float, confidence: float = 0.95) -> Dict[str, Requirement]:
+        """反查所有资源，额外购买配额只在样本中出现过购买时给出"""
+        quantities = [REQUIRED_CHARACTER_PULLS, REQUIRED_WEAPON_TEN_PULLS]
+        extra_quota = self.values[REQUIRED_EXTRA_QUOTA]
+        if np.any((extra_quota > 0) & (extra_quota != _UNREACHABLE)):
+            quantities.append(REQUIRED_EXTRA_QUOTA)
+        return {quantity: self.required(quantity, target, confidence) for quantity in quantities}
+
+
+_sample_cache = {}
+
+
+def first_hit_sample(character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                     player_info: PlayerInfo, runs: int, seed: int) -> FirstHitSample:
+    """带缓存的 FirstHitSample.simulate：同一场景、样本量和种子只模拟一次，之后的反查都复用这批样本"""
+    from archive_utils import scenario_hash
+    key = (scenario_hash(character_pool_config, weapon_pool_config, player_info), runs, seed)
+    sample = _sample_cache.get(key)
+    if sample is None:
+        sample = FirstHitSample.simulate(character_pool_config, weapon_pool_config, player_info, runs, seed)
+        if len(_sample_cache) >= _SAMPLE_CACHE_SIZE:
+            _sample_cache.pop(next(iter(_sample_cache)))
+        _sample_cache[key] = sample
+    return sample
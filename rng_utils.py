@@ -0,0 +1,100 @@
+"""
+随机数流模块 - 基于计数器的随机数生成（Philox4x64-10），每次模拟的随机流只由 (种子, 模拟编号, 卡池) 决定
+
+任意一次模拟都可以脱离整批模拟单独重放，分块/并行执行的结果与串行执行逐位一致。
+jit_gacha_utils 中的编译型引擎实现了同一算法，两种引擎在相同种子下结果完全相同。
+numpy 在第一次生成随机数时才导入，不使用种子的模拟不会加载它。
+"""
+import secrets
+import threading
+from itertools import chain
+
+
+# 随机流编号：每次模拟的角色池和武器池各使用一条独立的随机流
+STREAM_CHARACTER = 0
+STREAM_WEAPON = 1
+STREAMS_PER_BANNER = 2  # 多期连续模拟（campaign_utils）中第 b 期使用编号为 STREAM_* + b*STREAMS_PER_BANNER 的随机流
+
+SEED_BITS = 63  # 种子取值范围 [0, 2**63)，可直接存入 int64
+_FIRST_BLOCK_SIZE = 32  # 首次从生成器取出的随机数个数，多数武器池随机流用不完一块
+_BLOCK_SIZE = 256  # 之后每次批量取出的随机数个数
+_MASK64 = (1 << 64) - 1
+
+_local = threading.local()
+
+
+def _shared_generator():
+    """当前线程共享的 Philox 生成器（numpy.random.Generator）；每次取块前重设状态，避免为每条随机流构造生成器"""
+    generator = getattr(_local, 'generator', None)
+    if generator is None:
+        import numpy as np
+        generator = _local.generator = np.random.Generator(np.random.Philox(0))
+    return generator
+
+
+def new_seed() -> int:
+    """生成一个新的随机种子，用于未指定种子但仍需要可重放的批量模拟"""
+    return secrets.randbits(SEED_BITS)
+
+
+def stream_key(seed: int, run_index: int) -> int:
+    """Philox 密钥：低64位为种子，高64位为模拟编号"""
+    if not 0 <= seed < 2 ** 64:
+        raise ValueError(f"随机种子超出范围: {seed}")
+    if not 0 <= run_index < 2 ** 64:
+        raise ValueError(f"模拟编号超出范围: {run_index}")
+    return seed | (run_index << 64)
+
+
+def stream_counter(stream: int) -> int:
+    """Philox 初始计数器：随机流编号放在最高的64位，各流之间不会重叠"""
+    return stream << 192
+
+
+class PhiloxStream:
+    """单条随机流，接口与 random 模块的 random() 一致
+
+    第 i 个随机数为 Philox4x64-10(密钥, 计数器 + i // 4 + 1) 的第 i % 4 个输出取高53位，
+    与 numpy.random.Generator(Philox(key, counter)).random() 的序列相同。
+    random 属性直接绑定到内部迭代器，单次调用不经过 Python 层函数。
+    """
+
+    __slots__ = ('random',)
+
+    def __init__(self, seed: int, run_index: int, stream: int):
+        """
+        参数:
+            seed: 随机种子
+            run_index: 模拟编号
+            stream: 随机流编号，见 STREAM_*
+        """
+        self.random = chain.from_iterable(_blocks(stream_key(seed, run_index), stream_counter(stream))).__next__
+
+
+def _blocks(key: int, counter: int):
+    """按块无限生成随机流的随机数，每4个随机数消耗一个计数器值"""
+    import numpy as np
+    key_words = np.array([key & _MASK64, key >> 64], dtype=np.uint64)
+    size = _FIRST_BLOCK_SIZE
+    while True:
+        generator = _shared_generator()
+        generator.bit_generator.state = {
+            'bit_generator': 'Philox',
+            'state': {'counter': np.array([(counter >> shift) & _MASK64 for shift in (0, 64, 128, 192)],
+                                          dtype=np.uint64),
+                      'key': key_words},
+            'buffer': np.zeros(4, dtype=np.uint64),
+            'buffer_pos': 4,
+            'has_uint32': 0,
+            'uinteger': 0,
+        }
+        yield generator.random(size).tolist()
+        counter += size // 4
+        size = _BLOCK_SIZE
+
+
+def run_streams(seed: int, run_index: int, banner: int = 0):
+    """返回一次模拟的 (角色池随机流, 武器池随机流)；banner 为多期连续模拟中的期号，第0期与单期模拟相同"""
+    offset = banner * STREAMS_PER_BANNER
+    return (PhiloxStream(seed, run_index, STREAM_CHARACTER + offset),
+            PhiloxStream(seed, run_index, STREAM_WEAPON + offset))
@@ -0,0 +1,469 @@
+"""
+标量抽卡引擎模块 - 不依赖 NumPy、单次模拟不分配对象的纯 Python 综合模拟
+
+与 combined_character_weapon_simulation 的逻辑和随机数消耗顺序完全一致，相同随机数源下结果相同：
+- 运行时状态保存在预分配的 __slots__ 对象中，每次模拟只需 reset()
+- 物品名称编码为小整数，六星概率提升区间和卡池累积概率预先展开为列表
+- 目标进度记录为剩余缺口计数，"是否达成目标"的判断为 O(1)
+不支持性能剖析和轨迹记录，需要时使用 weapon_gacha_utils 中的参考实现。
+"""
+import random
+from typing import Dict, List, Optional
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo, CharacterRuntimeInfo
+from character_gacha_utils import get_current_six_star_character_probability
+from rng_utils import run_streams
+
+
+LIMITED_CHARACTER = "限定"  # 大保底和循环保底给出的当期UP角色
+LIMITED_WEAPON = "限定武器"  # 武器池保底和里程碑给出的当期UP武器
+
+
+def _intern_names(pool: Dict[str, float], required: str, goals: Dict[str, int]) -> List[str]:
+    """生成名称表：卡池中的物品在前，其后是硬编码的限定物品和池外的目标名称"""
+    names = list(pool.keys())
+    for name in [required, *goals]:
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def _cumulative(pool: Dict[str, float]) -> List[float]:
+    """按 get_six_star_*_by_probability 的累加顺序计算累积概率"""
+    cumulative_probability = 0.0
+    cdf = []
+    for probability in pool.values():
+        cumulative_probability += probability
+        cdf.append(cumulative_probability)
+    return cdf
+
+
+class ScalarRules:
+    """编译后的卡池规则"""
+
+    __slots__ = ('soft_pity', 'hard_pity', 'loop_pity', 'urgent_pity', 'quota_by_rarity', 'base_six',
+                 'four_share', 'six_star_rate', 'character_cdf', 'character_names', 'limited_character',
+                 'weapon_cost', 'weapon_base_six', 'weapon_cdf', 'weapon_names', 'limited_weapon')
+
+    def __init__(self, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                 player_info: PlayerInfo):
+        """
+        参数:
+            character_pool_config: 角色池配置
+            weapon_pool_config: 武器池配置
+            player_info: 玩家信息，其目标名称会被编入名称表
+        """
+        self.soft_pity = character_pool_config.soft_pity
+        self.hard_pity = character_pool_config.hard_pity
+        self.loop_pity = character_pool_config.loop_pity
+        self.urgent_pity = character_pool_config.urgent_recruitment_pity
+        quota = character_pool_config.weapon_quota_per_rarity
+        self.quota_by_rarity = [0, 0, 0, 0, quota[4], quota[5], quota[6]]  # 按稀有度索引
+        self.base_six = character_pool_config.base_six_probability
+        self.four_share = character_pool_config.four_star_probability / (
+            character_pool_config.four_star_probability + character_pool_config.five_star_probability
+        )
+        # 六星概率表覆盖到小保底和所有提升区间的末尾，超出表长时使用基础概率
+        table_length = character_pool_config.soft_pity + 1
+        for start, end, boost in character_pool_config.probability_boost_ranges:
+            table_length = max(table_length, end + 1)
+        self.six_star_rate = [get_current_six_star_character_probability(character_pool_config, soft_pity_count)
+                              for soft_pity_count in range(table_length)]
+        self.character_cdf = _cumulative(character_pool_config.six_star_pool)
+        self.character_names = _intern_names(character_pool_config.six_star_pool, LIMITED_CHARACTER,
+                                             player_info.character_goals)
+        self.limited_character = self.character_names.index(LIMITED_CHARACTER)
+
+        self.weapon_cost = weapon_pool_config.weapon_quota_cost_per_ten_pull
+        self.weapon_base_six = weapon_pool_config.base_six_probability
+        self.weapon_cdf = _cumulative(weapon_pool_config.six_star_weapon_pool)
+        self.weapon_names = _intern_names(weapon_pool_config.six_star_weapon_pool, LIMITED_WEAPON,
+                                          player_info.weapon_goals)
+        self.limited_weapon = self.weapon_names.index(LIMITED_WEAPON)
+
+
+class ScalarPlayer:
+    """编译后的玩家信息：初始状态、按物品编码索引的目标数量和策略"""
+
+    __slots__ = ('initial_state', 'character_goal_counts', 'weapon_goal_counts', 'always_pull_ten',
+                 'low_quota_character_pull', 'character_pull_limit', 'character_pull_minimum',
+                 'weapon_pull_limit', 'weapon_pull_minimum')
+
+    def __init__(self, player_info: PlayerInfo, character_pool_config: CharacterPoolConfig, rules: ScalarRules):
+        """
+        参数:
+            player_info: 玩家信息（内部状态字段需已计算）
+            character_pool_config: 角色池配置
+            rules: 由同一玩家信息编译的卡池规则
+        """
+        character_runtime_info = CharacterRuntimeInfo.from_player_info(player_info, character_pool_config)
+        # 顺序与 ScalarState.reset 一致
+        self.initial_state = (
+            character_runtime_info.soft_pity_accumulate,
+            character_runtime_info.total_pulls,
+            character_runtime_info.limited_obtained,
+            character_runtime_info.weapon_quota,
+            character_runtime_info.ten_pull_count,
+            character_runtime_info.ten_pull_count_urgent,
+            character_runtime_info.urgent_recruitment_got,
+            character_runtime_info.got_five_or_six_star_character_in_next_pulls,
+            player_info.weapon_total_pulls_used,
+            player_info.weapon_limited_obtained,
+            player_info.weapon_six_star_obtained,
+        )
+        self.character_goal_counts = [player_info.character_goals.get(name, 0) for name in rules.character_names]
+        self.weapon_goal_counts = [player_info.weapon_goals.get(name, 0) for name in rules.weapon_names]
+        self.always_pull_ten = player_info.character_always_pull_ten
+        self.low_quota_character_pull = player_info.is_character_pull_enabled_on_low_quota
+        self.character_pull_limit = player_info.character_pull_limit
+        self.character_pull_minimum = player_info.character_pull_minimum
+        self.weapon_pull_limit = player_info.weapon_pull_limit
+        self.weapon_pull_minimum = player_info.weapon_pull_minimum
+
+
+class ScalarState:
+    """单次模拟的运行时状态，跨模拟复用
+
+    角色池和武器池共用同一份武器配额，目标进度记为剩余缺口：
+    character_deficit[编码] 为该物品还差的数量，character_remaining 为所有缺口之和。
+    """
+
+    __slots__ = ('soft_pity_accumulate', 'total_pulls', 'limited_obtained', 'weapon_quota', 'ten_pull_count',
+                 'ten_pull_count_urgent', 'urgent_recruitment_got', 'five_star_countdown',
+                 'weapon_total_pulls', 'weapon_limited_obtained', 'weapon_six_star_obtained', 'supply_boxes',
+                 'character_deficit', 'character_remaining', 'weapon_deficit', 'weapon_remaining')
+
+    def __init__(self, player: ScalarPlayer):
+        self.character_deficit = [0] * len(player.character_goal_counts)
+        self.weapon_deficit = [0] * len(player.weapon_goal_counts)
+        self.reset(player)
+
+    def reset(self, player: ScalarPlayer):
+        """恢复到玩家的初始状态"""
+        (self.soft_pity_accumulate, self.total_pulls, self.limited_obtained, self.weapon_quota,
+         self.ten_pull_count, self.ten_pull_count_urgent, self.urgent_recruitment_got, self.five_star_countdown,
+         self.weapon_total_pulls, self.weapon_limited_obtained, self.weapon_six_star_obtained) = player.initial_state
+        self.supply_boxes = 0
+        self.character_deficit[:] = player.character_goal_counts
+        self.character_remaining = sum(player.character_goal_counts)
+        self.weapon_deficit[:] = player.weapon_goal_counts
+        self.weapon_remaining = sum(player.weapon_goal_counts)
+
+
+def _sample_index(cdf: List[float], rng) -> int:
+    """按累积概率表抽取一个物品编码，与 get_six_star_*_by_probability 的判定方式一致"""
+    rand_value = rng.random()
+    for code, cumulative_probability in enumerate(cdf):
+        if rand_value <= cumulative_probability:
+            return code
+    return len(cdf) - 1
+
+
+class ScalarSimulator:
+    """标量综合模拟器
+
+    用法:
+        simulator = ScalarSimulator(character_pool_config, weapon_pool_config, player_info)
+        results = [simulator.simulate(seed=42, run_index=i) for i in range(10000)]
+    """
+
+    __slots__ = ('rules', 'player', 'state')
+
+    def __init__(self, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                 player_info: PlayerInfo):
+        """
+        参数:
+            character_pool_config: 角色池配置
+            weapon_pool_config: 武器池配置
+            player_info: 玩家信息（内部状态字段需已计算）
+        """
+        self.rules = ScalarRules(character_pool_config, weapon_pool_config, player_info)
+        self.player = ScalarPlayer(player_info, character_pool_config, self.rules)
+        self.state = ScalarState(self.player)
+
+    def _obtain_character(self, code: int):
+        """获得一个六星角色，更新目标缺口"""
+        state = self.state
+        if state.character_deficit[code] > 0:
+            state.character_deficit[code] -= 1
+            state.character_remaining -= 1
+
+    def _obtain_weapon(self, code: int):
+        """获得一个六星武器，更新目标缺口"""
+        state = self.state
+        if state.weapon_deficit[code] > 0:
+            state.weapon_deficit[code] -= 1
+            state.weapon_remaining -= 1
+
+    def _sample_character(self, rng) -> int:
+        """按六星干员池的概率抽取一个六星角色编码"""
+        return _sample_index(self.rules.character_cdf, rng)
+
+    def _sample_weapon(self, rng) -> int:
+        """按六星武器池的概率抽取一个六星武器编码"""
+        return _sample_index(self.rules.weapon_cdf, rng)
+
+    def _draw_character(self, six_probability: float, rng):
+        """按概率抽取一个角色，返回 (角色编码, 稀有度)，未抽中六星时编码为-1"""
+        if rng.random() <= six_probability:
+            return self._sample_character(rng), 6
+        if rng.random() <= self.rules.four_share:
+            return -1, 4
+        return -1, 5
+
+    def _single_character_pull(self, rng):
+        """单次角色池抽卡，对应 perform_single_character_pull"""
+        rules = self.rules
+        state = self.state
+        state.soft_pity_accumulate += 1
+        state.total_pulls += 1
+        state.five_star_countdown -= 1
+        total_pulls = state.total_pulls
+
+        # 循环保底赠送，不给武器配额，还要继续抽
+        if total_pulls >= rules.loop_pity and total_pulls % rules.loop_pity == 0:
+            self._obtain_character(rules.limited_character)
+            state.soft_pity_accumulate = 0
+
+        if not state.limited_obtained and total_pulls == rules.hard_pity:
+            # 大保底
+            self._obtain_character(rules.limited_character)
+            state.weapon_quota += rules.quota_by_rarity[6]
+            state.limited_obtained = True
+            state.soft_pity_accumulate = 0
+            state.five_star_countdown = 10
+        elif state.soft_pity_accumulate == rules.soft_pity:
+            # 小保底
+            character = self._sample_character(rng)
+            self._obtain_character(character)
+            state.weapon_quota += rules.quota_by_rarity[6]
+            if character == rules.limited_character:
+                state.limited_obtained = True
+            state.soft_pity_accumulate = 0
+            state.five_star_countdown = 10
+        else:
+            soft_pity_count = state.soft_pity_accumulate
+            six_star_rate = rules.six_star_rate
+            six_probability = six_star_rate[soft_pity_count] if soft_pity_count < len(six_star_rate) \
+                else rules.base_six
+            character, rarity = self._draw_character(six_probability, rng)
+            # 已经10发未出5星或6星，强制出一个5星
+            if state.five_star_countdown <= 0 and rarity < 5:
+                character = -1
+                rarity = 5
+            state.weapon_quota += rules.quota_by_rarity[rarity]
+            if rarity >= 5:
+                state.five_star_countdown = 10
+            if character >= 0:
+                if character == rules.limited_character:
+                    state.limited_obtained = True
+                self._obtain_character(character)
+                state.soft_pity_accumulate = 0
+
+    def _ten_character_pulls(self, rng):
+        """角色池十连抽，对应 perform_ten_character_pulls"""
+        state = self.state
+        if state.ten_pull_count_urgent != 0:
+            # 紧急招募使用基础概率（不累计大小保底和五星保底）
+            quota_by_rarity = self.rules.quota_by_rarity
+            base_six = self.rules.base_six
+            for _ in range(10):
+                character, rarity = self._draw_character(base_six, rng)
+                state.weapon_quota += quota_by_rarity[rarity]
+                if character >= 0:
+                    self._obtain_character(character)
+            state.ten_pull_count_urgent -= 1
+        else:
+            for _ in range(10):
+                self._single_character_pull(rng)
+            if state.ten_pull_count > 0:
+                state.ten_pull_count -= 1
+
+    def _paid_character_pulls(self, rng, character_pulls: int, quota_target: int) -> int:
+        """付费单抽，返回实际抽数；标量引擎每次只抽一次，子类可以一次跨过多抽
+
+        参数:
+            rng: 角色池随机数源
+            character_pulls: 已进行的角色池抽数（不含紧急招募）
+            quota_target: 阶段2补充配额时需要达到的配额，阶段1为0
+        """
+        self._single_character_pull(rng)
+        return 1
+
+    def _grant_urgent_recruitment(self):
+        """紧急招募更新"""
+        state = self.state
+        if not state.urgent_recruitment_got and state.total_pulls >= self.rules.urgent_pity:
+            state.ten_pull_count_urgent += 1
+            state.urgent_recruitment_got = True
+
+    def _draw_weapon(self, rng) -> int:
+        """按基础概率抽取一个武器，返回六星武器编码，未抽中六星时为-1"""
+        if rng.random() <= self.rules.weapon_base_six:
+            return self._sample_weapon(rng)
+        return -1
+
+    def _ten_weapon_pulls(self, rng):
+        """武器池十连抽，对应 perform_ten_weapon_pulls（调用前需保证配额充足）"""
+        rules = self.rules
+        state = self.state
+        limited = rules.limited_weapon
+        state.weapon_quota -= rules.weapon_cost
+        state.weapon_total_pulls += 1
+        total_pulls = state.weapon_total_pulls
+
+        # 特殊奖励
+        if total_pulls == 10:
+            state.supply_boxes += 1
+        elif total_pulls == 18:
+            self._obtain_weapon(limited)
+            state.weapon_limited_obtained = True
+        elif total_pulls > 18:
+            cycles_after_18 = total_pulls - 18
+            if cycles_after_18 % 8 == 0:
+                if (cycles_after_18 // 8) % 2 == 1:
+                    state.supply_boxes += 1
+                else:
+                    self._obtain_weapon(limited)
+                    state.weapon_limited_obtained = True
+
+        # 正常概率抽取
+        for _ in range(10):
+            weapon = self._draw_weapon(rng)
+            if weapon >= 0:
+                self._obtain_weapon(weapon)
+                state.weapon_six_star_obtained = True
+                if weapon == limited:
+                    state.weapon_limited_obtained = True
+
+        # 保底，限定保底优先级高于六星保底
+        if total_pulls == 8 and not state.weapon_limited_obtained:
+            self._obtain_weapon(limited)
+            state.weapon_limited_obtained = True
+            state.weapon_six_star_obtained = True
+        elif total_pulls == 4 and not state.weapon_six_star_obtained:
+            weapon = self._sample_weapon(rng)
+            self._obtain_weapon(weapon)
+            state.weapon_six_star_obtained = True
+            if weapon == limited:
+                state.weapon_limited_obtained = True
+
+    def run(self, character_rng=random, weapon_rng=random) -> Dict:
+        """执行一次综合模拟，返回值与 combined_character_weapon_simulation 相同
+
+        参数:
+            character_rng: 角色池随机数源
+            weapon_rng: 武器池随机数源
+        """
+        player = self.player
+        state = self.state
+        state.reset(player)
+        cost = self.rules.weapon_cost
+
+        character_paid_pulls = 0
+        character_free_pulls = 0
+        character_urgent_pulls = 0
+        weapon_ten_pulls = 0
+        extra_quota_purchased = 0
+        character_pull_limit = player.character_pull_limit
+        weapon_pull_limit = player.weapon_pull_limit
+
+        # ========== 阶段1: 抽角色池直到满足目标和约束 ==========
+        while True:
+            if state.character_remaining == 0 \
+                    and character_paid_pulls + character_free_pulls >= player.character_pull_minimum:
+                break
+            if character_pull_limit > 0 and character_paid_pulls + character_free_pulls >= character_pull_limit:
+                return self._result(character_paid_pulls + character_free_pulls, character_urgent_pulls, 0, 0,
+                                    0, extra_quota_purchased, False, '角色池达到上限但未满足目标')
+
+            self._grant_urgent_recruitment()
+            if state.ten_pull_count > 0 or state.ten_pull_count_urgent > 0:
+                using_urgent = state.ten_pull_count_urgent > 0
+                self._ten_character_pulls(character_rng)
+                if using_urgent:
+                    character_urgent_pulls += 10
+                else:
+                    character_free_pulls += 10
+            elif player.always_pull_ten:
+                self._ten_character_pulls(character_rng)
+                character_paid_pulls += 10
+            else:
+                character_paid_pulls += self._paid_character_pulls(
+                    character_rng, character_paid_pulls + character_free_pulls, 0)
+
+        # ========== 阶段2: 抽武器池直到满足目标和约束 ==========
+        while True:
+            if state.weapon_remaining == 0 and weapon_ten_pulls >= player.weapon_pull_minimum:
+                break
+            if weapon_pull_limit > 0 and weapon_ten_pulls >= weapon_pull_limit:
+                return self._result(character_paid_pulls + character_free_pulls, character_urgent_pulls,
+                                    weapon_ten_pulls, weapon_ten_pulls * cost, state.supply_boxes,
+                                    extra_quota_purchased, False, '武器池达到上限但未满足目标')
+
+            # 配额不足一次十连时补充配额
+            while state.weapon_quota < cost:
+                if not player.low_quota_character_pull:
+                    quota_needed = cost - state.weapon_quota
+                    state.weapon_quota += quota_needed
+                    extra_quota_purchased += quota_needed
+                    break
+                if character_pull_limit > 0 and character_paid_pulls + character_free_pulls >= character_pull_limit:
+                    # 与参考实现一致：此时角色总抽数不含紧急招募
+                    result = self._result(character_paid_pulls + character_free_pulls, character_urgent_pulls,
+                                          weapon_ten_pulls, weapon_ten_pulls * cost, state.supply_boxes,
+                                          extra_quota_purchased, False, '角色池达到上限无法继续获取武器配额')
+                    result['角色总抽数'] = character_paid_pulls + character_free_pulls
+                    return result
+
+                self._grant_urgent_recruitment()
+                if state.ten_pull_count > 0 or state.ten_pull_count_urgent > 0:
+                    using_urgent = state.ten_pull_count_urgent > 0
+                    self._ten_character_pulls(character_rng)
+                    if using_urgent:
+                        character_urgent_pulls += 10
+                    else:
+                        character_free_pulls += 10
+                else:
+                    character_paid_pulls += self._paid_character_pulls(
+                        character_rng, character_paid_pulls + character_free_pulls, cost)
+
+            self._ten_weapon_pulls(weapon_rng)
+            weapon_ten_pulls += 1
+
+        return self._result(character_paid_pulls + character_free_pulls, character_urgent_pulls, weapon_ten_pulls,
+                            weapon_ten_pulls * cost, state.supply_boxes, extra_quota_purchased,
+                            state.weapon_remaining == 0)
+
+    def _result(self, character_pulls: int, urgent_pulls: int, weapon_ten_pulls: int, quota_used: int,
+                supply_boxes: int, extra_quota: int, success: bool, failure_reason: str = '') -> Dict:
+        """生成与参考实现相同格式的结果字典"""
+        result = {
+            '角色总抽数（不含紧急）': character_pulls,
+            '角色紧急招募': urgent_pulls,
+            '角色总抽数': character_pulls + urgent_pulls,
+            '武器十连次数': weapon_ten_pulls,
+            '武器总抽数': weapon_ten_pulls * 10,
+            '武器配额消耗': quota_used,
+            '剩余配额': self.state.weapon_quota,
+            '补充武库箱': supply_boxes,
+            '额外购买配额': extra_quota,
+            '成功': success,
+        }
+        if failure_reason:
+            result['失败原因'] = failure_reason
+        return result
+
+    def simulate(self, seed: Optional[int] = None, run_index: Optional[int] = None) -> Dict:
+        """执行一次综合模拟，随机数源的选择与 combined_character_weapon_simulation 相同
+
+        参数:
+            seed: 随机种子，传入时使用由 (seed, run_index, 卡池) 决定的计数器随机流；None表示使用全局 random 模块
+            run_index: 模拟编号，写入结果的'模拟编号'；传入 seed 时默认为0
+        """
+        if seed is None:
+            result = self.run()
+        else:
+            result = self.run(*run_streams(seed, run_index or 0))
+        if run_index is not None:
+            result['模拟编号'] = run_index
+        return result
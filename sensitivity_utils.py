@@ -0,0 +1,197 @@
+"""
+灵敏度分析模块 - 一次模拟同时估计成功率和平均抽数对各项卡池概率参数的导数
+
+使用似然比（得分函数）估计：每次模拟的得分为所有随机抽取的对数概率对参数的导数之和，
+d E[f]/dθ = E[(f - E[f]) · 得分]。保底、配额和目标判定都是抽取结果的确定函数，不影响估计的无偏性。
+一批轨迹即可给出所有参数的导数，不需要为每个参数各做两批扰动模拟。
+
+参数:
+- 角色池基础六星概率、每个概率提升区间的提升值（对应区间内的六星概率）
+- 六星干员池中"限定"的份额（其余干员按原比例分摊剩余份额）
+- 武器池基础六星概率、六星武器池中"限定武器"的份额
+"""
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+from scalar_gacha_utils import ScalarSimulator, LIMITED_CHARACTER, LIMITED_WEAPON
+from compiled_rules import records_from_results
+from rng_utils import new_seed
+
+
+# 得分向量中固定参数的位置，概率提升区间依次排在其后
+S_BASE_SIX = 0
+S_LIMITED_SHARE = 1
+S_WEAPON_BASE_SIX = 2
+S_WEAPON_LIMITED_SHARE = 3
+S_BOOST = 4
+
+# 估计导数的结果量：(结果记录字段, 中文名)
+SENSITIVITY_OUTCOMES = [
+    ('success', '成功率'),
+    ('character_pulls', '角色池平均抽数'),
+    ('weapon_ten_pulls', '武器平均十连次数'),
+]
+
+
+def probability_parameters(character_pool_config: CharacterPoolConfig,
+                           weapon_pool_config: WeaponPoolConfig) -> List[Tuple[str, float]]:
+    """按得分向量顺序列出概率参数的 (中文名, 当前值)"""
+    parameters = [
+        ('角色池基础六星概率', character_pool_config.base_six_probability),
+        (f'六星干员池"{LIMITED_CHARACTER}"份额', character_pool_config.six_star_pool.get(LIMITED_CHARACTER, 0.0)),
+        ('武器池基础六星概率', weapon_pool_config.base_six_probability),
+        (f'六星武器池"{LIMITED_WEAPON}"份额', weapon_pool_config.six_star_weapon_pool.get(LIMITED_WEAPON, 0.0)),
+    ]
+    for start, end, boost in character_pool_config.probability_boost_ranges:
+        span = f'{start}' if start == end else f'{start}-{end}'
+        parameters.append((f'第{span}抽六星概率提升', boost))
+    return parameters
+
+
+def _share_score(share: float, hit: bool) -> float:
+    """按份额 share 抽取时，抽中/未抽中该物品的对数概率对份额的导数（其余物品按比例分摊）"""
+    if not 0 < share < 1:
+        return 0.0  # 份额为0或1时抽取结果是确定的，没有可估计的导数
+    return 1 / share if hit else -1 / (1 - share)
+
+
+def _bernoulli_score(probability: float, hit: bool) -> float:
+    """以概率 probability 判定成功时，判定结果的对数概率对该概率的导数（概率被截断到1时为0）"""
+    if probability >= 1:
+        return 0.0
+    if probability <= 0:
+        return -1.0 if not hit else 0.0
+    return 1 / probability if hit else -1 / (1 - probability)
+
+
+class ScoreSimulator(ScalarSimulator):
+    """在标量模拟的同时累计每次模拟的得分向量，随机数消耗和结果与 ScalarSimulator 完全相同"""
+
+    __slots__ = ('score', 'boost_index', 'limited_share', 'weapon_limited_share')
+
+    def __init__(self, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                 player_info: PlayerInfo):
+        super().__init__(character_pool_config, weapon_pool_config, player_info)
+        self.score = [0.0] * (S_BOOST + len(character_pool_config.probability_boost_ranges))
+        # 小保底累计抽数 -> 生效的提升区间（与 get_current_six_star_character_probability 一样取第一个匹配的区间）
+        self.boost_index = [-1] * len(self.rules.six_star_rate)
+        for soft_pity_count in range(len(self.boost_index)):
+            for index, (start, end, boost) in enumerate(character_pool_config.probability_boost_ranges):
+                if start <= soft_pity_count <= end:
+                    self.boost_index[soft_pity_count] = index
+                    break
+        self.limited_share = character_pool_config.six_star_pool.get(LIMITED_CHARACTER, 0.0)
+        self.weapon_limited_share = weapon_pool_config.six_star_weapon_pool.get(LIMITED_WEAPON, 0.0)
+
+    def _draw_character(self, six_probability: float, rng):
+        character, rarity = super()._draw_character(six_probability, rng)
+        score = _bernoulli_score(six_probability, rarity == 6)
+        self.score[S_BASE_SIX] += score
+        # 紧急招募使用基础概率，不受提升区间影响；单抽期间不会持有紧急招募
+        state = self.state
+        if state.ten_pull_count_urgent == 0 and state.soft_pity_accumulate < len(self.boost_index):
+            boost = self.boost_index[state.soft_pity_accumulate]
+            if boost >= 0:
+                self.score[S_BOOST + boost] += score
+        return character, rarity
+
+    def _sample_character(self, rng) -> int:
+        character = super()._sample_character(rng)
+        self.score[S_LIMITED_SHARE] += _share_score(self.limited_share, character == self.rules.limited_character)
+        return character
+
+    def _draw_weapon(self, rng) -> int:
+        weapon = super()._draw_weapon(rng)
+        self.score[S_WEAPON_BASE_SIX] += _bernoulli_score(self.rules.weapon_base_six, weapon >= 0)
+        return weapon
+
+    def _sample_weapon(self, rng) -> int:
+        weapon = super()._sample_weapon(rng)
+        self.score[S_WEAPON_LIMITED_SHARE] += _share_score(self.weapon_limited_share,
+                                                           weapon == self.rules.limited_weapon)
+        return weapon
+
+    def simulate_scores(self, seed: int, run_index: int) -> Tuple[dict, List[float]]:
+        """执行编号为 run_index 的一次模拟，返回 (结果, 得分向量)"""
+        self.score[:] = [0.0] * len(self.score)
+        result = self.simulate(seed=seed, run_index=run_index)
+        return result, list(self.score)
+
+
+@dataclass
+class ParameterSensitivity:
+    """一个概率参数的导数估计"""
+
+    label: str  # 参数中文名
+    value: float  # 参数当前值
+    derivatives: np.ndarray  # 各结果量对该参数的导数，顺序同 SENSITIVITY_OUTCOMES
+    errors: np.ndarray  # 导数估计的标准误
+
+
+@dataclass
+class SensitivityReport:
+    """灵敏度分析结果"""
+
+    runs: int
+    seed: int
+    means: np.ndarray  # 各结果量的均值，顺序同 SENSITIVITY_OUTCOMES
+    parameters: List[ParameterSensitivity]
+
+    def format(self) -> str:
+        """格式化为中文表格，导数按参数变化0.01（1个百分点）给出"""
+        lines = [f"{self.runs} 次模拟，" + '，'.join(
+            f"{label} {mean:.2%}" if name == 'success' else f"{label} {mean:.2f}"
+            for (name, label), mean in zip(SENSITIVITY_OUTCOMES, self.means))]
+        header = ''.join(f"{'Δ' + label:>18}" for _, label in SENSITIVITY_OUTCOMES)
+        lines.append(f"{'参数（+1个百分点）':<22}{'当前值':>10}{header}")
+        for parameter in self.parameters:
+            cells = ''.join(f"{derivative * 0.01:>+11.4f}±{error * 0.01:<6.4f}"
+                            for derivative, error in zip(parameter.derivatives, parameter.errors))
+            lines.append(f"{parameter.label:<22}{parameter.value:>10.4f}{cells}")
+        return '\n'.join(lines)
+
+
+def analyze_sensitivity(character_pool_config: CharacterPoolConfig,
+                        weapon_pool_config: WeaponPoolConfig,
+                        player_info: PlayerInfo,
+                        simulation_runs: int,
+                        seed: Optional[int] = None,
+                        first_run: int = 0) -> SensitivityReport:
+    """一次模拟估计成功率、角色池平均抽数和武器平均十连次数对所有概率参数的导数
+
+    参数:
+        character_pool_config: 角色池配置
+        weapon_pool_config: 武器池配置
+        player_info: 玩家信息（内部状态字段需已计算）
+        simulation_runs: 模拟次数
+        seed: 随机种子，None表示随机生成
+        first_run: 第一次模拟的编号
+
+    返回:
+        各参数的导数估计及其标准误
+    """
+    if seed is None:
+        seed = new_seed()
+    simulator = ScoreSimulator(character_pool_config, weapon_pool_config, player_info)
+    results = []
+    scores = np.empty((simulation_runs, len(simulator.score)))
+    for i in range(simulation_runs):
+        result, scores[i] = simulator.simulate_scores(seed, first_run + i)
+        results.append(result)
+    records = records_from_results(results, first_run=first_run)
+
+    outcomes = np.column_stack([records[name].astype(float) for name, _ in SENSITIVITY_OUTCOMES])
+    means = outcomes.mean(axis=0)
+    # 以均值为基线：得分的期望为0，减去基线不改变期望但能显著降低方差
+    terms = (outcomes - means)[:, :, None] * scores[:, None, :]  # 模拟 × 结果量 × 参数
+    derivatives = terms.mean(axis=0)
+    errors = terms.std(axis=0, ddof=1) / math.sqrt(simulation_runs) if simulation_runs > 1 \
+        else np.full_like(derivatives, np.nan)
+
+    parameters = [
+        ParameterSensitivity(label, value, derivatives[:, index], errors[:, index])
+        for index, (label, value) in enumerate(probability_parameters(character_pool_config, weapon_pool_config))
+    ]
+    return SensitivityReport(runs=simulation_runs, seed=seed, means=means, parameters=parameters)
@@ -0,0 +1,37 @@
+"""
+本地模拟服务 - 在常驻进程池中回答 JSON 模拟查询，供机器人等程序调用
+
+示例:
+    python service_main.py --workers 4
+    curl -X POST http://127.0.0.1:8765/simulate -d '{"player": {"character_goals": {"限定": 2}}, "runs": 20000}'
+    curl http://127.0.0.1:8765/metrics
+"""
+import argparse
+import asyncio
+from service_utils import SimulationService, DEFAULT_HOST, DEFAULT_PORT
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='本地抽卡模拟服务')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'监听地址，默认 {DEFAULT_HOST}（只接受本机连接）')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'端口，默认 {DEFAULT_PORT}')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--max-queue', type=int, default=256, help='最多排队的请求数，超出时返回503')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+    service = SimulationService(workers=args.workers, max_queue=args.max_queue)
+    print(f"正在启动 {service.workers} 个工作进程并预热...")
+    try:
+        asyncio.run(service.serve(args.host, args.port,
+                                  ready=lambda port: print(f"模拟服务已启动: http://{args.host}:{port}")))
+    except KeyboardInterrupt:
+        print("\n模拟服务已停止")
+
+
+if __name__ == "__main__":
+    main()
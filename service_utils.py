@@ -0,0 +1,391 @@
+"""
+本地模拟服务模块 - 基于 asyncio 的 HTTP 服务，在常驻的进程池中回答模拟查询
+
+接口（只监听本机，请求和响应均为 JSON）:
+- POST /simulate  请求体见 parse_query，返回统计摘要（可选附带 base64 编码的PNG图表）
+- GET  /metrics   Prometheus 文本格式的计数器：排队数、执行中请求数、延迟分布、模拟次数和每秒模拟次数
+- GET  /health    服务状态
+
+工作进程启动时导入 NumPy/Numba 并预热编译型内核，之后按场景哈希缓存编译好的规则表，
+同一场景的后续查询不再重新编译。每个请求有时间预算：排队超时直接返回504，
+执行中超时则按块停止并返回已完成部分的统计（truncated 为 true）。
+"""
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo, config_from_dict
+from worker_utils import init_worker, worker_simulator, run_chunk
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_RUNS = 10000
+MAX_RUNS = 10_000_000  # 单个请求的模拟次数上限
+DEFAULT_TIME_BUDGET = 10.0  # 秒
+MAX_TIME_BUDGET = 300.0
+SERVICE_CHUNK_RUNS = 4096  # 工作进程每块的模拟次数，也是超时判定的粒度
+MAX_BODY_BYTES = 1 << 20
+RESULT_GRACE_SECONDS = 2.0  # 时间预算之外等待工作进程返回已完成部分的时间
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_WINDOW_SECONDS = 60.0  # 每秒模拟次数的统计窗口
+
+
+class QueryError(ValueError):
+    """请求内容无效，返回400"""
+
+
+def _dataclass_from_dict(cls, data: Optional[Dict[str, Any]]):
+    """用 JSON 对象覆盖数据类的默认值，未知字段报错"""
+    if data is None:
+        return cls()
+    if not isinstance(data, dict):
+        raise QueryError(f"{cls.__name__} 必须是JSON对象")
+    return config_from_dict(cls, data)
+
+
+@dataclass
+class SimulationQuery:
+    """一次模拟查询"""
+
+    character_pool_config: CharacterPoolConfig
+    weapon_pool_config: WeaponPoolConfig
+    player_info: PlayerInfo
+    runs: int = DEFAULT_RUNS
+    seed: Optional[int] = None
+    time_budget: float = DEFAULT_TIME_BUDGET  # 秒，包括排队时间
+    charts: bool = False
+
+
+def parse_query(body: Dict[str, Any]) -> SimulationQuery:
+    """解析 /simulate 的请求体
+
+    参数:
+        body: {"player": {PlayerInfo字段}, "character_pool": {CharacterPoolConfig字段},
+               "weapon_pool": {WeaponPoolConfig字段}, "runs": 模拟次数, "seed": 随机种子,
+               "time_budget": 秒, "charts": 是否返回图表}，除 player 外均可省略
+    """
+    if not isinstance(body, dict):
+        raise QueryError("请求体必须是JSON对象")
+    unknown = sorted(set(body) - {'player', 'character_pool', 'weapon_pool', 'runs', 'seed', 'time_budget',
+                                  'charts'})
+    if unknown:
+        raise QueryError(f"未知参数: {', '.join(unknown)}")
+    try:
+        character_pool_config = _dataclass_from_dict(CharacterPoolConfig, body.get('character_pool'))
+        weapon_pool_config = _dataclass_from_dict(WeaponPoolConfig, body.get('weapon_pool'))
+        player_info = _dataclass_from_dict(PlayerInfo, body.get('player'))
+        player_info.compute_internal_state(character_pool_config)
+    except (TypeError, AttributeError) as e:
+        raise QueryError(f"配置格式错误: {e}") from e
+    except ValueError as e:
+        raise QueryError(str(e.args[-1]) if e.args else str(e)) from e
+
+    runs = body.get('runs', DEFAULT_RUNS)
+    if not isinstance(runs, int) or not 0 < runs <= MAX_RUNS:
+        raise QueryError(f"runs 必须是1到{MAX_RUNS}之间的整数")
+    seed = body.get('seed')
+    if seed is not None and (not isinstance(seed, int) or seed < 0):
+        raise QueryError("seed 必须是非负整数")
+    time_budget = body.get('time_budget', DEFAULT_TIME_BUDGET)
+    if not isinstance(time_budget, (int, float)) or not 0 < time_budget <= MAX_TIME_BUDGET:
+        raise QueryError(f"time_budget 必须在0到{MAX_TIME_BUDGET}秒之间")
+    return SimulationQuery(character_pool_config, weapon_pool_config, player_info, runs, seed,
+                           float(time_budget), bool(body.get('charts', False)))
+
+
+# ========== 工作进程 ==========
+
+def _worker_ready() -> int:
+    """进程池预热用的空任务，返回工作进程号"""
+    return os.getpid()
+
+
+def summarize(histogram) -> Dict[str, Any]:
+    """结果直方图的统计摘要"""
+    if not histogram.runs:
+        return {'success_rate': None}
+
+    def stats(field):
+        return {
+            'mean': histogram.mean(field),
+            'median': histogram.median(field),
+            'p90': histogram.quantile(field, 0.9),
+            'p99': histogram.quantile(field, 0.99),
+            'max': histogram.value_at(field, histogram.runs - 1),
+        }
+
+    return {
+        'success_rate': histogram.successes / histogram.runs,
+        'character_pulls': stats('character_pulls'),
+        'weapon_ten_pulls': stats('weapon_ten_pulls'),
+        'extra_quota_purchased': {'mean': histogram.mean('extra_quota_purchased')},
+        'failure_reasons': histogram.failure_reasons(),
+    }
+
+
+def _render_charts(histogram) -> Dict[str, str]:
+    """绘制饼图和分布图，返回 文件名 -> base64 编码的PNG"""
+    from analysis_utils import plot_success_failure_pie, plot_combined_distributions
+    charts = {}
+    with tempfile.TemporaryDirectory() as directory:
+        prefix = os.path.join(directory, 'query')
+        plot_success_failure_pie(histogram.successes, histogram.runs - histogram.successes,
+                                 save_path=f'{prefix}_success_failure_pie.png', results=histogram)
+        plot_combined_distributions(histogram, histogram.successes / histogram.runs * 100, save_prefix=prefix)
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), 'rb') as f:
+                charts[name[len('query_'):]] = base64.b64encode(f.read()).decode('ascii')
+    return charts
+
+
+def run_query(query: SimulationQuery, seed: int, deadline: float) -> Dict[str, Any]:
+    """在工作进程中执行一次查询，超过 deadline（time.time()）后不再开始新的块
+
+    返回:
+        统计摘要，附带 runs（已完成次数）、truncated 和可选的 charts
+    """
+    from archive_utils import ResultHistogram
+    started = time.time()
+    simulator = worker_simulator(query.character_pool_config, query.weapon_pool_config, query.player_info)
+    histogram = ResultHistogram()
+    for start in range(0, query.runs, SERVICE_CHUNK_RUNS):
+        if time.time() >= deadline:
+            break
+        histogram.add_records(run_chunk(simulator, seed, start, min(start + SERVICE_CHUNK_RUNS, query.runs)))
+    response = {
+        'seed': seed,
+        'runs': histogram.runs,
+        'requested_runs': query.runs,
+        'truncated': histogram.runs < query.runs,
+        'simulation_seconds': time.time() - started,
+        **summarize(histogram),
+    }
+    if query.charts and histogram.runs:
+        response['charts'] = _render_charts(histogram)
+    return response
+
+
+# ========== 服务端 ==========
+
+class ServiceMetrics:
+    """服务计数器"""
+
+    def __init__(self):
+        self.queued = 0  # 等待空闲工作进程的请求数
+        self.in_flight = 0  # 正在工作进程中执行的请求数
+        self.requests = {}  # HTTP状态码 -> 请求数
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.simulated_runs = 0
+        self.truncated = 0
+        self._recent_runs = deque()  # (完成时间, 模拟次数)
+
+    def observe(self, status: int, latency: float):
+        """记录一个 /simulate 请求的状态码和延迟"""
+        self.requests[status] = self.requests.get(status, 0) + 1
+        self.latency_sum += latency
+        self.latency_count += 1
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.latency_buckets[index] += 1
+
+    def add_runs(self, runs: int, truncated: bool):
+        """记录一次查询完成的模拟次数"""
+        self.simulated_runs += runs
+        self.truncated += truncated
+        self._recent_runs.append((time.monotonic(), runs))
+
+    def runs_per_second(self) -> float:
+        """最近 RATE_WINDOW_SECONDS 秒内的平均每秒模拟次数"""
+        now = time.monotonic()
+        while self._recent_runs and self._recent_runs[0][0] < now - RATE_WINDOW_SECONDS:
+            self._recent_runs.popleft()
+        return sum(runs for _, runs in self._recent_runs) / RATE_WINDOW_SECONDS
+
+    def format(self, workers: int) -> str:
+        """Prometheus 文本格式"""
+        lines = [
+            '# TYPE gacha_workers gauge', f'gacha_workers {workers}',
+            '# TYPE gacha_queue_depth gauge', f'gacha_queue_depth {self.queued}',
+            '# TYPE gacha_in_flight gauge', f'gacha_in_flight {self.in_flight}',
+            '# TYPE gacha_requests_total counter',
+        ]
+        lines += [f'gacha_requests_total{{status="{status}"}} {count}'
+                  for status, count in sorted(self.requests.items())]
+        lines.append('# TYPE gacha_request_latency_seconds histogram')
+        lines += [f'gacha_request_latency_seconds_bucket{{le="{bound}"}} {count}'
+                  for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets)]
+        lines += [
+            f'gacha_request_latency_seconds_bucket{{le="+Inf"}} {self.latency_count}',
+            f'gacha_request_latency_seconds_sum {self.latency_sum:.6f}',
+            f'gacha_request_latency_seconds_count {self.latency_count}',
+            '# TYPE gacha_simulated_runs_total counter', f'gacha_simulated_runs_total {self.simulated_runs}',
+            '# TYPE gacha_truncated_queries_total counter', f'gacha_truncated_queries_total {self.truncated}',
+            '# TYPE gacha_runs_per_second gauge', f'gacha_runs_per_second {self.runs_per_second():.1f}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+            504: 'Gateway Timeout'}
+
+
+class SimulationService:
+    """本地模拟服务
+
+    用法:
+        service = SimulationService(workers=4)
+        asyncio.run(service.serve('127.0.0.1', 8765))
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_queue: int = 256):
+        """
+        参数:
+            workers: 工作进程数，默认为CPU核数
+            max_queue: 最多排队的请求数，超出时返回503
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.metrics = ServiceMetrics()
+        self.executor = None
+        self._slots = None
+
+    async def start(self):
+        """启动进程池并等待所有工作进程完成预热"""
+        # spawn 在各平台行为一致，且不会把事件循环和线程状态复制到子进程
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=init_worker)
+        self._slots = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _worker_ready) for _ in range(self.workers)))
+
+    def close(self):
+        """关闭进程池"""
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    async def simulate(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """处理一个模拟查询，返回 (状态码, 响应)"""
+        from rng_utils import new_seed
+        try:
+            query = parse_query(body)
+        except QueryError as e:
+            return 400, {'error': str(e)}
+        if self.metrics.queued >= self.max_queue:
+            return 503, {'error': '排队请求过多，请稍后重试'}
+        deadline = time.time() + query.time_budget
+        seed = new_seed() if query.seed is None else query.seed
+
+        self.metrics.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), query.time_budget)
+        except asyncio.TimeoutError:
+            return 504, {'error': '排队超出时间预算'}
+        finally:
+            self.metrics.queued -= 1
+        self.metrics.in_flight += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, run_query, query, seed, deadline)
+
+        def finished(_):
+            # 超时返回后工作进程仍在执行，直到它真正空闲才让出名额
+            self.metrics.in_flight -= 1
+            self._slots.release()
+
+        future.add_done_callback(finished)
+        try:
+            # 工作进程在预算用完后最多再执行一块，超出宽限时间仍未返回视为超时
+            response = await asyncio.wait_for(asyncio.shield(future),
+                                              max(deadline - time.time(), 0) + RESULT_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            return 504, {'error': '模拟超出时间预算'}
+        if not response['runs']:
+            return 504, {'error': '模拟超出时间预算', 'seed': seed}
+        self.metrics.add_runs(response['runs'], response['truncated'])
+        return 200, response
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个HTTP连接（每个连接一个请求）"""
+        started = time.monotonic()
+        status, payload, content_type = 500, {'error': '内部错误'}, 'application/json'
+        path = None
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                status, payload = 400, {'error': '无效的HTTP请求'}
+            else:
+                method, path = request_line[0], request_line[1].split('?', 1)[0]
+                status, payload, content_type = await self._route(method, path, headers, reader)
+        except Exception as e:  # 单个请求出错不影响服务
+            status, payload = 500, {'error': f'{type(e).__name__}: {e}'}
+        if path == '/simulate':
+            self.metrics.observe(status, time.monotonic() - started)
+
+        body = payload.encode('utf-8') if isinstance(payload, str) else \
+            json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(f'HTTP/1.1 {status} {_REASONS.get(status, "")}\r\n'
+                     f'Content-Type: {content_type}; charset=utf-8\r\n'
+                     f'Content-Length: {len(body)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('latin-1') + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, headers: Dict[str, str], reader: asyncio.StreamReader):
+        """按路径分发，返回 (状态码, 响应, Content-Type)"""
+        if path == '/metrics':
+            if method != 'GET':
+                return 405, {'error': '只支持GET'}, 'application/json'
+            return 200, self.metrics.format(self.workers), 'text/plain; version=0.0.4'
+        if path == '/health':
+            return 200, {'status': 'ok', 'workers': self.workers}, 'application/json'
+        if path != '/simulate':
+            return 404, {'error': f'没有该接口: {path}'}, 'application/json'
+        if method != 'POST':
+            return 405, {'error': '只支持POST'}, 'application/json'
+
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_BYTES:
+            return 413, {'error': '请求体过大'}, 'application/json'
+        try:
+            body = json.loads((await reader.readexactly(length)).decode('utf-8')) if length else {}
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return 400, {'error': '请求体不是有效的JSON'}, 'application/json'
+        status, payload = await self.simulate(body)
+        return status, payload, 'application/json'
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, ready=None):
+        """启动进程池并持续提供服务
+
+        参数:
+            host: 监听地址，默认只监听本机
+            port: 端口
+            ready: 开始监听后调用的回调，参数为实际端口（port 为0时由系统分配）
+        """
+        await self.start()
+        try:
+            server = await asyncio.start_server(self.handle, host, port)
+            async with server:
+                if ready is not None:
+                    ready(server.sockets[0].getsockname()[1])
+                await server.serve_forever()
+        finally:
+            self.close()
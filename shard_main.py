@@ -0,0 +1,149 @@
+"""
+分片模拟 - 在多台机器上执行同一场景的超大规模模拟，合并后得到与单机运行相同的统计和图表
+
+示例:
+    python shard_main.py init /mnt/shared/study --runs 1000000000 --shard-size 16777216 --engine jit
+    python shard_main.py work /mnt/shared/study --reclaim-after 600     # 在每个节点上执行
+    python shard_main.py status /mnt/shared/study
+    python shard_main.py merge /mnt/shared/study
+"""
+import argparse
+import json
+import os
+import sys
+from config import CharacterPoolConfig, WeaponPoolConfig
+from checkpoint_utils import CheckpointPolicy, DEFAULT_CHUNK_SIZE
+from shard_utils import ShardJob, DEFAULT_SHARD_SIZE, JOB_FILE, work, shard_status, merge_shards
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='分片模拟：多节点执行，精确合并')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    init = commands.add_parser('init', help='在共享目录中新建分片任务')
+    init.add_argument('directory', help='共享目录')
+    init.add_argument('--runs', type=int, required=True, help='总模拟次数')
+    init.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+                      help=f'每个分片的模拟次数，默认{DEFAULT_SHARD_SIZE}')
+    init.add_argument('--engine', choices=['scalar', 'python', 'jit', 'event'], default='jit',
+                      help='模拟引擎，默认 jit')
+    init.add_argument('--seed', type=int, default=None, help='随机种子，默认随机生成')
+    init.add_argument('--scenario', default=None, metavar='PATH',
+                      help='场景JSON文件（character_pool/weapon_pool/player 三个对象，缺少的字段使用默认值），'
+                           '默认使用 character_weapon_main.py 的场景')
+
+    worker = commands.add_parser('work', help='认领并执行尚未完成的分片（可在多个节点上同时运行）')
+    worker.add_argument('directory', help='共享目录')
+    worker.add_argument('--shards', default='', metavar='SPEC', help='只执行指定的分片，如 "0-9,15"，默认全部')
+    worker.add_argument('--max-shards', type=int, default=0, metavar='N', help='最多执行N个分片，0表示不限')
+    worker.add_argument('--reclaim-after', type=float, default=0.0, metavar='S',
+                        help='认领超过S秒未更新时视为该节点已退出，接手其分片并从检查点继续；0表示不接手')
+    worker.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, metavar='N',
+                        help=f'每块的模拟次数，默认{DEFAULT_CHUNK_SIZE}')
+    worker.add_argument('--checkpoint-every-seconds', type=float, default=60.0, metavar='S',
+                        help='每隔S秒写一次分片检查点，默认60')
+
+    status = commands.add_parser('status', help='查看各分片的状态')
+    status.add_argument('directory', help='共享目录')
+
+    merge = commands.add_parser('merge', help='合并分片结果，输出与单机运行相同的统计和图表')
+    merge.add_argument('paths', nargs='+', help='分片结果文件或共享目录')
+    merge.add_argument('--runs', type=int, default=None,
+                       help='应覆盖的总模拟次数，默认取目录中任务文件的设置')
+    merge.add_argument('--allow-partial', action='store_true', help='有未覆盖的模拟编号时仍然输出（仅供预览）')
+    return parser.parse_args(argv)
+
+
+def init(args):
+    """新建分片任务"""
+    from archive_utils import scenario_from_dict
+    from character_weapon_main import default_player_info
+    if args.scenario is None:
+        character_pool_config, weapon_pool_config = CharacterPoolConfig(), WeaponPoolConfig()
+        player_info = default_player_info()
+    else:
+        with open(args.scenario, encoding='utf-8') as f:
+            character_pool_config, weapon_pool_config, player_info = scenario_from_dict(json.load(f))
+    try:
+        job = ShardJob.create(character_pool_config, weapon_pool_config, player_info, args.runs,
+                              shard_size=args.shard_size, seed=args.seed, engine=args.engine)
+    except ValueError as e:
+        sys.exit(f"场景配置错误: {e.args[-1]}")
+    try:
+        job.save(args.directory)
+    except FileExistsError:
+        sys.exit(f"{args.directory} 中已有分片任务，请使用新的目录")
+    print(f"分片任务已创建: {args.directory}（{job.shard_count} 个分片，种子 {job.seed}，"
+          f"场景哈希 {job.scenario_hash[:12]}）")
+
+
+def run_work(args):
+    """认领并执行分片"""
+    from trace_utils import parse_run_filter
+    shards = None
+    if args.shards:
+        job = ShardJob.load(args.directory)
+        selected = parse_run_filter(args.shards)
+        shards = [shard for shard in range(job.shard_count) if shard in selected]
+    policy = CheckpointPolicy(every_seconds=args.checkpoint_every_seconds)
+
+    def report(shard, result):
+        print(f"分片 {shard} 已完成: 模拟编号 {result.run_start}-{result.run_stop - 1}，"
+              f"用时 {result.metadata['seconds']:.1f} 秒")
+
+    try:
+        completed = work(args.directory, shards, max_shards=args.max_shards, reclaim_after=args.reclaim_after,
+                         chunk_size=args.chunk_size, policy=policy, on_shard=report)
+    except KeyboardInterrupt:
+        print("\n已中断，正在执行的分片已写入检查点，可由任意节点继续")
+        return
+    print(f"本节点完成 {len(completed)} 个分片；{shard_status(args.directory).format()}")
+
+
+def run_merge(args):
+    """合并分片结果并输出统计和图表"""
+    from character_weapon_main import report_results
+    try:
+        merged = merge_shards(args.paths)
+    except ValueError as e:
+        sys.exit(str(e))
+    simulation_runs = args.runs
+    if simulation_runs is None:
+        for path in args.paths:
+            if os.path.isfile(os.path.join(path, JOB_FILE)):
+                job = ShardJob.load(path)
+                if job.scenario_hash != merged.scenario_hash:
+                    sys.exit(f"分片结果与 {path} 中的任务属于不同的模拟场景")
+                simulation_runs = job.simulation_runs
+                break
+        else:
+            simulation_runs = merged.ranges[-1][1]
+    gaps = merged.gaps(simulation_runs)
+    print(f"已合并 {merged.shards} 个分片，共 {merged.histogram.runs} 次模拟（种子 {merged.seed}，"
+          f"引擎 {merged.engine}，场景哈希 {merged.scenario_hash[:12]}）")
+    if gaps:
+        missing = sum(stop - start for start, stop in gaps)
+        print(f"有 {missing} 次模拟尚未完成，缺少的编号区间: "
+              + ', '.join(f'{start}-{stop - 1}' for start, stop in gaps[:10]) + (' ...' if len(gaps) > 10 else ''))
+        if not args.allow_partial:
+            sys.exit("结果不完整，如需预览请加 --allow-partial")
+        simulation_runs = merged.histogram.runs
+    report_results(merged.histogram, simulation_runs)
+
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+    if args.command == 'init':
+        init(args)
+    elif args.command == 'work':
+        run_work(args)
+    elif args.command == 'status':
+        print(shard_status(args.directory).format())
+    else:
+        run_merge(args)
+
+
+if __name__ == "__main__":
+    main()
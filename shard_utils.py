@@ -0,0 +1,411 @@
+"""
+分片模拟模块 - 把一次超大规模模拟拆成多个 (种子, 编号区间) 分片，在任意多台机器上执行后精确合并
+
+每次模拟的随机流只由 (种子, 模拟编号) 决定（见 rng_utils），一个分片就是一段连续的模拟编号。
+分片的结果只保存汇总直方图（ResultHistogram，整数计数，可精确合并），
+任意一组覆盖全部编号的分片合并后，与单机一次完成同样次数的模拟得到的统计和图表完全相同。
+
+协调只依赖一个共享目录（NFS、SMB 等），不需要任何外部服务:
+- job.json: 分片任务，保存完整的模拟场景、种子、引擎和分片大小
+- shard-XXXXXX.claim: 分片的认领文件，以独占方式创建，谁创建成功谁执行该分片；执行期间定期更新修改时间
+- shard-XXXXXX.ckpt.npz: 分片的检查点，认领者中途退出后，接手的节点从检查点继续
+- shard-XXXXXX.npz: 分片结果（部分汇总），原子写入，存在即表示该分片已完成
+"""
+import glob
+import json
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+from archive_utils import ResultHistogram, scenario_dict, scenario_from_dict, scenario_hash
+from checkpoint_utils import SimulationCheckpoint, CheckpointPolicy, DEFAULT_CHUNK_SIZE, run_chunks, chunk_simulator
+from rng_utils import new_seed
+
+
+SHARD_VERSION = 1
+JOB_FILE = 'job.json'
+DEFAULT_SHARD_SIZE = 1 << 24  # 每个分片的模拟次数
+
+
+def shard_path(directory: str, shard: int, suffix: str = '.npz') -> str:
+    """分片相关文件的路径，suffix 为 '.npz'（结果）、'.claim'（认领）或 '.ckpt.npz'（检查点）"""
+    return os.path.join(directory, f'shard-{shard:06d}{suffix}')
+
+
+def _atomic_write(path: str, write: Callable):
+    """先写临时文件再原子替换，读者不会看到写了一半的文件"""
+    temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(temporary, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+@dataclass
+class ShardJob:
+    """一次分片模拟任务"""
+
+    scenario: Dict  # 模拟场景，见 archive_utils.scenario_dict
+    seed: int  # 随机种子，所有分片共用
+    engine: str  # 模拟引擎，所有分片共用（event 引擎与其他引擎不逐位一致）
+    simulation_runs: int  # 总模拟次数
+    shard_size: int = DEFAULT_SHARD_SIZE  # 每个分片的模拟次数
+    scenario_hash: str = ''  # 场景哈希，为空时由 scenario 计算
+
+    def __post_init__(self):
+        if self.simulation_runs <= 0 or self.shard_size <= 0:
+            raise ValueError(f"模拟次数和分片大小必须为正数: {self.simulation_runs}, {self.shard_size}")
+        actual = scenario_hash(*self.configs())
+        if self.scenario_hash and self.scenario_hash != actual:
+            raise ValueError("分片任务的场景哈希与场景内容不一致，任务文件可能已被修改")
+        self.scenario_hash = actual
+
+    @classmethod
+    def create(cls, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+               player_info: PlayerInfo, simulation_runs: int, shard_size: int = DEFAULT_SHARD_SIZE,
+               seed: Optional[int] = None, engine: str = 'jit') -> 'ShardJob':
+        """为一个场景新建分片任务
+
+        参数:
+            character_pool_config: 角色池配置
+            weapon_pool_config: 武器池配置
+            player_info: 玩家信息（内部状态字段在此计算，填写有误时抛出ValueError）
+            simulation_runs: 总模拟次数
+            shard_size: 每个分片的模拟次数
+            seed: 随机种子，None表示随机生成
+            engine: 模拟引擎，见 checkpoint_utils.chunk_simulator
+        """
+        player_info.compute_internal_state(character_pool_config)
+        return cls(scenario=scenario_dict(character_pool_config, weapon_pool_config, player_info),
+                   seed=new_seed() if seed is None else seed, engine=engine,
+                   simulation_runs=simulation_runs, shard_size=shard_size)
+
+    def configs(self) -> Tuple[CharacterPoolConfig, WeaponPoolConfig, PlayerInfo]:
+        """还原 (角色池配置, 武器池配置, 玩家信息)"""
+        return scenario_from_dict(self.scenario)
+
+    @property
+    def shard_count(self) -> int:
+        """分片数"""
+        return -(-self.simulation_runs // self.shard_size)
+
+    def shard_range(self, shard: int) -> Tuple[int, int]:
+        """第 shard 个分片的模拟编号范围 [start, stop)"""
+        if not 0 <= shard < self.shard_count:
+            raise ValueError(f"分片编号超出范围: {shard}（共 {self.shard_count} 个分片）")
+        start = shard * self.shard_size
+        return start, min(start + self.shard_size, self.simulation_runs)
+
+    def save(self, directory: str):
+        """在共享目录中写入任务文件；目录中已有任务时报错，避免不同任务的分片混在一起"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, JOB_FILE)
+        header = {
+            'version': SHARD_VERSION,
+            'scenario_hash': self.scenario_hash,
+            'seed': self.seed,
+            'engine': self.engine,
+            'simulation_runs': self.simulation_runs,
+            'shard_size': self.shard_size,
+            'scenario': self.scenario,
+        }
+        text = json.dumps(header, ensure_ascii=False, indent=2, default=str).encode('utf-8')
+        # 独占创建：两个节点同时初始化同一目录时只有一个成功
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @classmethod
+    def load(cls, directory: str) -> 'ShardJob':
+        """读取共享目录中的任务文件"""
+        with open(os.path.join(directory, JOB_FILE), encoding='utf-8') as f:
+            header = json.load(f)
+        if header.pop('version') != SHARD_VERSION:
+            raise ValueError(f"不支持的分片任务版本: {directory}")
+        return cls(**header)
+
+
+@dataclass
+class ShardResult:
+    """一个分片的部分汇总：编号区间 [run_start, run_stop) 内所有模拟的结果直方图"""
+
+    scenario_hash: str
+    seed: int
+    engine: str
+    run_start: int
+    run_stop: int
+    histogram: ResultHistogram
+    metadata: Dict = field(default_factory=dict)  # 执行节点、耗时等，只用于查看
+
+    def save(self, path: str):
+        """原子写入分片结果文件"""
+        header = {
+            'version': SHARD_VERSION,
+            'scenario_hash': self.scenario_hash,
+            'seed': self.seed,
+            'engine': self.engine,
+            'run_start': self.run_start,
+            'run_stop': self.run_stop,
+            **self.metadata,
+        }
+        arrays = {f'histogram.{name}': array for name, array in self.histogram.to_arrays().items()}
+        _atomic_write(path, lambda f: np.savez(
+            f, header=np.frombuffer(json.dumps(header, ensure_ascii=False).encode('utf-8'), dtype=np.uint8),
+            **arrays))
+
+    @classmethod
+    def load(cls, path: str) -> 'ShardResult':
+        """读取分片结果文件"""
+        with np.load(path) as data:
+            header = json.loads(data['header'].tobytes().decode('utf-8'))
+            if header.pop('version') != SHARD_VERSION:
+                raise ValueError(f"不支持的分片结果版本: {path}")
+            prefix = 'histogram.'
+            histogram = ResultHistogram.from_arrays(
+                {name[len(prefix):]: data[name] for name in data.files if name.startswith(prefix)})
+        result = cls(header.pop('scenario_hash'), header.pop('seed'), header.pop('engine'),
+                     header.pop('run_start'), header.pop('run_stop'), histogram, header)
+        if histogram.runs != result.run_stop - result.run_start:
+            raise ValueError(f"分片结果不完整: {path}")
+        return result
+
+
+# ========== 认领与执行 ==========
+
+def claim_shard(directory: str, shard: int, reclaim_after: float = 0.0) -> bool:
+    """尝试认领一个分片，成功返回True
+
+    认领文件以独占方式创建，同一时刻只有一个节点能认领成功。认领文件超过 reclaim_after 秒未更新时，
+    视为认领者已退出：先把它改名（只有一个节点能改名成功）再重新认领。
+
+    参数:
+        directory: 共享目录
+        shard: 分片编号
+        reclaim_after: 认领文件多久未更新视为失效（秒），0表示从不接手
+    """
+    path = shard_path(directory, shard, '.claim')
+    owner = json.dumps({'host': socket.gethostname(), 'pid': os.getpid(), 'time': time.time()}).encode('utf-8')
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            if reclaim_after <= 0:
+                return False
+            try:
+                if time.time() - os.path.getmtime(path) < reclaim_after:
+                    return False
+                os.rename(path, f'{path}.{uuid.uuid4().hex}.stale')
+            except FileNotFoundError:
+                pass  # 认领者刚好完成，或被其他节点抢先接手
+            continue
+        with os.fdopen(fd, 'wb') as f:
+            f.write(owner)
+        return True
+    return False
+
+
+def _remove_stale_claims(directory: str, shard: int):
+    """删除被接手的失效认领文件"""
+    for path in glob.glob(glob.escape(shard_path(directory, shard, '.claim')) + '.*.stale'):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def run_shard(job: ShardJob, directory: str, shard: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+              policy: Optional[CheckpointPolicy] = None) -> ShardResult:
+    """执行一个（已认领的）分片并写入结果文件
+
+    分片按块执行并定期写入检查点，接手的节点从检查点继续，结果与不中断时逐位一致。
+    每完成一块更新一次认领文件的修改时间，表明认领者仍在运行。
+
+    参数:
+        job: 分片任务
+        directory: 共享目录
+        shard: 分片编号
+        chunk_size: 每块的模拟次数
+        policy: 写检查点的间隔，默认 CheckpointPolicy()
+    """
+    start, stop = job.shard_range(shard)
+    checkpoint_path = shard_path(directory, shard, '.ckpt.npz')
+    claim_path = shard_path(directory, shard, '.claim')
+    if os.path.exists(checkpoint_path):
+        checkpoint = SimulationCheckpoint.load(checkpoint_path)
+        checkpoint.check_scenario(job.scenario_hash)
+    else:
+        checkpoint = SimulationCheckpoint(job.scenario_hash, job.seed, job.engine, stop - start, chunk_size,
+                                          metadata={'run_start': start})
+    simulate = chunk_simulator(job.engine, *job.configs(), job.seed)
+
+    def simulate_chunk(chunk_start, chunk_stop):
+        # 检查点内的编号从0开始，加上分片的起点才是模拟编号
+        return simulate(start + chunk_start, start + chunk_stop)
+
+    def heartbeat():
+        try:
+            os.utime(claim_path)
+        except FileNotFoundError:
+            pass
+        return False
+
+    began = time.time()
+    run_chunks(checkpoint, simulate_chunk, path=checkpoint_path, policy=policy, should_stop=heartbeat)
+    result = ShardResult(job.scenario_hash, job.seed, job.engine, start, stop, checkpoint.histogram,
+                         metadata={'host': socket.gethostname(), 'seconds': round(time.time() - began, 3)})
+    result.save(shard_path(directory, shard))
+    for path in (checkpoint_path, claim_path):
+        if os.path.exists(path):
+            os.remove(path)
+    _remove_stale_claims(directory, shard)
+    return result
+
+
+def work(directory: str, shards: Optional[List[int]] = None, max_shards: int = 0, reclaim_after: float = 0.0,
+         chunk_size: int = DEFAULT_CHUNK_SIZE, policy: Optional[CheckpointPolicy] = None,
+         on_shard: Optional[Callable[[int, ShardResult], None]] = None) -> List[int]:
+    """在共享目录中依次认领并执行尚未完成的分片，多个节点可以同时对同一目录调用
+
+    参数:
+        directory: 共享目录（已由 ShardJob.save 初始化）
+        shards: 只执行这些分片，None表示全部
+        max_shards: 最多执行多少个分片，0表示不限
+        reclaim_after: 认领文件多久未更新视为失效（秒），0表示不接手其他节点的分片
+        chunk_size: 每块的模拟次数，也是中断时最多需要重算的次数
+        policy: 写检查点的间隔
+        on_shard: 每完成一个分片调用 on_shard(分片编号, 分片结果)
+
+    返回:
+        本节点完成的分片编号
+    """
+    job = ShardJob.load(directory)
+    completed = []
+    for shard in (range(job.shard_count) if shards is None else shards):
+        if max_shards and len(completed) >= max_shards:
+            break
+        if os.path.exists(shard_path(directory, shard)) or not claim_shard(directory, shard, reclaim_after):
+            continue
+        if os.path.exists(shard_path(directory, shard)):
+            os.remove(shard_path(directory, shard, '.claim'))  # 认领之前刚被其他节点完成
+            continue
+        try:
+            result = run_shard(job, directory, shard, chunk_size, policy)
+        except BaseException:
+            # 释放认领，其他节点可以立即接手（检查点保留）
+            if os.path.exists(shard_path(directory, shard, '.claim')):
+                os.remove(shard_path(directory, shard, '.claim'))
+            raise
+        completed.append(shard)
+        if on_shard is not None:
+            on_shard(shard, result)
+    return completed
+
+
+@dataclass
+class ShardStatus:
+    """共享目录中各分片的状态"""
+
+    job: ShardJob
+    done: List[int]
+    running: List[int]  # 已被认领、尚未完成
+    pending: List[int]
+
+    def format(self) -> str:
+        """格式化为一行中文说明"""
+        done_runs = sum(stop - start for start, stop in map(self.job.shard_range, self.done))
+        return (f"共 {self.job.shard_count} 个分片: 已完成 {len(self.done)}，执行中 {len(self.running)}，"
+                f"未开始 {len(self.pending)}；已完成 {done_runs}/{self.job.simulation_runs} 次模拟")
+
+
+def shard_status(directory: str) -> ShardStatus:
+    """查看共享目录中各分片的状态"""
+    job = ShardJob.load(directory)
+    status = ShardStatus(job, [], [], [])
+    for shard in range(job.shard_count):
+        if os.path.exists(shard_path(directory, shard)):
+            status.done.append(shard)
+        elif os.path.exists(shard_path(directory, shard, '.claim')):
+            status.running.append(shard)
+        else:
+            status.pending.append(shard)
+    return status
+
+
+# ========== 合并 ==========
+
+@dataclass
+class MergedShards:
+    """合并后的结果"""
+
+    scenario_hash: str
+    seed: int
+    engine: str
+    histogram: ResultHistogram
+    ranges: List[Tuple[int, int]]  # 已合并的编号区间，按起点排序
+    shards: int  # 合并的分片文件数
+
+    def gaps(self, simulation_runs: int) -> List[Tuple[int, int]]:
+        """[0, simulation_runs) 中没有被任何分片覆盖的编号区间"""
+        gaps = []
+        position = 0
+        for start, stop in self.ranges:
+            if start > position:
+                gaps.append((position, start))
+            position = max(position, stop)
+        if position < simulation_runs:
+            gaps.append((position, simulation_runs))
+        return gaps
+
+
+def shard_files(paths: List[str]) -> List[str]:
+    """展开分片结果文件列表，目录展开为其中的所有 shard-*.npz（不含检查点）"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(name for name in glob.glob(os.path.join(glob.escape(path), 'shard-*.npz'))
+                            if not name.endswith('.ckpt.npz'))
+        else:
+            files.append(path)
+    return files
+
+
+def merge_shards(paths: List[str]) -> MergedShards:
+    """精确合并一组分片结果文件
+
+    所有分片必须属于同一场景（场景哈希相同）、使用相同的种子和引擎，编号区间不能重叠，否则报错。
+    合并结果与顺序无关，覆盖全部编号时与单机一次完成的模拟结果相同。
+
+    参数:
+        paths: 分片结果文件（或包含分片结果的目录）
+    """
+    files = shard_files(paths)
+    if not files:
+        raise ValueError("没有找到分片结果文件")
+    results = sorted(((ShardResult.load(path), path) for path in files), key=lambda item: item[0].run_start)
+    first, first_path = results[0]
+    histogram = ResultHistogram()
+    ranges = []
+    previous_stop, previous_path = 0, None
+    for result, path in results:
+        if result.scenario_hash != first.scenario_hash:
+            raise ValueError(f"{path} 与 {first_path} 属于不同的模拟场景（场景哈希不同），不能合并")
+        if (result.seed, result.engine) != (first.seed, first.engine):
+            raise ValueError(f"{path} 与 {first_path} 的种子或模拟引擎不同，不能合并")
+        if previous_path is not None and result.run_start < previous_stop:
+            raise ValueError(f"{path} 与 {previous_path} 的模拟编号区间重叠")
+        histogram.merge(result.histogram)
+        ranges.append((result.run_start, result.run_stop))
+        previous_stop, previous_path = result.run_stop, path
+    return MergedShards(first.scenario_hash, first.seed, first.engine, histogram, ranges, len(results))
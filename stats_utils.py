@@ -0,0 +1,57 @@
+"""
+统计检验工具模块 - 预算优化、抽卡记录拟合、引擎一致性验证共用的二项置信区间和卡方分布尾概率，只依赖标准库
+"""
+import math
+from statistics import NormalDist
+from typing import Tuple
+
+
+def wilson_interval(successes: int, trials: int, confidence: float = 0.95) -> Tuple[float, float]:
+    """二项比例的 Wilson 置信区间，试验次数为0时为 (0, 1)"""
+    if trials == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def chi2_survival(statistic: float, degrees_of_freedom: int) -> float:
+    """卡方分布的上尾概率 P(X >= statistic)，即正则化上不完全伽马函数 Q(k/2, x/2)"""
+    if degrees_of_freedom <= 0:
+        return float('nan')
+    a = degrees_of_freedom / 2
+    x = statistic / 2
+    if x <= 0:
+        return 1.0
+    log_prefactor = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        # 级数展开求下尾 P
+        term = total = 1 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1 - total * math.exp(log_prefactor))
+    # 连分式求上尾 Q（Lentz 算法）
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 10000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1.0, math.exp(log_prefactor) * h)
@@ -0,0 +1,73 @@
+"""
+抽卡策略模拟 - 按策略文件（格式见 strategy_utils）模拟，输出成功率、失败原因和与内置引擎相同的图表
+
+示例:
+    python strategy_main.py --print-default > my_strategy.txt    # 以内置策略为模板修改
+    python strategy_main.py my_strategy.txt --runs 100000 --engine jit
+"""
+import argparse
+import json
+import sys
+from config import CharacterPoolConfig, WeaponPoolConfig
+from rng_utils import new_seed
+from strategy_utils import DEFAULT_STRATEGY, StrategyError, load_strategy, strategy_chunk_simulator
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='按声明式抽卡策略模拟')
+    parser.add_argument('path', nargs='?', default=None, help='策略文件')
+    parser.add_argument('--print-default', action='store_true', help='输出复现内置引擎的策略后退出')
+    parser.add_argument('--runs', type=int, default=10000, help='模拟次数')
+    parser.add_argument('--engine', choices=['jit', 'scalar'], default='jit', help='模拟引擎，默认 jit')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子，默认随机生成并打印')
+    parser.add_argument('--scenario', default=None, metavar='PATH',
+                        help='场景JSON文件（character_pool/weapon_pool/player 三个对象），'
+                             '默认使用 character_weapon_main.py 的场景')
+    parser.add_argument('--chunk-size', type=int, default=1 << 16, metavar='N', help='每块的模拟次数，决定内存占用')
+    args = parser.parse_args(argv)
+    if args.path is None and not args.print_default:
+        parser.error('需要策略文件')
+    return args
+
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+    if args.print_default:
+        print(DEFAULT_STRATEGY, end='')
+        return
+    from archive_utils import ResultHistogram, scenario_from_dict
+    from character_weapon_main import default_player_info, report_results
+    try:
+        strategy = load_strategy(args.path)
+    except StrategyError as e:
+        sys.exit(f"{args.path}: {e}")
+    if args.scenario is None:
+        character_pool_config, weapon_pool_config = CharacterPoolConfig(), WeaponPoolConfig()
+        player_info = default_player_info()
+    else:
+        with open(args.scenario, encoding='utf-8') as f:
+            character_pool_config, weapon_pool_config, player_info = scenario_from_dict(json.load(f))
+    try:
+        player_info.compute_internal_state(character_pool_config)
+    except ValueError as e:
+        sys.exit(f"场景配置错误: {e.args[-1]}")
+
+    seed = new_seed() if args.seed is None else args.seed
+    print(f"策略 {args.path}（{len(strategy.rule_table)} 条规则），模拟 {args.runs} 次，"
+          f"引擎 {args.engine}，随机种子: {seed}")
+    simulate_chunk = strategy_chunk_simulator(args.engine, character_pool_config, weapon_pool_config,
+                                              player_info, strategy, seed)
+    histogram = ResultHistogram()
+    for start in range(0, args.runs, args.chunk_size):
+        histogram.add_records(simulate_chunk(start, min(start + args.chunk_size, args.runs)))
+
+    print(f"成功率: {histogram.successes / args.runs:.2%}")
+    for reason, count in histogram.failure_reasons().items():
+        print(f"  {reason}: {count / args.runs:.2%}")
+    report_results(histogram, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+抽卡策略编码模块 - 策略描述语言（strategy_utils）编译后的变量、动作、比较运算和规则表列下标，
+由 strategy_utils 编译策略、由 jit_gacha_utils 的策略内核执行
+"""
+
+# 抽卡策略（strategy_utils）可引用的变量，编译后按下标存放在变量向量中
+V_SOFT_PITY = 0  # 小保底累计抽数
+V_BANNER_PULLS = 1  # 角色池总抽数（含模拟开始前已用的抽数，决定大保底和循环保底）
+V_CHARACTER_PULLS = 2  # 本次模拟的角色池抽数（不含紧急）
+V_PAID_PULLS = 3  # 其中的付费抽数
+V_URGENT_PULLS = 4  # 紧急招募抽数
+V_WEAPON_TEN_PULLS = 5  # 武器十连次数
+V_QUOTA = 6  # 当前武器配额
+V_EXTRA_QUOTA = 7  # 已额外购买的配额
+V_VOUCHERS = 8  # 剩余十连寻访凭证
+V_URGENT_VOUCHERS = 9  # 剩余紧急招募十连
+V_LIMITED_OBTAINED = 10  # 是否已获得限定角色
+V_WEAPON_LIMITED_OBTAINED = 11  # 是否已获得限定武器
+V_CHARACTER_GOALS_MET = 12  # 角色池目标是否已满足
+V_WEAPON_GOALS_MET = 13  # 武器池目标是否已满足
+V_CHARACTER_DONE = 14  # 角色池目标已满足且达到抽数下限
+V_WEAPON_DONE = 15  # 武器池目标已满足且达到十连次数下限
+V_WEAPON_COST = 16  # 武器池每次十连消耗的配额
+V_CHARACTER_PULL_LIMIT = 17  # 以下为玩家信息中的参数
+V_CHARACTER_PULL_MINIMUM = 18
+V_WEAPON_PULL_LIMIT = 19
+V_WEAPON_PULL_MINIMUM = 20
+V_ALWAYS_PULL_TEN = 21
+V_LOW_QUOTA_CHARACTER_PULL = 22
+N_VARIABLES = 23
+
+# 抽卡策略的动作
+A_STOP = 0  # 停止本次模拟
+A_CHARACTER_PULL = 1  # 有十连凭证或紧急招募时用掉一次（免费十连），否则付费单抽
+A_CHARACTER_TEN_PULL = 2  # 有十连凭证或紧急招募时用掉一次，否则付费十连
+A_WEAPON_TEN_PULL = 3  # 武器池十连，配额不足时以"武器配额不足"失败结束
+A_BUY_QUOTA = 4  # 购买配额补足一次武器十连
+
+# 条件比较运算
+O_LT = 0
+O_LE = 1
+O_GT = 2
+O_GE = 3
+O_EQ = 4
+O_NE = 5
+
+# 编译后的策略：规则表每行为 (动作, 停止时的失败原因, 条件起始下标, 条件结束下标)，
+# 条件表每行为 (左侧变量, 运算, 右侧是否为变量, 右侧变量下标或常数)
+RULE_ACTION = 0
+RULE_REASON = 1
+RULE_FIRST_CONDITION = 2
+RULE_STOP_CONDITION = 3
+N_RULE_COLUMNS = 4
+CONDITION_VARIABLE = 0
+CONDITION_OP = 1
+CONDITION_RIGHT_IS_VARIABLE = 2
+CONDITION_RIGHT = 3
+N_CONDITION_COLUMNS = 4
+MAX_STRATEGY_STEPS = 1 << 20  # 单次模拟最多执行的动作数，防止不会停止的策略无限循环
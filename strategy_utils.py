@@ -0,0 +1,425 @@
+"""
+抽卡策略模块 - 用声明式规则描述"每一步抽什么、何时停止"，同一份策略由标量引擎和编译型引擎执行
+
+内置引擎的抽取策略（先抽角色池、配额不足时抽角色池或购买配额等）写死在模拟循环中，
+PlayerInfo 只能调整其中的几个参数。抽卡策略把这部分逻辑改为一组按顺序检查的规则，每行一条:
+
+    动作 [失败原因] [when 条件 and 条件 ...]
+
+每一步从上到下检查规则，执行第一条条件全部成立的规则的动作；没有规则成立时停止。
+'#' 之后为注释。条件为 "变量 运算 变量或整数"（运算为 < <= > >= == !=），
+或单独的 "变量"（不为0）、"not 变量"（为0）。变量见 VARIABLES，动作见 ACTIONS:
+
+- stop: 停止。不带失败原因时两个池的目标都满足即成功，否则以"策略结束时未满足目标"失败；
+  带失败原因（STOP_REASONS）时以该原因失败
+- character_pull: 有十连寻访凭证或紧急招募时用掉一次，否则付费单抽
+- character_ten_pull: 有十连寻访凭证或紧急招募时用掉一次，否则付费十连
+- weapon_ten_pull: 武器池十连，配额不足时以"武器配额不足"失败
+- buy_quota: 购买配额补足一次武器十连
+
+策略编译为整数规则表和条件表（compiled_rules 中的 RULE_*/CONDITION_* 列），
+StrategySimulator 和 jit_gacha_utils 的编译型内核解释同一份表，随机数消耗顺序相同，结果逐位一致。
+DEFAULT_STRATEGY 复现内置引擎的策略，结果与 combined_character_weapon_simulation 逐位一致。
+
+示例（为下一期留存：角色池最多付费80抽，武器池配额不足时不再补充）:
+    stop character_limit when not character_done and paid_pulls >= 80
+    character_pull when not character_done
+    stop when weapon_done
+    weapon_ten_pull when quota >= weapon_cost
+    stop quota_insufficient
+"""
+import operator
+import random
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+from compiled_rules import (
+    FAILURE_CHARACTER_LIMIT, FAILURE_WEAPON_LIMIT, FAILURE_QUOTA_CHARACTER_LIMIT, FAILURE_QUOTA_INSUFFICIENT,
+    FAILURE_STRATEGY_STOP, FAILURE_REASONS, records_from_results,
+)
+from strategy_rules import (
+    V_SOFT_PITY, V_BANNER_PULLS, V_CHARACTER_PULLS, V_PAID_PULLS, V_URGENT_PULLS, V_WEAPON_TEN_PULLS, V_QUOTA,
+    V_EXTRA_QUOTA, V_VOUCHERS, V_URGENT_VOUCHERS, V_LIMITED_OBTAINED, V_WEAPON_LIMITED_OBTAINED,
+    V_CHARACTER_GOALS_MET, V_WEAPON_GOALS_MET, V_CHARACTER_DONE, V_WEAPON_DONE, V_WEAPON_COST,
+    V_CHARACTER_PULL_LIMIT, V_CHARACTER_PULL_MINIMUM, V_WEAPON_PULL_LIMIT, V_WEAPON_PULL_MINIMUM,
+    V_ALWAYS_PULL_TEN, V_LOW_QUOTA_CHARACTER_PULL, N_VARIABLES,
+    A_STOP, A_CHARACTER_PULL, A_CHARACTER_TEN_PULL, A_WEAPON_TEN_PULL, A_BUY_QUOTA,
+    O_LT, O_LE, O_GT, O_GE, O_EQ, O_NE,
+    RULE_ACTION, RULE_REASON, RULE_FIRST_CONDITION, RULE_STOP_CONDITION, N_RULE_COLUMNS,
+    N_CONDITION_COLUMNS,
+    MAX_STRATEGY_STEPS,
+)
+from rng_utils import new_seed
+from scalar_gacha_utils import ScalarSimulator
+
+
+# 策略中可用的变量
+VARIABLES = {
+    'soft_pity': V_SOFT_PITY,  # 小保底累计抽数
+    'banner_pulls': V_BANNER_PULLS,  # 本期角色池总抽数（含紧急招募，决定大保底、循环保底和紧急招募）
+    'character_pulls': V_CHARACTER_PULLS,  # 本次模拟的角色池抽数（不含紧急招募）
+    'paid_pulls': V_PAID_PULLS,  # 其中的付费抽数
+    'urgent_pulls': V_URGENT_PULLS,  # 紧急招募抽数
+    'weapon_ten_pulls': V_WEAPON_TEN_PULLS,  # 武器十连次数
+    'quota': V_QUOTA,  # 当前武器配额
+    'extra_quota': V_EXTRA_QUOTA,  # 已额外购买的配额
+    'vouchers': V_VOUCHERS,  # 剩余十连寻访凭证
+    'urgent_vouchers': V_URGENT_VOUCHERS,  # 剩余紧急招募十连
+    'limited_obtained': V_LIMITED_OBTAINED,  # 本期是否已获得限定角色
+    'weapon_limited_obtained': V_WEAPON_LIMITED_OBTAINED,  # 本期是否已获得限定武器
+    'character_goals_met': V_CHARACTER_GOALS_MET,  # 角色池目标是否已满足
+    'weapon_goals_met': V_WEAPON_GOALS_MET,  # 武器池目标是否已满足
+    'character_done': V_CHARACTER_DONE,  # 角色池目标已满足且抽数达到 character_pull_minimum
+    'weapon_done': V_WEAPON_DONE,  # 武器池目标已满足且十连次数达到 weapon_pull_minimum
+    'weapon_cost': V_WEAPON_COST,  # 武器池每次十连消耗的配额
+    # 以下取自玩家信息，便于同一份策略配合不同的玩家信息使用
+    'character_pull_limit': V_CHARACTER_PULL_LIMIT,
+    'character_pull_minimum': V_CHARACTER_PULL_MINIMUM,
+    'weapon_pull_limit': V_WEAPON_PULL_LIMIT,
+    'weapon_pull_minimum': V_WEAPON_PULL_MINIMUM,
+    'always_pull_ten': V_ALWAYS_PULL_TEN,
+    'low_quota_character_pull': V_LOW_QUOTA_CHARACTER_PULL,
+}
+
+ACTIONS = {
+    'stop': A_STOP,
+    'character_pull': A_CHARACTER_PULL,
+    'character_ten_pull': A_CHARACTER_TEN_PULL,
+    'weapon_ten_pull': A_WEAPON_TEN_PULL,
+    'buy_quota': A_BUY_QUOTA,
+}
+
+# stop 可带的失败原因
+STOP_REASONS = {
+    'character_limit': FAILURE_CHARACTER_LIMIT,
+    'weapon_limit': FAILURE_WEAPON_LIMIT,
+    'quota_character_limit': FAILURE_QUOTA_CHARACTER_LIMIT,
+    'quota_insufficient': FAILURE_QUOTA_INSUFFICIENT,
+}
+
+_OPERATORS = {'<': O_LT, '<=': O_LE, '>': O_GT, '>=': O_GE, '==': O_EQ, '!=': O_NE}
+# 常数在左侧时交换两侧并翻转运算
+_MIRRORED = {O_LT: O_GT, O_LE: O_GE, O_GT: O_LT, O_GE: O_LE, O_EQ: O_EQ, O_NE: O_NE}
+_COMPARE: Dict[int, Callable[[int, int], bool]] = {
+    O_LT: operator.lt, O_LE: operator.le, O_GT: operator.gt,
+    O_GE: operator.ge, O_EQ: operator.eq, O_NE: operator.ne,
+}
+_TOKEN = re.compile(r'\s*(>=|<=|==|!=|<|>|[A-Za-z_]\w*|-?\d+)')
+
+# 内置引擎的策略：先抽角色池直到满足目标，再抽武器池，配额不足时按玩家信息抽角色池或购买配额
+DEFAULT_STRATEGY = """\
+# 阶段1: 抽角色池直到满足目标和抽数下限
+stop character_limit when not character_done and character_pull_limit > 0 and character_pulls >= character_pull_limit
+character_ten_pull when not character_done and always_pull_ten
+character_pull when not character_done
+# 阶段2: 抽武器池直到满足目标和十连次数下限
+stop when weapon_done
+stop weapon_limit when weapon_pull_limit > 0 and weapon_ten_pulls >= weapon_pull_limit
+weapon_ten_pull when quota >= weapon_cost
+# 配额不足时购买配额，或抽角色池获取配额
+buy_quota when not low_quota_character_pull
+stop quota_character_limit when character_pull_limit > 0 and character_pulls >= character_pull_limit
+character_pull
+"""
+
+
+class StrategyError(ValueError):
+    """策略文本有语法错误"""
+
+
+@dataclass
+class Strategy:
+    """编译后的抽卡策略"""
+
+    source: str  # 策略文本
+    rule_table: np.ndarray  # (规则数, N_RULE_COLUMNS) int64，列见 compiled_rules.RULE_*
+    condition_table: np.ndarray  # (条件数, N_CONDITION_COLUMNS) int64，列见 compiled_rules.CONDITION_*
+
+
+def _parse_operand(token: str, line_number: int):
+    """解析条件的一侧，返回 (是否为变量, 变量下标或常数)"""
+    if token in VARIABLES:
+        return True, VARIABLES[token]
+    try:
+        return False, int(token)
+    except ValueError:
+        raise StrategyError(f"第{line_number}行: 未知的变量 {token}") from None
+
+
+def _parse_condition(tokens: List[str], line_number: int) -> List[int]:
+    """解析一个条件，返回条件表的一行"""
+    if len(tokens) == 1 or (len(tokens) == 2 and tokens[0] == 'not'):
+        is_variable, variable = _parse_operand(tokens[-1], line_number)
+        if not is_variable:
+            raise StrategyError(f"第{line_number}行: 单独的条件必须是变量: {' '.join(tokens)}")
+        return [variable, O_EQ if tokens[0] == 'not' else O_NE, 0, 0]
+    if len(tokens) != 3 or tokens[1] not in _OPERATORS:
+        raise StrategyError(f"第{line_number}行: 无法识别的条件: {' '.join(tokens)}")
+    left_is_variable, left = _parse_operand(tokens[0], line_number)
+    right_is_variable, right = _parse_operand(tokens[2], line_number)
+    op = _OPERATORS[tokens[1]]
+    if not left_is_variable:
+        if not right_is_variable:
+            raise StrategyError(f"第{line_number}行: 条件两侧都是常数: {' '.join(tokens)}")
+        left, right, right_is_variable, op = right, left, False, _MIRRORED[op]
+    return [left, op, int(right_is_variable), right]
+
+
+def parse_strategy(text: str) -> Strategy:
+    """解析并编译策略文本
+
+    参数:
+        text: 策略文本，格式见模块说明
+
+    返回:
+        Strategy
+
+    异常:
+        StrategyError: 策略有语法错误，信息中包含行号
+    """
+    rules = []
+    conditions = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        tokens = []
+        position = 0
+        while position < len(line):
+            match = _TOKEN.match(line, position)
+            if match is None:
+                raise StrategyError(f"第{line_number}行: 无法识别的内容: {line[position:].strip()}")
+            tokens.append(match.group(1))
+            position = match.end()
+
+        action = tokens[0]
+        if action not in ACTIONS:
+            raise StrategyError(f"第{line_number}行: 未知的动作 {action}，可用的动作: {', '.join(ACTIONS)}")
+        rest = tokens[1:]
+        reason = 0
+        if rest and rest[0] != 'when':
+            if action != 'stop':
+                raise StrategyError(f"第{line_number}行: 只有 stop 可以带失败原因")
+            if rest[0] not in STOP_REASONS:
+                raise StrategyError(f"第{line_number}行: 未知的失败原因 {rest[0]}，"
+                                    f"可用的失败原因: {', '.join(STOP_REASONS)}")
+            reason = STOP_REASONS[rest[0]]
+            rest = rest[1:]
+
+        first_condition = len(conditions)
+        if rest:
+            if rest[0] != 'when' or len(rest) == 1:
+                raise StrategyError(f"第{line_number}行: 动作之后应为 when 和条件")
+            condition = []
+            for token in rest[1:] + ['and']:
+                if token != 'and':
+                    condition.append(token)
+                    continue
+                if not condition:
+                    raise StrategyError(f"第{line_number}行: and 两侧缺少条件")
+                conditions.append(_parse_condition(condition, line_number))
+                condition = []
+        rules.append([ACTIONS[action], reason, first_condition, len(conditions)])
+
+    if not rules:
+        raise StrategyError("策略中没有规则")
+    rule_table = np.array(rules, dtype=np.int64).reshape(-1, N_RULE_COLUMNS)
+    condition_table = np.array(conditions, dtype=np.int64).reshape(-1, N_CONDITION_COLUMNS)
+    return Strategy(text, rule_table, condition_table)
+
+
+def load_strategy(path: str) -> Strategy:
+    """读取并编译策略文件"""
+    with open(path, encoding='utf-8') as f:
+        return parse_strategy(f.read())
+
+
+class StrategySimulator(ScalarSimulator):
+    """按抽卡策略执行的标量综合模拟器，与编译型内核结果逐位一致
+
+    用法:
+        simulator = StrategySimulator(character_pool_config, weapon_pool_config, player_info, strategy)
+        results = [simulator.simulate(seed=42, run_index=i) for i in range(10000)]
+    """
+
+    __slots__ = ('strategy', '_rules', '_variables')
+
+    def __init__(self, character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                 player_info: PlayerInfo, strategy: Strategy):
+        """
+        参数:
+            character_pool_config: 角色池配置
+            weapon_pool_config: 武器池配置
+            player_info: 玩家信息（内部状态字段需已计算），提供初始状态、目标和策略中的玩家参数
+            strategy: 抽卡策略
+        """
+        super().__init__(character_pool_config, weapon_pool_config, player_info)
+        self.strategy = strategy
+        # 规则表展开为 (动作, 失败原因, [(左侧变量, 比较函数, 右侧是否为变量, 右侧)])
+        self._rules = [
+            (int(action), int(reason), [
+                (int(variable), _COMPARE[int(op)], bool(right_is_variable), int(right))
+                for variable, op, right_is_variable, right in strategy.condition_table[first:stop].tolist()
+            ])
+            for action, reason, first, stop in strategy.rule_table[:, [RULE_ACTION, RULE_REASON,
+                                                                       RULE_FIRST_CONDITION,
+                                                                       RULE_STOP_CONDITION]].tolist()
+        ]
+        player = self.player
+        self._variables = [0] * N_VARIABLES
+        self._variables[V_WEAPON_COST] = self.rules.weapon_cost
+        self._variables[V_CHARACTER_PULL_LIMIT] = player.character_pull_limit
+        self._variables[V_CHARACTER_PULL_MINIMUM] = player.character_pull_minimum
+        self._variables[V_WEAPON_PULL_LIMIT] = player.weapon_pull_limit
+        self._variables[V_WEAPON_PULL_MINIMUM] = player.weapon_pull_minimum
+        self._variables[V_ALWAYS_PULL_TEN] = int(player.always_pull_ten)
+        self._variables[V_LOW_QUOTA_CHARACTER_PULL] = int(player.low_quota_character_pull)
+
+    def _select(self, variables: List[int]):
+        """返回第一条条件全部成立的规则的 (动作, 失败原因)，没有时为 (stop, 0)"""
+        for action, reason, conditions in self._rules:
+            for variable, compare, right_is_variable, right in conditions:
+                if not compare(variables[variable], variables[right] if right_is_variable else right):
+                    break
+            else:
+                return action, reason
+        return A_STOP, 0
+
+    def run(self, character_rng=random, weapon_rng=random) -> Dict:
+        """按策略执行一次综合模拟，返回值格式与 combined_character_weapon_simulation 相同
+
+        参数:
+            character_rng: 角色池随机数源
+            weapon_rng: 武器池随机数源
+        """
+        player = self.player
+        state = self.state
+        state.reset(player)
+        cost = self.rules.weapon_cost
+        variables = self._variables
+
+        paid_pulls = 0
+        free_pulls = 0
+        urgent_pulls = 0
+        weapon_ten_pulls = 0
+        extra_quota_purchased = 0
+        reason = FAILURE_STRATEGY_STOP  # 超出步数时的失败原因
+        for _ in range(MAX_STRATEGY_STEPS):
+            character_pulls = paid_pulls + free_pulls
+            variables[V_SOFT_PITY] = state.soft_pity_accumulate
+            variables[V_BANNER_PULLS] = state.total_pulls
+            variables[V_CHARACTER_PULLS] = character_pulls
+            variables[V_PAID_PULLS] = paid_pulls
+            variables[V_URGENT_PULLS] = urgent_pulls
+            variables[V_WEAPON_TEN_PULLS] = weapon_ten_pulls
+            variables[V_QUOTA] = state.weapon_quota
+            variables[V_EXTRA_QUOTA] = extra_quota_purchased
+            variables[V_VOUCHERS] = state.ten_pull_count
+            variables[V_URGENT_VOUCHERS] = state.ten_pull_count_urgent
+            variables[V_LIMITED_OBTAINED] = int(state.limited_obtained)
+            variables[V_WEAPON_LIMITED_OBTAINED] = int(state.weapon_limited_obtained)
+            variables[V_CHARACTER_GOALS_MET] = int(state.character_remaining == 0)
+            variables[V_WEAPON_GOALS_MET] = int(state.weapon_remaining == 0)
+            variables[V_CHARACTER_DONE] = int(state.character_remaining == 0
+                                              and character_pulls >= player.character_pull_minimum)
+            variables[V_WEAPON_DONE] = int(state.weapon_remaining == 0
+                                           and weapon_ten_pulls >= player.weapon_pull_minimum)
+
+            action, rule_reason = self._select(variables)
+            if action == A_STOP:
+                reason = rule_reason
+                break
+            if action == A_CHARACTER_PULL or action == A_CHARACTER_TEN_PULL:
+                self._grant_urgent_recruitment()
+                if state.ten_pull_count > 0 or state.ten_pull_count_urgent > 0:
+                    using_urgent = state.ten_pull_count_urgent > 0
+                    self._ten_character_pulls(character_rng)
+                    if using_urgent:
+                        urgent_pulls += 10
+                    else:
+                        free_pulls += 10
+                elif action == A_CHARACTER_TEN_PULL:
+                    self._ten_character_pulls(character_rng)
+                    paid_pulls += 10
+                else:
+                    self._single_character_pull(character_rng)
+                    paid_pulls += 1
+            elif action == A_WEAPON_TEN_PULL:
+                if state.weapon_quota < cost:
+                    reason = FAILURE_QUOTA_INSUFFICIENT
+                    break
+                self._ten_weapon_pulls(weapon_rng)
+                weapon_ten_pulls += 1
+            elif action == A_BUY_QUOTA:
+                if state.weapon_quota < cost:
+                    extra_quota_purchased += cost - state.weapon_quota
+                    state.weapon_quota = cost
+
+        # 不带失败原因的停止：两个池的目标都满足即成功
+        success = False
+        if reason == 0:
+            success = state.character_remaining == 0 and state.weapon_remaining == 0
+            if not success:
+                reason = FAILURE_STRATEGY_STOP
+        result = self._result(paid_pulls + free_pulls, urgent_pulls, weapon_ten_pulls, weapon_ten_pulls * cost,
+                              state.supply_boxes, extra_quota_purchased, success, FAILURE_REASONS[reason])
+        if reason == FAILURE_QUOTA_CHARACTER_LIMIT:
+            # 与参考实现一致：此时角色总抽数不含紧急招募
+            result['角色总抽数'] = paid_pulls + free_pulls
+        return result
+
+
+def simulate_strategy_batch(character_pool_config: CharacterPoolConfig,
+                            weapon_pool_config: WeaponPoolConfig,
+                            player_info: PlayerInfo,
+                            strategy: Strategy,
+                            simulation_runs: int,
+                            seed: Optional[int] = None,
+                            parallel: bool = True,
+                            first_run: int = 0) -> np.ndarray:
+    """按抽卡策略批量执行综合模拟，参数和随机流与 combined_character_weapon_simulation_batch 相同
+
+    未安装 Numba 时使用结果相同的 StrategySimulator。
+
+    返回:
+        RESULT_DTYPE 结果记录数组
+    """
+    from jit_gacha_utils import NUMBA_AVAILABLE, simulate_strategy_batch as simulate_compiled
+    if seed is None:
+        seed = new_seed()
+    if not NUMBA_AVAILABLE:
+        simulator = StrategySimulator(character_pool_config, weapon_pool_config, player_info, strategy)
+        return records_from_results([simulator.simulate(seed=seed, run_index=run_index)
+                                     for run_index in range(first_run, first_run + simulation_runs)])
+    return simulate_compiled(character_pool_config, weapon_pool_config, player_info,
+                             strategy.rule_table, strategy.condition_table, simulation_runs, seed,
+                             parallel=parallel, first_run=first_run)
+
+
+def strategy_chunk_simulator(engine: str, character_pool_config: CharacterPoolConfig,
+                             weapon_pool_config: WeaponPoolConfig, player_info: PlayerInfo, strategy: Strategy,
+                             seed: int) -> Callable[[int, int], np.ndarray]:
+    """按引擎生成按策略模拟的 simulate_chunk(start, stop)，对应 checkpoint_utils.chunk_simulator
+
+    参数:
+        engine: 'jit'（编译型内核）或 'scalar'（StrategySimulator）
+        character_pool_config: 角色池配置
+        weapon_pool_config: 武器池配置
+        player_info: 玩家信息
+        strategy: 抽卡策略
+        seed: 随机种子
+    """
+    if engine == 'jit':
+        def simulate_chunk(start, stop):
+            return simulate_strategy_batch(character_pool_config, weapon_pool_config, player_info, strategy,
+                                           stop - start, seed=seed, first_run=start)
+        return simulate_chunk
+    if engine != 'scalar':
+        raise ValueError(f"抽卡策略只支持 jit 和 scalar 引擎: {engine}")
+    simulate = StrategySimulator(character_pool_config, weapon_pool_config, player_info, strategy).simulate
+
+    def simulate_chunk(start, stop):
+        return records_from_results([simulate(seed=seed, run_index=i) for i in range(start, stop)], first_run=start)
+    return simulate_chunk
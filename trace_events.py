@@ -0,0 +1,26 @@
+"""
+抽卡轨迹事件编码 - 抽卡函数记录轨迹时使用的卡池、抽卡类型和保底类型编码
+"""
+
+POOL_CHARACTER = 0
+POOL_WEAPON = 1
+POOL_NAMES = ['角色池', '武器池']
+
+KIND_SINGLE = 0
+KIND_TEN = 1
+KIND_URGENT = 2
+KIND_WEAPON = 3
+KIND_PURCHASE = 4
+KIND_NAMES = ['单抽', '十连', '紧急招募', '武器十连', '购买配额']
+
+GUARANTEE_NONE = 0
+GUARANTEE_LOOP = 1  # 循环保底赠送
+GUARANTEE_HARD = 2  # 大保底
+GUARANTEE_SOFT = 3  # 小保底
+GUARANTEE_FIVE = 4  # 本抽处于五星保底（10抽内未出5星或以上）
+GUARANTEE_WEAPON_MILESTONE = 5  # 武器池第18次及后续循环赠送的限定武器
+GUARANTEE_WEAPON_BOX = 6  # 武器池补充武库箱
+GUARANTEE_WEAPON_LIMITED = 7  # 武器池8次十连限定保底
+GUARANTEE_WEAPON_SIX = 8  # 武器池4次十连六星保底
+GUARANTEE_NAMES = ['', '循环保底', '大保底', '小保底', '五星保底',
+                   '里程碑限定武器', '补充武库箱', '武器限定保底', '武器六星保底']
@@ -0,0 +1,36 @@
+"""
+抽卡轨迹查看工具 - 汇总或逐条回放 character_weapon_main.py --trace 生成的轨迹文件
+"""
+import argparse
+from trace_utils import PullTrace, parse_run_filter, format_summary
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='抽卡轨迹查看')
+    parser.add_argument('path', help='轨迹文件路径')
+    parser.add_argument('--runs', default='', metavar='SPEC', help='只查看指定编号的模拟，如 "0-99,734211"')
+    parser.add_argument('--replay', type=int, default=None, metavar='RUN', help='逐条回放指定编号的模拟')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+    trace = PullTrace(args.path)
+    if args.replay is not None:
+        lines = list(trace.replay(args.replay))
+        if not lines:
+            print(f"轨迹中没有模拟 #{args.replay} 的记录")
+            return
+        print(f"模拟 #{args.replay}（{len(lines)} 条记录）:")
+        for line in lines:
+            print(line)
+        return
+    summaries = trace.summarize(parse_run_filter(args.runs))
+    print(f"轨迹文件 {args.path}: {len(trace)} 条记录，{len(trace.runs())} 次模拟")
+    print(format_summary(summaries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+抽卡轨迹模块 - 以定长二进制记录逐抽记录模拟过程，用于排查异常结果
+
+文件格式: 固定长度的文件头（魔数、版本、记录数、JSON元数据）后接 TRACE_DTYPE 定长记录，
+写入和读取均通过内存映射完成。
+"""
+import json
+import struct
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional
+import numpy as np
+from trace_events import (POOL_CHARACTER, POOL_WEAPON, POOL_NAMES, KIND_SINGLE, KIND_TEN, KIND_URGENT,
+                          KIND_WEAPON, KIND_PURCHASE, KIND_NAMES, GUARANTEE_NONE, GUARANTEE_LOOP,
+                          GUARANTEE_NAMES)
+
+
+TRACE_MAGIC = b'GTRC'
+TRACE_VERSION = 1
+TRACE_HEADER_SIZE = 4096
+_HEADER_PREFIX = struct.Struct('<4sIQI')  # 魔数, 版本, 记录数, 元数据长度
+
+TRACE_DTYPE = np.dtype([
+    ('run', np.uint32),           # 模拟编号
+    ('sequence', np.uint32),      # 本次模拟内的记录序号
+    ('pool', np.uint8),           # 卡池，见 POOL_*
+    ('kind', np.uint8),           # 抽卡类型，见 KIND_*
+    ('rarity', np.uint8),         # 稀有度，0表示非抽卡事件
+    ('guarantee', np.uint8),      # 触发的保底/奖励，见 GUARANTEE_*
+    ('item', np.int16),           # 六星物品编码，-1表示非六星
+    ('pity', np.int16),           # 角色池为本抽的小保底累计，武器池为累计十连次数
+    ('quota_before', np.int32),   # 本次事件前的武器配额
+    ('quota_after', np.int32),    # 本次事件后的武器配额
+])
+
+
+def parse_run_filter(spec: str) -> Optional[set]:
+    """解析模拟编号过滤表达式，如 "0-99,734211"，空字符串表示不过滤"""
+    if not spec:
+        return None
+    runs = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = part.split('-', 1)
+            runs.update(range(int(start), int(end) + 1))
+        elif part:
+            runs.add(int(part))
+    return runs
+
+
+class PullTraceWriter:
+    """轨迹写入器
+
+    作为 tracer 参数传给抽卡函数和 combined_character_weapon_simulation 即可启用；
+    不传时抽卡函数只多一次 None 判断。
+    """
+
+    def __init__(self, path: str, runs: Optional[Iterable[int]] = None, capacity: int = 1 << 16):
+        """
+        参数:
+            path: 轨迹文件路径
+            runs: 需要记录的模拟编号，None表示全部记录
+            capacity: 初始容量（记录数），写满后按倍数扩容
+        """
+        self.path = path
+        self.run_filter = None if runs is None else set(runs)
+        self.kind = KIND_SINGLE  # 当前角色池抽卡类型，由十连函数临时切换
+        self.run_index = -1
+        self._sequence = 0
+        self._count = 0
+        self._capacity = 0
+        self._records = None
+        self._item_codes = {}  # (卡池, 名称) -> 编码
+        self._item_names = [[], []]
+        with open(path, 'wb') as f:
+            f.write(b'\0' * TRACE_HEADER_SIZE)
+        self._grow(capacity)
+
+    def _grow(self, capacity: int):
+        """扩大文件并重新映射"""
+        if self._records is not None:
+            self._records.flush()
+            del self._records
+        with open(self.path, 'r+b') as f:
+            f.truncate(TRACE_HEADER_SIZE + capacity * TRACE_DTYPE.itemsize)
+        self._records = np.memmap(self.path, dtype=TRACE_DTYPE, mode='r+',
+                                  offset=TRACE_HEADER_SIZE, shape=(capacity,))
+        self._capacity = capacity
+
+    def begin_run(self, run_index: int = None) -> bool:
+        """开始一次模拟，返回该次模拟是否需要记录
+
+        参数:
+            run_index: 模拟编号，None表示在上一次编号的基础上加1
+        """
+        self.run_index = self.run_index + 1 if run_index is None else run_index
+        self._sequence = 0
+        self.kind = KIND_SINGLE
+        return self.run_filter is None or self.run_index in self.run_filter
+
+    def item_code(self, pool: int, name: str) -> int:
+        """获取物品编码，首次出现时分配"""
+        if not name:
+            return -1
+        code = self._item_codes.get((pool, name))
+        if code is None:
+            code = len(self._item_names[pool])
+            self._item_codes[(pool, name)] = code
+            self._item_names[pool].append(name)
+        return code
+
+    def record(self, pool: int, kind: int, rarity: int, item: str, pity: int,
+               quota_before: int, quota_after: int, guarantee: int = GUARANTEE_NONE):
+        """追加一条记录"""
+        if self._count == self._capacity:
+            self._grow(self._capacity * 2)
+        self._records[self._count] = (self.run_index, self._sequence, pool, kind, rarity, guarantee,
+                                      self.item_code(pool, item), pity, quota_before, quota_after)
+        self._count += 1
+        self._sequence += 1
+
+    def close(self):
+        """截断多余容量并写入文件头"""
+        if self._records is None:
+            return
+        self._records.flush()
+        del self._records
+        self._records = None
+        metadata = json.dumps({
+            'dtype': TRACE_DTYPE.descr,
+            'item_names': {POOL_NAMES[POOL_CHARACTER]: self._item_names[POOL_CHARACTER],
+                           POOL_NAMES[POOL_WEAPON]: self._item_names[POOL_WEAPON]},
+        }, ensure_ascii=False).encode('utf-8')
+        if _HEADER_PREFIX.size + len(metadata) > TRACE_HEADER_SIZE:
+            raise ValueError("轨迹元数据超出文件头长度")
+        with open(self.path, 'r+b') as f:
+            f.truncate(TRACE_HEADER_SIZE + self._count * TRACE_DTYPE.itemsize)
+            f.seek(0)
+            f.write(_HEADER_PREFIX.pack(TRACE_MAGIC, TRACE_VERSION, self._count, len(metadata)))
+            f.write(metadata)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PullTrace:
+    """轨迹读取器，记录以内存映射方式按需加载"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            magic, version, count, metadata_length = _HEADER_PREFIX.unpack(f.read(_HEADER_PREFIX.size))
+            if magic != TRACE_MAGIC:
+                raise ValueError(f"{path} 不是抽卡轨迹文件")
+            if version != TRACE_VERSION:
+                raise ValueError(f"不支持的轨迹文件版本: {version}")
+            metadata = json.loads(f.read(metadata_length).decode('utf-8'))
+        self.path = path
+        item_names = metadata['item_names']
+        self.item_names = [item_names[POOL_NAMES[POOL_CHARACTER]], item_names[POOL_NAMES[POOL_WEAPON]]]
+        if count:
+            self.records = np.memmap(path, dtype=TRACE_DTYPE, mode='r', offset=TRACE_HEADER_SIZE, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=TRACE_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def runs(self) -> np.ndarray:
+        """轨迹中包含的模拟编号"""
+        return np.unique(self.records['run'])
+
+    def select(self, runs: Optional[Iterable[int]] = None) -> np.ndarray:
+        """按模拟编号筛选记录"""
+        if runs is None:
+            return self.records
+        return self.records[np.isin(self.records['run'], np.fromiter(runs, dtype=np.uint32))]
+
+    def item_name(self, pool: int, code: int) -> str:
+        """物品编码转名称"""
+        return self.item_names[pool][code] if code >= 0 else ''
+
+    def summarize(self, runs: Optional[Iterable[int]] = None) -> List[Dict]:
+        """按模拟汇总：抽数、六星、触发的保底和购买的配额"""
+        records = self.select(runs)
+        records = records[np.argsort(records['run'], kind='stable')]
+        run_indices, starts = np.unique(records['run'], return_index=True)
+        summaries = []
+        for run, run_records in zip(run_indices, np.split(records, starts[1:])):
+            kinds = Counter(run_records['kind'].tolist())
+            character_pulls = np.count_nonzero((run_records['pool'] == POOL_CHARACTER)
+                                               & np.isin(run_records['kind'], [KIND_SINGLE, KIND_TEN])
+                                               & (run_records['guarantee'] != GUARANTEE_LOOP))
+            six_stars = Counter()
+            for record in run_records[run_records['item'] >= 0]:
+                six_stars[self.item_name(int(record['pool']), int(record['item']))] += 1
+            guarantees = Counter(GUARANTEE_NAMES[g] for g in run_records['guarantee'].tolist() if g)
+            purchases = run_records[run_records['kind'] == KIND_PURCHASE]
+            summaries.append({
+                '模拟编号': int(run),
+                '角色池抽数': int(character_pulls),
+                '紧急招募抽数': kinds[KIND_URGENT],
+                '武器十连次数': len(np.unique(run_records['pity'][run_records['kind'] == KIND_WEAPON])),
+                '六星': dict(six_stars),
+                '保底触发': dict(guarantees),
+                '额外购买配额': int((purchases['quota_after'].astype(np.int64) - purchases['quota_before']).sum()),
+            })
+        return summaries
+
+    def replay(self, run: int) -> Iterator[str]:
+        """逐条回放一次模拟，生成可读文本"""
+        for record in self.select([run]):
+            pool = int(record['pool'])
+            kind = int(record['kind'])
+            if kind == KIND_PURCHASE:
+                yield (f"#{record['sequence']:<5} 购买配额 {record['quota_before']} -> {record['quota_after']}")
+                continue
+            item = self.item_name(pool, int(record['item']))
+            guarantee = GUARANTEE_NAMES[record['guarantee']]
+            rarity = f"{record['rarity']}星" if record['rarity'] else '-'
+            pity_label = '小保底累计' if pool == POOL_CHARACTER else '十连次数'
+            yield (f"#{record['sequence']:<5} {POOL_NAMES[pool]} {KIND_NAMES[kind]:<4} {rarity:<3} {item:<6} "
+                   f"{pity_label}={record['pity']:<4} 配额 {record['quota_before']} -> {record['quota_after']}"
+                   + (f" [{guarantee}]" if guarantee else ''))
+
+
+def format_summary(summaries: List[Dict]) -> str:
+    """格式化汇总结果"""
+    lines = []
+    for summary in summaries:
+        lines.append(f"模拟 #{summary['模拟编号']}: 角色池 {summary['角色池抽数']} 抽 (紧急 {summary['紧急招募抽数']}), "
+                     f"武器十连 {summary['武器十连次数']} 次, 额外购买配额 {summary['额外购买配额']}")
+        if summary['六星']:
+            lines.append(f"  六星: {summary['六星']}")
+        if summary['保底触发']:
+            lines.append(f"  保底触发: {summary['保底触发']}")
+    return '\n'.join(lines)
@@ -3,11 +3,22 @@
 """
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
+import multiprocessing
+import os
 import threading
-from collections import Counter
 from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo, SimulationConfig
 from weapon_gacha_utils import combined_character_weapon_simulation
-from analysis_utils import plot_success_failure_pie, plot_combined_distributions
+from scalar_gacha_utils import ScalarSimulator
+from profiling_utils import SimulationProfile
+from rng_utils import new_seed
+from job_queue_utils import JobQueue, JOB_DONE, format_result_report
+# analysis_utils 会加载 matplotlib 和 numpy，在窗口显示后由后台预热线程导入；
+# checkpoint_utils/archive_utils 同样依赖 numpy，在模拟线程中导入
+
+CHECKPOINT_PATH = 'simulation_checkpoint.npz'  # 模拟进度检查点，模拟完成后删除
+CHECKPOINT_INTERVAL_SECONDS = 30
+CLOSE_TIMEOUT_SECONDS = 10  # 关闭窗口时最多等待后台模拟写入检查点的时间
+JOB_POLL_MS = 200  # 任务队列的轮询间隔
 
 
 class GachaSimulatorUI:
@@ -15,6 +26,10 @@ class GachaSimulatorUI:
         self.root = root
         self.root.title("明日方舟·终末地 抽卡概率模拟器")
         self.root.geometry("800x900")
+        self.closing = False
+        self.simulation_thread = None
+        self.job_queue = JobQueue()  # 进程池在第一个任务加入时启动
+        self.job_polling = False
         
         # 绑定窗口关闭事件
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -146,6 +161,23 @@ class GachaSimulatorUI:
         self.simulation_runs.insert(0, "10000")
         self.simulation_runs.grid(row=0, column=1, sticky=tk.W, pady=2)
         
+        self.enable_profiling = tk.BooleanVar(value=False)
+        ttk.Checkbutton(sim_frame, text="收集性能剖析数据（导出 simulation_profile.json）", 
+                       variable=self.enable_profiling).grid(
+            row=1, column=0, columnspan=2, sticky=tk.W, pady=2
+        )
+        
+        self.enable_requirement = tk.BooleanVar(value=False)
+        ttk.Checkbutton(sim_frame, text="反查达到目标成功率所需资源（另需最多2万次模拟）", 
+                       variable=self.enable_requirement).grid(
+            row=2, column=0, columnspan=2, sticky=tk.W, pady=2
+        )
+        
+        ttk.Label(sim_frame, text="反查目标成功率(%):").grid(row=3, column=0, sticky=tk.W, pady=2)
+        self.target_probability = ttk.Entry(sim_frame, width=15)
+        self.target_probability.insert(0, "90")
+        self.target_probability.grid(row=3, column=1, sticky=tk.W, pady=2)
+        
         # 按钮和进度
         control_frame = ttk.Frame(scrollable_frame)
         control_frame.grid(row=7, column=0, columnspan=2, pady=10)
@@ -153,6 +185,8 @@ class GachaSimulatorUI:
         self.run_button = ttk.Button(control_frame, text="开始模拟", command=self.run_simulation)
         self.run_button.pack(side=tk.LEFT, padx=5)
         
+        ttk.Button(control_frame, text="加入队列", command=self.enqueue_job).pack(side=tk.LEFT, padx=5)
+        
         self.progress = ttk.Progressbar(control_frame, length=300, mode='indeterminate')
         self.progress.pack(side=tk.LEFT, padx=5)
         
@@ -163,6 +197,26 @@ class GachaSimulatorUI:
         self.result_text = scrolledtext.ScrolledText(result_frame, width=80, height=15)
         self.result_text.pack(fill=tk.BOTH, expand=True)
         
+        # 任务队列：多组参数在后台进程池中并发模拟，输出写入各任务自己的目录
+        queue_frame = ttk.LabelFrame(scrollable_frame, text="任务队列", padding=10)
+        queue_frame.grid(row=9, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        
+        columns = ('name', 'priority', 'state', 'progress', 'success_rate', 'character_pulls', 'weapon_ten_pulls')
+        headings = ('任务', '优先级', '状态', '进度', '成功率', '平均角色抽数', '平均武器十连')
+        widths = (230, 50, 60, 110, 70, 90, 90)
+        self.job_tree = ttk.Treeview(queue_frame, columns=columns, show='headings', height=6)
+        for column, heading, width in zip(columns, headings, widths):
+            self.job_tree.heading(column, text=heading)
+            self.job_tree.column(column, width=width, anchor=tk.W if column == 'name' else tk.CENTER)
+        self.job_tree.pack(fill=tk.BOTH, expand=True)
+        
+        job_buttons = ttk.Frame(queue_frame)
+        job_buttons.pack(fill=tk.X, pady=(5, 0))
+        ttk.Button(job_buttons, text="提高优先级", command=lambda: self.change_job_priority(1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(job_buttons, text="降低优先级", command=lambda: self.change_job_priority(-1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(job_buttons, text="取消任务", command=self.cancel_jobs).pack(side=tk.LEFT, padx=5)
+        ttk.Button(job_buttons, text="并排对比所选结果", command=self.compare_jobs).pack(side=tk.LEFT, padx=5)
+        
         # 配置Canvas和Scrollbar
         canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
@@ -171,6 +225,18 @@ class GachaSimulatorUI:
         def _on_mousewheel(event):
             canvas.yview_scroll(int(-1*(event.delta/120)), "units")
         canvas.bind_all("<MouseWheel>", _on_mousewheel)
+        
+        # 窗口显示后在后台预热绘图模块
+        self.warm_up_thread = threading.Thread(target=self.warm_up_plotting, daemon=True)
+        self.root.after_idle(self.warm_up_thread.start)
+    
+    def warm_up_plotting(self):
+        """后台导入绘图模块并预热字体缓存，缩短第一次模拟的出图时间"""
+        try:
+            import analysis_utils
+            analysis_utils.warm_up()
+        except Exception:
+            pass  # 预热失败不影响正常使用，出图时会重新初始化
     
     def validate_inputs(self):
         """验证输入"""
@@ -201,11 +267,22 @@ class GachaSimulatorUI:
             if sim_runs <= 0:
                 raise ValueError("模拟次数必须大于0")
             
+            if self.enable_requirement.get():
+                target = float(self.target_probability.get())
+                if not 0 < target < 100:
+                    raise ValueError("反查目标成功率必须在0和100之间")
+            
             return True
         except ValueError as e:
             messagebox.showerror("输入错误", f"请检查输入的数值是否正确:\n{str(e)}")
             return False
     
+    def requirement_target(self):
+        """反查所需资源的目标成功率（0-1），未勾选反查时返回None"""
+        if not self.enable_requirement.get():
+            return None
+        return float(self.target_probability.get()) / 100
+    
     def create_player_info(self):
         """从UI创建PlayerInfo对象"""
         character_goals = {}
@@ -262,81 +339,80 @@ class GachaSimulatorUI:
             player_info.compute_internal_state(character_pool_config)
             
             sim_runs = int(self.simulation_runs.get())
-            sim_config = SimulationConfig(simulation_runs=sim_runs)
+            sim_config = SimulationConfig(simulation_runs=sim_runs, engine="scalar")
+            
+            # 模拟按块执行并定期写入检查点；上次同一场景的模拟被中断（关闭窗口、崩溃）时从检查点继续
+            from archive_utils import scenario_hash
+            from checkpoint_utils import SimulationCheckpoint, CheckpointPolicy, run_chunks
+            from compiled_rules import records_from_results
+            scenario = scenario_hash(character_pool_config, weapon_pool_config, player_info)
+            checkpoint = self.load_checkpoint(scenario, sim_config)
+            resumed_runs = checkpoint.completed_runs if checkpoint is not None else 0
+            if checkpoint is None:
+                checkpoint = SimulationCheckpoint(scenario, new_seed(), sim_config.engine, sim_config.simulation_runs)
+            seed = checkpoint.seed
             
             # 运行模拟
-            results = []
-            success_count = 0
-            failure_reasons = Counter()
+            profile = SimulationProfile() if self.enable_profiling.get() else None
+            # 剖析时使用参考实现，否则使用结果相同、速度更快的标量引擎
+            simulator = None
+            if profile is None and sim_config.engine == "scalar":
+                simulator = ScalarSimulator(character_pool_config, weapon_pool_config, player_info)
             
-            for i in range(sim_config.simulation_runs):
-                result = combined_character_weapon_simulation(
-                    character_pool_config,
-                    weapon_pool_config,
-                    player_info
-                )
-                results.append(result)
-                
-                if result['成功']:
-                    success_count += 1
+            def simulate_chunk(start, stop):
+                if simulator is not None:
+                    results = [simulator.simulate(seed=seed, run_index=i) for i in range(start, stop)]
                 else:
-                    failure_reason = result.get('失败原因', '未知原因')
-                    failure_reasons[failure_reason] += 1
+                    results = [
+                        combined_character_weapon_simulation(
+                            character_pool_config,
+                            weapon_pool_config,
+                            player_info,
+                            profile=profile,
+                            seed=seed,
+                            run_index=i
+                        )
+                        for i in range(start, stop)
+                    ]
+                return records_from_results(results, first_run=start)
+            
+            finished = run_chunks(checkpoint, simulate_chunk, path=CHECKPOINT_PATH,
+                                  policy=CheckpointPolicy(every_seconds=CHECKPOINT_INTERVAL_SECONDS),
+                                  should_stop=lambda: self.closing)
+            if not finished:
+                return  # 窗口正在关闭，进度已写入检查点
+            os.remove(CHECKPOINT_PATH)
+            results = checkpoint.histogram
+            success_count = results.successes
             
             # 计算成功率
             failure_count = sim_config.simulation_runs - success_count
             success_rate = success_count / sim_config.simulation_runs * 100
             
-            # 绘制图表
+            # 绘制图表（等待预热完成，pyplot 不能在两个线程中同时使用）
+            if self.warm_up_thread.is_alive():
+                self.warm_up_thread.join()
+            from analysis_utils import plot_success_failure_pie, plot_combined_distributions
             plot_success_failure_pie(success_count, failure_count, 
                                     save_path='combined_success_failure_pie.png',
                                     results=results)
             plot_combined_distributions(results, success_rate, save_prefix='combined_all')
             
-            # 统计结果
-            char_pulls_list = [r['角色总抽数（不含紧急）'] for r in results]
-            weapon_pulls_list = [r['武器十连次数'] for r in results]
-            remaining_quota_list = [r['剩余配额'] for r in results]
-            extra_quota_list = [r['额外购买配额'] for r in results]
-            
             result_msg = f"模拟完成！\n\n"
-            result_msg += f"模拟次数: {sim_config.simulation_runs}\n"
-            result_msg += f"成功次数: {success_count}\n"
-            result_msg += f"失败次数: {failure_count}\n"
-            result_msg += f"成功率: {success_rate:.2f}%\n\n"
-            
-            result_msg += f"角色池抽数统计（不含紧急）:\n"
-            result_msg += f"  平均: {sum(char_pulls_list)/len(char_pulls_list):.2f}\n"
-            result_msg += f"  最小: {min(char_pulls_list)}\n"
-            result_msg += f"  最大: {max(char_pulls_list)}\n"
-            result_msg += f"  中位数: {sorted(char_pulls_list)[len(char_pulls_list)//2]}\n\n"
-            
-            result_msg += f"武器池十连次数统计:\n"
-            result_msg += f"  平均: {sum(weapon_pulls_list)/len(weapon_pulls_list):.2f}\n"
-            result_msg += f"  最小: {min(weapon_pulls_list)}\n"
-            result_msg += f"  最大: {max(weapon_pulls_list)}\n"
-            result_msg += f"  中位数: {sorted(weapon_pulls_list)[len(weapon_pulls_list)//2]}\n\n"
+            if resumed_runs:
+                result_msg += f"（从上次中断处继续，已完成的 {resumed_runs} 次模拟来自检查点）\n\n"
+            result_msg += format_result_report(character_pool_config, weapon_pool_config, player_info, results,
+                                               seed, self.requirement_target())
             
-            result_msg += f"剩余武库配额统计:\n"
-            result_msg += f"  平均: {sum(remaining_quota_list)/len(remaining_quota_list):.2f}\n"
-            result_msg += f"  最小: {min(remaining_quota_list)}\n"
-            result_msg += f"  最大: {max(remaining_quota_list)}\n"
-            result_msg += f"  中位数: {sorted(remaining_quota_list)[len(remaining_quota_list)//2]}\n\n"
-            
-            result_msg += f"额外购买武库配额统计:\n"
-            result_msg += f"  平均: {sum(extra_quota_list)/len(extra_quota_list):.2f}\n"
-            result_msg += f"  最小: {min(extra_quota_list)}\n"
-            result_msg += f"  最大: {max(extra_quota_list)}\n"
-            result_msg += f"  中位数: {sorted(extra_quota_list)[len(extra_quota_list)//2]}\n\n"
-            
-            if failure_reasons:
-                result_msg += f"失败原因统计:\n"
-                for reason, count in failure_reasons.most_common():
-                    result_msg += f"  {reason}: {count} 次 ({count/failure_count*100:.1f}%)\n"
+            if profile is not None:
+                profile.save_json('simulation_profile.json')
+                result_msg += f"\n{profile.format_report()}\n"
             
             result_msg += f"\n图片已保存到当前目录:\n"
             result_msg += f"  - combined_success_failure_pie.png\n"
             result_msg += f"  - combined_all_cdf.png\n"
+            if profile is not None:
+                result_msg += f"  - simulation_profile.json\n"
             
             # 在主线程更新UI
             self.root.after(0, self.update_result, result_msg, True)
@@ -366,15 +442,114 @@ class GachaSimulatorUI:
         self.result_text.insert(1.0, "正在运行模拟，请稍候...\n")
         
         # 在后台线程运行
-        thread = threading.Thread(target=self.run_simulation_thread, daemon=True)
-        thread.start()
+        self.simulation_thread = threading.Thread(target=self.run_simulation_thread, daemon=True)
+        self.simulation_thread.start()
+    
+    def enqueue_job(self):
+        """以当前参数加入任务队列，与正在运行的模拟和其他任务并发执行"""
+        if not self.validate_inputs():
+            return
+        character_pool_config = CharacterPoolConfig()
+        player_info = self.create_player_info()
+        try:
+            player_info.compute_internal_state(character_pool_config)
+        except ValueError as e:
+            messagebox.showerror("输入错误", str(e.args[-1]))
+            return
+        runs = int(self.simulation_runs.get())
+        name = (f"限定×{player_info.character_goals['限定']} "
+                f"武器×{player_info.weapon_goals['限定武器']}，{runs}次")
+        job = self.job_queue.add(name, character_pool_config, WeaponPoolConfig(), player_info, runs,
+                                 self.requirement_target())
+        self.job_tree.insert('', tk.END, iid=str(job.job_id))
+        self.refresh_job_row(job)
+        if not self.job_polling:
+            self.job_polling = True
+            self.root.after(JOB_POLL_MS, self.poll_jobs)
+    
+    def poll_jobs(self):
+        """定时检查任务队列（只处理已完成的块，不阻塞事件循环），队列空闲后停止轮询"""
+        if self.closing:
+            return
+        if self.job_queue.poll():
+            for job in self.job_queue.jobs.values():
+                self.refresh_job_row(job)
+        self.job_polling = self.job_queue.active
+        if self.job_polling:
+            self.root.after(JOB_POLL_MS, self.poll_jobs)
+    
+    def refresh_job_row(self, job):
+        """更新任务在列表中的一行"""
+        success_rate = character_pulls = weapon_ten_pulls = ''
+        if job.state == JOB_DONE:
+            histogram = job.histogram
+            success_rate = f"{histogram.successes / histogram.runs:.2%}"
+            character_pulls = f"{histogram.mean('character_pulls'):.1f}"
+            weapon_ten_pulls = f"{histogram.mean('weapon_ten_pulls'):.2f}"
+        state = job.error if job.error else job.state
+        self.job_tree.item(str(job.job_id), values=(
+            f"#{job.job_id} {job.name}", job.priority, state, f"{job.progress:.0%} ({job.completed_runs}/{job.runs})",
+            success_rate, character_pulls, weapon_ten_pulls))
+    
+    def selected_jobs(self):
+        """列表中选中的任务"""
+        return [self.job_queue.jobs[int(iid)] for iid in self.job_tree.selection()]
+    
+    def change_job_priority(self, delta):
+        """调整选中任务的优先级，下一块开始生效"""
+        for job in self.selected_jobs():
+            self.job_queue.set_priority(job.job_id, job.priority + delta)
+            self.refresh_job_row(job)
+    
+    def cancel_jobs(self):
+        """取消选中的任务"""
+        for job in self.selected_jobs():
+            self.job_queue.cancel(job.job_id)
+            self.refresh_job_row(job)
+    
+    def compare_jobs(self):
+        """在新窗口中并排显示选中的已完成任务的报告和输出文件"""
+        jobs = [job for job in self.selected_jobs() if job.state == JOB_DONE]
+        if not jobs:
+            messagebox.showinfo("并排对比", "请在任务队列中选择已完成的任务（按住Ctrl可多选）")
+            return
+        window = tk.Toplevel(self.root)
+        window.title("结果对比")
+        for column, job in enumerate(jobs):
+            frame = ttk.LabelFrame(window, text=f"#{job.job_id} {job.name}", padding=5)
+            frame.grid(row=0, column=column, sticky=(tk.N, tk.S, tk.W, tk.E), padx=5, pady=5)
+            window.columnconfigure(column, weight=1)
+            text = scrolledtext.ScrolledText(frame, width=50, height=40)
+            text.insert(1.0, job.report + "\n输出文件:\n" + "".join(f"  - {path}\n" for path in job.output_paths()))
+            text.config(state=tk.DISABLED)
+            text.pack(fill=tk.BOTH, expand=True)
+        window.rowconfigure(0, weight=1)
+    
+    def load_checkpoint(self, scenario, sim_config):
+        """读取上次被中断的同一场景、同一模拟次数的检查点，没有时返回None"""
+        if not os.path.exists(CHECKPOINT_PATH):
+            return None
+        from checkpoint_utils import SimulationCheckpoint
+        try:
+            checkpoint = SimulationCheckpoint.load(CHECKPOINT_PATH)
+        except (OSError, ValueError, KeyError):
+            return None  # 损坏或旧版本的检查点直接忽略，重新开始
+        if (checkpoint.scenario != scenario or checkpoint.engine != sim_config.engine
+                or checkpoint.simulation_runs != sim_config.simulation_runs or checkpoint.done):
+            return None
+        return checkpoint
     
     def on_closing(self):
-        """窗口关闭时的处理"""
+        """窗口关闭时的处理：通知后台模拟在当前块完成后写入检查点，下次以相同参数模拟时继续"""
+        self.closing = True
+        if self.simulation_thread is not None and self.simulation_thread.is_alive():
+            self.simulation_thread.join(timeout=CLOSE_TIMEOUT_SECONDS)
+        self.job_queue.shutdown()
         self.root.destroy()
 
 
 def main():
+    multiprocessing.freeze_support()  # 打包后任务队列的工作进程需要
     root = tk.Tk()
     app = GachaSimulatorUI(root)
     root.mainloop()
@@ -0,0 +1,56 @@
+"""
+引擎一致性验证 - 用场景库检查各加速引擎与参考实现是否一致，有未通过的检查时返回非零退出码
+
+用法:
+    python validation_main.py                          # 全部场景、全部引擎
+    python validation_main.py --engines jit event      # 只检查指定引擎
+    python validation_main.py --scenarios 保底 --runs 20000
+    python validation_main.py --list                   # 列出场景库
+"""
+import argparse
+import sys
+from validation_utils import (ENGINES, DEFAULT_VALIDATION_RUNS, DEFAULT_DISTRIBUTION_RUNS, DEFAULT_VALIDATION_SEED,
+                              DEFAULT_ALPHA, scenario_library, run_validation)
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='检查各模拟引擎与参考实现是否一致')
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=None, metavar='ENGINE',
+                        help=f"被检查的引擎，默认全部: {' '.join(ENGINES)}")
+    parser.add_argument('--scenarios', nargs='+', default=None, metavar='TEXT',
+                        help='只运行名称包含任一文本的场景')
+    parser.add_argument('--runs', type=int, default=DEFAULT_VALIDATION_RUNS,
+                        help=f'逐位比较时每个场景每个引擎的模拟次数，默认{DEFAULT_VALIDATION_RUNS}')
+    parser.add_argument('--distribution-runs', type=int, default=DEFAULT_DISTRIBUTION_RUNS,
+                        help=f'分布检验（event 引擎）时每个场景的模拟次数，默认{DEFAULT_DISTRIBUTION_RUNS}')
+    parser.add_argument('--seed', type=int, default=DEFAULT_VALIDATION_SEED,
+                        help='随机种子，默认固定以便结果可复现')
+    parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA,
+                        help=f'分布检验的总体显著性水平，默认{DEFAULT_ALPHA}')
+    parser.add_argument('--list', action='store_true', help='列出场景库后退出')
+    parser.add_argument('--quiet', action='store_true', help='不打印每项检查的进度')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """主函数，返回退出码"""
+    args = parse_args(argv)
+    scenarios = scenario_library()
+    if args.scenarios:
+        scenarios = [scenario for scenario in scenarios if any(text in scenario.name for text in args.scenarios)]
+    if args.list or not scenarios:
+        if not scenarios:
+            print('没有匹配的场景，场景库:')
+        for scenario in scenario_library() if not scenarios else scenarios:
+            print(f"{scenario.name}: {scenario.description}")
+        return 0 if scenarios else 1
+
+    report = run_validation(scenarios, args.engines, runs=args.runs, seed=args.seed, alpha=args.alpha,
+                            progress=None if args.quiet else print, distribution_runs=args.distribution_runs)
+    print(report.format())
+    return 1 if report.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+"""
+引擎一致性验证模块 - 用场景库检查各加速引擎与参考实现 combined_character_weapon_simulation 是否一致
+
+场景库覆盖保底边界（提升区间起点66、小保底80、大保底120、循环保底240前一抽）、紧急招募、
+十连凭证、配额补充开/关、抽数上下限等情况。每个场景先用参考实现（python 引擎）模拟一批结果，再按引擎分两种方式检查：
+- 声明与参考实现逐位一致的引擎（scalar、jit、grid、strategy-*）用相同种子模拟同样的编号，
+  逐条比较结果记录，报告第一条不一致的模拟编号和字段
+- 只保证同分布的引擎（event）用另一个种子模拟 distribution_runs 次（默认远多于逐位比较的次数），
+  对各结果字段做两样本卡方齐性检验和 KS 检验，全部检验按 Bonferroni 校正后的显著性水平判定。
+  参考样本的前 runs 次来自参考实现，其余编号由逐位一致的编译型引擎（Numba 不可用时为标量引擎）以同一种子补足，
+  与参考实现模拟同样编号的结果相同；该引擎本身是否逐位一致由同一次验证的逐位比较检查
+
+默认规模下六星基础概率偏差10%即可在多数场景中被检出。种子固定时检查结果可复现，
+全部场景和引擎在单核上约一分半，适合每次修改后运行（见 validation_main.py）。
+"""
+import json
+import math
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence, Tuple
+import numpy as np
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+from compiled_rules import RESULT_DTYPE
+from rng_utils import SEED_BITS
+from stats_utils import chi2_survival
+
+
+REFERENCE_ENGINE = 'python'
+# 被检查的引擎 -> 是否与参考实现逐位一致
+ENGINES = {
+    'scalar': True,
+    'jit': True,
+    'grid': True,  # 编译型多场景内核（combined_character_weapon_simulation_scenarios）
+    'strategy-scalar': True,  # 内置策略（strategy_utils.DEFAULT_STRATEGY）在标量引擎上执行
+    'strategy-jit': True,  # 内置策略在编译型策略内核上执行
+    'event': False,
+}
+# 做分布检验的结果字段，failure_reason 按类别只做卡方检验；weapon_quota_used 恒为十连次数×每次消耗，不重复检验
+DISTRIBUTION_FIELDS = ('character_pulls', 'character_urgent_pulls', 'weapon_ten_pulls', 'remaining_quota',
+                       'extra_quota_purchased', 'failure_reason')
+CATEGORICAL_FIELDS = ('failure_reason',)
+DEFAULT_VALIDATION_RUNS = 2000
+DEFAULT_DISTRIBUTION_RUNS = 20000  # 分布检验的样本量，检验功效随样本量增长
+DEFAULT_VALIDATION_SEED = 20240101
+DEFAULT_ALPHA = 0.01  # 整个验证的总体显著性水平（Bonferroni 校正前）
+MIN_EXPECTED = 5  # 卡方检验每格的最小期望次数，不足时与相邻取值合并
+
+
+@dataclass
+class ValidationScenario:
+    """验证场景"""
+
+    name: str
+    description: str
+    player_info: PlayerInfo  # 内部状态字段已计算
+    character_pool_config: CharacterPoolConfig = field(default_factory=CharacterPoolConfig)
+    weapon_pool_config: WeaponPoolConfig = field(default_factory=WeaponPoolConfig)
+
+
+def _scenario(name: str, description: str, character_pool_config: CharacterPoolConfig = None,
+              **player_fields) -> ValidationScenario:
+    """由玩家信息字段构造场景，并按角色池配置计算内部状态"""
+    character_pool_config = character_pool_config or CharacterPoolConfig()
+    player_info = PlayerInfo(**player_fields)
+    player_info.compute_internal_state(character_pool_config)
+    return ValidationScenario(name, description, player_info, character_pool_config)
+
+
+def scenario_library() -> List[ValidationScenario]:
+    """内置的验证场景库"""
+    return [
+        _scenario('新号单限定', '全新账号，目标1个限定角色和1个限定武器'),
+        _scenario('提升区间起点', '小保底累计65抽，下一抽进入概率提升区间',
+                  got_six_star_character_in_next_pulls=15, character_total_pulls_used=65),
+        _scenario('小保底前一抽', '小保底累计79抽，下一抽必出六星',
+                  got_six_star_character_in_next_pulls=1, character_total_pulls_used=79),
+        _scenario('大保底前一抽', '已抽119次未获得限定，下一抽必出限定',
+                  got_six_star_character_in_next_pulls=41, character_total_pulls_used=119),
+        _scenario('循环保底前一抽', '已抽239次且已获得限定，下一抽由循环保底再给一个限定',
+                  got_six_star_character_in_next_pulls=50, character_total_pulls_used=239,
+                  character_limited_obtained=True, character_goals={"限定": 2}),
+        _scenario('紧急招募前一抽', '已抽29次，下一抽获得紧急招募十连',
+                  got_six_star_character_in_next_pulls=51, character_total_pulls_used=29),
+        _scenario('紧急招募凭证', '持有1张紧急招募十连和2张十连凭证',
+                  character_urgent_ten_pulls_available=1, character_ten_pulls_available=2),
+        _scenario('总是十连', '持有3张十连凭证且角色池总是十连',
+                  character_ten_pulls_available=3, character_always_pull_ten=True,
+                  got_five_or_six_star_character_in_next_pulls=3),
+        _scenario('配额补充', '初始配额1000，配额不足时抽角色池补充，目标2个限定武器',
+                  initial_weapon_quota=1000, weapon_goals={"限定武器": 2}),
+        _scenario('直接购买配额', '配额不足时直接购买，目标2个限定武器',
+                  weapon_goals={"限定武器": 2}, is_character_pull_enabled_on_low_quota=False),
+        _scenario('抽数上限', '角色池上限90抽、武器池上限4次十连，部分模拟失败',
+                  character_pull_limit=90, weapon_pull_limit=4),
+        _scenario('上限内补充配额', '角色池上限100抽且靠抽角色池补充配额，目标2个限定武器',
+                  character_pull_limit=100, weapon_goals={"限定武器": 2}),
+        _scenario('抽数下限', '角色池至少60抽、武器池至少3次十连',
+                  character_pull_minimum=60, weapon_pull_minimum=3),
+        _scenario('武器池里程碑前', '武器池已抽9次十连且出过六星武器，目标1个限定武器',
+                  weapon_total_pulls_used=9, weapon_six_star_obtained=True, character_goals={}),
+        _scenario('只靠保底', '基础六星概率为0，六星只来自概率提升区间和保底',
+                  CharacterPoolConfig(base_six_probability=0.0)),
+    ]
+
+
+def engine_chunk_simulator(engine: str, character_pool_config: CharacterPoolConfig,
+                           weapon_pool_config: WeaponPoolConfig, player_info: PlayerInfo,
+                           seed: int) -> Callable[[int, int], np.ndarray]:
+    """按引擎名生成 simulate_chunk(start, stop)，在 checkpoint_utils.chunk_simulator 的基础上
+    增加多场景内核和内置策略
+
+    参数:
+        engine: REFERENCE_ENGINE 或 ENGINES 中的引擎名
+        character_pool_config: 角色池配置
+        weapon_pool_config: 武器池配置
+        player_info: 玩家信息（内部状态字段需已计算）
+        seed: 随机种子
+    """
+    if engine == 'grid':
+        from jit_gacha_utils import combined_character_weapon_simulation_scenarios
+
+        def simulate_chunk(start, stop):
+            return combined_character_weapon_simulation_scenarios(
+                [(character_pool_config, weapon_pool_config, player_info)], stop - start, seed=seed,
+                first_run=start)[0]
+        return simulate_chunk
+    if engine.startswith('strategy-'):
+        from strategy_utils import DEFAULT_STRATEGY, parse_strategy, strategy_chunk_simulator
+        return strategy_chunk_simulator(engine[len('strategy-'):], character_pool_config, weapon_pool_config,
+                                        player_info, parse_strategy(DEFAULT_STRATEGY), seed)
+    from checkpoint_utils import chunk_simulator
+    return chunk_simulator(engine, character_pool_config, weapon_pool_config, player_info, seed)
+
+
+def chi2_homogeneity(reference: np.ndarray, sample: np.ndarray) -> Tuple[float, int, float]:
+    """两样本卡方齐性检验
+
+    按取值升序合并相邻取值，使每格的期望次数不少于 MIN_EXPECTED。
+
+    参数:
+        reference: 参考样本
+        sample: 被检查的样本
+
+    返回:
+        (统计量, 自由度, p值)，合并后只剩一格时为 (0, 0, 1)
+    """
+    values, inverse = np.unique(np.concatenate([reference, sample]), return_inverse=True)
+    counts = np.zeros((2, len(values)), dtype=np.int64)
+    np.add.at(counts[0], inverse[:len(reference)], 1)
+    np.add.at(counts[1], inverse[len(reference):], 1)
+    sizes = counts.sum(axis=1)
+    # 两行期望次数为 合并次数 × 行占比，较小的一行满足最小期望即可
+    min_pooled = MIN_EXPECTED * sizes.sum() / max(int(sizes.min()), 1)
+    bins = []
+    current = np.zeros(2, dtype=np.int64)
+    for column in counts.T:
+        current = current + column
+        if current.sum() >= min_pooled:
+            bins.append(current)
+            current = np.zeros(2, dtype=np.int64)
+    if current.sum():
+        if bins:
+            bins[-1] = bins[-1] + current
+        else:
+            bins.append(current)
+    if len(bins) < 2:
+        return 0.0, 0, 1.0
+    table = np.array(bins, dtype=np.float64).T
+    expected = np.outer(sizes, table.sum(axis=0)) / sizes.sum()
+    statistic = float(((table - expected) ** 2 / expected).sum())
+    degrees_of_freedom = len(bins) - 1
+    return statistic, degrees_of_freedom, chi2_survival(statistic, degrees_of_freedom)
+
+
+def kolmogorov_survival(statistic: float, effective_size: float) -> float:
+    """KS 统计量的渐近上尾概率（Stephens 小样本修正）"""
+    root = math.sqrt(effective_size)
+    x = (root + 0.12 + 0.11 / root) * statistic
+    if x < 0.2:
+        return 1.0
+    total = 0.0
+    for k in range(1, 101):
+        term = 2 * (-1) ** (k - 1) * math.exp(-2 * k * k * x * x)
+        total += term
+        if abs(term) < 1e-12:
+            break
+    return min(max(total, 0.0), 1.0)
+
+
+def ks_two_sample(reference: np.ndarray, sample: np.ndarray) -> Tuple[float, float]:
+    """两样本 KS 检验，返回 (最大累积分布差, p值)
+
+    结果字段是离散的，渐近p值偏保守（更不容易拒绝），与卡方检验互补：卡方检验对局部差异敏感，
+    KS 检验对整体位置的偏移敏感。
+    """
+    values = np.unique(np.concatenate([reference, sample]))
+    reference_cdf = np.searchsorted(np.sort(reference), values, side='right') / len(reference)
+    sample_cdf = np.searchsorted(np.sort(sample), values, side='right') / len(sample)
+    statistic = float(np.abs(reference_cdf - sample_cdf).max())
+    effective_size = len(reference) * len(sample) / (len(reference) + len(sample))
+    return statistic, kolmogorov_survival(statistic, effective_size)
+
+
+@dataclass
+class TestResult:
+    """一个字段上的一次统计检验"""
+
+    field: str
+    test: str  # '卡方' 或 'KS'
+    statistic: float
+    p_value: float
+    degrees_of_freedom: int = 0
+
+    def format(self) -> str:
+        """格式化为一行文本"""
+        detail = f"χ²={self.statistic:.2f}，自由度{self.degrees_of_freedom}" if self.test == '卡方' \
+            else f"D={self.statistic:.4f}"
+        return f"{self.field} {self.test}检验: {detail}，p={self.p_value:.3g}"
+
+
+@dataclass
+class Mismatch:
+    """逐位比较中第一条不一致的结果"""
+
+    run: int  # 模拟编号
+    field: str
+    reference: object
+    value: object
+
+
+@dataclass
+class EngineCheck:
+    """一个场景上一个引擎的检查结果"""
+
+    scenario: ValidationScenario
+    engine: str
+    exact: bool  # True 为逐位比较，False 为分布检验
+    seconds: float = 0.0
+    mismatch: Optional[Mismatch] = None
+    tests: List[TestResult] = field(default_factory=list)
+    error: str = ''  # 引擎抛出的异常
+    threshold: float = 0.0  # 分布检验的显著性水平（Bonferroni 校正后）
+
+    @property
+    def rejected(self) -> List[TestResult]:
+        """p值低于显著性水平的检验"""
+        return [test for test in self.tests if test.p_value < self.threshold]
+
+    @property
+    def passed(self) -> bool:
+        """是否通过"""
+        return not self.error and self.mismatch is None and not self.rejected
+
+
+def first_mismatch(reference: np.ndarray, records: np.ndarray) -> Optional[Mismatch]:
+    """逐条比较两组结果记录，返回第一条不一致的结果，完全一致时返回 None"""
+    if len(records) != len(reference):
+        return Mismatch(int(reference['run'][0]) + min(len(reference), len(records)), '结果条数',
+                        len(reference), len(records))
+    differs = np.zeros(len(reference), dtype=bool)
+    for name in RESULT_DTYPE.names:
+        differs |= reference[name] != records[name]
+    if not differs.any():
+        return None
+    index = int(np.argmax(differs))
+    name = next(name for name in RESULT_DTYPE.names if reference[name][index] != records[name][index])
+    return Mismatch(int(reference['run'][index]), name, reference[name][index].item(),
+                    records[name][index].item())
+
+
+def compare_distributions(reference: np.ndarray, records: np.ndarray,
+                          fields: Sequence[str] = DISTRIBUTION_FIELDS) -> List[TestResult]:
+    """对各结果字段做卡方齐性检验和 KS 检验（类别字段只做卡方检验）"""
+    tests = []
+    for name in fields:
+        statistic, degrees_of_freedom, p_value = chi2_homogeneity(reference[name], records[name])
+        tests.append(TestResult(name, '卡方', statistic, p_value, degrees_of_freedom))
+        if name not in CATEGORICAL_FIELDS:
+            statistic, p_value = ks_two_sample(reference[name], records[name])
+            tests.append(TestResult(name, 'KS', statistic, p_value))
+    return tests
+
+
+@dataclass
+class ValidationReport:
+    """一次验证的全部检查结果"""
+
+    checks: List[EngineCheck]
+    runs: int
+    seed: int
+    alpha: float
+    reference_seconds: float = 0.0
+    distribution_runs: int = 0
+
+    @property
+    def failures(self) -> List[EngineCheck]:
+        """未通过的检查"""
+        return [check for check in self.checks if not check.passed]
+
+    def format(self) -> str:
+        """格式化为文本报告：每个场景一行汇总，未通过的检查列出原因和场景"""
+        from archive_utils import scenario_dict
+        tests = sum(len(check.tests) for check in self.checks)
+        lines = [f"逐位比较每个场景每个引擎模拟 {self.runs} 次，分布检验 {self.distribution_runs} 次，"
+                 f"随机种子 {self.seed}，共 {tests} 项分布检验，总体显著性水平 {self.alpha:g}（Bonferroni 校正）"]
+        scenarios = []
+        for check in self.checks:
+            if check.scenario not in scenarios:
+                scenarios.append(check.scenario)
+        for scenario in scenarios:
+            checks = [check for check in self.checks if check.scenario is scenario]
+            status = '  '.join(f"{check.engine}{'✓' if check.passed else '✗'}" for check in checks)
+            lines.append(f"{scenario.name:<10}{status}")
+        for check in self.failures:
+            lines.append('')
+            lines.append(f"未通过: 场景「{check.scenario.name}」（{check.scenario.description}），引擎 {check.engine}")
+            if check.error:
+                lines.append(check.error.rstrip())
+            elif check.mismatch is not None:
+                mismatch = check.mismatch
+                lines.append(f"  第 {mismatch.run} 次模拟的 {mismatch.field} 不一致: 参考实现 {mismatch.reference}，"
+                             f"{check.engine} {mismatch.value}（种子 {self.seed}）")
+            else:
+                for test in check.rejected:
+                    lines.append(f"  {test.format()} < {check.threshold:.3g}")
+            lines.append('  场景JSON（可用于其他工具的 --scenario）:')
+            lines.append(json.dumps(scenario_dict(check.scenario.character_pool_config,
+                                                  check.scenario.weapon_pool_config, check.scenario.player_info),
+                                    ensure_ascii=False))
+        failures = len(self.failures)
+        lines.append('')
+        lines.append(f"全部 {len(self.checks)} 项检查通过" if not failures
+                     else f"{failures}/{len(self.checks)} 项检查未通过")
+        return '\n'.join(lines)
+
+
+def run_validation(scenarios: Sequence[ValidationScenario] = None, engines: Sequence[str] = None,
+                   runs: int = DEFAULT_VALIDATION_RUNS, seed: int = DEFAULT_VALIDATION_SEED,
+                   alpha: float = DEFAULT_ALPHA, progress: Callable[[str], None] = None,
+                   distribution_runs: int = DEFAULT_DISTRIBUTION_RUNS) -> ValidationReport:
+    """用场景库检查各引擎与参考实现是否一致
+
+    参数:
+        scenarios: 验证场景，None表示 scenario_library()
+        engines: 被检查的引擎名（ENGINES 的键），None表示全部
+        runs: 逐位比较时每个场景每个引擎的模拟次数
+        seed: 参考实现和逐位比较使用的随机种子，分布检验使用另一个种子
+        alpha: 总体显著性水平，按分布检验的总项数做 Bonferroni 校正
+        progress: 进度回调，参数为一行文本
+        distribution_runs: 分布检验时每个场景两个样本各自的模拟次数，不少于 runs
+
+    返回:
+        ValidationReport
+    """
+    scenarios = scenario_library() if scenarios is None else scenarios
+    engines = list(ENGINES) if engines is None else engines
+    unknown = [engine for engine in engines if engine not in ENGINES]
+    if unknown:
+        raise ValueError(f"未知的引擎: {', '.join(unknown)}，可用的引擎: {', '.join(ENGINES)}")
+    distribution_seed = (seed + 1) % (1 << SEED_BITS)
+    distribution_runs = max(distribution_runs, runs)
+    if any(not ENGINES[engine] for engine in engines):
+        from jit_gacha_utils import NUMBA_AVAILABLE
+        extension_engine = 'jit' if NUMBA_AVAILABLE else 'scalar'
+
+    checks = []
+    reference_seconds = 0.0
+    for scenario in scenarios:
+        configs = (scenario.character_pool_config, scenario.weapon_pool_config, scenario.player_info)
+        start = time.perf_counter()
+        reference = engine_chunk_simulator(REFERENCE_ENGINE, *configs, seed)(0, runs)
+        reference_seconds += time.perf_counter() - start
+        distribution_reference = None
+        for engine in engines:
+            check = EngineCheck(scenario, engine, ENGINES[engine])
+            start = time.perf_counter()
+            try:
+                if check.exact:
+                    check.mismatch = first_mismatch(reference, engine_chunk_simulator(engine, *configs, seed)(0, runs))
+                else:
+                    if distribution_reference is None:
+                        distribution_reference = np.concatenate([
+                            reference,
+                            engine_chunk_simulator(extension_engine, *configs, seed)(runs, distribution_runs)])
+                    records = engine_chunk_simulator(engine, *configs, distribution_seed)(0, distribution_runs)
+                    check.tests = compare_distributions(distribution_reference, records)
+            except Exception:
+                check.error = traceback.format_exc()
+            check.seconds = time.perf_counter() - start
+            checks.append(check)
+            if progress is not None:
+                progress(f"{scenario.name} / {engine}: {check.seconds:.2f}秒")
+
+    tests = sum(len(check.tests) for check in checks)
+    for check in checks:
+        check.threshold = alpha / max(tests, 1)
+    return ValidationReport(checks, runs, seed, alpha, reference_seconds, distribution_runs)
@@ -2,10 +2,14 @@
 武器池抽卡工具模块 - 包含武器池抽卡相关的核心逻辑函数
 """
 import random
-from typing import List, Dict
+from typing import List, Dict, Optional
 from config import WeaponPoolConfig, PlayerInfo, WeaponRuntimeInfo, CharacterPoolConfig, CharacterRuntimeInfo
 from character_gacha_utils import (perform_ten_character_pulls, update_character_goals_achieved, 
                                    character_goals_achieved, perform_single_character_pull)
+from rng_utils import run_streams
+from profiling_utils import (SimulationProfile, PHASE_WEAPON_CHECK, PHASE_REFILL, PHASE_WEAPON_PULL)
+from trace_events import (POOL_WEAPON, KIND_WEAPON, KIND_PURCHASE, GUARANTEE_WEAPON_MILESTONE,
+                          GUARANTEE_WEAPON_BOX, GUARANTEE_WEAPON_LIMITED, GUARANTEE_WEAPON_SIX)
 
 
 def weapon_goals_achieved(goals_achieved_dict: Dict[str, int], goals: Dict[str, int]) -> bool:
@@ -25,16 +29,17 @@ def weapon_goals_achieved(goals_achieved_dict: Dict[str, int], goals: Dict[str,
     return True
 
 
-def get_six_star_weapon_by_probability(pool_config: WeaponPoolConfig) -> str:
+def get_six_star_weapon_by_probability(pool_config: WeaponPoolConfig, rng=random) -> str:
     """根据概率获取一个六星武器
     
     参数:
         pool_config: 武器池配置
+        rng: 随机数源，提供 random() 方法，默认为 random 模块
     
     返回:
         六星武器名称
     """
-    rand_value = random.random()
+    rand_value = rng.random()
     cumulative_probability = 0.0
     for weapon, probability in pool_config.six_star_weapon_pool.items():
         cumulative_probability += probability
@@ -43,30 +48,34 @@ def get_six_star_weapon_by_probability(pool_config: WeaponPoolConfig) -> str:
     return list(pool_config.six_star_weapon_pool.keys())[-1]
 
 
-def get_weapon_by_probability(pool_config: WeaponPoolConfig) -> tuple:
+def get_weapon_by_probability(pool_config: WeaponPoolConfig, rng=random) -> tuple:
     """根据概率获取一个武器
     
     参数:
         pool_config: 武器池配置
+        rng: 随机数源
     
     返回:
         (武器名称, 稀有度) - 武器名称为""表示未抽中六星，稀有度为5/6
     """
-    rand_value = random.random()
+    rand_value = rng.random()
     
     # 检查是否抽中六星武器
     if rand_value <= pool_config.base_six_probability:
-        return get_six_star_weapon_by_probability(pool_config), 6
+        return get_six_star_weapon_by_probability(pool_config, rng), 6
     else:
         return "", 5  # 5星武器,不具体细分了，不是六星就当5星
 
 
-def perform_ten_weapon_pulls(pool_config: WeaponPoolConfig, runtime_info: WeaponRuntimeInfo) -> List[str]:
+def perform_ten_weapon_pulls(pool_config: WeaponPoolConfig, runtime_info: WeaponRuntimeInfo,
+                             rng=random, tracer=None) -> List[str]:
     """执行一次武器池十连抽
     
     参数:
         pool_config: 武器池配置
         runtime_info: 武器池运行时信息
+        rng: 随机数源
+        tracer: 轨迹记录器（trace_utils.PullTraceWriter），None表示不记录
     
     返回:
         obtained_six_stars: 本次十连获得的六星武器列表
@@ -80,15 +89,23 @@ def perform_ten_weapon_pulls(pool_config: WeaponPoolConfig, runtime_info: Weapon
     # 扣除武器配额
     runtime_info.weapon_quota -= pool_config.weapon_quota_cost_per_ten_pull
     runtime_info.total_pulls += 1  # 记录十连次数
+    if tracer is not None:
+        quota_before = runtime_info.weapon_quota + pool_config.weapon_quota_cost_per_ten_pull
     
     # 检查特殊奖励（基于总抽数）
     if runtime_info.total_pulls == 10:
         # 第10次十连：额外获得补充武库箱
         runtime_info.supply_boxes += 1
+        if tracer is not None:
+            tracer.record(POOL_WEAPON, KIND_WEAPON, 0, "", runtime_info.total_pulls,
+                          quota_before, runtime_info.weapon_quota, GUARANTEE_WEAPON_BOX)
     elif runtime_info.total_pulls == 18:
         # 第18次十连：额外送当期UP武器
         obtained_six_stars.append("限定武器")
         runtime_info.limited_obtained = True
+        if tracer is not None:
+            tracer.record(POOL_WEAPON, KIND_WEAPON, 6, "限定武器", runtime_info.total_pulls,
+                          quota_before, runtime_info.weapon_quota, GUARANTEE_WEAPON_MILESTONE)
     elif runtime_info.total_pulls > 18:
         # 第18次之后，每8次在补充武库箱和限定武器之间交替
         cycles_after_18 = runtime_info.total_pulls - 18
@@ -98,14 +115,23 @@ def perform_ten_weapon_pulls(pool_config: WeaponPoolConfig, runtime_info: Weapon
             if cycle_number % 2 == 1:
                 # 奇数次：补充武库箱（第26次）
                 runtime_info.supply_boxes += 1
+                if tracer is not None:
+                    tracer.record(POOL_WEAPON, KIND_WEAPON, 0, "", runtime_info.total_pulls,
+                                  quota_before, runtime_info.weapon_quota, GUARANTEE_WEAPON_BOX)
             else:
                 # 偶数次：限定武器（第34次）
                 obtained_six_stars.append("限定武器")
                 runtime_info.limited_obtained = True
+                if tracer is not None:
+                    tracer.record(POOL_WEAPON, KIND_WEAPON, 6, "限定武器", runtime_info.total_pulls,
+                                  quota_before, runtime_info.weapon_quota, GUARANTEE_WEAPON_MILESTONE)
     
     # 正常概率抽取
     for i in range(10):
-        weapon, rarity = get_weapon_by_probability(pool_config)
+        weapon, rarity = get_weapon_by_probability(pool_config, rng)
+        if tracer is not None:
+            tracer.record(POOL_WEAPON, KIND_WEAPON, rarity, weapon, runtime_info.total_pulls,
+                          quota_before, runtime_info.weapon_quota)
         if rarity == 6:
             obtained_six_stars.append(weapon)
             runtime_info.six_star_obtained = True
@@ -119,13 +145,19 @@ def perform_ten_weapon_pulls(pool_config: WeaponPoolConfig, runtime_info: Weapon
         obtained_six_stars.append("限定武器")
         runtime_info.limited_obtained = True
         runtime_info.six_star_obtained = True
+        if tracer is not None:
+            tracer.record(POOL_WEAPON, KIND_WEAPON, 6, "限定武器", runtime_info.total_pulls,
+                          quota_before, runtime_info.weapon_quota, GUARANTEE_WEAPON_LIMITED)
     elif runtime_info.total_pulls == 4 and not runtime_info.six_star_obtained:
         # 4次十连内未出六星，触发六星保底
-        weapon = get_six_star_weapon_by_probability(pool_config)
+        weapon = get_six_star_weapon_by_probability(pool_config, rng)
         obtained_six_stars.append(weapon)
         runtime_info.six_star_obtained = True
         if weapon == "限定武器":
             runtime_info.limited_obtained = True
+        if tracer is not None:
+            tracer.record(POOL_WEAPON, KIND_WEAPON, 6, weapon, runtime_info.total_pulls,
+                          quota_before, runtime_info.weapon_quota, GUARANTEE_WEAPON_SIX)
     
     return obtained_six_stars
 
@@ -145,7 +177,9 @@ def pull_character_for_weapon_quota(
     character_pool_config: CharacterPoolConfig,
     character_runtime_info: CharacterRuntimeInfo,
     weapon_runtime_info: WeaponRuntimeInfo,
-    character_goals_achieved_dict: Dict[str, int]
+    character_goals_achieved_dict: Dict[str, int],
+    rng=random,
+    tracer=None
 ) -> int:
     """通过抽取角色池来获得武器配额
     
@@ -154,6 +188,8 @@ def pull_character_for_weapon_quota(
         character_runtime_info: 角色池运行时信息
         weapon_runtime_info: 武器池运行时信息
         character_goals_achieved_dict: 角色池已达成目标字典
+        rng: 随机数源
+        tracer: 轨迹记录器，None表示不记录
     
     返回:
         本次单抽使用的抽数（1）
@@ -162,7 +198,7 @@ def pull_character_for_weapon_quota(
     character_runtime_info.weapon_quota = weapon_runtime_info.weapon_quota
     # 执行角色池单抽
     obtained_six_stars = []
-    perform_single_character_pull(character_pool_config, character_runtime_info, obtained_six_stars)
+    perform_single_character_pull(character_pool_config, character_runtime_info, obtained_six_stars, rng, tracer)
     
     # 更新角色池目标
     update_character_goals_achieved(character_goals_achieved_dict, obtained_six_stars)
@@ -176,7 +212,11 @@ def pull_character_for_weapon_quota(
 def combined_character_weapon_simulation(
     character_pool_config: CharacterPoolConfig,
     weapon_pool_config: WeaponPoolConfig,
-    player_info: PlayerInfo
+    player_info: PlayerInfo,
+    profile: Optional[SimulationProfile] = None,
+    tracer=None,
+    seed: Optional[int] = None,
+    run_index: Optional[int] = None
 ) -> Dict:
     """执行角色池+武器池的综合模拟
     
@@ -190,10 +230,48 @@ def combined_character_weapon_simulation(
         character_pool_config: 角色池配置
         weapon_pool_config: 武器池配置
         player_info: 玩家信息
+        profile: 性能剖析数据，传入时累计本次模拟的阶段耗时和计数，None表示不剖析
+        tracer: 轨迹记录器（trace_utils.PullTraceWriter），每次调用视为一次新的模拟，
+                未被其模拟编号过滤器选中时不记录；None表示不记录
+        seed: 随机种子，传入时角色池和武器池分别使用由 (seed, run_index, 卡池) 决定的计数器随机流，
+              可单独重放任意一次模拟；None表示使用全局 random 模块
+        run_index: 模拟编号，写入结果的'模拟编号'并作为轨迹中的编号；传入 seed 时默认为0
     
     返回:
         包含角色池和武器池的抽数及是否成功的字典
     """
+    if tracer is not None and not tracer.begin_run(run_index):
+        tracer = None
+    if seed is None:
+        character_rng = weapon_rng = random
+    else:
+        character_rng, weapon_rng = run_streams(seed, run_index or 0)
+    
+    if profile is None:
+        result = _combined_character_weapon_simulation(character_pool_config, weapon_pool_config, player_info,
+                                                       character_rng, weapon_rng, None, tracer)
+    else:
+        character_rng, weapon_rng = profile.start_run(character_rng, weapon_rng)
+        try:
+            result = _combined_character_weapon_simulation(character_pool_config, weapon_pool_config, player_info,
+                                                           character_rng, weapon_rng, profile, tracer)
+        finally:
+            profile.end_run()
+    if run_index is not None:
+        result['模拟编号'] = run_index
+    return result
+
+
+def _combined_character_weapon_simulation(
+    character_pool_config: CharacterPoolConfig,
+    weapon_pool_config: WeaponPoolConfig,
+    player_info: PlayerInfo,
+    character_rng,
+    weapon_rng,
+    profile: Optional[SimulationProfile],
+    tracer
+) -> Dict:
+    """综合模拟的实现，参数和返回值见 combined_character_weapon_simulation"""
     # 初始化运行时信息
     character_runtime_info = CharacterRuntimeInfo.from_player_info(player_info, character_pool_config)
     weapon_runtime_info = WeaponRuntimeInfo.from_player_info(player_info)
@@ -255,7 +333,8 @@ def combined_character_weapon_simulation(
             # 记录使用哪种十连
             using_urgent = character_runtime_info.ten_pull_count_urgent > 0
             
-            obtained_six_stars = perform_ten_character_pulls(character_pool_config, character_runtime_info)
+            obtained_six_stars = perform_ten_character_pulls(character_pool_config, character_runtime_info,
+                                                             character_rng, tracer)
             update_character_goals_achieved(character_goals_achieved_dict, obtained_six_stars)
             
             # 统计使用的十连类型
@@ -263,21 +342,34 @@ def combined_character_weapon_simulation(
                 character_urgent_pulls += 10
             else:
                 character_free_pulls += 10
+            if profile is not None:
+                if using_urgent:
+                    profile.urgent_ten_pulls += 1
+                else:
+                    profile.ten_pulls += 1
         else:
             # 总是十连抽
             if player_info.character_always_pull_ten:
-                obtained_six_stars = perform_ten_character_pulls(character_pool_config, character_runtime_info)
+                obtained_six_stars = perform_ten_character_pulls(character_pool_config, character_runtime_info,
+                                                                 character_rng, tracer)
                 update_character_goals_achieved(character_goals_achieved_dict, obtained_six_stars)
                 character_paid_pulls += 10
+                if profile is not None:
+                    profile.ten_pulls += 1
             else:
                 # 单抽
                 obtained_six_stars = []
-                perform_single_character_pull(character_pool_config, character_runtime_info, obtained_six_stars)
+                perform_single_character_pull(character_pool_config, character_runtime_info, obtained_six_stars,
+                                              character_rng, tracer)
                 update_character_goals_achieved(character_goals_achieved_dict, obtained_six_stars)
                 character_paid_pulls += 1
+                if profile is not None:
+                    profile.single_pulls += 1
     
     # 角色池阶段完成，将武器配额同步到武器池运行时信息
     weapon_runtime_info.weapon_quota = character_runtime_info.weapon_quota
+    if profile is not None:
+        profile.enter_phase(PHASE_WEAPON_CHECK)
     
     # ========== 阶段2: 抽武器池直到满足目标和约束 ==========
     while True:
@@ -306,13 +398,20 @@ def combined_character_weapon_simulation(
             }
         
         # 检查武器配额是否足够一次十连
+        if profile is not None:
+            profile.enter_phase(PHASE_REFILL)
         while weapon_runtime_info.weapon_quota < weapon_pool_config.weapon_quota_cost_per_ten_pull:
+            if profile is not None:
+                profile.count_refill_iteration()
             # 检查是否启用了从角色池获取配额的策略
             if not weapon_runtime_info.is_character_pull_enabled_on_low_quota:
                 # 未启用策略，直接购买武器配额
                 quota_needed = weapon_pool_config.weapon_quota_cost_per_ten_pull - weapon_runtime_info.weapon_quota
                 weapon_runtime_info.weapon_quota += quota_needed
                 extra_quota_purchased += quota_needed
+                if tracer is not None:
+                    tracer.record(POOL_WEAPON, KIND_PURCHASE, 0, "", weapon_runtime_info.total_pulls,
+                                  weapon_runtime_info.weapon_quota - quota_needed, weapon_runtime_info.weapon_quota)
                 break
             # 检查角色池是否达到抽数上限
             character_total_pulls = character_paid_pulls + character_free_pulls
@@ -348,7 +447,8 @@ def combined_character_weapon_simulation(
                 # 记录使用哪种十连
                 using_urgent = character_runtime_info.ten_pull_count_urgent > 0
                 
-                obtained_six_stars = perform_ten_character_pulls(character_pool_config, character_runtime_info)
+                obtained_six_stars = perform_ten_character_pulls(character_pool_config, character_runtime_info,
+                                                                 character_rng, tracer)
                 update_character_goals_achieved(character_goals_achieved_dict, obtained_six_stars)
                 
                 # 统计使用的十连类型
@@ -356,12 +456,20 @@ def combined_character_weapon_simulation(
                     character_urgent_pulls += 10
                 else:
                     character_free_pulls += 10
+                if profile is not None:
+                    if using_urgent:
+                        profile.urgent_ten_pulls += 1
+                    else:
+                        profile.ten_pulls += 1
             else:
                 # 单抽获取武器配额
                 obtained_six_stars = []
-                perform_single_character_pull(character_pool_config, character_runtime_info, obtained_six_stars)
+                perform_single_character_pull(character_pool_config, character_runtime_info, obtained_six_stars,
+                                              character_rng, tracer)
                 update_character_goals_achieved(character_goals_achieved_dict, obtained_six_stars)
                 character_paid_pulls += 1
+                if profile is not None:
+                    profile.single_pulls += 1
             
             # 同步武器配额
             weapon_runtime_info.weapon_quota = character_runtime_info.weapon_quota
@@ -388,9 +496,14 @@ def combined_character_weapon_simulation(
             }
         
         # 执行武器池十连抽
-        obtained_six_stars = perform_ten_weapon_pulls(weapon_pool_config, weapon_runtime_info)
+        if profile is not None:
+            profile.enter_phase(PHASE_WEAPON_PULL)
+            profile.weapon_ten_pulls += 1
+        obtained_six_stars = perform_ten_weapon_pulls(weapon_pool_config, weapon_runtime_info, weapon_rng, tracer)
         update_weapon_goals_achieved(weapon_goals_achieved_dict, obtained_six_stars)
         weapon_ten_pulls += 1
+        if profile is not None:
+            profile.enter_phase(PHASE_WEAPON_CHECK)
     
     # 判断是否成功达成目标
     success = weapon_goals_achieved(weapon_goals_achieved_dict, player_info.weapon_goals)
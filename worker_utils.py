@@ -0,0 +1,58 @@
+"""
+模拟工作进程模块 - 本地模拟服务（service_utils）和任务队列（job_queue_utils）的进程池共用的工作进程函数
+
+工作进程启动时导入 NumPy/Numba 并预热编译型内核，之后按场景哈希缓存编译好的规则表，
+同一场景的后续模拟不再重新编译。
+"""
+from collections import OrderedDict
+from typing import Any
+from config import CharacterPoolConfig, WeaponPoolConfig, PlayerInfo
+
+
+SCENARIO_CACHE_SIZE = 32  # 每个工作进程缓存的场景数
+
+_worker_scenarios: 'OrderedDict[str, Any]' = OrderedDict()
+
+
+def init_worker():
+    """工作进程初始化：导入模拟依赖并预热编译型内核（首次调用触发 Numba 编译或读取缓存）"""
+    from jit_gacha_utils import NUMBA_AVAILABLE
+    if NUMBA_AVAILABLE:
+        character_pool_config = CharacterPoolConfig()
+        player_info = PlayerInfo()
+        player_info.compute_internal_state(character_pool_config)
+        run_chunk(worker_simulator(character_pool_config, WeaponPoolConfig(), player_info), 1, 0, 1)
+
+
+def worker_simulator(character_pool_config: CharacterPoolConfig, weapon_pool_config: WeaponPoolConfig,
+                     player_info: PlayerInfo):
+    """按场景哈希缓存的模拟器：Numba 可用时为编译好的规则表，否则为标量模拟器"""
+    from archive_utils import scenario_hash
+    key = scenario_hash(character_pool_config, weapon_pool_config, player_info)
+    simulator = _worker_scenarios.get(key)
+    if simulator is None:
+        from jit_gacha_utils import NUMBA_AVAILABLE
+        if NUMBA_AVAILABLE:
+            from compiled_rules import compile_scenarios
+            simulator = compile_scenarios([(character_pool_config, weapon_pool_config, player_info)])
+        else:
+            from scalar_gacha_utils import ScalarSimulator
+            simulator = ScalarSimulator(character_pool_config, weapon_pool_config, player_info)
+        if len(_worker_scenarios) >= SCENARIO_CACHE_SIZE:
+            _worker_scenarios.popitem(last=False)
+        _worker_scenarios[key] = simulator
+    else:
+        _worker_scenarios.move_to_end(key)
+    return simulator
+
+
+def run_chunk(simulator, seed: int, start: int, stop: int):
+    """用 worker_simulator 的结果执行编号为 [start, stop) 的模拟，返回结果记录"""
+    from compiled_rules import records_from_matrix, records_from_results
+    from jit_gacha_utils import simulate_compiled_scenarios
+    if hasattr(simulator, 'simulate'):
+        return records_from_results([simulator.simulate(seed=seed, run_index=i) for i in range(start, stop)],
+                                    first_run=start)
+    # 每个工作进程单线程执行，并行度由进程池提供
+    return records_from_matrix(simulate_compiled_scenarios(simulator, stop - start, seed, parallel=False,
+                                                           first_run=start)[0])